@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the annotation journal behind undo, redo and history.
+
+For a session of 10k annotations, runs a long stretch of single-vertex
+edits and reports the bytes each record takes next to the document it
+changes, the time to append a record and to write a snapshot, the time to
+undo (replaying from the last snapshot) and to replay the session at a
+past time, and the disk the journal uses once compacted.
+
+Usage:
+    python app/benchmarks/bench_annotation_journal.py
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from storage.annotation_journal import AnnotationJournal
+from utils.annotation_edits import apply_vertex_ops, edit_document, outer_ring
+
+ANNOTATIONS = 10000
+VERTICES = 40
+EDITS = 30000
+
+
+def document(rng: random.Random) -> dict:
+    """A manual annotation with a jittered circular polygon"""
+    cx, cy = rng.random(), rng.random()
+    ring = [
+        [
+            cx + 0.005 * rng.uniform(0.9, 1.0) * math.cos(2 * math.pi * i / VERTICES),
+            cy + 0.005 * rng.uniform(0.9, 1.0) * math.sin(2 * math.pi * i / VERTICES),
+        ]
+        for i in range(VERTICES)
+    ]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "building", "type": "manual"},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ],
+    }
+
+
+def directory_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def main():
+    rng = random.Random(0)
+    live = {f"ann{i}": document(rng) for i in range(ANNOTATIONS)}
+    temp_dir = tempfile.mkdtemp()
+    journal = AnnotationJournal(temp_dir)
+    journal.set_state_source(
+        lambda session_id: {
+            annotation_id: {
+                "image_id": "img",
+                "file_path": "",
+                "auto_generated": False,
+                "document": json_data,
+            }
+            for annotation_id, json_data in live.items()
+        }
+    )
+
+    def restore(targets):
+        for annotation_id, target in targets.items():
+            previous = live[annotation_id]
+            live[annotation_id] = target["document"]
+            journal.record_update("s", annotation_id, previous, target["document"])
+
+    try:
+        start = time.perf_counter()
+        with journal.group("s"):
+            pass  # Takes the first snapshot
+        first_ms = (time.perf_counter() - start) * 1000
+
+        append_ms, snapshot_ms = [], []
+        midway = None
+        for edit in range(EDITS):
+            annotation_id = f"ann{rng.randrange(ANNOTATIONS)}"
+            previous = live[annotation_id]
+            ring = apply_vertex_ops(
+                outer_ring(previous),
+                [
+                    {
+                        "op": "move",
+                        "index": rng.randrange(VERTICES),
+                        "point": [rng.random(), rng.random()],
+                    }
+                ],
+            )
+            snapshots = journal.stats["snapshots"]
+            start = time.perf_counter()
+            with journal.group("s"):
+                live[annotation_id] = edit_document(previous, ring=ring)
+                journal.record_update("s", annotation_id, previous, live[annotation_id])
+            elapsed = (time.perf_counter() - start) * 1000
+            if journal.stats["snapshots"] > snapshots:
+                snapshot_ms.append(elapsed)
+                midway = None
+            else:
+                append_ms.append(elapsed)
+            if midway is None and len(append_ms) % 1000 == 0:
+                midway = time.time()  # A while after the last snapshot
+
+        session_dir = os.path.join(temp_dir, "s")
+        segments = sorted(
+            name for name in os.listdir(session_dir) if name.endswith(".log")
+        )
+        with open(os.path.join(session_dir, segments[-1]), "rb") as f:
+            record = f.readline()
+        document_bytes = len(json.dumps(live[json.loads(record)["o"][0]["a"]]))
+        append_ms.sort()
+
+        start = time.perf_counter()
+        journal.undo("s", restore)
+        undo_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        state = journal.state_at("s", midway)
+        state_ms = (time.perf_counter() - start) * 1000
+
+        print(f"Session: {ANNOTATIONS} annotations of {VERTICES} vertices")
+        print(
+            f"{EDITS} single-vertex edits, {len(snapshot_ms)} snapshots written, "
+            f"{journal.keep_snapshots} kept"
+        )
+        print()
+        print(f"{'record (bytes)':>28} {len(record):>10}")
+        print(f"{'document it changes (bytes)':>28} {document_bytes:>10}")
+        print(f"{'first snapshot (ms)':>28} {first_ms:>10.1f}")
+        print(f"{'append, median (ms)':>28} {append_ms[len(append_ms) // 2]:>10.3f}")
+        print(
+            f"{'append + snapshot (ms)':>28} {sum(snapshot_ms) / len(snapshot_ms):>10.1f}"
+        )
+        print(
+            f"{'append, mean (ms)':>28} "
+            f"{(sum(append_ms) + sum(snapshot_ms)) / EDITS:>10.3f}"
+        )
+        print(f"{'undo (ms)':>28} {undo_ms:>10.1f}")
+        print(f"{'state at a time (ms)':>28} {state_ms:>10.1f}")
+        print(f"{'annotations replayed':>28} {len(state):>10}")
+        print(
+            f"{'journal on disk (KB)':>28} {directory_size(session_dir) / 1024:>10.0f}"
+        )
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark listing one image's annotation geometry, reading one JSON file per
+annotation (as before the geometry store) and from the GeometryStore.
+
+Also reports how long the write-behind log takes to replay on startup.
+
+Usage:
+    python app/benchmarks/bench_annotation_listing.py
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from storage.geometry_store import GeometryStore
+
+ANNOTATION_COUNTS = [10, 100, 1000]
+REPEATS = 20
+SESSION_ID = "bench-session"
+
+
+def document(i: int) -> dict:
+    """A manual annotation with a 64-vertex polygon"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": f"building {i}", "type": "manual"},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[i + j / 64, j / 64] for j in range(64)]],
+                },
+            }
+        ],
+    }
+
+
+def list_files(paths) -> list:
+    result = []
+    for path in paths:
+        with open(path, "r") as f:
+            result.append(json.load(f))
+    return result
+
+
+def main():
+    print(
+        f"{'Annotations':>12} {'files (ms)':>12} {'store (ms)':>12} {'replay (ms)':>12}"
+    )
+    print("-" * 52)
+    for count in ANNOTATION_COUNTS:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            ids = [f"annotation-{i}" for i in range(count)]
+            paths = []
+            store = GeometryStore(os.path.join(temp_dir, "geometry.log"))
+            for i, annotation_id in enumerate(ids):
+                path = os.path.join(temp_dir, f"{annotation_id}.json")
+                with open(path, "w") as f:
+                    json.dump(document(i), f, indent=2)
+                paths.append(path)
+                store.put(SESSION_ID, annotation_id, document(i))
+            store.flush()
+
+            start = time.perf_counter()
+            for _ in range(REPEATS):
+                list_files(paths)
+            files_ms = (time.perf_counter() - start) / REPEATS * 1000
+
+            start = time.perf_counter()
+            for _ in range(REPEATS):
+                store.get_many(SESSION_ID, ids)
+            store_ms = (time.perf_counter() - start) / REPEATS * 1000
+            store.close()
+
+            start = time.perf_counter()
+            restarted = GeometryStore(store.log_path)
+            restarted.get(SESSION_ID, ids[0])
+            replay_ms = (time.perf_counter() - start) * 1000
+            restarted.close()
+
+            print(f"{count:>12} {files_ms:>12.2f} {store_ms:>12.3f} {replay_ms:>12.1f}")
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
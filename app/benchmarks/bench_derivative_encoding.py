@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark encode time and output size of the browser derivative formats.
+
+Representative scenes are built by tiling the sample image in data/ (or any
+images passed on the command line) up to typical satellite scene sizes.
+
+Usage:
+    python app/benchmarks/bench_derivative_encoding.py [scene.tif ...]
+"""
+
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from PIL import Image
+from utils.image_processing import encode_derivative
+
+SAMPLE_IMAGE = next((app_path.parent / "data").glob("*.jpg"), None)
+SCENE_SIZES = [(2048, 2048), (4096, 4096)]
+
+# (label, format, quality, png compress level)
+CONFIGURATIONS = [
+    ("png level 1", "png", None, 1),
+    ("png level 6", "png", None, 6),
+    ("png level 9", "png", None, 9),
+    ("webp q75", "webp", 75, None),
+    ("webp q90", "webp", 90, None),
+    ("jpeg q85", "jpeg", 85, None),
+    ("jpeg q95", "jpeg", 95, None),
+]
+
+
+def tiled_scene(source: Image.Image, size) -> Image.Image:
+    """Tile a source image into a scene of the given size"""
+    scene = Image.new("RGB", size)
+    for y in range(0, size[1], source.height):
+        for x in range(0, size[0], source.width):
+            scene.paste(source, (x, y))
+    return scene
+
+
+def load_scenes(paths):
+    if paths:
+        for path in paths:
+            with Image.open(path) as img:
+                img.load()
+                yield Path(path).name, img.convert("RGB")
+        return
+
+    if SAMPLE_IMAGE is None:
+        raise SystemExit("No sample image found in data/, pass scene paths instead")
+    with Image.open(SAMPLE_IMAGE) as sample:
+        sample = sample.convert("RGB")
+        for size in SCENE_SIZES:
+            yield f"tiled {size[0]}x{size[1]}", tiled_scene(sample, size)
+
+
+def main():
+    out_dir = Path(tempfile.mkdtemp())
+    for name, scene in load_scenes(sys.argv[1:]):
+        # The TIFF size is the baseline every derivative is compared to
+        tiff_path = out_dir / "source.tif"
+        scene.save(tiff_path, "TIFF")
+        tiff_size = tiff_path.stat().st_size
+
+        print(f"\n===== {name} (TIFF source {tiff_size / 1e6:.1f} MB) =====")
+        print(f"{'Format':<14} {'Encode (s)':>11} {'Size (MB)':>10} {'vs TIFF':>8}")
+        print("-" * 46)
+        for label, fmt, quality, compress_level in CONFIGURATIONS:
+            start = time.perf_counter()
+            path, _ = encode_derivative(
+                scene, out_dir, fmt, quality=quality, compress_level=compress_level
+            )
+            elapsed = time.perf_counter() - start
+            size = path.stat().st_size
+            path.unlink()
+            print(
+                f"{label:<14} {elapsed:>11.3f} {size / 1e6:>10.2f} "
+                f"{size / tiff_size:>7.0%}"
+            )
+        tiff_path.unlink()
+    out_dir.rmdir()
+
+
+if __name__ == "__main__":
+    main()
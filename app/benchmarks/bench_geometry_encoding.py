@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the compact geometry encoding against plain GeoJSON.
+
+For building footprints, SAM outlines and large hand-drawn fields, reports
+the JSON bytes of the annotations and the time to serialize and to parse
+them (compact: encode/decode included), then the size of the geometry log
+and the time to replay it with either encoding.
+
+Usage:
+    python app/benchmarks/bench_geometry_encoding.py
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from storage.geometry_codec import decode_document, encode_document
+from storage.geometry_store import GeometryStore
+
+# name -> (annotations, vertices per polygon, radius in normalized units)
+WORKLOADS = {
+    "buildings": (20000, 12, 0.001),
+    "sam": (2000, 200, 0.02),
+    "fields": (100, 2000, 0.2),
+}
+
+
+def document(rng: random.Random, vertices: int, radius: float) -> dict:
+    """A manual annotation with a jittered circular polygon"""
+    cx, cy = rng.random(), rng.random()
+    ring = [
+        [
+            cx + radius * rng.uniform(0.9, 1.0) * math.cos(2 * math.pi * i / vertices),
+            cy + radius * rng.uniform(0.9, 1.0) * math.sin(2 * math.pi * i / vertices),
+        ]
+        for i in range(vertices)
+    ]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "building", "type": "manual"},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ],
+    }
+
+
+def timed(run) -> float:
+    """Milliseconds taken by run()"""
+    start = time.perf_counter()
+    run()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    rng = random.Random(0)
+    print(
+        f"{'Workload':>10} {'JSON (KB)':>10} {'compact':>9} {'ratio':>6} "
+        f"{'dumps (ms)':>11} {'compact':>8} {'loads (ms)':>11} {'compact':>8}"
+    )
+    print("-" * 80)
+    workloads = {}
+    for name, (count, vertices, radius) in WORKLOADS.items():
+        documents = [document(rng, vertices, radius) for _ in range(count)]
+        workloads[name] = documents
+        plain = json.dumps(documents)
+        compact = json.dumps([encode_document(d) for d in documents])
+
+        dumps_ms = timed(lambda: json.dumps(documents))
+        dumps_compact_ms = timed(
+            lambda: json.dumps([encode_document(d) for d in documents])
+        )
+        loads_ms = timed(lambda: json.loads(plain))
+        loads_compact_ms = timed(
+            lambda: [decode_document(d) for d in json.loads(compact)]
+        )
+        print(
+            f"{name:>10} {len(plain) / 1024:>10.0f} {len(compact) / 1024:>9.0f} "
+            f"{len(plain) / len(compact):>5.1f}x {dumps_ms:>11.1f} "
+            f"{dumps_compact_ms:>8.1f} {loads_ms:>11.1f} {loads_compact_ms:>8.1f}"
+        )
+
+    print()
+    print(f"{'Log':>10} {'size (KB)':>10} {'replay (ms)':>12}")
+    print("-" * 34)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for encoding in ("json", "compact"):
+            path = str(Path(temp_dir) / f"{encoding}.log")
+            store = GeometryStore(
+                path, flush_interval=0, fsync=False, encoding=encoding
+            )
+            for name, documents in workloads.items():
+                for i, doc in enumerate(documents):
+                    store.put("s1", f"{name}{i}", doc)
+            store.close()
+            replay_ms = timed(lambda: GeometryStore(path).get("s1", "fields0"))
+            size = Path(path).stat().st_size
+            print(f"{encoding:>10} {size / 1024:>10.0f} {replay_ms:>12.1f}")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
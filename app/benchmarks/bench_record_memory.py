@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the memory held per annotation by the in-memory session store.
+
+Compares the slotted dataclass records against the pydantic models they
+replaced, both for the records alone and for a whole SessionStore (records,
+dict entries and the per-image annotation index).
+
+Usage:
+    python app/benchmarks/bench_record_memory.py
+"""
+
+import sys
+import uuid
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+import storage.session_store as session_store_module
+from storage.session_store import SessionStore, SessionAnnotation
+
+ANNOTATIONS = 100_000
+ANNOTATIONS_PER_IMAGE = 20
+
+
+class PydanticAnnotation(BaseModel):
+    """The record type used before the slotted dataclasses"""
+
+    annotation_id: str
+    image_id: str
+    file_path: str
+    created_at: datetime = datetime.now()
+    auto_generated: bool = False
+    model_id: Optional[str] = None
+
+
+def measure(build) -> float:
+    """Bytes still allocated per annotation after `build()` returns"""
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    kept = build()
+    end = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in end.compare_to(start, "filename"))
+    del kept
+    return allocated / ANNOTATIONS
+
+
+def build_records(record_type):
+    def build():
+        image_id = str(uuid.uuid4())
+        records = {}
+        for i in range(ANNOTATIONS):
+            annotation_id = str(uuid.uuid4())
+            records[annotation_id] = record_type(
+                annotation_id=annotation_id,
+                image_id=image_id,
+                file_path=f"annotations/{annotation_id}.json",
+                created_at=datetime.now(),
+            )
+        return records
+
+    return build
+
+
+def build_store():
+    store = SessionStore()
+    session_id = "bench-session"
+    image_id = None
+    for i in range(ANNOTATIONS):
+        if i % ANNOTATIONS_PER_IMAGE == 0:
+            image_id = store.add_image(session_id, f"t{i}.png", f"uploads/t{i}.png")
+            image_id = image_id.image_id
+        # Ids arrive from requests as fresh strings
+        store.add_annotation(
+            session_id, "".join(image_id), f"annotations/{i}.json", True, "sam"
+        )
+    return store
+
+
+def main():
+    print(f"{ANNOTATIONS:,} annotations, {ANNOTATIONS_PER_IMAGE} per image")
+    print(f"{'Record type':<24} {'records (B/ann)':>16} {'store (B/ann)':>14}")
+    print("-" * 56)
+
+    for name, record_type in [
+        ("pydantic BaseModel", PydanticAnnotation),
+        ("slotted dataclass", SessionAnnotation),
+    ]:
+        records_cost = measure(build_records(record_type))
+        session_store_module.SessionAnnotation = record_type
+        try:
+            store_cost = measure(build_store)
+        finally:
+            session_store_module.SessionAnnotation = SessionAnnotation
+        print(f"{name:<24} {records_cost:>16.0f} {store_cost:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
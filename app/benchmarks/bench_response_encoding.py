@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark JSON response serialization and compression.
+
+For a session of 10k annotations, reports the time to serialize the
+annotation list and the session export with FastAPI's default path
+(jsonable_encoder, then json.dumps), with dumps() on the stdlib encoder
+and with dumps() on orjson, then the bytes on the wire and the time to
+compress them with gzip and brotli.
+
+Usage:
+    python app/benchmarks/bench_response_encoding.py
+"""
+
+import sys
+import math
+import time
+import random
+from datetime import datetime
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+import utils.json_response as json_response
+from storage.geometry_codec import encode_document
+from storage.session_store import SessionAnnotation, SessionImage
+from utils.compression import SUPPORTED_ENCODINGS, compress
+
+ANNOTATIONS = 10000
+VERTICES = 40
+
+
+def document(rng: random.Random) -> dict:
+    """A manual annotation with a jittered circular polygon"""
+    cx, cy = rng.random(), rng.random()
+    ring = [
+        [
+            cx + 0.005 * rng.uniform(0.9, 1.0) * math.cos(2 * math.pi * i / VERTICES),
+            cy + 0.005 * rng.uniform(0.9, 1.0) * math.sin(2 * math.pi * i / VERTICES),
+        ]
+        for i in range(VERTICES)
+    ]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "building", "type": "manual"},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ],
+    }
+
+
+def session(rng: random.Random):
+    """Image, annotation records and documents of a 10k-annotation session"""
+    image = SessionImage(image_id="img", file_name="scene.tif", file_path="scene.tif")
+    annotations = [
+        SessionAnnotation(annotation_id=f"ann{i}", image_id="img", file_path="")
+        for i in range(ANNOTATIONS)
+    ]
+    documents = {ann.annotation_id: document(rng) for ann in annotations}
+    return image, annotations, documents
+
+
+def listing(annotations, documents, encoding: str) -> list:
+    """The body of GET /api/annotations/{image_id}"""
+    return [
+        {
+            "annotation_id": ann.annotation_id,
+            "created_at": ann.created_at,
+            "auto_generated": ann.auto_generated,
+            "data": (
+                encode_document(documents[ann.annotation_id])
+                if encoding == "compact"
+                else documents[ann.annotation_id]
+            ),
+            "etag": '"0123456789abcdef01234567"',
+        }
+        for ann in annotations
+    ]
+
+
+def default_export(image, annotations, documents) -> bytes:
+    """POST /api/export-session/ as it was: .dict() records, then FastAPI's encoder"""
+    export = {
+        "session_id": "session",
+        "created_at": datetime.now().isoformat(),
+        "images": [image.dict()],
+        "annotations": [
+            {**ann.dict(), "data": documents[ann.annotation_id]} for ann in annotations
+        ],
+    }
+    return JSONResponse(jsonable_encoder(export)).body
+
+
+def fast_export(image, annotations, documents) -> bytes:
+    """POST /api/export-session/ with records serialized as they are"""
+    export = {
+        "session_id": "session",
+        "created_at": datetime.now(),
+        "images": [image],
+        "annotations": [
+            {**ann.model_dump(), "data": documents[ann.annotation_id]}
+            for ann in annotations
+        ],
+    }
+    return json_response.dumps(export)
+
+
+def stdlib_dumps(run):
+    """Run with dumps() falling back to the stdlib encoder"""
+    orjson = json_response.orjson
+    json_response.orjson = None
+    try:
+        return run()
+    finally:
+        json_response.orjson = orjson
+
+
+def timed(run) -> tuple:
+    """Result of run() and the milliseconds taken, best of three"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        result = run()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    image, annotations, documents = session(random.Random(0))
+    bodies = {}
+    print(f"Session: {ANNOTATIONS} annotations of {VERTICES} vertices")
+    print()
+    print(f"{'Body':>16} {'FastAPI (ms)':>13} {'stdlib':>8} {'orjson':>8}")
+    print("-" * 48)
+    for encoding in ("json", "compact"):
+        items = listing(annotations, documents, encoding)
+        body, default_ms = timed(lambda: JSONResponse(jsonable_encoder(items)).body)
+        _, stdlib_ms = timed(lambda: stdlib_dumps(lambda: json_response.dumps(items)))
+        _, fast_ms = timed(lambda: json_response.dumps(items))
+        name = f"list ({encoding})"
+        bodies[name] = body
+        print(f"{name:>16} {default_ms:>13.1f} {stdlib_ms:>8.1f} {fast_ms:>8.1f}")
+
+    body, default_ms = timed(lambda: default_export(image, annotations, documents))
+    _, stdlib_ms = timed(
+        lambda: stdlib_dumps(lambda: fast_export(image, annotations, documents))
+    )
+    _, fast_ms = timed(lambda: fast_export(image, annotations, documents))
+    bodies["export"] = body
+    print(f"{'export':>16} {default_ms:>13.1f} {stdlib_ms:>8.1f} {fast_ms:>8.1f}")
+
+    print()
+    header = f"{'Body':>16} {'identity (KB)':>14}"
+    for coding in SUPPORTED_ENCODINGS:
+        header += f" {coding + ' (KB)':>10} {'ms':>7}"
+    print(header)
+    print("-" * len(header))
+    for name, body in bodies.items():
+        row = f"{name:>16} {len(body) / 1024:>14.0f}"
+        for coding in SUPPORTED_ENCODINGS:
+            compressed, compress_ms = timed(lambda: compress(body, coding))
+            row += f" {len(compressed) / 1024:>10.0f} {compress_ms:>7.1f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
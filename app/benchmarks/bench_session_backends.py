@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark per-operation latency of the session store backends.
+
+The SQLite store runs on a temporary database file in WAL mode. Writes are
+measured both one transaction per call and grouped with `batch()`. Pass a
+Redis URL to include the Redis backend; its keys use a throwaway prefix.
+
+Usage:
+    python app/benchmarks/bench_session_backends.py [redis://host:6379/0]
+"""
+
+import sys
+import time
+import uuid
+import shutil
+import tempfile
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from storage.session_store import SessionStore
+from storage.sqlite_store import SQLiteSessionStore
+from storage.redis_store import RedisSessionStore
+
+IMAGES = 200
+ANNOTATIONS_PER_IMAGE = 20
+
+
+def timed(fn, count: int) -> float:
+    """Run fn and return the average cost per operation in microseconds"""
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(store, batched: bool) -> dict:
+    session_id = "bench-session"
+    image_ids = []
+
+    def add_images():
+        for i in range(IMAGES):
+            image = store.add_image(session_id, f"tile_{i}.png", f"uploads/{i}.png")
+            image_ids.append(image.image_id)
+
+    def add_annotations():
+        for i, image_id in enumerate(image_ids):
+            for j in range(ANNOTATIONS_PER_IMAGE):
+                store.add_annotation(session_id, image_id, f"annotations/{i}_{j}")
+
+    def add_annotations_batched():
+        with store.batch():
+            add_annotations()
+
+    def list_annotations():
+        for image_id in image_ids:
+            store.get_annotations(session_id, image_id)
+
+    def get_images():
+        for image_id in image_ids:
+            store.get_image(session_id, image_id)
+
+    def summaries():
+        for _ in range(IMAGES):
+            store.get_session_summary(session_id)
+
+    total = IMAGES * ANNOTATIONS_PER_IMAGE
+    return {
+        "add_image": timed(add_images, IMAGES),
+        "add_annotation": timed(
+            add_annotations_batched if batched else add_annotations, total
+        ),
+        "get_image": timed(get_images, IMAGES),
+        "list_per_image": timed(list_annotations, IMAGES),
+        "summary": timed(summaries, IMAGES),
+    }
+
+
+def main():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        results = {"memory": run(SessionStore(), batched=False)}
+        for batched in (False, True):
+            store = SQLiteSessionStore(f"{temp_dir}/bench_{batched}.db")
+            name = "sqlite (batch)" if batched else "sqlite"
+            results[name] = run(store, batched)
+            store.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+    if len(sys.argv) > 1:
+        for batched in (False, True):
+            store = RedisSessionStore(sys.argv[1], prefix=f"bench:{uuid.uuid4()}:")
+            name = "redis (batch)" if batched else "redis"
+            try:
+                results[name] = run(store, batched)
+            finally:
+                store.delete_session("bench-session")
+                store.close()
+
+    ops = list(results["memory"])
+    print(f"{'Operation (us)':<16}" + "".join(f"{name:>16}" for name in results))
+    print("-" * (16 + 16 * len(results)))
+    for op in ops:
+        print(f"{op:<16}" + "".join(f"{r[op]:>16.1f}" for r in results.values()))
+
+
+if __name__ == "__main__":
+    main()
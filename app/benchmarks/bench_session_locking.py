@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark SessionStore write throughput with threads working on separate
+sessions, using striped locks and a single lock shared by every session.
+
+Each thread plays one user annotating their own session, like sync route
+handlers running in the threadpool.
+
+Usage:
+    python app/benchmarks/bench_session_locking.py
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from storage.session_store import SessionStore, LOCK_STRIPES
+
+THREADS = [1, 2, 4, 8, 16]
+WRITES_PER_THREAD = 5_000
+
+
+def run(stripes: int, threads: int) -> float:
+    """Annotations added per second across all threads"""
+    store = SessionStore(stripes=stripes)
+    image_ids = [
+        store.add_image(f"session-{i}", "a.png", "uploads/a.png").image_id
+        for i in range(threads)
+    ]
+
+    def worker(i):
+        session_id = f"session-{i}"
+        for j in range(WRITES_PER_THREAD):
+            store.add_annotation(session_id, image_ids[i], f"annotations/{j}.json")
+            if j % 10 == 0:
+                store.get_annotations(session_id, image_ids[i])
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return threads * WRITES_PER_THREAD / (time.perf_counter() - start)
+
+
+def main():
+    print(
+        f"{'Threads':>8} {'1 lock (ops/s)':>16} {f'{LOCK_STRIPES} stripes (ops/s)':>22}"
+    )
+    print("-" * 48)
+    for threads in THREADS:
+        single = run(1, threads)
+        striped = run(LOCK_STRIPES, threads)
+        print(f"{threads:>8} {single:>16,.0f} {striped:>22,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark SessionStore annotation listing and image deletion as sessions grow.
+
+Every session has images with a fixed number of annotations each; only the
+number of images grows. Listing one image's annotations and deleting one
+image should cost the same regardless of the session size.
+
+Usage:
+    python app/benchmarks/bench_session_store.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from storage.session_store import SessionStore
+
+SESSION_SIZES = [1_000, 10_000, 100_000]  # Total annotations per session
+ANNOTATIONS_PER_IMAGE = 20
+REPEAT = 200
+
+
+def build_store(total_annotations: int):
+    store = SessionStore()
+    session_id = "bench-session"
+    image_ids = []
+    for i in range(total_annotations // ANNOTATIONS_PER_IMAGE):
+        image = store.add_image(session_id, f"tile_{i}.png", f"uploads/tile_{i}.png")
+        image_ids.append(image.image_id)
+        for j in range(ANNOTATIONS_PER_IMAGE):
+            store.add_annotation(
+                session_id, image.image_id, f"annotations/{i}_{j}.json"
+            )
+    return store, session_id, image_ids
+
+
+def main():
+    print(f"{'Annotations':>12} {'list (us)':>10} {'remove_image (us)':>18}")
+    print("-" * 42)
+    for size in SESSION_SIZES:
+        store, session_id, image_ids = build_store(size)
+
+        start = time.perf_counter()
+        for i in range(REPEAT):
+            store.get_annotations(session_id, image_ids[i % len(image_ids)])
+        list_cost = (time.perf_counter() - start) / REPEAT
+
+        start = time.perf_counter()
+        for image_id in image_ids[:REPEAT]:
+            store.remove_image(session_id, image_id)
+        remove_cost = (time.perf_counter() - start) / min(REPEAT, len(image_ids))
+
+        print(f"{size:>12} {list_cost * 1e6:>10.1f} {remove_cost * 1e6:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
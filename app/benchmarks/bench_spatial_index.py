@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark viewport queries and point hit-tests on a densely annotated
+20000x20000 scene, scanning every annotation against the spatial index.
+
+Also reports the time to build an image's index, to re-index one edited
+annotation, and how much of the annotation JSON a viewport needs.
+
+Usage:
+    python app/benchmarks/bench_spatial_index.py
+"""
+
+import sys
+import json
+import math
+import time
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+from utils.spatial_index import AnnotationIndex, contains_point, document_box
+
+SCENE = 20000  # Pixels per side
+VIEWPORT = (1920, 1080)
+ANNOTATION_COUNTS = [1000, 10000, 50000]
+QUERIES = 200
+# Queries answered by scanning every annotation (much slower)
+SCAN_QUERIES = 5
+
+
+def document(rng: random.Random) -> dict:
+    """A building-sized manual annotation with a 12-vertex polygon"""
+    cx, cy = rng.random(), rng.random()
+    radius = rng.uniform(10, 40) / SCENE
+    ring = [
+        [
+            cx + radius * math.cos(a * math.pi / 6),
+            cy + radius * math.sin(a * math.pi / 6),
+        ]
+        for a in range(12)
+    ]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "building"},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ],
+    }
+
+
+def intersects(a, b) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def timed(run, queries) -> float:
+    """Milliseconds per call of `run` on each of `queries`"""
+    start = time.perf_counter()
+    for query in queries:
+        run(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    rng = random.Random(0)
+    width, height = VIEWPORT[0] / SCENE, VIEWPORT[1] / SCENE
+    print(f"{SCENE}x{SCENE} scene, {VIEWPORT[0]}x{VIEWPORT[1]} viewport")
+    print(
+        f"{'Annotations':>11} {'build (ms)':>11} {'edit (ms)':>10} "
+        f"{'view scan':>10} {'view index':>11} {'hit scan':>9} {'hit index':>10} "
+        f"{'payload':>8}"
+    )
+    print("-" * 87)
+    for count in ANNOTATION_COUNTS:
+        items = [
+            (SimpleNamespace(annotation_id=f"a{i}"), document(rng))
+            for i in range(count)
+        ]
+        index = AnnotationIndex()
+        start = time.perf_counter()
+        index.sync(items)
+        build = (time.perf_counter() - start) * 1000
+
+        # Replace one annotation's document, as an edit does
+        edited = list(items)
+        edited[count // 2] = (edited[count // 2][0], document(rng))
+        start = time.perf_counter()
+        index.sync(edited)
+        edit = (time.perf_counter() - start) * 1000
+
+        viewports = []
+        for _ in range(QUERIES):
+            x, y = rng.uniform(0, 1 - width), rng.uniform(0, 1 - height)
+            viewports.append((x, y, x + width, y + height))
+        points = [(rng.random(), rng.random()) for _ in range(QUERIES)]
+
+        def view_scan(box):
+            return [d for _, d in edited if intersects(document_box(d), box)]
+
+        def hit_scan(point):
+            return [d for _, d in reversed(edited) if contains_point(d, *point)]
+
+        view_scan_ms = timed(view_scan, viewports[:SCAN_QUERIES])
+        view_index_ms = timed(index.query, viewports)
+        hit_scan_ms = timed(hit_scan, points[:SCAN_QUERIES])
+        hit_index_ms = timed(lambda point: index.hit(*point), points)
+
+        visible = sum(
+            len(json.dumps(d)) for box in viewports for _, d in index.query(box)
+        ) / len(viewports)
+        total = sum(len(json.dumps(d)) for _, d in edited)
+        print(
+            f"{count:>11} {build:>11.1f} {edit:>10.2f} {view_scan_ms:>10.2f} "
+            f"{view_index_ms:>11.3f} {hit_scan_ms:>9.2f} {hit_index_ms:>10.3f} "
+            f"{visible / total:>8.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
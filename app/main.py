@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from pathlib import Path
 import os
 import sys
@@ -19,12 +21,20 @@ if app_dir not in sys.path:
 try:
     # For uvicorn from root directory
     from app.routers import session_images, session_segmentation
+    from app.utils.compression import CompressionMiddleware
+    from app.utils.http_cache import ImmutableStaticFiles
+    from app.utils.session_sweeper import SessionActivityMiddleware
+    from app.storage.session_manager import SESSION_COOKIE_NAME
 
     logger.info("Using app.routers imports")
 except ImportError:
     try:
         # For running directly from app directory
         from routers import session_images, session_segmentation
+        from utils.compression import CompressionMiddleware
+        from utils.http_cache import ImmutableStaticFiles
+        from utils.session_sweeper import SessionActivityMiddleware
+        from storage.session_manager import SESSION_COOKIE_NAME
 
         logger.info("Using direct routers imports")
     except ImportError as e:
@@ -32,6 +42,10 @@ except ImportError:
         # Final fallback - try with explicit path manipulation
         sys.path.insert(0, os.path.dirname(app_dir))
         from app.routers import session_images, session_segmentation
+        from app.utils.compression import CompressionMiddleware
+        from app.utils.http_cache import ImmutableStaticFiles
+        from app.utils.session_sweeper import SessionActivityMiddleware
+        from app.storage.session_manager import SESSION_COOKIE_NAME
 
         logger.info("Using fallback app.routers imports")
 
@@ -52,7 +66,20 @@ annotations_dir.mkdir(exist_ok=True)
 # Define frontend directory for static files (if available)
 frontend_dir = base_path / "web"
 
-app = FastAPI(title="Satellite Image Annotation Tool")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Replay the annotation geometry log before serving, off the event loop
+    await run_in_threadpool(session_segmentation.geometry_store.load)
+    # Expire idle sessions in the background while the app is running
+    session_segmentation.session_sweeper.start()
+    yield
+    await session_segmentation.session_sweeper.stop()
+    # Write annotation geometry still waiting in memory
+    session_segmentation.geometry_store.close()
+
+
+app = FastAPI(title="Satellite Image Annotation Tool", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -61,8 +88,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Mask-Classes"],
 )
 
+# Track last access per session so the sweeper can expire idle ones
+app.add_middleware(
+    SessionActivityMiddleware,
+    sweeper=session_segmentation.session_sweeper,
+    cookie_name=SESSION_COOKIE_NAME,
+)
+
+# Compress large JSON bodies with brotli or gzip, as the client accepts
+app.add_middleware(CompressionMiddleware)
+
 
 # Health check endpoint for Docker container orchestration
 @app.get("/health")
@@ -74,8 +112,8 @@ def health_check():
 app.include_router(session_images.router, prefix="/api", tags=["images"])
 app.include_router(session_segmentation.router, prefix="/api", tags=["segmentation"])
 
-# Mount the uploads directory for static file serving
-app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
+# Mount the uploads directory for static file serving (immutable, range capable)
+app.mount("/uploads", ImmutableStaticFiles(directory=str(uploads_dir)), name="uploads")
 
 # Mount frontend if the web directory exists
 if frontend_dir.exists() and (frontend_dir / "index.html").exists():
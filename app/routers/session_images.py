@@ -1,14 +1,154 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
-from app.utils.image_processing import save_upload_file, validate_image_file
-from app.schemas.session_schemas import UploadResponse, Image
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    UploadFile,
+    File,
+    Form,
+    HTTPException,
+    Depends,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.utils.http_cache import (
+    make_etag,
+    etag_matches,
+    not_modified,
+    set_cache_headers,
+)
+from app.utils.image_processing import (
+    save_upload_file,
+    save_upload_files,
+    ingest_saved_file,
+    validate_image_file,
+    is_supported_image_name,
+    SESSION_QUOTA_BYTES,
+)
+from app.utils.chunked_upload import (
+    chunked_uploads,
+    ChunkedUpload,
+    ChunkedUploadError,
+    OffsetMismatchError,
+    QuotaExceededError,
+    DEFAULT_CHUNK_SIZE,
+)
+from app.schemas.session_schemas import (
+    UploadResponse,
+    Image,
+    BulkUploadItem,
+    BulkUploadResponse,
+    ChunkedUploadCreate,
+    ChunkedUploadStatus,
+)
 from app.storage.session_manager import get_session_manager, SessionManager
-from app.storage.session_store import session_store
-from typing import List
+from app.storage.session_store import session_store, SessionImage
+from app.storage.geometry_store import geometry_store
+from app.storage.annotation_journal import annotation_journal
+from app.utils.mask_cache import mask_cache
+from app.utils.spatial_index import spatial_index
+from app.utils.geometry_lod import lod_cache
+from app.utils.vector_tiles import tile_cache
+from app.utils.json_response import FastJSONResponse
+from app.routers.session_segmentation import (
+    segmenter,
+    construct_image_path,
+    session_sweeper,
+    load_annotation_data,
+)
+from typing import List, Optional
 import os
 import logging
 
 router = APIRouter()
 
+# Largest page GET /api/images/ returns
+MAX_PAGE_SIZE = 1000
+# Fields GET /api/images/ can be narrowed to with `fields=`
+IMAGE_LIST_FIELDS = (*Image.model_fields, "annotation_count")
+
+
+def quota_remaining(session_id: str) -> float:
+    """
+    Bytes the session may still store, unlimited when quotas are off.
+
+    Chunks already received by unfinished chunked uploads count too.
+    """
+    if not SESSION_QUOTA_BYTES:
+        return float("inf")
+    return (
+        SESSION_QUOTA_BYTES
+        - session_store.get_session_usage(session_id)
+        - chunked_uploads.session_usage(session_id)
+    )
+
+
+def quota_exceeded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Session disk quota of {SESSION_QUOTA_BYTES // 1024**2} MiB exceeded",
+    )
+
+
+def discard_ingested_file(file_info: dict) -> None:
+    """Delete the files of an ingested upload that will not be registered"""
+    for stored_path in (file_info["path"], file_info.get("sam_path")):
+        if stored_path:
+            try:
+                os.remove(construct_image_path(stored_path))
+            except FileNotFoundError:
+                pass
+
+
+def add_uploaded_image(
+    session_id: str, file_info: dict, remaining: Optional[float] = None
+) -> SessionImage:
+    """
+    Register an ingested file in the session store.
+
+    Files that do not fit in the session's disk quota (`remaining` bytes,
+    looked up when not given) are deleted and a 413 error is raised.
+    """
+    if remaining is None:
+        remaining = quota_remaining(session_id)
+    if file_info["stored_size"] > remaining:
+        discard_ingested_file(file_info)
+        raise quota_exceeded()
+
+    return session_store.add_image(
+        session_id=session_id,
+        file_name=file_info["original_filename"],
+        file_path=file_info["path"],
+        resolution=file_info["resolution"],
+        source="user_upload",
+        sam_path=file_info.get("sam_path"),
+        file_size=file_info["stored_size"],
+    )
+
+
+def to_image_schema(session_image: SessionImage) -> Image:
+    """Convert a stored SessionImage to the Image response model"""
+    return Image(
+        image_id=session_image.image_id,
+        file_name=session_image.file_name,
+        file_path=session_image.file_path,
+        resolution=session_image.resolution,
+        source=session_image.source,
+        capture_date=session_image.capture_date,
+        created_at=session_image.created_at,
+    )
+
+
+def precompute_embeddings(file_paths: List[str]) -> None:
+    """Generate SAM embeddings for freshly uploaded images, one at a time"""
+    for file_path in file_paths:
+        image_path = construct_image_path(file_path)
+        if not segmenter.preprocess_image(image_path):
+            logging.warning(f"Embedding precompute failed for {file_path}")
+
 
 @router.post("/upload-image/", response_model=UploadResponse)
 async def upload_image(
@@ -31,30 +171,21 @@ async def upload_image(
             detail="File type not supported. Please upload JPG, PNG, TIFF or GeoTIFF",
         )
 
+    # Refuse early when the declared size alone exceeds the quota
+    session_id = session_manager.session_id
+    if (file.size or 0) > await run_in_threadpool(quota_remaining, session_id):
+        raise quota_exceeded()
+
     # Process and save the file
     try:
         file_info = await save_upload_file(file)
 
-        # Save to session store
-        session_id = session_manager.session_id
-        session_image = session_store.add_image(
-            session_id=session_id,
-            file_name=file_info["original_filename"],
-            file_path=file_info["path"],
-            resolution=file_info["resolution"],
-            source="user_upload",
-        )
-        # Convert SessionImage to the expected Image pydantic model format
-        # Create an Image Pydantic model directly from the SessionImage attributes
-        image = Image(
-            image_id=session_image.image_id,
-            file_name=session_image.file_name,
-            file_path=session_image.file_path,
-            resolution=session_image.resolution,
-            source=session_image.source,
-            capture_date=session_image.capture_date,
-            created_at=session_image.created_at,
-        )  # Image uploaded successfully - ready for immediate preprocessing
+        # Save to session store, off the event loop as it may wait for a lock
+        session_image = await run_in_threadpool(
+            add_uploaded_image, session_id, file_info
+        )
+        image = to_image_schema(session_image)
+        # Image uploaded successfully - ready for immediate preprocessing
         logging.info(f"✓ Image uploaded successfully: {file_info['original_filename']}")
 
         return UploadResponse(
@@ -63,6 +194,8 @@ async def upload_image(
             image=image,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -70,16 +203,365 @@ async def upload_image(
         )
 
 
+@router.post("/upload-images/", response_model=BulkUploadResponse)
+async def upload_images(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    precompute: bool = Form(False),
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Upload many satellite images at once.
+
+    Accepts any mix of JPG, PNG, TIFF and GeoTIFF files and zip/tar archives
+    of them. Images are ingested in parallel and a result is returned per
+    file. With `precompute` set, SAM embeddings are generated in the
+    background for every uploaded image.
+    """
+    if not files:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="No files provided"
+        )
+
+    session_id = session_manager.session_id
+    # Looked up once and counted down, not re-read for every file
+    remaining = await run_in_threadpool(quota_remaining, session_id)
+    try:
+        # Files are refused before they are staged once the quota is used up
+        file_results = await save_upload_files(files, remaining)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error uploading files: {str(e)}",
+        )
+
+    results = []
+    uploaded_paths = []
+
+    def register(remaining: float) -> None:
+        # Register the whole batch in one store transaction
+        with session_store.batch():
+            for file_result in file_results:
+                file_info = file_result["file_info"]
+                if file_info is None:
+                    results.append(
+                        BulkUploadItem(
+                            file_name=file_result["original_filename"],
+                            success=False,
+                            error=file_result["error"],
+                        )
+                    )
+                    continue
+
+                try:
+                    session_image = add_uploaded_image(session_id, file_info, remaining)
+                except HTTPException as e:
+                    results.append(
+                        BulkUploadItem(
+                            file_name=file_info["original_filename"],
+                            success=False,
+                            error=e.detail,
+                        )
+                    )
+                    continue
+                remaining -= session_image.file_size
+                uploaded_paths.append(session_image.sam_path or session_image.file_path)
+                results.append(
+                    BulkUploadItem(
+                        file_name=file_info["original_filename"],
+                        success=True,
+                        image=to_image_schema(session_image),
+                    )
+                )
+
+    # The transaction may wait for other workers' writes
+    await run_in_threadpool(register, remaining)
+
+    if precompute and uploaded_paths:
+        background_tasks.add_task(precompute_embeddings, uploaded_paths)
+
+    failed = len(results) - len(uploaded_paths)
+    logging.info(f"✓ Bulk upload finished: {len(uploaded_paths)} ok, {failed} failed")
+
+    return BulkUploadResponse(
+        success=failed == 0,
+        message=f"Uploaded {len(uploaded_paths)} of {len(results)} files.",
+        uploaded=len(uploaded_paths),
+        failed=failed,
+        results=results,
+    )
+
+
+# Request bodies are appended to disk in pieces of this size
+CHUNK_WRITE_BUFFER = 1024 * 1024
+
+
+def _chunked_upload_status(upload: ChunkedUpload, offset: int) -> ChunkedUploadStatus:
+    return ChunkedUploadStatus(
+        upload_id=upload.upload_id,
+        file_name=upload.file_name,
+        offset=offset,
+        total_size=upload.total_size,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        complete=offset == upload.total_size,
+    )
+
+
+def _get_chunked_upload(upload_id: str, session_id: str) -> ChunkedUpload:
+    upload = chunked_uploads.get(upload_id, session_id)
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Upload with ID {upload_id} not found",
+        )
+    return upload
+
+
+@router.post("/uploads/", response_model=ChunkedUploadStatus)
+async def create_chunked_upload(
+    upload_data: ChunkedUploadCreate,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Start a resumable upload for a large image.
+
+    Send the file with `PUT /api/uploads/{upload_id}?offset=N` in chunks, then
+    call `POST /api/uploads/{upload_id}/complete`. If a chunk fails, ask for
+    the current offset with `GET /api/uploads/{upload_id}` and resume.
+    """
+    if upload_data.content_type not in (
+        "image/jpeg",
+        "image/png",
+        "image/tiff",
+        "image/geotiff",
+    ) and not is_supported_image_name(upload_data.file_name):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="File type not supported. Please upload JPG, PNG, TIFF or GeoTIFF",
+        )
+    remaining = await run_in_threadpool(quota_remaining, session_manager.session_id)
+    if upload_data.total_size > remaining:
+        raise quota_exceeded()
+
+    try:
+        upload = await run_in_threadpool(
+            chunked_uploads.create,
+            session_manager.session_id,
+            upload_data.file_name,
+            upload_data.total_size,
+            upload_data.content_type,
+            upload_data.sha256,
+        )
+    except ChunkedUploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return _chunked_upload_status(upload, 0)
+
+
+@router.get("/uploads/{upload_id}", response_model=ChunkedUploadStatus)
+def get_chunked_upload(
+    upload_id: str, session_manager: SessionManager = Depends(get_session_manager)
+):
+    """Get the progress of a resumable upload"""
+    upload = _get_chunked_upload(upload_id, session_manager.session_id)
+    return _chunked_upload_status(upload, upload.offset)
+
+
+@router.put("/uploads/{upload_id}", response_model=ChunkedUploadStatus)
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Append a chunk of raw bytes (the request body) at `offset`.
+
+    The offset must match the bytes already received, otherwise 409 is
+    returned with the expected offset in the detail. Received bytes count
+    toward the session's disk quota, so a chunk that does not fit is refused
+    with 413.
+    """
+    session_id = session_manager.session_id
+    upload = _get_chunked_upload(upload_id, session_id)
+
+    def write(position: int, data: bytes) -> int:
+        # Reserved first, so concurrent chunks of the session share the quota
+        with chunked_uploads.reserve(
+            session_id, len(data), lambda: quota_remaining(session_id)
+        ):
+            return chunked_uploads.write_chunk(upload, position, data)
+
+    # Write the body as it streams in instead of buffering the whole chunk
+    position = offset
+    buffer = bytearray()
+    try:
+        async for piece in request.stream():
+            buffer += piece
+            if len(buffer) >= CHUNK_WRITE_BUFFER:
+                position = await run_in_threadpool(write, position, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            position = await run_in_threadpool(write, position, bytes(buffer))
+    except OffsetMismatchError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "offset": e.expected},
+        )
+    except QuotaExceededError:
+        raise quota_exceeded()
+    except ChunkedUploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return _chunked_upload_status(upload, position)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadResponse)
+async def complete_chunked_upload(
+    upload_id: str, session_manager: SessionManager = Depends(get_session_manager)
+):
+    """Finish a resumable upload and ingest the file like a normal upload"""
+    session_id = session_manager.session_id
+    upload = _get_chunked_upload(upload_id, session_id)
+
+    try:
+        file_path = await run_in_threadpool(chunked_uploads.finalize, upload)
+    except ChunkedUploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        file_info = await ingest_saved_file(
+            file_path, upload.file_name, upload.content_type
+        )
+        session_image = await run_in_threadpool(
+            add_uploaded_image, session_id, file_info
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing upload: {str(e)}",
+        )
+
+    logging.info(f"✓ Resumable upload finished: {upload.file_name}")
+
+    return UploadResponse(
+        success=True,
+        message="File uploaded successfully. Ready for annotation.",
+        image=to_image_schema(session_image),
+    )
+
+
+@router.delete("/uploads/{upload_id}")
+def abort_chunked_upload(
+    upload_id: str, session_manager: SessionManager = Depends(get_session_manager)
+):
+    """Abort a resumable upload and discard the received data"""
+    upload = _get_chunked_upload(upload_id, session_manager.session_id)
+    chunked_uploads.abort(upload)
+    return {"success": True, "message": "Upload aborted"}
+
+
+def parse_image_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Validate a comma separated `fields=` projection"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in IMAGE_LIST_FIELDS]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields {unknown}, choose from {list(IMAGE_LIST_FIELDS)}",
+        )
+    return names
+
+
+def parse_image_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Turn an X-Next-Cursor value back into a store position"""
+    if not cursor:
+        return None
+    if not (cursor.isascii() and cursor.isdigit()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return int(cursor)
+
+
 @router.get("/images/", response_model=List[Image])
 def get_images(
+    request: Request,
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     session_manager: SessionManager = Depends(get_session_manager),
 ):
-    """Get list of uploaded images in the current session"""
+    """
+    Get list of uploaded images in the current session, in upload order.
+
+    When more images follow, the X-Next-Cursor header holds the `cursor` to
+    send for the next page; each page costs O(limit) however large the
+    session is. `fields` narrows the images to a comma separated list, e.g.
+    `image_id,file_name,annotation_count` for the sidebar. `skip` still
+    pages by offset, but costs O(skip).
+
+    Responses carry an ETag; send it back in If-None-Match to get a 304 when
+    nothing in the session changed.
+    """
     session_id = session_manager.session_id
-    images = session_store.get_images(session_id, skip=skip, limit=limit)
-    return images
+    projection = parse_image_fields(fields)
+    after = parse_image_cursor(cursor)
+
+    etag = make_etag(
+        "images",
+        session_id,
+        session_store.get_version(session_id),
+        skip,
+        limit,
+        cursor,
+        fields,
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    next_position = None
+    if skip and after is None:
+        images = session_store.get_images(session_id, skip=skip, limit=limit)
+    else:
+        images, next_position = session_store.get_images_page(
+            session_id, after=after, limit=limit
+        )
+
+    if projection is None:
+        set_cache_headers(response, etag)
+        if next_position is not None:
+            response.headers["X-Next-Cursor"] = str(next_position)
+        return [to_image_schema(image) for image in images]
+
+    # Projected rows skip response model validation
+    counts = {}
+    if "annotation_count" in projection:
+        counts = session_store.count_annotations(
+            session_id, [image.image_id for image in images]
+        )
+    rows = [
+        {
+            name: (
+                counts.get(image.image_id, 0)
+                if name == "annotation_count"
+                else getattr(image, name)
+            )
+            for name in projection
+        }
+        for image in images
+    ]
+    projected = JSONResponse(jsonable_encoder(rows))
+    set_cache_headers(projected, etag)
+    if next_position is not None:
+        projected.headers["X-Next-Cursor"] = str(next_position)
+    return projected
 
 
 @router.get("/images/{image_id}/", response_model=Image)
@@ -104,12 +586,14 @@ def get_image(
 
 
 @router.delete("/images/{image_id}", response_model=dict)
-async def delete_image(
+def delete_image(
     image_id: str, session_manager: SessionManager = Depends(get_session_manager)
 ):
     """
     Delete an image and its associated annotations.
     """
+    # A plain def, so FastAPI runs it in the threadpool: it deletes files and
+    # may wait for the session's journal held by a long geometry operation
     session_id = session_manager.session_id
 
     # Get the image from session store
@@ -119,18 +603,28 @@ async def delete_image(
 
     try:
         # Delete the image file if it exists
-        if os.path.exists(image.file_path):
-            os.remove(image.file_path)
+        for stored_path in (image.file_path, image.sam_path):
+            if stored_path and os.path.exists(construct_image_path(stored_path)):
+                os.remove(construct_image_path(stored_path))
 
-        # Delete all annotations associated with this image
+        # Delete all annotations associated with this image, which cannot be
+        # undone and takes their undo history with them
         annotations = session_store.get_annotations(session_id, image_id)
-        for annotation in annotations:
-            if os.path.exists(annotation.file_path):
-                os.remove(annotation.file_path)
-            session_store.remove_annotation(session_id, annotation.annotation_id)
+        with annotation_journal.group(session_id, undoable=False):
+            for annotation in annotations:
+                geometry_store.delete(session_id, annotation.annotation_id)
+                lod_cache.drop(session_id, annotation.annotation_id)
+                if os.path.exists(annotation.file_path):
+                    os.remove(annotation.file_path)
+                session_store.remove_annotation(session_id, annotation.annotation_id)
+                annotation_journal.record_delete(session_id, annotation.annotation_id)
 
         # Remove image from session store
         success = session_store.remove_image(session_id, image_id)
+        segmenter.clear_cache(construct_image_path(image.sam_path or image.file_path))
+        mask_cache.drop(session_id, image_id)
+        spatial_index.drop(session_id, image_id)
+        tile_cache.drop(session_id, image_id)
 
         if success:
             return {
@@ -150,15 +644,10 @@ async def delete_image(
 def get_session_info(session_manager: SessionManager = Depends(get_session_manager)):
     """Get information about the current session"""
     session_id = session_manager.session_id
-    session_data = session_store.get_session(session_id)
-
-    if session_data:
-        return {
-            "session_id": session_id,
-            "images_count": len(session_data.get("images", {})),
-            "annotations_count": len(session_data.get("annotations", {})),
-            "created_at": session_data.get("created_at"),
-        }
+    summary = session_store.get_session_summary(session_id)
+
+    if summary:
+        return {"session_id": session_id, **summary}
 
     return {
         "session_id": session_id,
@@ -173,14 +662,13 @@ def clear_session(session_manager: SessionManager = Depends(get_session_manager)
     """Clear the current session data"""
     session_id = session_manager.session_id
 
-    # Remove session from store
-    if session_id in session_store.sessions:
-        del session_store.sessions[session_id]
+    # Remove session from store along with its files and cached embeddings
+    reclaimed = session_sweeper.expire_session(session_id)
 
     # Clear the session cookie
     session_manager.clear_session()
 
-    return {"message": "Session cleared successfully"}
+    return {"message": "Session cleared successfully", **reclaimed}
 
 
 @router.post("/export-session/")
@@ -194,15 +682,28 @@ def export_session(session_manager: SessionManager = Depends(get_session_manager
             status_code=status.HTTP_404_NOT_FOUND, detail="No session data found"
         )
 
-    # Convert session data to a format suitable for export
+    # Convert session data to a format suitable for export, with the GeoJSON
+    # of each annotation (annotations saved before the geometry store existed
+    # are read from their file). Image records are serialized as they are.
+    annotations = list(session_data["annotations"].values())
+    documents = geometry_store.get_many(
+        session_id, [ann.annotation_id for ann in annotations]
+    )
     export_data = {
         "session_id": session_id,
-        "created_at": session_data["created_at"].isoformat(),
-        "images": [img.dict() for img in session_data["images"].values()],
-        "annotations": [ann.dict() for ann in session_data["annotations"].values()],
+        "created_at": session_data["created_at"],
+        "images": list(session_data["images"].values()),
+        "annotations": [
+            {
+                **ann.model_dump(),
+                "data": documents.get(ann.annotation_id)
+                or load_annotation_data(session_id, ann),
+            }
+            for ann in annotations
+        ],
     }
 
-    return export_data
+    return FastJSONResponse(export_data)
 
 
 @router.get("/session-id/")
@@ -219,8 +720,7 @@ def get_session_id_endpoint(
 @router.get("/validate-session/{session_id}/")
 def validate_session(session_id: str):
     """Validate if a session exists in the store"""
-    session_data = session_store.get_session(session_id)
-    if session_data:
+    if session_store.session_exists(session_id):
         return {"valid": True, "session_id": session_id}
     else:
         return {"valid": False, "session_id": None}
@@ -1,20 +1,101 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.responses import FileResponse
-from app.storage.session_manager import get_session_manager, SessionManager
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from app.storage.session_manager import (
+    get_session_manager,
+    SessionManager,
+    SESSION_TIMEOUT_DAYS,
+)
 from app.storage.session_store import session_store
+from app.storage.geometry_store import geometry_store
+from app.storage.annotation_journal import (
+    annotation_journal,
+    HistoryError,
+    HistoryExpiredError,
+)
+from app.storage.geometry_codec import (
+    COMPACT_ENCODING,
+    GEOMETRY_ENCODINGS,
+    encode_document,
+    encode_ring,
+)
 from app.utils.sam_model import SAMSegmenter
+from app.utils.session_sweeper import SessionSweeper
+from app.utils.image_processing import UPLOAD_DIR
+from app.utils.chunked_upload import chunked_uploads
+from app.utils.mask_cache import mask_cache, MASK_TYPES
+from app.utils.spatial_index import spatial_index
+from app.utils.geometry_lod import lod_cache, lod_level
+from app.utils.vector_tiles import (
+    MAX_OVERZOOM,
+    TILE_BUFFER,
+    TILE_EXTENT,
+    TILE_LAYER,
+    TILE_SIZE,
+    encode_tile,
+    max_zoom,
+    tile_bounds,
+    tile_cache,
+    tile_level,
+)
+from app.utils.annotation_edits import (
+    apply_vertex_ops,
+    edit_document,
+    first_feature,
+    get_revision,
+    outer_ring,
+    restore_document,
+)
+from app.utils.polygon_ops import (
+    MIN_PART_AREA,
+    dissolve_groups,
+    document_rings,
+    merge_polygons,
+    polygon_parts,
+    split_polygon,
+    subtract_polygons,
+    to_polygons,
+    to_rings,
+)
+from app.utils.annotation_export import (
+    prepare_annotations,
+    label_classes,
+    stream_coco,
+    stream_geojson,
+    stream_label_mask,
+)
+from app.utils.json_response import FastJSONResponse
+from app.utils.http_cache import (
+    make_etag,
+    etag_matches,
+    if_match_header_passes,
+    not_modified,
+    set_cache_headers,
+)
 from pydantic import BaseModel
 from typing import List, Optional
 import json
+import hashlib
+import uuid
 from pathlib import Path
 import os
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import cv2
+from PIL import Image as PILImage
 from app.schemas.session_schemas import (
     ManualAnnotationCreate,
     ManualAnnotationUpdate,
+    AnnotationPatch,
     AnnotationResponse,
+    BulkAnnotationRequest,
+    BulkAnnotationResult,
+    BulkAnnotationResponse,
+    AnnotationMerge,
+    AnnotationSubtract,
+    AnnotationSplit,
+    AnnotationDissolve,
+    GeometryOperationResponse,
 )
 
 # Set up logging
@@ -59,6 +140,289 @@ def construct_image_path(stored_path):
     return image_path
 
 
+# Directory holding the annotation JSON files
+if os.path.exists("/.dockerenv"):
+    ANNOTATION_DIR = Path("/app/annotations")
+else:
+    ANNOTATION_DIR = Path(
+        os.path.join(
+            os.path.dirname(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            ),
+            "annotations",
+        )
+    )
+
+
+def evict_session_images(session_id: str, images: list) -> None:
+    """Drop the SAM embeddings and masks cached for an expired session"""
+    for image in images:
+        segmenter.clear_cache(construct_image_path(image.sam_path or image.file_path))
+
+
+# Expires idle sessions and reclaims their files and cached embeddings, then
+# removes upload and annotation files that no session references
+session_sweeper = SessionSweeper(
+    session_store,
+    timeout=timedelta(days=SESSION_TIMEOUT_DAYS),
+    resolve_path=construct_image_path,
+    orphan_dirs={str(UPLOAD_DIR): None, str(ANNOTATION_DIR): (".json",)},
+)
+session_sweeper.add_listener(evict_session_images)
+
+
+def drop_session_geometry(session_id: str, images: list) -> None:
+    """Forget the annotation geometry, masks and indexes of an expired session"""
+    geometry_store.drop_session(session_id)
+    annotation_journal.drop(session_id)
+    mask_cache.drop(session_id)
+    spatial_index.drop(session_id)
+    lod_cache.drop(session_id)
+    tile_cache.drop(session_id)
+
+
+session_sweeper.add_listener(drop_session_geometry)
+
+
+def drop_session_uploads(session_id: str, images: list) -> None:
+    """Delete the unfinished chunked uploads of an expired session"""
+    chunked_uploads.drop_session(session_id)
+
+
+session_sweeper.add_listener(drop_session_uploads)
+# Chunked uploads abandoned by live sessions are deleted once they go stale
+session_sweeper.add_reaper(chunked_uploads.reap)
+
+
+def collect_orphan_geometry() -> None:
+    """Forget geometry and journals of sessions the store lost (e.g. on a restart)"""
+    for session_id in geometry_store.session_ids():
+        if not session_store.session_exists(session_id):
+            geometry_store.drop_session(session_id)
+    for session_id in annotation_journal.session_ids():
+        if not session_store.session_exists(session_id):
+            annotation_journal.drop(session_id)
+
+
+session_sweeper.add_orphan_collector(collect_orphan_geometry)
+
+
+def load_annotation_data(session_id: str, annotation) -> Optional[dict]:
+    """
+    Get an annotation's GeoJSON from the geometry store.
+
+    Annotations saved before the store existed only have their JSON file;
+    it is read once and moved into the store.
+    """
+    json_data = geometry_store.get(session_id, annotation.annotation_id)
+    if json_data is None and os.path.exists(annotation.file_path):
+        with open(annotation.file_path, "r") as f:
+            json_data = json.load(f)
+        geometry_store.put(session_id, annotation.annotation_id, json_data)
+    return json_data
+
+
+def annotation_etag(session_id: str, annotation_id: str, json_data: dict) -> str:
+    """Strong ETag of an annotation's current revision"""
+    return make_etag(
+        "annotation", session_id, annotation_id, get_revision(json_data), weak=False
+    )
+
+
+def manual_annotation_document(
+    polygon: list, label: str, type: str, source: str, holes: list = ()
+):
+    """GeoJSON document of a manual annotation"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {
+                    "label": label,
+                    "type": type,
+                    "source": source,
+                    "created": datetime.now().isoformat(),
+                },
+                "geometry": {"type": "Polygon", "coordinates": [polygon, *holes]},
+            }
+        ],
+    }
+
+
+def manual_annotation_path(session_id: str, image_id: str, annotation_id: str) -> str:
+    """Path a manual annotation is exported to"""
+    return str(ANNOTATION_DIR / f"manual_{session_id}_{image_id}_{annotation_id}.json")
+
+
+def edit_annotation(
+    session_id: str, annotation, change, if_match: Optional[str] = None
+) -> dict:
+    """
+    Replace an annotation's document with `change(document)` if the
+    If-Match precondition (a header value) holds for it, and return the
+    new one.
+
+    Check and replace are atomic within this worker; a failed precondition
+    raises 412 with the current ETag.
+    """
+    if load_annotation_data(session_id, annotation) is None:
+        raise HTTPException(status_code=404, detail="Annotation data not found")
+    previous = None
+
+    def checked_change(json_data):
+        nonlocal previous
+        etag = annotation_etag(session_id, annotation.annotation_id, json_data)
+        if not if_match_header_passes(if_match, etag):
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Annotation was changed by another edit",
+                headers={"ETag": etag},
+            )
+        try:
+            changed = change(json_data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        previous = json_data
+        return changed
+
+    json_data = geometry_store.update(
+        session_id, annotation.annotation_id, checked_change
+    )
+    if json_data is None:
+        raise HTTPException(status_code=404, detail="Annotation data not found")
+    annotation_journal.record_update(
+        session_id, annotation.annotation_id, previous, json_data
+    )
+    session_store.bump_version(session_id)
+    return json_data
+
+
+def remove_annotation(session_id: str, annotation) -> bool:
+    """
+    Delete an annotation's geometry, the file of annotations saved before
+    the geometry store existed, and its session store entry
+    """
+    geometry_store.delete(session_id, annotation.annotation_id)
+    lod_cache.drop(session_id, annotation.annotation_id)
+    if os.path.exists(annotation.file_path):
+        os.remove(annotation.file_path)
+        logger.info(f"Deleted annotation file: {annotation.file_path}")
+    removed = session_store.remove_annotation(session_id, annotation.annotation_id)
+    if removed:
+        annotation_journal.record_delete(session_id, annotation.annotation_id)
+    return removed
+
+
+def store_annotation_document(session_id: str, annotation, json_data: dict) -> None:
+    """Store a new annotation's GeoJSON and journal its creation"""
+    geometry_store.put(session_id, annotation.annotation_id, json_data)
+    annotation_journal.record_create(session_id, annotation, json_data)
+
+
+def annotation_item(
+    session_id: str,
+    annotation,
+    json_data: dict,
+    level: Optional[float] = None,
+    size: Optional[tuple] = None,
+    encoding: str = "json",
+) -> dict:
+    """
+    An annotation as listed by GET /api/annotations/{image_id}, with its
+    polygons simplified at `level` pixels of an image of `size` if given,
+    in the given geometry encoding
+    """
+    item = {
+        "annotation_id": annotation.annotation_id,
+        "created_at": annotation.created_at,
+        "auto_generated": annotation.auto_generated,
+        "data": json_data,
+        "etag": annotation_etag(session_id, annotation.annotation_id, json_data),
+    }
+    if level is not None:
+        item["data"] = lod_cache.get(
+            session_id, annotation.annotation_id, json_data, level, *size
+        )
+        item["simplified"] = level
+    if encoding == COMPACT_ENCODING:
+        item["data"] = encode_document(item["data"])
+    return item
+
+
+def get_annotation_index(session_id: str, image_id: str):
+    """The image's spatial annotation index, synced with the session"""
+    return spatial_index.get(
+        session_id,
+        image_id,
+        session_store.get_version(session_id),
+        lambda: get_annotation_documents(
+            session_id, session_store.get_annotations(session_id, image_id), True
+        ),
+    )
+
+
+def check_encoding(encoding: str) -> str:
+    """Validate an `encoding` query parameter"""
+    if encoding not in GEOMETRY_ENCODINGS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid encoding. Use one of: {', '.join(GEOMETRY_ENCODINGS)}",
+        )
+    return encoding
+
+
+def parse_bbox(bbox: str) -> tuple:
+    """Parse a `x0,y0,x1,y1` query parameter"""
+    try:
+        x0, y0, x1, y1 = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="bbox must be x0,y0,x1,y1 (normalized 0-1)"
+        )
+    return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+
+def get_annotation_documents(
+    session_id: str, annotations, with_annotations: bool = False
+) -> list:
+    """
+    (annotation_id, GeoJSON) of the given annotations that have data, or
+    (annotation, GeoJSON) with `with_annotations`
+    """
+    stored = geometry_store.get_many(
+        session_id, [ann.annotation_id for ann in annotations]
+    )
+    documents = []
+    for ann in annotations:
+        json_data = stored.get(ann.annotation_id)
+        if json_data is None:
+            json_data = load_annotation_data(session_id, ann)
+        if json_data is not None:
+            documents.append(
+                (ann if with_annotations else ann.annotation_id, json_data)
+            )
+    return documents
+
+
+def journal_state(session_id: str) -> dict:
+    """Every annotation of a session with its GeoJSON, as the journal snapshots them"""
+    return {
+        annotation.annotation_id: {
+            "image_id": annotation.image_id,
+            "file_path": annotation.file_path,
+            "auto_generated": annotation.auto_generated,
+            "document": json_data,
+        }
+        for annotation, json_data in get_annotation_documents(
+            session_id, session_store.get_annotations(session_id), True
+        )
+    }
+
+
+annotation_journal.set_state_source(journal_state)
+
+
 class PointPrompt(BaseModel):
     image_id: str
     x: float
@@ -67,7 +431,8 @@ class PointPrompt(BaseModel):
 
 class SegmentationResponse(BaseModel):
     success: bool
-    polygon: List[List[float]]
+    polygon: List[List[float]]  # Empty with ?encoding=compact
+    polygon_encoded: Optional[str] = None  # The polygon as a compact ring
     annotation_id: Optional[str] = None
     cached: bool = False
     processing_time: Optional[float] = None
@@ -84,12 +449,18 @@ class PreprocessResponse(BaseModel):
 
 @router.post("/segment/", response_model=SegmentationResponse)
 async def segment_from_point(
-    prompt: PointPrompt, session_manager: SessionManager = Depends(get_session_manager)
+    prompt: PointPrompt,
+    encoding: str = "json",
+    session_manager: SessionManager = Depends(get_session_manager),
 ):
-    """Generate segmentation from a point click with timeout handling"""
+    """
+    Generate segmentation from a point click with timeout handling. With
+    `encoding=compact` the polygon is sent as a compact ring instead.
+    """
     import asyncio
     import concurrent.futures
 
+    check_encoding(encoding)
     session_id = session_manager.session_id
 
     # Debug: log the received coordinates
@@ -97,7 +468,9 @@ async def segment_from_point(
         f"Received segmentation request: image_id={prompt.image_id}, x={prompt.x}, y={prompt.y}"
     )
 
-    image = session_store.get_image(session_id, prompt.image_id)
+    image = await run_in_threadpool(
+        session_store.get_image, session_id, prompt.image_id
+    )
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
@@ -125,7 +498,7 @@ async def segment_from_point(
 
         # Get the image path from the session store
         t1 = time.time()
-        stored_path = image.file_path
+        stored_path = image.sam_path or image.file_path
         image_path = construct_image_path(stored_path)
         timings["construct_image_path"] = time.time() - t1
 
@@ -214,32 +587,43 @@ async def segment_from_point(
                     detail="Segmentation timeout - image may still be processing...",
                 )
 
-        # Save JSON
-        t_save = time.time()
         annotation_path = (
             annotation_dir
             / f"annotation_{session_id}_{image.image_id}_{len(polygon)}.json"
         )
-        with open(annotation_path, "w") as f:
-            json.dump(
-                {
-                    "type": "Feature",
-                    "geometry": {"type": "Polygon", "coordinates": [polygon]},
-                    "properties": {"cached": is_cached},
-                },
-                f,
-            )
-        timings["save_json"] = time.time() - t_save
 
-        # Add annotation to session store
-        t_ann = time.time()
-        annotation = session_store.add_annotation(
-            session_id=session_id,
-            image_id=image.image_id,
-            file_path=str(annotation_path),
-            auto_generated=True,
-        )
-        timings["add_annotation"] = time.time() - t_ann
+        def store_segmentation():
+            with annotation_journal.group(session_id):
+                # Add annotation to session store, the path is where it is
+                # exported to
+                t_ann = time.time()
+                annotation = session_store.add_annotation(
+                    session_id=session_id,
+                    image_id=image.image_id,
+                    file_path=str(annotation_path),
+                    auto_generated=True,
+                )
+                timings["add_annotation"] = time.time() - t_ann
+
+                # Keep the GeoJSON in memory, it is written to disk in the
+                # background
+                t_save = time.time()
+                if annotation:
+                    store_annotation_document(
+                        session_id,
+                        annotation,
+                        {
+                            "type": "Feature",
+                            "geometry": {"type": "Polygon", "coordinates": [polygon]},
+                            "properties": {"cached": is_cached},
+                        },
+                    )
+                timings["save_json"] = time.time() - t_save
+            return annotation
+
+        # In a worker thread: a long geometry operation may hold the
+        # session's journal
+        annotation = await run_in_threadpool(store_segmentation)
 
         logger.info(
             f"Generated segmentation with {len(polygon)} points, cached: {is_cached}"
@@ -248,14 +632,23 @@ async def segment_from_point(
         logger.info(f"Total segmentation processing time: {total_processing_time:.3f}s")
         logger.info(f"Step timings: {timings}")
 
+        polygon_encoded = None
+        if encoding == COMPACT_ENCODING:
+            polygon_encoded = encode_ring(polygon)
+            if polygon_encoded is not None:
+                polygon = []
+
         # Optionally, include detailed timings in the response for debugging
-        return SegmentationResponse(
-            success=True,
-            polygon=polygon,
-            annotation_id=annotation.annotation_id if annotation else None,
-            cached=is_cached,
-            processing_time=total_processing_time,
-            timings={**timings, **seg_timings},
+        return FastJSONResponse(
+            SegmentationResponse(
+                success=True,
+                polygon=polygon,
+                polygon_encoded=polygon_encoded,
+                annotation_id=annotation.annotation_id if annotation else None,
+                cached=is_cached,
+                processing_time=total_processing_time,
+                timings={**timings, **seg_timings},
+            )
         )
 
     except HTTPException:
@@ -269,63 +662,381 @@ async def segment_from_point(
 
 
 @router.get("/masks/{session_id}/{image_id}/{mask_type}")
-async def get_mask_image(session_id: str, image_id: str, mask_type: str):
-    """Serve mask or overlay image for download or display."""
-    if mask_type not in ["mask", "overlay"]:
+def get_mask_image(session_id: str, image_id: str, mask_type: str, request: Request):
+    """
+    Serve an image's label mask or overlay as a PNG.
+
+    Both are rendered from the session's annotations on first request and
+    kept in memory; later edits only repaint the regions they touch. The
+    ETag changes with the session, so clients get a 304 while nothing
+    changed. Mask pixels are class ids, listed in the X-Mask-Classes header.
+    """
+    if mask_type not in MASK_TYPES:
         raise HTTPException(
             status_code=400, detail="Invalid mask_type. Use 'mask' or 'overlay'."
         )
-    mask_path = Path(f"/app/annotations/{mask_type}_{session_id}_{image_id}.png")
-    if not mask_path.exists():
-        raise HTTPException(status_code=404, detail=f"{mask_type} image not found")
-    return FileResponse(
-        mask_path,
+    image = session_store.get_image(session_id, image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = make_etag(
+        "masks", session_id, session_store.get_version(session_id), image_id, mask_type
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    annotations = session_store.get_annotations(session_id, image_id)
+    documents = get_annotation_documents(session_id, annotations)
+
+    def render():
+        width, height = get_image_size(image)
+        polygons = prepare_annotations(documents, width, height)
+
+        def load_image():
+            path = construct_image_path(image.file_path)
+            pixels = cv2.imread(path, cv2.IMREAD_COLOR)
+            if pixels is None:
+                raise ValueError(f"Could not read image at {path}")
+            if pixels.shape[:2] != (height, width):
+                pixels = cv2.resize(pixels, (width, height))
+            return pixels
+
+        return mask_cache.render(
+            session_id, image_id, polygons, width, height, mask_type, load_image
+        )
+
+    try:
+        png, classes = render()
+    except (OSError, ValueError) as e:
+        logger.error(f"Error rendering {mask_type} for image {image_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error rendering {mask_type}: {str(e)}",
+        )
+
+    response = Response(
+        png,
         media_type="image/png",
-        filename=f"{mask_type}_{session_id}_{image_id}.png",
+        headers={
+            "Content-Disposition": (
+                f'inline; filename="{mask_type}_{session_id}_{image_id}.png"'
+            ),
+            "X-Mask-Classes": json.dumps(classes),
+        },
     )
+    set_cache_headers(response, etag)
+    return response
 
 
 @router.get("/annotations/{image_id}")
-async def get_image_annotations(
-    image_id: str, session_manager: SessionManager = Depends(get_session_manager)
+def get_image_annotations(
+    image_id: str,
+    request: Request,
+    bbox: Optional[str] = None,
+    zoom: Optional[float] = None,
+    tolerance: Optional[float] = None,
+    encoding: str = "json",
+    session_manager: SessionManager = Depends(get_session_manager),
 ):
-    """Get all annotations for a specific image"""
+    """
+    Get all annotations for a specific image, or with `bbox=x0,y0,x1,y1`
+    (normalized 0-1) only those whose bounding boxes overlap the viewport.
+
+    With `zoom` (screen pixels per image pixel) or `tolerance` (image
+    pixels), polygons are simplified at the coarsest precomputed level
+    that stays within half a screen pixel (or the tolerance). With
+    `encoding=compact` polygon rings are sent as compact strings.
+
+    Responses carry an ETag; send it back in If-None-Match to get a 304 when
+    nothing in the session changed.
+    """
     session_id = session_manager.session_id
     image = session_store.get_image(session_id, image_id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
-    annotations = session_store.get_annotations(session_id, image_id)
+    viewport = parse_bbox(bbox) if bbox else None
+    level = lod_level(zoom, tolerance)
+    check_encoding(encoding)
+    etag = make_etag(
+        "annotations",
+        session_id,
+        session_store.get_version(session_id),
+        image_id,
+        viewport,
+        level,
+        encoding,
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
 
-    result = []
-    for ann in annotations:
-        try:
-            file_path = ann.file_path
-            if os.path.exists(file_path):
-                with open(file_path, "r") as f:
-                    json_data = json.load(f)  # DEBUG: Log what we're loading
-                if json_data.get("features") and len(json_data["features"]) > 0:
-                    feature = json_data["features"][0]
-                    if feature.get("geometry", {}).get("coordinates"):
-                        coords = feature["geometry"]["coordinates"]
-
-                result.append(
-                    {
-                        "annotation_id": ann.annotation_id,
-                        "created_at": ann.created_at,
-                        "auto_generated": ann.auto_generated,
-                        "data": json_data,
-                    }
+    if viewport is not None:
+        pairs = get_annotation_index(session_id, image_id).query(viewport)
+    else:
+        annotations = session_store.get_annotations(session_id, image_id)
+        documents = geometry_store.get_many(
+            session_id, [ann.annotation_id for ann in annotations]
+        )
+        pairs = []
+        for ann in annotations:
+            try:
+                json_data = documents.get(ann.annotation_id)
+                if json_data is None:
+                    json_data = load_annotation_data(session_id, ann)
+                if json_data is not None:
+                    pairs.append((ann, json_data))
+            except Exception as e:
+                logger.error(f"Error loading annotation {ann.annotation_id}: {e}")
+                continue
+
+    size = get_image_size(image) if level is not None else None
+    response = FastJSONResponse(
+        [
+            annotation_item(session_id, ann, data, level, size, encoding)
+            for ann, data in pairs
+        ]
+    )
+    set_cache_headers(response, etag)
+    return response
+
+
+@router.get("/annotations/{image_id}/hit")
+def hit_test_annotations(
+    image_id: str,
+    x: float,
+    y: float,
+    encoding: str = "json",
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Get the annotations whose polygons contain the point (x, y), normalized
+    0-1, topmost (last drawn) first.
+    """
+    check_encoding(encoding)
+    session_id = session_manager.session_id
+    if not session_store.get_image(session_id, image_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    index = get_annotation_index(session_id, image_id)
+    return FastJSONResponse(
+        [
+            annotation_item(session_id, annotation, json_data, encoding=encoding)
+            for annotation, json_data in index.hit(x, y)
+        ]
+    )
+
+
+@router.get("/annotations/{image_id}/tiles.json")
+def get_annotation_tilejson(
+    image_id: str,
+    request: Request,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """TileJSON describing an image's annotation vector tiles"""
+    session_id = session_manager.session_id
+    image = session_store.get_image(session_id, image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        width, height = get_image_size(image)
+    except (OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Could not read image size: {str(e)}",
+        )
+
+    url = str(request.url_for("get_annotation_tile", image_id=image_id, z=0, x=0, y=0))
+    return {
+        "tilejson": "3.0.0",
+        "tiles": [url.replace("/0/0/0.mvt", "/{z}/{x}/{y}.mvt")],
+        "minzoom": 0,
+        "maxzoom": max_zoom(width, height) + MAX_OVERZOOM,
+        "tile_size": TILE_SIZE,
+        "extent": TILE_EXTENT,
+        "width": width,
+        "height": height,
+        "native_zoom": max_zoom(width, height),
+        "vector_layers": [
+            {
+                "id": TILE_LAYER,
+                "fields": {
+                    "annotation_id": "String",
+                    "auto_generated": "Boolean",
+                    "label": "String",
+                },
+            }
+        ],
+    }
+
+
+@router.get("/annotations/{image_id}/tiles/{z}/{x}/{y}.mvt")
+def get_annotation_tile(
+    image_id: str,
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Get a Mapbox Vector Tile of an image's annotations, in image pixels.
+
+    Zoom 0 is one tile over the whole image and each zoom halves the tile
+    span, down to one image pixel per screen pixel (and MAX_OVERZOOM levels
+    past it). Polygons are simplified to half a screen pixel at the tile's
+    zoom and clipped to the tile. Encoded tiles are cached until one of
+    their annotations changes; the ETag follows the tile's content.
+    """
+    session_id = session_manager.session_id
+    image = session_store.get_image(session_id, image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        width, height = get_image_size(image)
+    except (OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Could not read image size: {str(e)}",
+        )
+    try:
+        bounds = tile_bounds(z, x, y, width, height)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    level = tile_level(z, width, height)
+    pad = (bounds[2] - bounds[0]) * TILE_BUFFER / TILE_EXTENT
+    box = (
+        (bounds[0] - pad) / width,
+        (bounds[1] - pad) / height,
+        (bounds[2] + pad) / width,
+        (bounds[3] + pad) / height,
+    )
+    version = session_store.get_version(session_id)
+
+    def query():
+        return get_annotation_index(session_id, image_id).query(box)
+
+    def encode(pairs):
+        items = []
+        for annotation, json_data in pairs:
+            if level is not None:
+                json_data = lod_cache.get(
+                    session_id,
+                    annotation.annotation_id,
+                    json_data,
+                    level,
+                    width,
+                    height,
                 )
-        except Exception as e:
-            logger.error(f"Error loading annotation {ann.annotation_id}: {e}")
-            continue
+            properties = {
+                "annotation_id": annotation.annotation_id,
+                "auto_generated": annotation.auto_generated,
+            }
+            items.append((properties, json_data))
+        return encode_tile(items, bounds, width, height)
+
+    tile = tile_cache.get(session_id, image_id, (z, x, y), version, query, encode)
+    etag = make_etag(
+        "tile", image_id, z, x, y, hashlib.blake2b(tile, digest_size=12).hexdigest()
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response = Response(tile, media_type="application/vnd.mapbox-vector-tile")
+    set_cache_headers(response, etag)
+    return response
+
+
+# format -> (media type, download file suffix); `json` is kept for the frontend
+EXPORT_FORMATS = {
+    "geojson": ("application/geo+json", "geojson"),
+    "json": ("application/geo+json", "geojson"),
+    "coco": ("application/json", "coco.json"),
+    "mask": ("image/png", "mask.png"),
+}
+
+
+def get_image_size(image) -> tuple:
+    """(width, height) of an image, from its resolution or its file header"""
+    if image.resolution and "x" in image.resolution:
+        width, height = image.resolution.split("x", 1)
+        return int(width), int(height)
+    with PILImage.open(construct_image_path(image.file_path)) as img:
+        return img.width, img.height
+
+
+@router.get("/annotations/{image_id}/export")
+def export_image_annotations(
+    image_id: str,
+    request: Request,
+    format: str = "geojson",
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Export an image's annotations as a download.
+
+    `format` is `geojson` (a FeatureCollection with normalized coordinates),
+    `coco` (COCO instances with RLE segmentations) or `mask` (a PNG whose
+    pixels are class ids, listed in the X-Mask-Classes header). The body is
+    streamed while it is generated, in a worker thread.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}",
+        )
+    media_type, suffix = EXPORT_FORMATS[format]
 
-    return result
+    session_id = session_manager.session_id
+    image = session_store.get_image(session_id, image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = make_etag(
+        "export", session_id, session_store.get_version(session_id), image_id, format
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    annotations = session_store.get_annotations(session_id, image_id)
+    documents = get_annotation_documents(session_id, annotations)
+
+    try:
+        width, height = get_image_size(image)
+    except (OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Could not read image size: {str(e)}",
+        )
+    image_info = {"file_name": image.file_name, "width": width, "height": height}
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="annotations_{image_id}.{suffix}"'
+    }
+    if format in ("geojson", "json"):
+        details = {
+            ann.annotation_id: {
+                "image_id": image_id,
+                "auto_generated": ann.auto_generated,
+                "created_at": ann.created_at.isoformat(),
+            }
+            for ann in annotations
+        }
+        body = stream_geojson(image_info, documents, details)
+    else:
+        polygons = prepare_annotations(documents, width, height)
+        if format == "coco":
+            body = stream_coco(image_info, polygons)
+        else:
+            headers["X-Mask-Classes"] = json.dumps(label_classes(polygons))
+            body = stream_label_mask(polygons, width, height)
+
+    response = StreamingResponse(body, media_type=media_type, headers=headers)
+    set_cache_headers(response, etag)
+    return response
 
 
 @router.post("/clear-cache/{image_id}")
-async def clear_image_cache(
+def clear_image_cache(
     image_id: str, session_manager: SessionManager = Depends(get_session_manager)
 ):
     """Clear the segmentation cache for a specific image"""
@@ -336,7 +1047,7 @@ async def clear_image_cache(
         raise HTTPException(status_code=404, detail="Image not found")
 
     # Use unified path construction
-    image_path = construct_image_path(image.file_path)
+    image_path = construct_image_path(image.sam_path or image.file_path)
 
     segmenter.clear_cache(image_path)
 
@@ -344,7 +1055,7 @@ async def clear_image_cache(
 
 
 @router.post("/annotations/", response_model=AnnotationResponse)
-async def save_manual_annotation(
+def save_manual_annotation(
     annotation_data: ManualAnnotationCreate,
     session_manager: SessionManager = Depends(get_session_manager),
 ):
@@ -357,54 +1068,27 @@ async def save_manual_annotation(
         raise HTTPException(status_code=404, detail="Image not found")
 
     try:
-        # Define annotation directory
-        in_docker = os.path.exists("/.dockerenv")
-        if in_docker:
-            annotation_dir = Path("/app/annotations")
-        else:
-            base_dir = os.path.dirname(
-                os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            )
-            annotation_dir = Path(os.path.join(base_dir, "annotations"))
-        annotation_dir.mkdir(exist_ok=True)
-
         # Create JSON format for the annotation
-        json_data = {
-            "type": "FeatureCollection",
-            "features": [
-                {
-                    "type": "Feature",
-                    "properties": {
-                        "label": annotation_data.label,
-                        "type": annotation_data.type,
-                        "source": annotation_data.source,
-                        "created": datetime.now().isoformat(),
-                    },
-                    "geometry": {
-                        "type": "Polygon",
-                        "coordinates": [
-                            annotation_data.polygon
-                        ],  # Fix: Direct polygon array, not nested
-                    },
-                }
-            ],
-        }
-        # Save annotation file
-        annotation_path = (
-            annotation_dir
-            / f"manual_{session_id}_{annotation_data.image_id}_{annotation_data.id}.json"
+        json_data = manual_annotation_document(
+            annotation_data.polygon,
+            annotation_data.label,
+            annotation_data.type,
+            annotation_data.source,
         )
-        with open(annotation_path, "w") as f:
-            json.dump(json_data, f, indent=2)
 
-        # Add annotation to session store
-        annotation = session_store.add_annotation(
-            session_id,
-            annotation_data.image_id,
-            annotation_id=annotation_data.id,
-            file_path=str(annotation_path),
-            auto_generated=False,
-        )
+        # Add annotation to session store and its GeoJSON to the geometry store
+        with annotation_journal.group(session_id):
+            annotation = session_store.add_annotation(
+                session_id,
+                annotation_data.image_id,
+                annotation_id=annotation_data.id,
+                file_path=manual_annotation_path(
+                    session_id, annotation_data.image_id, annotation_data.id
+                ),
+                auto_generated=False,
+            )
+            if annotation:
+                store_annotation_document(session_id, annotation, json_data)
 
         return AnnotationResponse(
             success=True,
@@ -412,6 +1096,11 @@ async def save_manual_annotation(
             annotation_id=(
                 annotation.annotation_id if annotation else annotation_data.id
             ),
+            etag=(
+                annotation_etag(session_id, annotation.annotation_id, json_data)
+                if annotation
+                else None
+            ),
         )
 
     except Exception as e:
@@ -423,12 +1112,19 @@ async def save_manual_annotation(
 
 
 @router.put("/annotations/{annotation_id}", response_model=AnnotationResponse)
-async def update_annotation(
+def update_annotation(
     annotation_id: str,
     update_data: ManualAnnotationUpdate,
+    request: Request,
+    response: Response,
     session_manager: SessionManager = Depends(get_session_manager),
 ):
-    """Update an existing annotation"""
+    """
+    Update an existing annotation, replacing its whole polygon.
+
+    An If-Match header with the annotation's ETag makes the update fail
+    with 412 if someone else changed it first.
+    """
     session_id = session_manager.session_id
 
     # Get the annotation from session store
@@ -436,37 +1132,33 @@ async def update_annotation(
     if not annotation:
         raise HTTPException(status_code=404, detail="Annotation not found")
 
-    try:  # Load existing annotation data
-        if not os.path.exists(annotation.file_path):
-            raise HTTPException(status_code=404, detail="Annotation file not found")
-
-        with open(annotation.file_path, "r") as f:
-            json_data = json.load(f)
-
-        # Update the data
-        if json_data.get("features"):
-            feature = json_data["features"][0]
-
-            if update_data.polygon:
-                feature["geometry"]["coordinates"] = [
-                    [[point[0], point[1]] for point in update_data.polygon]
-                ]
-
-            if update_data.label:
-                feature["properties"]["label"] = update_data.label
-
-            # Update modified timestamp
-            feature["properties"]["modified"] = datetime.now().isoformat()
-        # Save updated annotation
-        with open(annotation.file_path, "w") as f:
-            json.dump(json_data, f, indent=2)
+    try:
+        polygon = update_data.polygon
+        with annotation_journal.group(session_id):
+            json_data = edit_annotation(
+                session_id,
+                annotation,
+                lambda json_data: edit_document(
+                    json_data,
+                    ring=(
+                        [[point[0], point[1]] for point in polygon] if polygon else None
+                    ),
+                    label=update_data.label,
+                ),
+                request.headers.get("if-match"),
+            )
+        etag = annotation_etag(session_id, annotation_id, json_data)
+        response.headers["ETag"] = etag
 
         return AnnotationResponse(
             success=True,
             message="Annotation updated successfully",
             annotation_id=annotation_id,
+            etag=etag,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating annotation: {str(e)}")
         raise HTTPException(
@@ -475,8 +1167,55 @@ async def update_annotation(
         )
 
 
+@router.patch("/annotations/{annotation_id}", response_model=AnnotationResponse)
+def patch_annotation(
+    annotation_id: str,
+    patch: AnnotationPatch,
+    request: Request,
+    response: Response,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Edit an annotation's polygon with vertex operations (move, insert,
+    delete ranges) instead of resending it.
+
+    The If-Match header must hold the annotation's current ETag (from
+    GET /api/annotations/{image_id} or the previous edit); a stale one
+    fails with 412 so concurrent edits are not overwritten.
+    """
+    session_id = session_manager.session_id
+    annotation = session_store.get_annotation(session_id, annotation_id)
+    if not annotation:
+        raise HTTPException(status_code=404, detail="Annotation not found")
+    if "if-match" not in request.headers:
+        raise HTTPException(
+            status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+            detail="If-Match header with the annotation's ETag is required",
+        )
+
+    ops = [op.model_dump(exclude_none=True) for op in patch.ops]
+
+    def change(json_data):
+        ring = apply_vertex_ops(outer_ring(json_data), ops) if ops else None
+        return edit_document(json_data, ring=ring, label=patch.label)
+
+    with annotation_journal.group(session_id):
+        json_data = edit_annotation(
+            session_id, annotation, change, request.headers.get("if-match")
+        )
+    etag = annotation_etag(session_id, annotation_id, json_data)
+    response.headers["ETag"] = etag
+
+    return AnnotationResponse(
+        success=True,
+        message="Annotation updated successfully",
+        annotation_id=annotation_id,
+        etag=etag,
+    )
+
+
 @router.delete("/annotations/{annotation_id}", response_model=AnnotationResponse)
-async def delete_annotation(
+def delete_annotation(
     annotation_id: str, session_manager: SessionManager = Depends(get_session_manager)
 ):
     """Delete an annotation"""
@@ -486,12 +1225,6 @@ async def delete_annotation(
         f"Attempting to delete annotation {annotation_id} from session {session_id}"
     )
 
-    # List all annotations in session for debugging
-    all_annotations = session_store.get_annotations(session_id)
-    logger.info(
-        f"Available annotations in session: {[ann.annotation_id for ann in all_annotations]}"
-    )
-
     # Get the annotation from session store
     annotation = session_store.get_annotation(session_id, annotation_id)
     if not annotation:
@@ -501,13 +1234,8 @@ async def delete_annotation(
     logger.info(f"Found annotation to delete: {annotation.annotation_id}")
 
     try:
-        # Delete the annotation file if it exists
-        if os.path.exists(annotation.file_path):
-            os.remove(annotation.file_path)
-            logger.info(f"Deleted annotation file: {annotation.file_path}")
-
-        # Remove from session store
-        success = session_store.remove_annotation(session_id, annotation_id)
+        with annotation_journal.group(session_id):
+            success = remove_annotation(session_id, annotation)
         logger.info(f"Removed annotation from session store: {success}")
 
         return AnnotationResponse(
@@ -524,16 +1252,562 @@ async def delete_annotation(
         )
 
 
+# Most operations one bulk request may carry
+MAX_BULK_OPERATIONS = 5000
+
+
+@router.post("/annotations/bulk", response_model=BulkAnnotationResponse)
+def bulk_annotations(
+    bulk: BulkAnnotationRequest,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Create, update and delete many annotations in one request.
+
+    Operations are applied in order in one session store transaction, and
+    their geometry is written to disk in one batch. Each operation succeeds
+    or fails on its own, with the status the single-annotation endpoint
+    would have returned; `if_match` works like the If-Match header of PUT.
+    """
+    if len(bulk.operations) > MAX_BULK_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BULK_OPERATIONS} operations per request",
+        )
+    session_id = session_manager.session_id
+    results = []
+
+    def find(annotation_id):
+        # Reads inside the batch see the operations applied before this one
+        annotation = session_store.get_annotation(session_id, annotation_id)
+        if annotation is None:
+            raise HTTPException(status_code=404, detail="Annotation not found")
+        return annotation
+
+    with (
+        annotation_journal.group(session_id),
+        session_store.batch(),
+        geometry_store.batch(),
+    ):
+        for item in bulk.operations:
+            etag = None
+            try:
+                if item.op == "create":
+                    if not item.image_id or not item.polygon or not item.label:
+                        raise HTTPException(
+                            status_code=400,
+                            detail="create needs image_id, polygon and label",
+                        )
+                    if not session_store.get_image(session_id, item.image_id):
+                        raise HTTPException(status_code=404, detail="Image not found")
+                    json_data = manual_annotation_document(
+                        item.polygon, item.label, item.type, item.source
+                    )
+                    annotation = session_store.add_annotation(
+                        session_id,
+                        item.image_id,
+                        annotation_id=item.id,
+                        file_path=manual_annotation_path(
+                            session_id, item.image_id, item.id
+                        ),
+                        auto_generated=False,
+                    )
+                    if annotation is None:
+                        raise HTTPException(status_code=404, detail="Image not found")
+                    store_annotation_document(session_id, annotation, json_data)
+                elif item.op == "update":
+                    polygon = item.polygon
+                    json_data = edit_annotation(
+                        session_id,
+                        find(item.id),
+                        lambda json_data: edit_document(
+                            json_data,
+                            ring=[[p[0], p[1]] for p in polygon] if polygon else None,
+                            label=item.label,
+                        ),
+                        item.if_match,
+                    )
+                else:
+                    annotation = find(item.id)
+                    json_data = load_annotation_data(session_id, annotation)
+                    current = annotation_etag(session_id, item.id, json_data or {})
+                    if not if_match_header_passes(item.if_match, current):
+                        raise HTTPException(
+                            status_code=status.HTTP_412_PRECONDITION_FAILED,
+                            detail="Annotation was changed by another edit",
+                        )
+                    if not remove_annotation(session_id, annotation):
+                        raise HTTPException(
+                            status_code=404, detail="Annotation not found"
+                        )
+                    json_data = None
+                if json_data is not None:
+                    etag = annotation_etag(session_id, item.id, json_data)
+                results.append(
+                    BulkAnnotationResult(
+                        id=item.id, op=item.op, success=True, status=200, etag=etag
+                    )
+                )
+            except HTTPException as e:
+                results.append(
+                    BulkAnnotationResult(
+                        id=item.id,
+                        op=item.op,
+                        success=False,
+                        status=e.status_code,
+                        error=str(e.detail),
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Error in bulk {item.op} of {item.id}: {str(e)}")
+                results.append(
+                    BulkAnnotationResult(
+                        id=item.id,
+                        op=item.op,
+                        success=False,
+                        status=500,
+                        error=str(e),
+                    )
+                )
+
+    applied = sum(result.success for result in results)
+    failed = len(results) - applied
+    logger.info(f"Bulk annotation operations: {applied} applied, {failed} failed")
+
+    return BulkAnnotationResponse(
+        success=failed == 0,
+        message=f"Applied {applied} of {len(results)} operations.",
+        applied=applied,
+        failed=failed,
+        results=results,
+    )
+
+
+def load_operation_polygons(session_id: str, annotation_ids: List[str]) -> tuple:
+    """
+    The annotations a geometry operation applies to, their image's size and
+    their polygons in image pixels. All must be polygons of the same image.
+    """
+    if len(set(annotation_ids)) != len(annotation_ids):
+        raise HTTPException(status_code=400, detail="Annotation ids must be distinct")
+    annotations = []
+    rings = []
+    for annotation_id in annotation_ids:
+        annotation = session_store.get_annotation(session_id, annotation_id)
+        if annotation is None:
+            raise HTTPException(
+                status_code=404, detail=f"Annotation {annotation_id} not found"
+            )
+        json_data = load_annotation_data(session_id, annotation)
+        polygon = document_rings(json_data) if json_data is not None else None
+        if polygon is None:
+            raise HTTPException(
+                status_code=400, detail=f"Annotation {annotation_id} is not a polygon"
+            )
+        annotations.append(annotation)
+        rings.append(polygon)
+
+    if len({annotation.image_id for annotation in annotations}) > 1:
+        raise HTTPException(
+            status_code=400, detail="Annotations must belong to the same image"
+        )
+    image = session_store.get_image(session_id, annotations[0].image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    size = operation_image_size(image)
+    try:
+        polygons = to_polygons(rings, *size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return annotations, size, polygons
+
+
+def operation_image_size(image) -> tuple:
+    """get_image_size() for geometry operations, which work in image pixels"""
+    try:
+        return get_image_size(image)
+    except (OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Could not read image size: {str(e)}",
+        )
+
+
+def check_tolerance(tolerance: float) -> float:
+    """Validate the gap tolerance (image pixels) of a merge or dissolve"""
+    if not 0 <= tolerance < float("inf"):
+        raise HTTPException(
+            status_code=400, detail="tolerance must be a non-negative number"
+        )
+    return tolerance
+
+
+def store_pieces(
+    session_id: str,
+    annotation,
+    pieces: list,
+    size: tuple,
+    result: GeometryOperationResponse,
+    label: Optional[str] = None,
+) -> None:
+    """
+    Store the polygons a geometry operation left of an annotation: it keeps
+    the largest and the others become new annotations with its properties.
+    """
+    rings = [to_rings(piece, *size) for piece in pieces]
+    json_data = edit_annotation(
+        session_id,
+        annotation,
+        lambda json_data: edit_document(
+            json_data, ring=rings[0][0], label=label, holes=rings[0][1:]
+        ),
+    )
+    result.updated.append(annotation.annotation_id)
+    result.etags[annotation.annotation_id] = annotation_etag(
+        session_id, annotation.annotation_id, json_data
+    )
+
+    properties = (first_feature(json_data) or {}).get("properties") or {}
+    for piece in rings[1:]:
+        annotation_id = str(uuid.uuid4())
+        created = session_store.add_annotation(
+            session_id,
+            annotation.image_id,
+            annotation_id=annotation_id,
+            file_path=manual_annotation_path(
+                session_id, annotation.image_id, annotation_id
+            ),
+            auto_generated=annotation.auto_generated,
+        )
+        if created is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        document = manual_annotation_document(
+            piece[0],
+            properties.get("label", ""),
+            properties.get("type", "polygon"),
+            properties.get("source", "manual"),
+            piece[1:],
+        )
+        store_annotation_document(session_id, created, document)
+        result.created.append(annotation_id)
+        result.etags[annotation_id] = annotation_etag(
+            session_id, annotation_id, document
+        )
+
+
+@router.post("/annotations/merge", response_model=GeometryOperationResponse)
+def merge_annotations(
+    merge: AnnotationMerge,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Merge annotations into the first one: its polygon becomes their union
+    and the others are deleted. With `tolerance`, gaps up to that many image
+    pixels wide are closed as well; annotations that stay apart are refused.
+    """
+    if len(merge.annotation_ids) < 2:
+        raise HTTPException(
+            status_code=400, detail="Merging needs at least two annotations"
+        )
+    tolerance = check_tolerance(merge.tolerance)
+    session_id = session_manager.session_id
+    annotations, size, polygons = load_operation_polygons(
+        session_id, merge.annotation_ids
+    )
+    pieces = polygon_parts(merge_polygons(polygons, tolerance))
+    if len(pieces) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="Annotations do not touch; set a tolerance to close the gaps",
+        )
+
+    result = GeometryOperationResponse(success=True, message="")
+    with (
+        annotation_journal.group(session_id),
+        session_store.batch(),
+        geometry_store.batch(),
+    ):
+        store_pieces(session_id, annotations[0], pieces, size, result, merge.label)
+        for annotation in annotations[1:]:
+            remove_annotation(session_id, annotation)
+            result.deleted.append(annotation.annotation_id)
+    result.message = f"Merged {len(annotations)} annotations."
+    return result
+
+
+@router.post("/annotations/dissolve", response_model=GeometryOperationResponse)
+def dissolve_annotations(
+    dissolve: AnnotationDissolve,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Merge every group of touching polygons with a label on an image, or of
+    polygons within `tolerance` image pixels of each other. Each group is
+    merged into its oldest annotation and the others are deleted.
+    """
+    tolerance = check_tolerance(dissolve.tolerance)
+    session_id = session_manager.session_id
+    image = session_store.get_image(session_id, dissolve.image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    size = operation_image_size(image)
+
+    candidates = []
+    rings = []
+    annotations = session_store.get_annotations(session_id, dissolve.image_id)
+    for annotation, json_data in get_annotation_documents(
+        session_id, annotations, True
+    ):
+        properties = (first_feature(json_data) or {}).get("properties") or {}
+        polygon = document_rings(json_data)
+        if properties.get("label") == dissolve.label and polygon is not None:
+            candidates.append(annotation)
+            rings.append(polygon)
+    try:
+        polygons = to_polygons(rings, *size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    groups = dissolve_groups(polygons, tolerance) if len(polygons) else []
+
+    result = GeometryOperationResponse(success=True, message="")
+    with (
+        annotation_journal.group(session_id),
+        session_store.batch(),
+        geometry_store.batch(),
+    ):
+        for group in groups:
+            pieces = polygon_parts(merge_polygons(polygons[group], tolerance))
+            if not pieces:
+                continue
+            store_pieces(session_id, candidates[group[0]], pieces, size, result)
+            for index in group[1:]:
+                remove_annotation(session_id, candidates[index])
+                result.deleted.append(candidates[index].annotation_id)
+    merged = len(result.updated) + len(result.deleted)
+    result.message = f"Dissolved {merged} annotations into {len(result.updated)}."
+    logger.info(f"Dissolve of {dissolve.label!r}: {result.message}")
+    return result
+
+
+@router.post(
+    "/annotations/{annotation_id}/subtract", response_model=GeometryOperationResponse
+)
+def subtract_annotations(
+    annotation_id: str,
+    subtract: AnnotationSubtract,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Cut other annotations out of an annotation's polygon, leaving them
+    unchanged. If it falls apart, the largest piece stays in the annotation
+    and the others become new annotations.
+    """
+    if not subtract.annotation_ids:
+        raise HTTPException(status_code=400, detail="No annotations to subtract")
+    session_id = session_manager.session_id
+    annotations, size, polygons = load_operation_polygons(
+        session_id, [annotation_id, *subtract.annotation_ids]
+    )
+    remainder = subtract_polygons(polygons[0], polygons[1:])
+    if polygons[0].area - remainder.area < MIN_PART_AREA:
+        raise HTTPException(status_code=400, detail="The annotations do not overlap")
+    pieces = polygon_parts(remainder)
+    if not pieces:
+        raise HTTPException(
+            status_code=400, detail="Nothing would be left of the annotation"
+        )
+
+    result = GeometryOperationResponse(success=True, message="")
+    with (
+        annotation_journal.group(session_id),
+        session_store.batch(),
+        geometry_store.batch(),
+    ):
+        store_pieces(session_id, annotations[0], pieces, size, result)
+    result.message = f"Subtracted {len(annotations) - 1} annotations."
+    return result
+
+
+@router.post(
+    "/annotations/{annotation_id}/split", response_model=GeometryOperationResponse
+)
+def split_annotation(
+    annotation_id: str,
+    split: AnnotationSplit,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Cut an annotation's polygon along a polyline that crosses it. The
+    largest piece stays in the annotation and the others become new
+    annotations.
+    """
+    session_id = session_manager.session_id
+    annotations, size, polygons = load_operation_polygons(session_id, [annotation_id])
+    try:
+        pieces = split_polygon(polygons[0], split.line, *size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(pieces) < 2:
+        raise HTTPException(
+            status_code=400, detail="The line does not cut across the annotation"
+        )
+
+    result = GeometryOperationResponse(success=True, message="")
+    with (
+        annotation_journal.group(session_id),
+        session_store.batch(),
+        geometry_store.batch(),
+    ):
+        store_pieces(session_id, annotations[0], pieces, size, result)
+    result.message = f"Split the annotation into {len(pieces)} pieces."
+    return result
+
+
+def restore_annotations(
+    session_id: str, targets: dict, result: GeometryOperationResponse
+) -> None:
+    """
+    Bring annotations back to states replayed from the journal (None for
+    one that did not exist). Restored documents get a new revision, so
+    ETags of the versions undone are not reused.
+    """
+    for annotation_id, target in targets.items():
+        annotation = session_store.get_annotation(session_id, annotation_id)
+        if target is None:
+            if annotation is not None:
+                remove_annotation(session_id, annotation)
+                result.deleted.append(annotation_id)
+            continue
+        if annotation is not None:
+            json_data = edit_annotation(
+                session_id,
+                annotation,
+                lambda json_data: restore_document(
+                    target["document"], get_revision(json_data)
+                ),
+            )
+            result.updated.append(annotation_id)
+        else:
+            annotation = session_store.add_annotation(
+                session_id,
+                target["image_id"],
+                annotation_id=annotation_id,
+                file_path=target["file_path"],
+                auto_generated=target["auto_generated"],
+            )
+            if annotation is None:
+                logger.warning(f"Not restoring {annotation_id}: its image is gone")
+                continue
+            json_data = restore_document(target["document"], 0)
+            store_annotation_document(session_id, annotation, json_data)
+            result.created.append(annotation_id)
+        result.etags[annotation_id] = annotation_etag(
+            session_id, annotation_id, json_data
+        )
+
+
+def step_history(session_id: str, kind: str) -> GeometryOperationResponse:
+    """Undo or redo the session's last annotation change"""
+    result = GeometryOperationResponse(success=True, message="")
+
+    def restore(targets):
+        with session_store.batch(), geometry_store.batch():
+            restore_annotations(session_id, targets, result)
+
+    step = annotation_journal.undo if kind == "undo" else annotation_journal.redo
+    try:
+        _, annotation_ids = step(session_id, restore)
+    except HistoryExpiredError as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    except HistoryError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    done = "Undid" if kind == "undo" else "Redid"
+    result.message = f"{done} the change to {len(annotation_ids)} annotations."
+    return result
+
+
+@router.post("/annotations/undo", response_model=GeometryOperationResponse)
+def undo_annotation_change(
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Undo the session's last annotation change (one request: a create,
+    edit, delete, bulk request or geometry operation) not undone yet,
+    restoring the annotations it touched as they were before it. Fails with
+    409 if there is nothing to undo.
+    """
+    return step_history(session_manager.session_id, "undo")
+
+
+@router.post("/annotations/redo", response_model=GeometryOperationResponse)
+def redo_annotation_change(
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    Redo the last undone annotation change. Any other change made since
+    the undo clears what can be redone (409).
+    """
+    return step_history(session_manager.session_id, "redo")
+
+
+@router.get("/history/")
+def get_history(session_manager: SessionManager = Depends(get_session_manager)):
+    """
+    How many annotation changes can be undone and redone, and since when
+    the session's annotations can be replayed (GET /api/history/state)
+    """
+    history = annotation_journal.history(session_manager.session_id)
+    since = history["since"]
+    return {**history, "since": datetime.fromtimestamp(since) if since else None}
+
+
+@router.get("/history/state")
+def get_history_state(
+    at: datetime,
+    image_id: Optional[str] = None,
+    encoding: str = "json",
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    The session's annotations (or one image's) as they were at time `at`
+    (ISO 8601), replayed from the journal's snapshot before it. Fails with
+    410 if `at` is older than the history kept.
+    """
+    check_encoding(encoding)
+    session_id = session_manager.session_id
+    try:
+        state = annotation_journal.state_at(session_id, at.timestamp(), image_id)
+    except HistoryExpiredError as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    return FastJSONResponse(
+        {
+            "at": at,
+            "annotations": [
+                {
+                    "annotation_id": annotation_id,
+                    "image_id": target["image_id"],
+                    "auto_generated": target["auto_generated"],
+                    "data": (
+                        encode_document(target["document"])
+                        if encoding == COMPACT_ENCODING
+                        else target["document"]
+                    ),
+                }
+                for annotation_id, target in state.items()
+            ],
+        }
+    )
+
+
 @router.post("/preprocess/", response_model=PreprocessResponse)
-async def preprocess_image(
+def preprocess_image(
     request: PreprocessRequest,
     session_manager: SessionManager = Depends(get_session_manager),
 ):
     """Pre-generate embeddings for faster segmentation"""
     try:
         # Check if session exists
-        session_data = session_store.get_session(session_manager.session_id)
-        if not session_data:
+        if not session_store.session_exists(session_manager.session_id):
             raise HTTPException(
                 status_code=404,
                 detail=f"Session {session_manager.session_id} not found. Please refresh the page to create a new session.",
@@ -546,7 +1820,7 @@ async def preprocess_image(
                 status_code=404,
                 detail=f"Image {request.image_id} not found in session {session_manager.session_id}",
             )  # Handle both absolute and relative paths for image_path
-        image_path = construct_image_path(image.file_path)
+        image_path = construct_image_path(image.sam_path or image.file_path)
 
         # Check if file exists
         if not os.path.exists(image_path):
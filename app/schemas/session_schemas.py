@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Literal, Dict
 from datetime import datetime
 
 
@@ -63,7 +63,113 @@ class ManualAnnotationUpdate(BaseModel):
     label: Optional[str] = None
 
 
+class VertexOperation(BaseModel):
+    op: Literal["move", "insert", "delete"]
+    index: int  # Vertex the operation applies to (insert: vertex to insert before)
+    point: Optional[List[float]] = None  # move: new [x, y] (normalized 0-1)
+    points: Optional[List[List[float]]] = None  # insert: vertices to insert
+    end: Optional[int] = None  # delete: end of the range (exclusive)
+
+
+class AnnotationPatch(BaseModel):
+    ops: List[VertexOperation] = []  # Applied in order to the outer ring
+    label: Optional[str] = None
+
+
 class AnnotationResponse(BaseModel):
     success: bool
     message: str
     annotation_id: Optional[str] = None
+    etag: Optional[str] = None  # Send in If-Match to edit this revision
+
+
+class BulkAnnotationOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: str  # Annotation ID (chosen by the frontend for creates)
+    image_id: Optional[str] = None  # create: image the annotation belongs to
+    type: str = "polygon"
+    polygon: Optional[List[List[float]]] = None  # create/update (normalized 0-1)
+    label: Optional[str] = None  # create/update
+    source: str = "manual"
+    if_match: Optional[str] = None  # update/delete: ETag the change applies to
+
+
+class BulkAnnotationRequest(BaseModel):
+    operations: List[BulkAnnotationOperation]  # Applied in order
+
+
+class BulkAnnotationResult(BaseModel):
+    id: str
+    op: str
+    success: bool
+    status: int  # Status the single-annotation endpoint would have returned
+    etag: Optional[str] = None  # create/update: ETag of the new revision
+    error: Optional[str] = None
+
+
+class BulkAnnotationResponse(BaseModel):
+    success: bool
+    message: str
+    applied: int
+    failed: int
+    results: List[BulkAnnotationResult]
+
+
+class AnnotationMerge(BaseModel):
+    annotation_ids: List[str]  # Merged into the first; the others are deleted
+    label: Optional[str] = None  # Label of the result (default: the first's)
+    tolerance: float = 0.0  # Also close gaps up to this wide (image pixels)
+
+
+class AnnotationSubtract(BaseModel):
+    annotation_ids: List[str]  # Cut out of the target, left unchanged
+
+
+class AnnotationSplit(BaseModel):
+    line: List[List[float]]  # Polyline cutting across the polygon (normalized 0-1)
+
+
+class AnnotationDissolve(BaseModel):
+    image_id: str
+    label: str  # Only annotations with this label are dissolved
+    tolerance: float = 0.0  # Also join polygons this close (image pixels)
+
+
+class GeometryOperationResponse(BaseModel):
+    success: bool
+    message: str
+    updated: List[str] = []  # Annotations whose polygon was replaced
+    created: List[str] = []  # New annotations for the other pieces
+    deleted: List[str] = []  # Annotations merged into another one
+    etags: Dict[str, str] = {}  # ETags of the updated and created annotations
+
+
+class BulkUploadItem(BaseModel):
+    file_name: str
+    success: bool
+    image: Optional[Image] = None
+    error: Optional[str] = None
+
+
+class BulkUploadResponse(BaseModel):
+    success: bool
+    message: str
+    uploaded: int
+    failed: int
+    results: List[BulkUploadItem]
+
+
+class ChunkedUploadCreate(BaseModel):
+    file_name: str
+    total_size: int
+    content_type: Optional[str] = None
+    sha256: Optional[str] = None  # Hex digest checked when the upload is finalized
+
+
+class ChunkedUploadStatus(BaseModel):
+    upload_id: str
+    file_name: str
+    offset: int
+    total_size: int
+    chunk_size: int
+    complete: bool
@@ -0,0 +1,797 @@
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import weakref
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .geometry_codec import decode_document, decode_ring, encode_document, encode_ring
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process owns the journal
+    fcntl = None
+
+# Determine if we're running in Docker or locally
+in_docker = os.path.exists("/.dockerenv")
+base_path = (
+    Path("/app")
+    if in_docker
+    else Path(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+)
+
+# Directory holding one journal directory per session
+JOURNAL_DIR = os.environ.get(
+    "SAT_ANNOTATOR_JOURNAL_DIR", str(base_path / "annotations" / "journal")
+)
+# A snapshot of the session's annotations is written every this many records
+# at least, and once the records since the last one take
+# JOURNAL_SNAPSHOT_RATIO of its size (so large sessions snapshot less often)
+JOURNAL_SNAPSHOT_EVERY = int(
+    os.environ.get("SAT_ANNOTATOR_JOURNAL_SNAPSHOT_EVERY", "200")
+)
+# Snapshots kept per session; older ones and their records are deleted, which
+# bounds the disk used, the undo depth and how far back history reaches
+JOURNAL_KEEP_SNAPSHOTS = int(
+    os.environ.get("SAT_ANNOTATOR_JOURNAL_KEEP_SNAPSHOTS", "5")
+)
+JOURNAL_SNAPSHOT_RATIO = 0.5
+# Session ids used as directory names as they are; others are not journaled
+_SAFE_SESSION_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+_SNAPSHOT = re.compile(r"snapshot-(\d+)\.json")
+# Start of a record line, as _append() writes it
+_RECORD_START = re.compile(rb'\{"n":(\d+),"k":"\w+","t":([-+.\deE]+),')
+
+
+class HistoryError(Exception):
+    """There is nothing to undo or redo, or no history for the session"""
+
+
+class HistoryExpiredError(HistoryError):
+    """The requested point in time is older than the history kept"""
+
+
+# Diffs
+
+
+def _is_point(value) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) == 2
+        and not isinstance(value[0], (list, dict))
+    )
+
+
+def _is_nested(value) -> bool:
+    """Whether a diff recurses into the value rather than replacing it"""
+    return isinstance(value, dict) or (
+        isinstance(value, list)
+        and bool(value)
+        and isinstance(value[0], (list, dict))
+        and not _is_point(value)
+    )
+
+
+def _pack(values: list):
+    """Inserted list items, as a compact ring if they are vertices"""
+    if values and all(_is_point(value) for value in values):
+        encoded = encode_ring(values)
+        if encoded is not None:
+            return encoded
+    return values
+
+
+def diff_documents(old, new) -> Optional[dict]:
+    """
+    Compact diff turning one version of an annotation's document into the
+    next, or None if they are equal.
+
+    Dicts are diffed key by key (`{"k": {key: diff}, "x": [removed]}`);
+    lists are cut to the run between their common prefix and suffix, which
+    is diffed item by item when it holds as many rings or objects on both
+    sides (`{"i": [[index, diff], ...]}`) and spliced otherwise
+    (`{"s": [start, deleted, inserted]}`, vertices as a compact ring).
+    Anything else is replaced (`{"=": value}`). Copy-on-write edits share
+    their untouched parts, which are skipped without being compared.
+    """
+    if old is new or old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        changed = {}
+        for key, value in new.items():
+            if key not in old:
+                changed[key] = {"=": value}
+            else:
+                diff = diff_documents(old[key], value)
+                if diff is not None:
+                    changed[key] = diff
+        removed = [key for key in old if key not in new]
+        diff = {}
+        if changed:
+            diff["k"] = changed
+        if removed:
+            diff["x"] = removed
+        return diff
+    if isinstance(old, list) and isinstance(new, list):
+        start = 0
+        shortest = min(len(old), len(new))
+        while start < shortest and (
+            old[start] is new[start] or old[start] == new[start]
+        ):
+            start += 1
+        end = 0
+        while end < shortest - start and (
+            old[-1 - end] is new[-1 - end] or old[-1 - end] == new[-1 - end]
+        ):
+            end += 1
+        removed = old[start : len(old) - end]
+        inserted = new[start : len(new) - end]
+        if len(removed) == len(inserted) and all(
+            _is_nested(value) for value in removed + inserted
+        ):
+            return {
+                "i": [
+                    [start + index, diff_documents(a, b)]
+                    for index, (a, b) in enumerate(zip(removed, inserted))
+                ]
+            }
+        return {"s": [start, len(removed), _pack(inserted)]}
+    return {"=": new}
+
+
+def patch_document(value, diff: Optional[dict]):
+    """Apply a diff made by diff_documents(); the input is not modified"""
+    if diff is None:
+        return value
+    if "=" in diff:
+        return diff["="]
+    if "s" in diff:
+        start, deleted, inserted = diff["s"]
+        if isinstance(inserted, str):
+            inserted = decode_ring(inserted)
+        value = list(value)
+        value[start : start + deleted] = inserted
+        return value
+    if "i" in diff:
+        value = list(value)
+        for index, item_diff in diff["i"]:
+            value[index] = patch_document(value[index], item_diff)
+        return value
+    value = dict(value)
+    for key, item_diff in diff.get("k", {}).items():
+        value[key] = patch_document(value.get(key), item_diff)
+    for key in diff.get("x", ()):
+        value.pop(key, None)
+    return value
+
+
+def _on_event_loop() -> bool:
+    """Whether this thread is running an asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+# Journal
+
+
+@dataclass
+class _Head:
+    """Where a session's journal stands, as far as this process knows"""
+
+    snapshots: List[Tuple[int, float]]  # (record number, time), oldest first
+    snapshot_size: int = 0  # Bytes of the newest snapshot
+    offset: int = 0  # Bytes of the current segment read
+    next: int = 1  # Number of the next record
+    # [record number, annotation ids] of the records that can be undone
+    # (last on top) and redone
+    undo: List[list] = field(default_factory=list)
+    redo: List[list] = field(default_factory=list)
+
+    @property
+    def segment(self) -> int:
+        """First record number of the segment being appended to"""
+        return self.snapshots[-1][0] + 1
+
+
+@dataclass
+class _Group:
+    """Changes made to a session's annotations by one request"""
+
+    session_id: str
+    kind: str = "edit"
+    target: Optional[int] = None  # Record an undo or redo applies to
+    ops: List[dict] = field(default_factory=list)
+    bootstrapped: bool = False  # The session's first snapshot was just taken
+
+
+class AnnotationJournal:
+    """
+    Per-session, append-only journal of the changes to annotations, for
+    server-side undo/redo and the state of the annotations at a past time.
+
+    The changes one request makes form a group (see group()), appended as
+    one JSON line. Creations hold the compact document, updates a compact
+    diff from the previous version (diff_documents()) and deletions the id
+    only. Once JOURNAL_SNAPSHOT_EVERY records, taking JOURNAL_SNAPSHOT_RATIO
+    of the last snapshot's size, were appended, the session's annotations
+    are written to a snapshot (one line each) and a new segment is started.
+    Past states are replayed from the nearest snapshot, so replay reads at
+    most one snapshot and a segment of about half its size, and snapshots
+    cost a bounded time per record however large the session. Only
+    JOURNAL_KEEP_SNAPSHOTS snapshots are kept, and the segments older than
+    the oldest one are deleted.
+
+    Undo restores the annotations a group touched to their state before it,
+    and redo to their state after it, each recorded as a group of its own;
+    a new edit clears the redo stack. The stacks are rebuilt from the
+    newest segment. Workers share the journal: appends hold a file lock and
+    each worker reloads a session's head when another appended to it.
+    Coordinates replayed from the journal are rounded to GEOMETRY_DECIMALS.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = JOURNAL_DIR,
+        snapshot_every: Optional[int] = None,
+        keep_snapshots: Optional[int] = None,
+    ):
+        # None turns the journal off
+        self.directory = directory
+        self.snapshot_every = max(1, snapshot_every or JOURNAL_SNAPSHOT_EVERY)
+        self.keep_snapshots = max(1, keep_snapshots or JOURNAL_KEEP_SNAPSHOTS)
+        # session_id -> {annotation_id: {"image_id", "file_path",
+        # "auto_generated", "document"}}, the live state snapshots are taken of
+        self._load_state: Optional[Callable[[str], Dict[str, dict]]] = None
+        self._heads: Dict[str, _Head] = {}
+        # session_id -> its lock, dropped once no group or reader holds it
+        self._locks = weakref.WeakValueDictionary()
+        self._locks_lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"records": 0, "snapshots": 0, "compactions": 0, "replays": 0}
+
+    def set_state_source(self, load_state: Callable[[str], Dict[str, dict]]) -> None:
+        """Set how the current annotations of a session are read for snapshots"""
+        self._load_state = load_state
+
+    def _lock(self, session_id: str) -> threading.RLock:
+        with self._locks_lock:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = threading.RLock()
+            return lock
+
+    def _session_dir(self, session_id: str) -> Optional[str]:
+        if self.directory is None or not _SAFE_SESSION_ID.fullmatch(session_id):
+            return None
+        return os.path.join(self.directory, session_id)
+
+    def _open_groups(self) -> Dict[str, _Group]:
+        groups = getattr(self._local, "groups", None)
+        if groups is None:
+            groups = self._local.groups = {}
+        return groups
+
+    # Recording
+
+    @contextmanager
+    def group(self, session_id: str, undoable: bool = True) -> Iterator[_Group]:
+        """
+        Collect the changes made to a session's annotations in the block into
+        one record, appended once it exits (also if it raises, since the
+        changes made so far stay). Nested blocks join the outer one.
+
+        Changes of a group that is not `undoable` (e.g. deleting an image)
+        cannot be undone and take the undo history of the annotations they
+        touch with them. The session's changes are serialized while a group
+        is open, so open it before any session or geometry store batch, and
+        never on the event loop: async routes run it in the threadpool.
+        """
+        assert not _on_event_loop(), "Journal groups block, run them in a thread"
+        groups = self._open_groups()
+        if session_id in groups or self._session_dir(session_id) is None:
+            yield groups.get(session_id) or _Group(session_id)
+            return
+        with self._lock(session_id):
+            group = _Group(session_id, kind="edit" if undoable else "drop")
+            group.bootstrapped = self._bootstrap(session_id)
+            groups[session_id] = group
+            try:
+                yield group
+            finally:
+                del groups[session_id]
+                if group.ops or group.target is not None:
+                    self._append(group)
+
+    def _record(self, session_id: str, op: dict) -> None:
+        group = self._open_groups().get(session_id)
+        if group is not None:
+            group.ops.append(op)
+            return
+        with self.group(session_id) as group:
+            # A first snapshot taken now already holds the change
+            if not group.bootstrapped:
+                group.ops.append(op)
+
+    def record_create(self, session_id: str, annotation, document: dict) -> None:
+        """Journal a new annotation (a session store record) and its document"""
+        self._record(
+            session_id,
+            {
+                "a": annotation.annotation_id,
+                "c": _meta(
+                    annotation.image_id, annotation.file_path, annotation.auto_generated
+                ),
+                "d": encode_document(document),
+            },
+        )
+
+    def record_update(
+        self, session_id: str, annotation_id: str, old: dict, new: dict
+    ) -> None:
+        """Journal the replacement of an annotation's document"""
+        diff = diff_documents(old, new)
+        if diff is not None:
+            self._record(session_id, {"a": annotation_id, "u": diff})
+
+    def record_delete(self, session_id: str, annotation_id: str) -> None:
+        """Journal the deletion of an annotation"""
+        self._record(session_id, {"a": annotation_id, "x": 1})
+
+    # Undo and redo
+
+    def undo(
+        self, session_id: str, restore: Callable[[Dict[str, Optional[dict]]], None]
+    ) -> Tuple[int, List[str]]:
+        """
+        Undo the session's last edit that is not undone yet: calls
+        `restore(targets)` with, for each annotation it touched, its state
+        before the edit (None if it did not exist) inside a group that
+        records the restoring changes. Returns the edit's record number and
+        annotation ids; raises HistoryError if there is nothing to undo.
+        """
+        return self._step(session_id, "undo", restore)
+
+    def redo(
+        self, session_id: str, restore: Callable[[Dict[str, Optional[dict]]], None]
+    ) -> Tuple[int, List[str]]:
+        """Redo the last undone edit, like undo() with the state after it"""
+        return self._step(session_id, "redo", restore)
+
+    def _step(self, session_id, kind, restore) -> Tuple[int, List[str]]:
+        if self._open_groups().get(session_id) is not None:
+            raise RuntimeError(f"Cannot {kind} inside a group")
+        if self._session_dir(session_id) is None:
+            raise HistoryError(f"Nothing to {kind}")
+        with self.group(session_id) as group:
+            head = self._head(session_id)
+            stack = (head.undo if kind == "undo" else head.redo) if head else []
+            if not stack:
+                raise HistoryError(f"Nothing to {kind}")
+            number, annotation_ids = stack[-1]
+            state = self._replay(
+                session_id,
+                annotation_ids,
+                number=number - 1 if kind == "undo" else number,
+            )
+            restore(
+                {
+                    annotation_id: state.get(annotation_id)
+                    for annotation_id in annotation_ids
+                }
+            )
+            # Set once restored: changes left by a failed restore stay an edit
+            group.kind, group.target = kind, number
+        return number, annotation_ids
+
+    def history(self, session_id: str) -> dict:
+        """How many edits can be undone and redone, and since when history is kept"""
+        with self._lock(session_id):
+            head = self._head(session_id) if self._session_dir(session_id) else None
+            if head is None:
+                return {"undo": 0, "redo": 0, "since": None}
+            return {
+                "undo": len(head.undo),
+                "redo": len(head.redo),
+                "since": head.snapshots[0][1],
+            }
+
+    def state_at(
+        self, session_id: str, at: float, image_id: Optional[str] = None
+    ) -> Dict[str, dict]:
+        """
+        The session's annotations (optionally one image's) as they were at
+        time `at` (seconds since the epoch), replayed from the last snapshot
+        before it. Raises HistoryExpiredError if `at` is older than the
+        history kept.
+        """
+        with self._lock(session_id):
+            if self._session_dir(session_id) is None or self._head(session_id) is None:
+                raise HistoryExpiredError("No history is kept for this session")
+            return self._replay(session_id, at=at, image_id=image_id)
+
+    def drop(self, session_id: str) -> None:
+        """Delete a session's journal"""
+        directory = self._session_dir(session_id)
+        if directory is None:
+            return
+        with self._lock(session_id):
+            self._heads.pop(session_id, None)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def session_ids(self) -> List[str]:
+        """Get the sessions that have a journal"""
+        if self.directory is None:
+            return []
+        try:
+            return [
+                entry.name for entry in os.scandir(self.directory) if entry.is_dir()
+            ]
+        except FileNotFoundError:
+            return []
+
+    # Files
+
+    def _path(self, session_id: str, name: str) -> str:
+        return os.path.join(self._session_dir(session_id), name)
+
+    @staticmethod
+    def _segment_name(first: int) -> str:
+        return f"journal-{first:010d}.log"
+
+    @staticmethod
+    def _snapshot_name(number: int) -> str:
+        return f"snapshot-{number:010d}.json"
+
+    @contextmanager
+    def _file_lock(self, session_id: str) -> Iterator[None]:
+        """Keep other processes from changing a session's journal (no-op without fcntl)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(session_id, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lines(self, path: str, offset: int = 0) -> Iterator[Tuple[bytes, int]]:
+        """(line, offset after it) of the complete lines of a segment"""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written, or torn by a crash
+                offset += len(line)
+                yield line, offset
+
+    def _records(self, path: str, offset: int = 0) -> Iterator[Tuple[dict, int]]:
+        """(record, offset after it) of the valid lines of a segment"""
+        for line, offset in self._lines(path, offset):
+            try:
+                yield json.loads(line), offset
+            except ValueError:
+                continue
+
+    def _read_header(self, session_id: str, number: int) -> Optional[dict]:
+        try:
+            with open(self._path(session_id, self._snapshot_name(number)), "rb") as f:
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def _head(self, session_id: str) -> Optional[_Head]:
+        """The session's head, reloaded if another process appended, with the lock held"""
+        head = self._heads.get(session_id)
+        if head is not None:
+            try:
+                size = os.stat(
+                    self._path(session_id, self._segment_name(head.segment))
+                ).st_size
+            except FileNotFoundError:
+                size = -1 if head.offset else 0
+            if size == head.offset:
+                return head
+        head = self._load_head(session_id)
+        if head is None:
+            self._heads.pop(session_id, None)
+        else:
+            self._heads[session_id] = head
+        return head
+
+    def _load_head(self, session_id: str) -> Optional[_Head]:
+        """Read the snapshot headers and the newest segment of a session"""
+        try:
+            names = os.listdir(self._session_dir(session_id))
+        except FileNotFoundError:
+            return None
+        numbers = sorted(
+            int(match.group(1))
+            for match in map(_SNAPSHOT.fullmatch, names)
+            if match is not None
+        )
+        headers = {}
+        for number in numbers:
+            header = self._read_header(session_id, number)
+            if header is not None:
+                headers[number] = header
+        if not headers:
+            return None
+        snapshots = [(number, header["t"]) for number, header in headers.items()]
+        latest = headers[snapshots[-1][0]]
+        try:
+            snapshot_size = os.stat(
+                self._path(session_id, self._snapshot_name(snapshots[-1][0]))
+            ).st_size
+        except FileNotFoundError:
+            snapshot_size = 0
+        head = _Head(
+            snapshots=snapshots,
+            snapshot_size=snapshot_size,
+            next=snapshots[-1][0] + 1,
+            undo=latest["undo"],
+            redo=latest["redo"],
+        )
+        path = self._path(session_id, self._segment_name(head.segment))
+        for record, offset in self._records(path):
+            _advance(head, record)
+            head.offset = offset
+        _prune(head)
+        return head
+
+    def _bootstrap(self, session_id: str) -> bool:
+        """
+        Write a session's first snapshot, of its current annotations, unless
+        it has a journal; with the lock held. Returns True if it was written.
+        """
+        if self._head(session_id) is not None or self._load_state is None:
+            return False
+        os.makedirs(self._session_dir(session_id), exist_ok=True)
+        with self._file_lock(session_id):
+            if self._head(session_id) is not None:
+                return False
+            head = _Head(snapshots=[])
+            self._write_snapshot(session_id, head, 0)
+            self._heads[session_id] = head
+        return True
+
+    def _append(self, group: _Group) -> None:
+        """Append a group's record, with the lock held"""
+        session_id = group.session_id
+        record = {"k": group.kind, "t": time.time(), "o": group.ops}
+        if group.target is not None:
+            record["r"] = group.target
+        if not os.path.isdir(self._session_dir(session_id)):
+            self._heads.pop(session_id, None)
+            return  # Dropped meanwhile
+        with self._file_lock(session_id):
+            head = self._head(session_id)
+            if head is None:
+                return
+            record = {"n": head.next, **record}
+            data = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+            path = self._path(session_id, self._segment_name(head.segment))
+            with open(path, "ab") as f:
+                start = f.tell()
+                if start != head.offset:
+                    # Left torn by a crash (live writers hold the lock)
+                    f.write(b"\n")
+                    start += 1
+                f.write(data)
+            head.offset = start + len(data)
+            _advance(head, record)
+            self.stats["records"] += 1
+            if (
+                record["n"] - head.snapshots[-1][0] >= self.snapshot_every
+                and head.offset >= JOURNAL_SNAPSHOT_RATIO * head.snapshot_size
+            ):
+                self._write_snapshot(session_id, head, record["n"])
+                self._compact(session_id, head)
+
+    def _write_snapshot(self, session_id: str, head: _Head, number: int) -> None:
+        """
+        Snapshot the session's current annotations as the state after record
+        `number` and start a new segment; with both locks held, so no change
+        is in flight
+        """
+        now = time.time()
+        header = {"n": number, "t": now, "undo": head.undo, "redo": head.redo}
+        lines = [json.dumps(header, separators=(",", ":"))]
+        for annotation_id, target in self._load_state(session_id).items():
+            entry = {
+                "a": annotation_id,
+                **_meta(
+                    target["image_id"], target["file_path"], target["auto_generated"]
+                ),
+                "d": encode_document(target["document"]),
+            }
+            lines.append(json.dumps(entry, separators=(",", ":")))
+        data = ("\n".join(lines) + "\n").encode()
+        path = self._path(session_id, self._snapshot_name(number))
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        head.snapshots.append((number, now))
+        head.snapshot_size = len(data)
+        head.offset = 0
+        head.next = number + 1
+        self.stats["snapshots"] += 1
+
+    def _compact(self, session_id: str, head: _Head) -> None:
+        """Delete the snapshots and segments older than the ones kept"""
+        if len(head.snapshots) <= self.keep_snapshots:
+            return
+        dropped = head.snapshots[: -self.keep_snapshots]
+        head.snapshots = head.snapshots[-self.keep_snapshots :]
+        for number, _ in dropped:
+            for name in (self._snapshot_name(number), self._segment_name(number + 1)):
+                try:
+                    os.remove(self._path(session_id, name))
+                except FileNotFoundError:
+                    pass
+        _prune(head)
+        self.stats["compactions"] += 1
+
+    def _replay(
+        self,
+        session_id: str,
+        annotation_ids: Optional[List[str]] = None,
+        number: Optional[int] = None,
+        at: Optional[float] = None,
+        image_id: Optional[str] = None,
+    ) -> Dict[str, dict]:
+        """
+        State of a session's annotations (or of some of them, or of one
+        image's) after record `number` or at time `at`, from the last
+        snapshot before it; with the lock held
+        """
+        head = self._head(session_id)
+        snapshots = [
+            snapshot
+            for snapshot in head.snapshots
+            if (number is None or snapshot[0] <= number)
+            and (at is None or snapshot[1] <= at)
+        ]
+        if not snapshots:
+            raise HistoryExpiredError("That change is older than the history kept")
+        self.stats["replays"] += 1
+        base = snapshots[-1][0]
+        wanted = set(annotation_ids) if annotation_ids is not None else None
+
+        # Snapshot lines start with their id (and image id) and changes hold
+        # it: only the lines of the wanted annotations are parsed
+        keys = (
+            [b'"a":' + json.dumps(annotation_id).encode() for annotation_id in wanted]
+            if wanted is not None
+            else None
+        )
+        prefixes = tuple(b"{" + key + b"," for key in keys or ())
+        image_key = (
+            b'"i":' + json.dumps(image_id).encode() + b","
+            if image_id is not None
+            else None
+        )
+
+        def past(record_number: int, record_time: float) -> bool:
+            return (number is not None and record_number > number) or (
+                at is not None and record_time > at
+            )
+
+        state = {}
+        with open(self._path(session_id, self._snapshot_name(base)), "rb") as f:
+            f.readline()
+            for line in f:
+                if (keys is None or line.startswith(prefixes)) and (
+                    image_key is None or image_key in line
+                ):
+                    entry = json.loads(line)
+                    state[entry.pop("a")] = entry
+        for first, _ in head.snapshots:
+            if first < base:
+                continue
+            path = self._path(session_id, self._segment_name(first + 1))
+            for line, _ in self._lines(path):
+                if keys is not None and not any(key in line for key in keys):
+                    start = _RECORD_START.match(line)
+                    if start is not None and not past(int(start[1]), float(start[2])):
+                        continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if past(record["n"], record["t"]):
+                    return _targets(state, image_id)
+                for op in record["o"]:
+                    if wanted is None or op["a"] in wanted:
+                        _apply(state, op)
+        return _targets(state, image_id)
+
+
+def _meta(image_id: str, file_path: str, auto_generated: bool) -> dict:
+    return {"i": image_id, "f": file_path, "g": auto_generated}
+
+
+def _advance(head: _Head, record: dict) -> None:
+    """Move the undo and redo stacks past a record"""
+    kind = record.get("k")
+    annotation_ids = sorted({op["a"] for op in record["o"]})
+    if kind == "edit":
+        head.undo.append([record["n"], annotation_ids])
+        head.redo.clear()
+    elif kind in ("undo", "redo"):
+        source, target = (
+            (head.undo, head.redo) if kind == "undo" else (head.redo, head.undo)
+        )
+        for index in range(len(source) - 1, -1, -1):
+            if source[index][0] == record["r"]:
+                target.append(source.pop(index))
+                break
+    elif kind == "drop":
+        touched = set(annotation_ids)
+        head.undo[:] = [entry for entry in head.undo if touched.isdisjoint(entry[1])]
+        head.redo[:] = [entry for entry in head.redo if touched.isdisjoint(entry[1])]
+    head.next = record["n"] + 1
+
+
+def _prune(head: _Head) -> None:
+    """
+    Drop the edits too old to replay from the oldest snapshot: undoing one
+    replays to the state before it, redoing one to the state after it.
+    Redoing only some of the undone edits would mix states, so redo is
+    cleared once one of them is dropped.
+    """
+    oldest = head.snapshots[0][0]
+    head.undo[:] = [entry for entry in head.undo if entry[0] > oldest]
+    if any(entry[0] < oldest for entry in head.redo):
+        head.redo.clear()
+
+
+def _apply(state: Dict[str, dict], op: dict) -> None:
+    """Apply one journaled change to replayed annotations"""
+    annotation_id = op["a"]
+    if "c" in op:
+        state[annotation_id] = {**op["c"], "d": op["d"]}
+    elif "u" in op:
+        entry = state.get(annotation_id)
+        if entry is not None:
+            document = patch_document(decode_document(entry["d"]), op["u"])
+            state[annotation_id] = {**entry, "d": document}
+    else:
+        state.pop(annotation_id, None)
+
+
+def _targets(state: Dict[str, dict], image_id: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Replayed annotations (optionally one image's) as {"image_id",
+    "file_path", "auto_generated", "document"}, decoding only those
+    """
+    return {
+        annotation_id: {
+            "image_id": entry["i"],
+            "file_path": entry["f"],
+            "auto_generated": entry["g"],
+            "document": decode_document(entry["d"]),
+        }
+        for annotation_id, entry in state.items()
+        if image_id is None or entry["i"] == image_id
+    }
+
+
+# Global annotation journal instance
+annotation_journal = AnnotationJournal()
@@ -0,0 +1,155 @@
+import base64
+import struct
+from itertools import accumulate
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Decimals kept in compact normalized coordinates (~0.02 px at 20000 px)
+GEOMETRY_DECIMALS = 6
+# Value of a Polygon's "encoding" member when its rings are compact strings
+COMPACT_ENCODING = "compact"
+# Geometry encodings the endpoints can send
+GEOMETRY_ENCODINGS = ("json", COMPACT_ENCODING)
+
+_SCALE = 10**GEOMETRY_DECIMALS
+# struct code -> (smallest, largest) delta it holds, narrowest first
+_DELTA_TYPES = {
+    "b": (-(2**7), 2**7 - 1),
+    "h": (-(2**15), 2**15 - 1),
+    "i": (-(2**31), 2**31 - 1),
+}
+# Rings longer than this are converted to fixed point with numpy
+_NUMPY_MIN_VERTICES = 100
+
+
+def encode_ring(ring) -> Optional[str]:
+    """
+    Encode a ring of normalized coordinates as a compact string.
+
+    Coordinates become fixed-point integers (GEOMETRY_DECIMALS); the first
+    vertex is kept as two int32 and the others as x deltas then y deltas,
+    in the narrowest integer type that holds them all. The string is a
+    struct code for that type followed by the base64 of the little-endian
+    bytes. Returns None for rings that cannot be encoded (anything but
+    [x, y] pairs of finite numbers not far outside the image).
+    """
+    try:
+        if len(ring) > _NUMPY_MIN_VERTICES:
+            xs, ys = _fixed_point_numpy(ring)
+        else:
+            xs, ys = _fixed_point(ring)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    low, high = _DELTA_TYPES["i"]
+    if not xs or min(xs[0], ys[0]) < low or max(xs[0], ys[0]) > high:
+        return None
+    deltas = [b - a for a, b in zip(xs, xs[1:])]
+    deltas += [b - a for a, b in zip(ys, ys[1:])]
+    smallest, largest = (min(deltas), max(deltas)) if deltas else (0, 0)
+    for code, (low, high) in _DELTA_TYPES.items():
+        if low <= smallest and largest <= high:
+            break
+    else:
+        return None
+    payload = struct.pack(f"<ii{len(deltas)}{code}", xs[0], ys[0], *deltas)
+    return code + base64.b64encode(payload).decode("ascii")
+
+
+def _fixed_point(ring) -> Tuple[List[int], List[int]]:
+    """Fixed-point x and y columns of a short ring"""
+    if any(len(point) != 2 for point in ring):
+        raise ValueError("Vertices must be [x, y] pairs")
+    return (
+        [round(float(point[0]) * _SCALE) for point in ring],
+        [round(float(point[1]) * _SCALE) for point in ring],
+    )
+
+
+def _fixed_point_numpy(ring) -> Tuple[List[int], List[int]]:
+    """_fixed_point() for long rings, where numpy is faster"""
+    points = np.asarray(ring, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError("Vertices must be [x, y] pairs")
+    if not np.all(np.isfinite(points)):
+        raise ValueError("Coordinates must be finite")
+    points = np.rint(points * _SCALE).astype(np.int64)
+    return points[:, 0].tolist(), points[:, 1].tolist()
+
+
+def decode_ring(encoded: str) -> List[List[float]]:
+    """Decode a ring made by encode_ring() to normalized [x, y] pairs"""
+    code = encoded[0]
+    if code not in _DELTA_TYPES:
+        raise ValueError(f"Unknown compact ring type: {code!r}")
+    payload = base64.b64decode(encoded[1:])
+    x0, y0 = struct.unpack_from("<ii", payload)
+    count = (len(payload) - 8) // struct.calcsize(code) // 2
+    deltas = struct.unpack_from(f"<{2 * count}{code}", payload, 8)
+    xs = accumulate(deltas[:count], initial=x0)
+    ys = accumulate(deltas[count:], initial=y0)
+    return [[x / _SCALE, y / _SCALE] for x, y in zip(xs, ys)]
+
+
+def _map_polygons(document: dict, convert) -> dict:
+    """
+    Copy of a document (a FeatureCollection, Feature or bare geometry) with
+    convert(geometry) applied to its Polygons
+    """
+
+    def map_feature(feature):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") != "Polygon":
+            return feature
+        converted = convert(geometry)
+        if converted is geometry:
+            return feature
+        return {**feature, "geometry": converted}
+
+    if document.get("type") == "FeatureCollection":
+        features = document.get("features") or []
+        mapped = [map_feature(feature) for feature in features]
+        if all(a is b for a, b in zip(mapped, features)):
+            return document
+        return {**document, "features": mapped}
+    if document.get("type") == "Feature":
+        return map_feature(document)
+    if document.get("type") == "Polygon":
+        return convert(document)
+    return document
+
+
+def encode_document(document: dict) -> dict:
+    """
+    Copy of an annotation's document with Polygon rings as compact strings
+    and `"encoding": "compact"` on their geometries. Properties are shared
+    with the original; rings that cannot be encoded stay as lists.
+    """
+
+    def encode(geometry):
+        if geometry.get("encoding") == COMPACT_ENCODING:
+            return geometry
+        rings = []
+        for ring in geometry.get("coordinates") or []:
+            encoded = encode_ring(ring)
+            rings.append(ring if encoded is None else encoded)
+        return {**geometry, "coordinates": rings, "encoding": COMPACT_ENCODING}
+
+    return _map_polygons(document, encode)
+
+
+def decode_document(document: dict) -> dict:
+    """Reverse encode_document(); documents without compact rings are returned as is"""
+
+    def decode(geometry):
+        if geometry.get("encoding") != COMPACT_ENCODING:
+            return geometry
+        rings = [
+            decode_ring(ring) if isinstance(ring, str) else ring
+            for ring in geometry.get("coordinates") or []
+        ]
+        decoded = {**geometry, "coordinates": rings}
+        del decoded["encoding"]
+        return decoded
+
+    return _map_polygons(document, decode)
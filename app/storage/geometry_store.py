@@ -0,0 +1,498 @@
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .geometry_codec import COMPACT_ENCODING, decode_document, encode_document
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process owns the log
+    fcntl = None
+
+# Determine if we're running in Docker or locally
+in_docker = os.path.exists("/.dockerenv")
+base_path = (
+    Path("/app")
+    if in_docker
+    else Path(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+)
+
+# Append-only log the annotation geometry is written behind to
+GEOMETRY_LOG = os.environ.get(
+    "SAT_ANNOTATOR_GEOMETRY_LOG", str(base_path / "annotations" / "geometry.log")
+)
+# Seconds a change may wait in memory so it is written with others
+GEOMETRY_FLUSH_INTERVAL = float(
+    os.environ.get("SAT_ANNOTATOR_GEOMETRY_BATCH_WAIT", "0.05")
+)
+# fsync the log after each batch, so written changes survive a power loss
+GEOMETRY_FSYNC = os.environ.get("SAT_ANNOTATOR_GEOMETRY_FSYNC", "1") != "0"
+# How polygons are written to the log: "compact" (delta-encoded fixed-point
+# rings, see geometry_codec) or "json" (plain GeoJSON); both are read back
+GEOMETRY_ENCODING = os.environ.get("SAT_ANNOTATOR_GEOMETRY_ENCODING", COMPACT_ENCODING)
+# The log is rewritten once it holds this many lines per live document
+COMPACT_RATIO = 4
+# ... and at least this many lines
+COMPACT_MIN_LINES = 10_000
+
+
+class GeometryStore:
+    """
+    Annotation geometry (GeoJSON documents) held in memory and written behind
+    to an append-only JSON lines log.
+
+    Reads are served from memory. Changes are queued and a background thread
+    appends them to the log in batches, so handlers never wait on file I/O,
+    and reads never wait for a batch to be written, synced or compacted.
+    Changes to one annotation queued before a batch is written collapse
+    into its last one, and each batch is made durable with a single fsync
+    (group commit), so a burst of edits costs a few writes. A line torn by
+    a crash is skipped on replay and terminated before the next append.
+    The log is replayed by load() at startup, or else on first use, and
+    rewritten (to a temporary file renamed over it) once most of its lines
+    are stale. Several worker processes may share one log: each appends its
+    own changes and picks up the others' before answering a read. Polygons
+    are written in the compact encoding unless `encoding` is "json", so
+    coordinates replayed from the log are rounded to GEOMETRY_DECIMALS.
+
+    Returned documents are shared with the store; copy them before editing.
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[str] = GEOMETRY_LOG,
+        flush_interval: Optional[float] = None,
+        fsync: Optional[bool] = None,
+        encoding: Optional[str] = None,
+    ):
+        # None keeps the geometry in memory only
+        self.log_path = log_path
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else GEOMETRY_FLUSH_INTERVAL
+        )
+        self.fsync = fsync if fsync is not None else GEOMETRY_FSYNC
+        self.encoding = encoding or GEOMETRY_ENCODING
+        # session_id -> {annotation_id: document}
+        self.documents: Dict[str, Dict[str, dict]] = {}
+        # Lines from other processes carry their id, ours are skipped on replay
+        self.writer_id = uuid.uuid4().hex[:12]
+
+        # Guards the documents and the queue; never held during file I/O
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        # One batch is written, synced or compacted at a time
+        self._io_lock = threading.Lock()
+        # Guards the reader, its offset and the line count
+        self._read_lock = threading.Lock()
+        # (session_id, annotation_id or None) -> document or None, in the
+        # order the changes must be written; only the latest change per key
+        self._pending: Dict[Tuple[str, Optional[str]], Optional[dict]] = {}
+        self._writing: List[Tuple[str, Optional[str], Optional[dict]]] = []
+        self._loaded = False
+        self._closing = False
+        self._batches = 0  # Open batch() blocks holding the writer back
+        self._thread: Optional[threading.Thread] = None
+        self._log = None  # Append handle
+        self._reader = None  # Handle other processes' lines are read from
+        self._offset = 0  # How far the reader got
+        self._lines = 0  # Lines in the log file
+        self.stats = {"changes": 0, "lines_written": 0, "batches": 0, "fsyncs": 0}
+
+    # Reads
+
+    def get(self, session_id: str, annotation_id: str) -> Optional[dict]:
+        """Get one annotation's document"""
+        self._catch_up()
+        with self._lock:
+            return self.documents.get(session_id, {}).get(annotation_id)
+
+    def get_many(
+        self, session_id: str, annotation_ids: Iterable[str]
+    ) -> Dict[str, dict]:
+        """Get the documents of several annotations, skipping unknown ones"""
+        self._catch_up()
+        with self._lock:
+            documents = self.documents.get(session_id, {})
+            return {
+                annotation_id: documents[annotation_id]
+                for annotation_id in annotation_ids
+                if annotation_id in documents
+            }
+
+    def session_ids(self) -> List[str]:
+        """Get the sessions that have documents"""
+        self._catch_up()
+        with self._lock:
+            return list(self.documents)
+
+    # Writes
+
+    def put(self, session_id: str, annotation_id: str, document: dict) -> None:
+        """Store an annotation's document, replacing any previous one"""
+        self._catch_up()
+        with self._lock:
+            self.documents.setdefault(session_id, {})[annotation_id] = document
+            self._queue(session_id, annotation_id, document)
+
+    def update(
+        self,
+        session_id: str,
+        annotation_id: str,
+        change: Callable[[dict], dict],
+    ) -> Optional[dict]:
+        """
+        Replace an annotation's document with `change(document)`, atomically
+        with respect to other updates in this process.
+
+        `change` must return a new document rather than edit the one it is
+        given, and may raise to abort. Returns the new document, or None if
+        the annotation has none.
+        """
+        self._catch_up()
+        with self._lock:
+            document = self.documents.get(session_id, {}).get(annotation_id)
+            if document is None:
+                return None
+            document = change(document)
+            self.documents[session_id][annotation_id] = document
+            self._queue(session_id, annotation_id, document)
+            return document
+
+    def delete(self, session_id: str, annotation_id: str) -> bool:
+        """Remove an annotation's document"""
+        self._catch_up()
+        with self._lock:
+            documents = self.documents.get(session_id)
+            if not documents or documents.pop(annotation_id, None) is None:
+                return False
+            self._queue(session_id, annotation_id, None)
+            return True
+
+    def drop_session(self, session_id: str) -> None:
+        """Remove every document of a session"""
+        self._catch_up()
+        with self._lock:
+            if self.documents.pop(session_id, None) is not None:
+                self._queue(session_id, None, None)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Hold the writer back while several changes are made, so they are
+        written and made durable together once the block exits.
+        """
+        with self._lock:
+            self._batches += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._batches -= 1
+                self._wake.notify()
+
+    def _queue(self, session_id, annotation_id, document) -> None:
+        if self.log_path is None:
+            return
+        self.stats["changes"] += 1
+        if annotation_id is None:
+            # Dropping the session supersedes its queued changes
+            for key in [key for key in self._pending if key[0] == session_id]:
+                del self._pending[key]
+        # Re-queued changes move to the end, after anything queued meanwhile
+        self._pending.pop((session_id, annotation_id), None)
+        self._pending[(session_id, annotation_id)] = document
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="geometry-writer", daemon=True
+            )
+            self._thread.start()
+        self._wake.notify()
+
+    # Log
+
+    def _encode(self, change) -> str:
+        session_id, annotation_id, document = change
+        record = {"w": self.writer_id, "s": session_id}
+        if annotation_id is not None:
+            record["a"] = annotation_id
+            if document is not None and self.encoding == COMPACT_ENCODING:
+                document = encode_document(document)
+            record["d"] = document
+        return json.dumps(record, separators=(",", ":")) + "\n"
+
+    @staticmethod
+    def _apply(documents, session_id, annotation_id, document) -> None:
+        """Apply one change to a session -> documents mapping"""
+        if annotation_id is None:
+            documents.pop(session_id, None)
+        elif document is None:
+            documents.get(session_id, {}).pop(annotation_id, None)
+        else:
+            documents.setdefault(session_id, {})[annotation_id] = document
+
+    def _read_changes(self, skip_own: bool) -> list:
+        """
+        Decode the complete lines after the reader's offset, with the read
+        lock held but not the documents' lock
+        """
+        changes = []
+        self._reader.seek(self._offset)
+        for line in self._reader:
+            if not line.endswith(b"\n"):
+                break  # Still being written
+            self._offset += len(line)
+            self._lines += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn by a crash
+            if not (skip_own and record.get("w") == self.writer_id):
+                document = record.get("d")
+                if document is not None:
+                    document = decode_document(document)
+                changes.append((record["s"], record.get("a"), document))
+        return changes
+
+    def _read_lines(self, skip_own: bool) -> None:
+        """Apply the complete lines after the reader's offset"""
+        changes = self._read_changes(skip_own)
+        if changes:
+            with self._lock:
+                for change in changes:
+                    self._apply(self.documents, *change)
+                # Changes not yet written are newer than anything in the log
+                for change in self._unwritten():
+                    self._apply(self.documents, *change)
+
+    def _unwritten(self) -> List[Tuple[str, Optional[str], Optional[dict]]]:
+        """Changes not in the log yet, oldest first"""
+        return self._writing + [
+            (session_id, annotation_id, document)
+            for (session_id, annotation_id), document in self._pending.items()
+        ]
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """
+        Keep other processes from appending while the log is written or
+        rewritten (no-op without fcntl). Readers need no lock: the log is
+        only ever appended to or atomically replaced.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.log_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reopen(self) -> None:
+        """Open new handles on the log, with the read lock held"""
+        for handle in (self._log, self._reader):
+            if handle is not None:
+                handle.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        self._log = open(self.log_path, "ab")
+        self._reader = open(self.log_path, "rb")
+        self._offset = self._lines = 0
+
+    def _open(self) -> None:
+        """
+        (Re)open the log and rebuild memory from it, with the read lock
+        held. The log is replayed into a new mapping that replaces the
+        documents in one step, so readers are not held up meanwhile.
+        """
+        self._reopen()
+        documents = {}
+        for change in self._read_changes(skip_own=False):
+            self._apply(documents, *change)
+        with self._lock:
+            for change in self._unwritten():
+                self._apply(documents, *change)
+            self.documents = documents
+
+    def _replaced(self) -> bool:
+        """Check whether another process rewrote the log"""
+        try:
+            return (
+                os.stat(self.log_path).st_ino != os.fstat(self._reader.fileno()).st_ino
+            )
+        except FileNotFoundError:
+            return True
+
+    def load(self) -> None:
+        """
+        Replay the log now rather than on first use. Call it from a worker
+        thread at startup, so no request waits for the replay.
+        """
+        if self.log_path is None:
+            return
+        with self._read_lock:
+            if not self._loaded:
+                self._open()
+                self._loaded = True
+
+    def _catch_up(self) -> None:
+        """
+        Load the log on first use and apply other processes' new lines.
+
+        Once loaded, a thread that finds another one reading the log (e.g.
+        replaying it after another process compacted it) does not wait and
+        is served from memory meanwhile.
+        """
+        if self.log_path is None:
+            return
+        if not self._loaded:
+            self.load()
+            return
+        if not self._read_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                size = os.stat(self.log_path).st_size
+            except FileNotFoundError:
+                size = -1
+            if size == self._offset:
+                return
+            if size < self._offset or self._replaced():
+                self._open()
+            else:
+                self._read_lines(skip_own=True)
+        finally:
+            self._read_lock.release()
+
+    def flush(self) -> None:
+        """
+        Write every queued change to the log now.
+
+        Only taking the queue and recording the result hold the documents'
+        lock; the write, fsync and compaction run under the I/O locks alone.
+        """
+        if self.log_path is None:
+            return
+        self._catch_up()
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                changes = [(s, a, d) for (s, a), d in pending.items()]
+                self._writing = changes
+            if not changes:
+                return
+            data = "".join(self._encode(change) for change in changes).encode()
+            with self._file_lock():
+                with self._read_lock:
+                    if self._replaced():
+                        self._open()
+                    log = self._log
+                # Skip straight past our own lines if no one else wrote
+                start = os.fstat(log.fileno()).st_size
+                if start and self._torn(start):
+                    # Left by a writer that crashed (live ones hold the lock)
+                    log.write(b"\n")
+                    log.flush()
+                    start += 1
+                log.write(data)
+                log.flush()
+                if self.fsync:
+                    os.fsync(log.fileno())
+                    self.stats["fsyncs"] += 1
+                with self._read_lock:
+                    if start == self._offset:
+                        self._offset += len(data)
+                        self._lines += len(changes)
+                    else:
+                        # Other processes wrote, or a reader got here first
+                        self._read_lines(skip_own=True)
+                with self._lock:
+                    self._writing = []
+                    self.stats["batches"] += 1
+                    self.stats["lines_written"] += len(changes)
+                if self._should_compact():
+                    self._compact()
+
+    def _torn(self, size: int) -> bool:
+        """Check whether the log ends in the middle of a line"""
+        with open(self.log_path, "rb") as f:
+            f.seek(size - 1)
+            return f.read(1) != b"\n"
+
+    def _should_compact(self) -> bool:
+        with self._lock:
+            live = sum(len(documents) for documents in self.documents.values())
+        return self._lines > max(COMPACT_MIN_LINES, COMPACT_RATIO * live)
+
+    def _compact(self) -> None:
+        """
+        Rewrite the log with one line per live document, with the I/O and
+        file locks held. Memory already matches the new log, so it is not
+        replayed.
+        """
+        with self._lock:
+            snapshot = [
+                (session_id, list(documents.items()))
+                for session_id, documents in self.documents.items()
+            ]
+        temp_path = f"{self.log_path}.{self.writer_id}.tmp"
+        size = lines = 0
+        with open(temp_path, "wb") as f:
+            for session_id, documents in snapshot:
+                for annotation_id, document in documents:
+                    line = self._encode((session_id, annotation_id, document))
+                    size += f.write(line.encode())
+                    lines += 1
+            f.flush()
+            os.fsync(f.fileno())
+        with self._read_lock:
+            os.replace(temp_path, self.log_path)
+            self._reopen()
+            self._offset, self._lines = size, lines
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            # Make the rename itself durable
+            directory = os.open(
+                os.path.dirname(os.path.abspath(self.log_path)), os.O_DIRECTORY
+            )
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while (not self._pending or self._batches) and not self._closing:
+                    self._wake.wait()
+                if self._closing:
+                    return
+            # Let changes arriving meanwhile share the write; close() cuts
+            # the wait short
+            with self._lock:
+                self._wake.wait_for(lambda: self._closing, self.flush_interval)
+                if self._batches and not self._closing:
+                    continue  # A batch started meanwhile; wait for it
+            self.flush()
+
+    def close(self) -> None:
+        """Write queued changes and stop the writer thread"""
+        with self._lock:
+            self._closing = True
+            self._wake.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.flush()
+        with self._read_lock, self._lock:
+            for handle in (self._log, self._reader):
+                if handle is not None:
+                    handle.close()
+            self._log = self._reader = None
+            self._loaded = self._closing = False
+
+
+# Global geometry store instance
+geometry_store = GeometryStore()
@@ -0,0 +1,830 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+from .session_store import (
+    BaseSessionStore,
+    SessionStore,
+    SessionImage,
+    SessionAnnotation,
+    _page_images,
+)
+
+# Server shared by every API worker
+REDIS_URL = os.environ.get("SAT_ANNOTATOR_REDIS_URL", "redis://localhost:6379/0")
+# Prefix of every key written by the session store
+REDIS_KEY_PREFIX = os.environ.get("SAT_ANNOTATOR_REDIS_PREFIX", "sat:")
+# Sessions kept in each worker's local read-through cache
+REDIS_CACHE_SESSIONS = int(os.environ.get("SAT_ANNOTATOR_REDIS_CACHE_SESSIONS", "1024"))
+# Socket timeout in seconds
+REDIS_TIMEOUT = 10.0
+# Attempts at a checked write before giving up on a busy session
+WATCH_RETRIES = 5
+
+
+class RedisError(Exception):
+    """Error reply from the server or a broken connection"""
+
+
+class TransactionAborted(RedisError):
+    """A watched key changed before EXEC, so the transaction did not run"""
+
+
+def _encode_command(args: Sequence) -> bytes:
+    """Encode one command as a RESP array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    """Read one RESP reply; error replies are returned, not raised"""
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by server")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RedisError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("Connection closed by server")
+        return data[:-2]
+    if kind == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [_read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply type {kind!r}")
+
+
+class RedisClient:
+    """
+    Minimal Redis protocol (RESP2) client.
+
+    Commands are always sent as a pipeline: every command of a call goes out
+    in one write and the replies are read back in order, so a call costs one
+    network round trip however many commands it carries. Each thread keeps
+    its own connection.
+    """
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", ""):
+            raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(
+                (self.host, self.port), timeout=REDIS_TIMEOUT
+            )
+            # Pipelines are written in one go, don't wait to coalesce them
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+
+            setup = []
+            if self.password:
+                setup.append(("AUTH", self.password))
+            if self.db:
+                setup.append(("SELECT", self.db))
+            if setup:
+                self._check(self._roundtrip(conn, setup))
+        return conn
+
+    @staticmethod
+    def _roundtrip(conn, commands: Sequence[Sequence]) -> list:
+        sock, reader = conn
+        sock.sendall(b"".join(_encode_command(command) for command in commands))
+        return [_read_reply(reader) for _ in commands]
+
+    @staticmethod
+    def _check(replies: list) -> list:
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def pipeline(self, commands: Sequence[Sequence]) -> list:
+        """Send commands in one round trip and return their replies"""
+        try:
+            replies = self._roundtrip(self._connection(), commands)
+        except (OSError, ConnectionError) as e:
+            if getattr(self._local, "watching", False):
+                # A new connection would not carry the WATCH; start over
+                self.close()
+                raise TransactionAborted(f"Redis connection failed: {e}") from e
+            # The server may have restarted or dropped an idle connection.
+            # Retrying is safe for the store's commands: the only one that is
+            # not idempotent is the version counter, which may skip a value.
+            self.close()
+            try:
+                replies = self._roundtrip(self._connection(), commands)
+            except (OSError, ConnectionError) as e:
+                self.close()
+                raise RedisError(f"Redis connection failed: {e}") from e
+        return self._check(replies)
+
+    def transaction(self, commands: Sequence[Sequence]) -> list:
+        """
+        Run commands atomically with MULTI/EXEC in one round trip. Raises
+        TransactionAborted when a key watched by watch() changed meanwhile.
+        """
+        try:
+            replies = self.pipeline([("MULTI",), *commands, ("EXEC",)])
+        finally:
+            # EXEC always ends the WATCH
+            self._local.watching = False
+        results = replies[-1]
+        if results is None:
+            raise TransactionAborted("Transaction aborted")
+        return self._check(results)
+
+    def watch(self, keys: Sequence, commands: Sequence[Sequence]) -> list:
+        """
+        WATCH keys and run read commands in the same round trip. The next
+        transaction() of this thread only runs if none of the keys changed
+        in between; call unwatch() instead to drop it.
+        """
+        replies = self.pipeline([("WATCH", *keys), *commands])
+        self._local.watching = True
+        return replies[1:]
+
+    def unwatch(self) -> None:
+        """Drop this thread's WATCH without running a transaction"""
+        self._local.watching = False
+        self.pipeline([("UNWATCH",)])
+
+    def close(self) -> None:
+        """Close this thread's connection"""
+        self._local.watching = False
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            sock, reader = conn
+            reader.close()
+            sock.close()
+            self._local.conn = None
+
+
+def _dumps(record: list) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode()
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    return (value or datetime.now()).timestamp()
+
+
+def _pack_image(image: SessionImage, seq: int) -> bytes:
+    # Positional JSON arrays: no field names repeated in every record
+    return _dumps(
+        [
+            seq,
+            image.file_name,
+            image.file_path,
+            image.resolution,
+            image.source,
+            image.sam_path,
+            _timestamp(image.capture_date),
+            _timestamp(image.created_at),
+            image.file_size,
+        ]
+    )
+
+
+def _unpack_image(image_id: str, data: bytes):
+    record = json.loads(data)
+    seq, name, path, resolution, source, sam_path, captured, created = record[:8]
+    # Records written before file_size existed are one field shorter
+    file_size = record[8] if len(record) > 8 else None
+    image = SessionImage(
+        image_id=image_id,
+        file_name=name,
+        file_path=path,
+        resolution=resolution,
+        source=source,
+        sam_path=sam_path,
+        capture_date=datetime.fromtimestamp(captured),
+        created_at=datetime.fromtimestamp(created),
+        file_size=file_size,
+    )
+    return seq, image
+
+
+def _pack_annotation(annotation: SessionAnnotation, seq: int) -> bytes:
+    return _dumps(
+        [
+            seq,
+            annotation.image_id,
+            annotation.file_path,
+            _timestamp(annotation.created_at),
+            int(annotation.auto_generated),
+            annotation.model_id,
+        ]
+    )
+
+
+def _unpack_annotation(annotation_id: str, data: bytes):
+    seq, image_id, path, created, auto_generated, model_id = json.loads(data)
+    annotation = SessionAnnotation(
+        annotation_id=annotation_id,
+        image_id=image_id,
+        file_path=path,
+        created_at=datetime.fromtimestamp(created),
+        auto_generated=bool(auto_generated),
+        model_id=model_id,
+    )
+    return seq, annotation
+
+
+def _pairs(flat: list) -> Dict[str, bytes]:
+    """Turn an HGETALL reply into a dict"""
+    it = iter(flat or [])
+    return {key.decode(): value for key, value in zip(it, it)}
+
+
+class RedisSessionStore(BaseSessionStore):
+    """
+    Session store kept in Redis so every worker and node sees the same data.
+
+    Each session is three hashes: metadata (created_at and the version
+    counter), images and annotations. Every write bumps the version in the
+    same MULTI/EXEC transaction. Each worker keeps recently used sessions in
+    a local cache; a read first fetches only the version and reuses the
+    cached copy when it still matches, so one small round trip serves it.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        prefix: Optional[str] = None,
+        cache_sessions: Optional[int] = None,
+    ):
+        self.client = RedisClient(url or REDIS_URL)
+        self.prefix = prefix if prefix is not None else REDIS_KEY_PREFIX
+        self.cache_sessions = (
+            cache_sessions if cache_sessions is not None else REDIS_CACHE_SESSIONS
+        )
+        # Read-through cache, laid out exactly like the in-memory store
+        self._cache = SessionStore()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._last_seq = 0
+
+    @property
+    def _sessions_key(self) -> str:
+        # Sorted set of session ids scored by last access time
+        return f"{self.prefix}sessions"
+
+    def _keys(self, session_id: str):
+        # The hash tag keeps a session's keys in one cluster slot for MULTI
+        tag = f"{self.prefix}{{{session_id}}}"
+        return f"{tag}:meta", f"{tag}:images", f"{tag}:annotations"
+
+    def _next_seq(self) -> int:
+        """Insertion order key, monotonic within this process"""
+        with self._lock:
+            self._last_seq = max(self._last_seq + 1, time.time_ns())
+            return self._last_seq
+
+    def _forget(self, session_id: str) -> None:
+        with self._lock:
+            self._cache.sessions.pop(session_id, None)
+
+    def _staged(self) -> Optional[SessionStore]:
+        """This thread's sessions changed by the open batch, if any"""
+        return getattr(self._local, "staged", None)
+
+    def _stage(self, session_id: str, staged: SessionStore) -> Dict:
+        """Copy a session into the batch's staging store on its first write"""
+        session = staged.sessions.get(session_id)
+        if session is not None:
+            return session
+
+        session = self._load(session_id)
+        if session is None:
+            staged.create_session(session_id)
+            return staged.sessions[session_id]
+        with self._lock:
+            session = {
+                **session,
+                "images": dict(session["images"]),
+                "annotations": dict(session["annotations"]),
+                "image_order": list(session["image_order"]),
+                "image_annotations": None,
+            }
+        staged.sessions[session_id] = session
+        staged._annotation_index(session_id)
+        return session
+
+    def _load(self, session_id: str) -> Optional[Dict]:
+        """Get a session through the local cache, validated by its version"""
+        staged = self._staged()
+        if staged is not None and session_id in staged.sessions:
+            return staged.sessions[session_id]
+
+        meta, images_key, annotations_key = self._keys(session_id)
+        version = self.client.pipeline([("HGET", meta, "version")])[0]
+        if version is None:
+            self._forget(session_id)
+            return None
+
+        version = int(version)
+        with self._lock:
+            cached = self._cache.sessions.pop(session_id, None)
+            if cached is not None and cached["version"] == version:
+                # Re-insert to keep the cache in least recently used order
+                self._cache.sessions[session_id] = cached
+                return cached
+
+        meta_reply, images_reply, annotations_reply = self.client.transaction(
+            [("HGETALL", meta), ("HGETALL", images_key), ("HGETALL", annotations_key)]
+        )
+        fields = _pairs(meta_reply)
+        if "version" not in fields:
+            return None
+
+        images = sorted(
+            (_unpack_image(k, v) for k, v in _pairs(images_reply).items()),
+            key=lambda item: item[0],
+        )
+        annotations = sorted(
+            (_unpack_annotation(k, v) for k, v in _pairs(annotations_reply).items()),
+            key=lambda item: item[0],
+        )
+        session = {
+            "images": {image.image_id: image for _, image in images},
+            "annotations": {a.annotation_id: a for _, a in annotations},
+            "created_at": datetime.fromtimestamp(float(fields["created_at"])),
+            "version": int(fields["version"]),
+            "image_annotations": None,
+            # Paging positions are the record sequence numbers, so cursors
+            # stay valid across workers and reloads
+            "image_order": [(seq, image.image_id) for seq, image in images],
+        }
+        with self._lock:
+            self._cache.sessions[session_id] = session
+            self._cache._annotation_index(session_id)
+            while len(self._cache.sessions) > self.cache_sessions:
+                del self._cache.sessions[next(iter(self._cache.sessions))]
+        return session
+
+    def _write(
+        self,
+        session_id: str,
+        commands: List[tuple],
+        apply=None,
+        checks: Sequence[Tuple[str, str, str]] = (),
+    ) -> Optional[int]:
+        """
+        Run write commands and bump the version in one transaction, and
+        return the new version.
+
+        `apply(store)` mirrors the change into the session held by an
+        in-memory store: the local cache, when it was current right before
+        the write (otherwise the entry is dropped and reloaded on the next
+        read), or inside a batch the staged copy later reads are served from.
+
+        `checks` are (meta key, hash key, field) records the write depends
+        on; it only runs while they exist, and None is returned otherwise.
+        """
+        meta = self._keys(session_id)[0]
+        commands = [*commands, ("HINCRBY", meta, "version", 1)]
+
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.extend(commands)
+            self._local.checks.extend(checks)
+            staged = self._staged()
+            session = self._stage(session_id, staged)
+            if apply is not None:
+                apply(staged)
+            # The version the queued HINCRBY sets, unless another worker
+            # writes to the session before the batch is sent
+            session["version"] += 1
+            return session["version"]
+
+        replies = self._commit(commands, checks)
+        if replies is None:
+            self._forget(session_id)
+            return None
+        version = replies[-1]
+        with self._lock:
+            cached = self._cache.sessions.get(session_id)
+            if cached is None:
+                return version
+            if apply is not None and cached["version"] == version - 1:
+                apply(self._cache)
+                cached["version"] = version
+            else:
+                del self._cache.sessions[session_id]
+        return version
+
+    def _commit(
+        self, commands: List[tuple], checks: Sequence[Tuple[str, str, str]]
+    ) -> Optional[list]:
+        """
+        Run a transaction, after checking the records it depends on.
+
+        The checked sessions' meta keys are WATCHed while the records are
+        looked up, and every write bumps a session's version there, so the
+        transaction is aborted and retried if another worker wrote to one of
+        them in between. Returns None when a record no longer exists.
+        """
+        if not checks:
+            return self.client.transaction(commands)
+
+        metas = list(dict.fromkeys(meta for meta, _, _ in checks))
+        lookups = [("HEXISTS", key, field) for _, key, field in checks]
+        for _ in range(WATCH_RETRIES):
+            if not all(self.client.watch(metas, lookups)):
+                self.client.unwatch()
+                return None
+            try:
+                return self.client.transaction(commands)
+            except TransactionAborted:
+                continue
+        raise RedisError(f"Session kept changing, gave up after {WATCH_RETRIES} tries")
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Buffer every write made inside the block and send them as a single
+        MULTI/EXEC transaction when it exits. Sessions written in the block
+        are staged in a local copy, so reads inside it see its own writes
+        as the other backends do; the writes are discarded if it raises.
+        """
+        if getattr(self._local, "pending", None) is not None:
+            yield
+            return
+
+        self._local.pending = []
+        self._local.staged = SessionStore()
+        self._local.checks = []
+        try:
+            yield
+            commands, staged = self._local.pending, self._local.staged
+            checks = self._local.checks
+        finally:
+            self._local.pending = None
+            self._local.staged = None
+            self._local.checks = None
+        if commands:
+            # Records the batch writes itself need no check
+            written = {command[1:3] for command in commands if command[0] == "HSET"}
+            checks = [check for check in checks if check[1:] not in written]
+            try:
+                if self._commit(commands, checks) is None:
+                    raise RedisError("A record the batch depends on was removed")
+            finally:
+                for session_id in staged.sessions:
+                    self._forget(session_id)
+
+    def close(self) -> None:
+        """Close this thread's connection"""
+        self.client.close()
+
+    def _create_commands(self, session_id: str) -> List[tuple]:
+        meta = self._keys(session_id)[0]
+        now = datetime.now().timestamp()
+        return [
+            ("HSETNX", meta, "created_at", now),
+            ("HSETNX", meta, "version", 0),
+            ("ZADD", self._sessions_key, "NX", now, session_id),
+        ]
+
+    def create_session(self, session_id: str) -> None:
+        commands = self._create_commands(session_id)
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.extend(commands)
+            self._stage(session_id, self._staged())
+        else:
+            self.client.transaction(commands)
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        return self._load(session_id)
+
+    def get_session_summary(self, session_id: str) -> Optional[Dict]:
+        session = self._load(session_id)
+        if session is None:
+            return None
+        return {
+            "created_at": session["created_at"],
+            "images_count": len(session["images"]),
+            "annotations_count": len(session["annotations"]),
+        }
+
+    def session_exists(self, session_id: str) -> bool:
+        staged = self._staged()
+        if staged is not None and session_id in staged.sessions:
+            return True
+        meta = self._keys(session_id)[0]
+        return self.client.pipeline([("EXISTS", meta)])[0] > 0
+
+    def get_version(self, session_id: str) -> int:
+        meta = self._keys(session_id)[0]
+        version = self.client.pipeline([("HGET", meta, "version")])[0]
+        return int(version) if version is not None else 0
+
+    def bump_version(self, session_id: str) -> int:
+        if not self.session_exists(session_id):
+            return 0
+        return self._write(session_id, [], apply=lambda store: None)
+
+    def add_image(
+        self,
+        session_id: str,
+        file_name: str,
+        file_path: str,
+        resolution: Optional[str] = None,
+        source: Optional[str] = None,
+        sam_path: Optional[str] = None,
+        file_size: Optional[int] = None,
+    ) -> SessionImage:
+        image = SessionImage(
+            image_id=str(uuid.uuid4()),
+            file_name=file_name,
+            file_path=file_path,
+            resolution=resolution,
+            source=source or "user_upload",
+            sam_path=sam_path,
+            file_size=file_size,
+        )
+        images_key = self._keys(session_id)[1]
+        seq = self._next_seq()
+
+        def apply(store):
+            session = store.sessions[session_id]
+            session["images"][image.image_id] = image
+            bisect.insort(session["image_order"], (seq, image.image_id))
+
+        self._write(
+            session_id,
+            [
+                *self._create_commands(session_id),
+                ("HSET", images_key, image.image_id, _pack_image(image, seq)),
+            ],
+            apply,
+        )
+        return image
+
+    def get_images(
+        self, session_id: str, skip: int = 0, limit: int = 100
+    ) -> List[SessionImage]:
+        session = self._load(session_id)
+        if session is None:
+            return []
+        images = list(session["images"].values())
+        return images[skip : skip + limit]
+
+    def get_images_page(
+        self, session_id: str, after: Optional[int] = None, limit: int = 100
+    ) -> Tuple[List[SessionImage], Optional[int]]:
+        session = self._load(session_id)
+        if session is None:
+            return [], None
+        with self._lock:
+            return _page_images(session, after, limit)
+
+    def get_image(self, session_id: str, image_id: str) -> Optional[SessionImage]:
+        session = self._load(session_id)
+        if session is None:
+            return None
+        return session["images"].get(image_id)
+
+    def add_annotation(
+        self,
+        session_id: str,
+        image_id: str,
+        file_path: str,
+        auto_generated: bool = False,
+        model_id: Optional[str] = None,
+        annotation_id: Optional[str] = None,
+    ) -> Optional[SessionAnnotation]:
+        session = self._load(session_id)
+        if session is None or image_id not in session["images"]:
+            return None
+
+        annotation = SessionAnnotation(
+            annotation_id=annotation_id or str(uuid.uuid4()),
+            image_id=image_id,
+            file_path=file_path,
+            auto_generated=auto_generated,
+            model_id=model_id,
+        )
+        meta, images_key, annotations_key = self._keys(session_id)
+
+        def apply(store):
+            # A replaced annotation moves to the end, as it does on reload
+            annotations = store.sessions[session_id]["annotations"]
+            index = store._annotation_index(session_id)
+            previous = annotations.pop(annotation.annotation_id, None)
+            if previous is not None:
+                index.get(previous.image_id, {}).pop(annotation.annotation_id, None)
+            annotations[annotation.annotation_id] = annotation
+            index.setdefault(image_id, {})[annotation.annotation_id] = None
+
+        # Only written while the image exists, even if another worker is
+        # removing it
+        version = self._write(
+            session_id,
+            [
+                (
+                    "HSET",
+                    annotations_key,
+                    annotation.annotation_id,
+                    _pack_annotation(annotation, self._next_seq()),
+                )
+            ],
+            apply,
+            checks=[(meta, images_key, image_id)],
+        )
+        return annotation if version is not None else None
+
+    def get_annotations(
+        self, session_id: str, image_id: Optional[str] = None
+    ) -> List[SessionAnnotation]:
+        session = self._load(session_id)
+        if session is None:
+            return []
+
+        annotations = session["annotations"]
+        if not image_id:
+            return list(annotations.values())
+        with self._lock:
+            annotation_ids = list(session["image_annotations"].get(image_id, {}))
+        return [annotations[a] for a in annotation_ids if a in annotations]
+
+    def get_annotation(
+        self, session_id: str, annotation_id: str
+    ) -> Optional[SessionAnnotation]:
+        session = self._load(session_id)
+        if session is None:
+            return None
+        return session["annotations"].get(annotation_id)
+
+    def count_annotations(
+        self, session_id: str, image_ids: Iterable[str]
+    ) -> Dict[str, int]:
+        session = self._load(session_id)
+        if session is None:
+            return {image_id: 0 for image_id in image_ids}
+        with self._lock:
+            index = session["image_annotations"]
+            return {image_id: len(index.get(image_id, ())) for image_id in image_ids}
+
+    def remove_annotation(self, session_id: str, annotation_id: str) -> bool:
+        session = self._load(session_id)
+        if session is None or annotation_id not in session["annotations"]:
+            return False
+
+        annotations_key = self._keys(session_id)[2]
+        self._write(
+            session_id,
+            [("HDEL", annotations_key, annotation_id)],
+            lambda store: store.remove_annotation(session_id, annotation_id),
+        )
+        return True
+
+    def remove_image(self, session_id: str, image_id: str) -> bool:
+        session = self._load(session_id)
+        if session is None or image_id not in session["images"]:
+            return False
+
+        _, images_key, annotations_key = self._keys(session_id)
+        with self._lock:
+            annotation_ids = list(session["image_annotations"].get(image_id, {}))
+        commands = [("HDEL", images_key, image_id)]
+        if annotation_ids:
+            commands.append(("HDEL", annotations_key, *annotation_ids))
+        self._write(
+            session_id,
+            commands,
+            lambda store: store.remove_image(session_id, image_id),
+        )
+        return True
+
+    def delete_session(self, session_id: str) -> bool:
+        removed = self.client.pipeline(
+            [
+                ("DEL", *self._keys(session_id)),
+                ("ZREM", self._sessions_key, session_id),
+            ]
+        )[0]
+        self._forget(session_id)
+        staged = self._staged()
+        if staged is not None:
+            staged.sessions.pop(session_id, None)
+        return removed > 0
+
+    def touch_session(self, session_id: str) -> None:
+        # XX: only update sessions that still exist
+        self.client.pipeline(
+            [
+                (
+                    "ZADD",
+                    self._sessions_key,
+                    "XX",
+                    datetime.now().timestamp(),
+                    session_id,
+                )
+            ]
+        )
+
+    def get_idle_sessions(self, cutoff: datetime) -> List[str]:
+        reply = self.client.pipeline(
+            [("ZRANGEBYSCORE", self._sessions_key, "-inf", cutoff.timestamp())]
+        )[0]
+        return [session_id.decode() for session_id in reply]
+
+    def get_session_usage(self, session_id: str) -> int:
+        session = self._load(session_id)
+        if session is None:
+            return 0
+        # Copied first, a refresh may replace the records meanwhile
+        with self._lock:
+            images = list(session["images"].values())
+        return sum(image.file_size or 0 for image in images)
+
+    def iter_file_paths(self) -> Iterator[str]:
+        session_ids = self.client.pipeline([("ZRANGE", self._sessions_key, 0, -1)])[0]
+        # Fetch the sessions' records a page at a time in one round trip each
+        for start in range(0, len(session_ids), 100):
+            commands = []
+            for session_id in session_ids[start : start + 100]:
+                _, images_key, annotations_key = self._keys(session_id.decode())
+                commands += [("HVALS", images_key), ("HVALS", annotations_key)]
+            replies = self.client.pipeline(commands)
+            for images, annotations in zip(replies[::2], replies[1::2]):
+                for data in images:
+                    record = json.loads(data)
+                    yield record[2]
+                    if record[5]:
+                        yield record[5]
+                for data in annotations:
+                    yield json.loads(data)[2]
+
+    def export_session(self, session_id: str) -> Optional[Dict]:
+        return self._load(session_id)
+
+    def import_session(self, session_id: str, data: Dict) -> bool:
+        if "images" not in data or "annotations" not in data:
+            return False
+
+        meta, images_key, annotations_key = self._keys(session_id)
+        version = max(self.get_version(session_id), data.get("version", 0)) + 1
+        commands = [
+            ("DEL", meta, images_key, annotations_key),
+            ("ZADD", self._sessions_key, datetime.now().timestamp(), session_id),
+            (
+                "HSET",
+                meta,
+                "created_at",
+                _timestamp(data.get("created_at")),
+                "version",
+                version,
+            ),
+        ]
+        image_fields = []
+        for image in data["images"].values():
+            image_fields += [image.image_id, _pack_image(image, self._next_seq())]
+        if image_fields:
+            commands.append(("HSET", images_key, *image_fields))
+        annotation_fields = []
+        for annotation in data["annotations"].values():
+            annotation_fields += [
+                annotation.annotation_id,
+                _pack_annotation(annotation, self._next_seq()),
+            ]
+        if annotation_fields:
+            commands.append(("HSET", annotations_key, *annotation_fields))
+
+        self.client.transaction(commands)
+        self._forget(session_id)
+        return True
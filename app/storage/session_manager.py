@@ -1,12 +1,13 @@
 from fastapi import Request, Response, Depends
+import os
 import uuid
 from typing import Optional
 from datetime import datetime, timedelta
 
 # Session cookie name
 SESSION_COOKIE_NAME = "sat_annotator_session"
-# Session timeout (7 days)
-SESSION_TIMEOUT_DAYS = 7
+# Idle sessions are expired after this many days (7 by default)
+SESSION_TIMEOUT_DAYS = float(os.environ.get("SAT_ANNOTATOR_SESSION_TIMEOUT_DAYS", "7"))
 
 
 def generate_session_id() -> str:
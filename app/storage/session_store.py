@@ -1,51 +1,307 @@
+import os
 import uuid
-from typing import Dict, List, Optional
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime
-from pydantic import BaseModel
 
+# Storage backend for session metadata: "memory", "sqlite" or "redis"
+SESSION_BACKEND = os.environ.get("SAT_ANNOTATOR_SESSION_BACKEND", "memory").lower()
+# Locks shared by the in-memory sessions, each guarding the sessions hashed to it
+LOCK_STRIPES = 64
 
-class SessionImage(BaseModel):
+
+@dataclass(slots=True)
+class SessionImage:
     image_id: str  # UUID string instead of integer
     file_name: str
     file_path: str
     resolution: Optional[str] = None
     source: Optional[str] = None
-    capture_date: datetime = datetime.now()
-    created_at: datetime = datetime.now()
+    sam_path: Optional[str] = None  # Pristine copy used as SAM input, if different
+    file_size: Optional[int] = None  # Bytes on disk, including the SAM copy
+    capture_date: datetime = field(default_factory=datetime.now)
+    created_at: datetime = field(default_factory=datetime.now)
+
+    def model_dump(self) -> Dict:
+        """Get the fields as a dictionary, like the pydantic models"""
+        return {name: getattr(self, name) for name in self.__slots__}
 
+    dict = model_dump
 
-class SessionAnnotation(BaseModel):
+
+@dataclass(slots=True)
+class SessionAnnotation:
     annotation_id: str  # UUID string
     image_id: str  # Reference to SessionImage
     file_path: str
-    created_at: datetime = datetime.now()
+    created_at: datetime = field(default_factory=datetime.now)
     auto_generated: bool = False
     model_id: Optional[str] = None
 
+    def model_dump(self) -> Dict:
+        """Get the fields as a dictionary, like the pydantic models"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    dict = model_dump
 
-class SessionStore:
+
+def _page_images(
+    session: Dict, after: Optional[int], limit: int
+) -> Tuple[List[SessionImage], Optional[int]]:
+    """
+    Read one page from a session's `image_order`, a list of (position,
+    image_id) sorted by position. Removed images may still be listed there
+    and are skipped.
+    """
+    order, images = session["image_order"], session["images"]
+    i = 0 if after is None else bisect.bisect_right(order, after, key=lambda e: e[0])
+    page: List[SessionImage] = []
+    while i < len(order):
+        position, image_id = order[i]
+        i += 1
+        image = images.get(image_id)
+        if image is None:
+            continue
+        if len(page) == limit:
+            return page, after
+        page.append(image)
+        after = position
+    return page, None
+
+
+class BaseSessionStore:
+    """
+    Interface shared by the session storage backends.
+
+    Routers only talk to this interface, so the backend can be swapped with
+    SAT_ANNOTATOR_SESSION_BACKEND without touching them.
+    """
+
+    # Whether every worker process sees the same sessions
+    shared = False
+
+    def create_session(self, session_id: str) -> None:
+        """Create a new session if it doesn't exist"""
+        raise NotImplementedError
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        """Get session data by ID"""
+        raise NotImplementedError
+
+    def get_session_summary(self, session_id: str) -> Optional[Dict]:
+        """Get created_at and image/annotation counts without loading records"""
+        raise NotImplementedError
+
+    def session_exists(self, session_id: str) -> bool:
+        """Check whether a session exists"""
+        return self.get_session_summary(session_id) is not None
+
+    def get_version(self, session_id: str) -> int:
+        """Get the session's change counter (0 for unknown sessions)"""
+        raise NotImplementedError
+
+    def bump_version(self, session_id: str) -> int:
+        """Record a change to the session's images or annotations"""
+        raise NotImplementedError
+
+    def add_image(
+        self,
+        session_id: str,
+        file_name: str,
+        file_path: str,
+        resolution: Optional[str] = None,
+        source: Optional[str] = None,
+        sam_path: Optional[str] = None,
+        file_size: Optional[int] = None,
+    ) -> SessionImage:
+        """Add image to session and return the created image object"""
+        raise NotImplementedError
+
+    def get_images(
+        self, session_id: str, skip: int = 0, limit: int = 100
+    ) -> List[SessionImage]:
+        """Get all images in a session with pagination"""
+        raise NotImplementedError
+
+    def get_images_page(
+        self, session_id: str, after: Optional[int] = None, limit: int = 100
+    ) -> Tuple[List[SessionImage], Optional[int]]:
+        """
+        Get up to `limit` images in upload order, starting after the position
+        `after`. Returns the page and the position to continue from, or None
+        on the last page. Costs O(limit) however large the session is.
+        """
+        raise NotImplementedError
+
+    def get_image(self, session_id: str, image_id: str) -> Optional[SessionImage]:
+        """Get specific image by ID"""
+        raise NotImplementedError
+
+    def add_annotation(
+        self,
+        session_id: str,
+        image_id: str,
+        file_path: str,
+        auto_generated: bool = False,
+        model_id: Optional[str] = None,
+        annotation_id: Optional[str] = None,
+    ) -> Optional[SessionAnnotation]:
+        """Add annotation to session and return the created annotation object"""
+        raise NotImplementedError
+
+    def get_annotations(
+        self, session_id: str, image_id: Optional[str] = None
+    ) -> List[SessionAnnotation]:
+        """Get annotations, optionally filtered by image_id"""
+        raise NotImplementedError
+
+    def get_annotation(
+        self, session_id: str, annotation_id: str
+    ) -> Optional[SessionAnnotation]:
+        """Get specific annotation by ID"""
+        raise NotImplementedError
+
+    def count_annotations(
+        self, session_id: str, image_ids: Iterable[str]
+    ) -> Dict[str, int]:
+        """Get the number of annotations of each of the given images"""
+        raise NotImplementedError
+
+    def remove_annotation(self, session_id: str, annotation_id: str) -> bool:
+        """Remove annotation from session and return True if successful"""
+        raise NotImplementedError
+
+    def remove_image(self, session_id: str, image_id: str) -> bool:
+        """Remove image from session and return True if successful"""
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session and return True if successful"""
+        raise NotImplementedError
+
+    def touch_session(self, session_id: str) -> None:
+        """Record that the session was just used"""
+        raise NotImplementedError
+
+    def get_idle_sessions(self, cutoff: datetime) -> List[str]:
+        """Get the ids of sessions not used since `cutoff`"""
+        raise NotImplementedError
+
+    def get_session_usage(self, session_id: str) -> int:
+        """Get the bytes on disk used by the session's images"""
+        raise NotImplementedError
+
+    def iter_file_paths(self) -> Iterator[str]:
+        """Yield every file path referenced by any session"""
+        raise NotImplementedError
+
+    def export_session(self, session_id: str) -> Optional[Dict]:
+        """Export session data as a dictionary"""
+        raise NotImplementedError
+
+    def import_session(self, session_id: str, data: Dict) -> bool:
+        """Import session data from a dictionary"""
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Group several writes so backends with durable storage commit them
+        together. The in-memory store has nothing to batch.
+        """
+        yield
+
+
+class SessionStore(BaseSessionStore):
     """
     In-memory session-based storage for images and annotations.
     This replaces the database for storing metadata.
+
+    Sync routes run in the threadpool, so sessions are guarded by a fixed set
+    of striped locks: requests for different sessions rarely share a lock,
+    while changes to one session are applied one at a time.
     """
 
-    def __init__(self):
+    def __init__(self, stripes: int = LOCK_STRIPES):
         # Dictionary to store active sessions
         self.sessions: Dict[str, Dict] = {}
+        # Reentrant, as store methods call each other under the same lock
+        self._stripes = [threading.RLock() for _ in range(stripes)]
+
+    def _lock(self, session_id: str) -> threading.RLock:
+        """Get the lock guarding a session"""
+        return self._stripes[hash(session_id) % len(self._stripes)]
 
     def create_session(self, session_id: str) -> None:
         """Create a new session if it doesn't exist"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "images": {},
-                "annotations": {},
-                "created_at": datetime.now(),
-            }
+        with self._lock(session_id):
+            if session_id not in self.sessions:
+                self.sessions[session_id] = {
+                    "images": {},
+                    "annotations": {},
+                    "created_at": datetime.now(),
+                    "last_access": datetime.now(),
+                    "version": 0,  # Bumped on every change, drives HTTP ETags
+                    # image_id -> {annotation_id: None}, an ordered set per image
+                    "image_annotations": {},
+                    # (position, image_id) in upload order, for keyset paging
+                    "image_order": [],
+                }
 
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Get session data by ID"""
         return self.sessions.get(session_id)
 
+    def get_session_summary(self, session_id: str) -> Optional[Dict]:
+        """Get created_at and image/annotation counts without loading records"""
+        session = self.sessions.get(session_id)
+        if not session:
+            return None
+        return {
+            "created_at": session.get("created_at"),
+            "images_count": len(session.get("images", {})),
+            "annotations_count": len(session.get("annotations", {})),
+        }
+
+    def _annotation_index(self, session_id: str) -> Dict[str, Dict[str, None]]:
+        """Get the image_id -> annotation ids index, building it if missing"""
+        session = self.sessions[session_id]
+        index = session.get("image_annotations")
+        if index is None:
+            index = {}
+            for annotation_id, annotation in session["annotations"].items():
+                index.setdefault(annotation.image_id, {})[annotation_id] = None
+            session["image_annotations"] = index
+        return index
+
+    def _image_order(self, session_id: str) -> List[Tuple[int, str]]:
+        """Get the (position, image_id) list, building it if missing"""
+        session = self.sessions[session_id]
+        order = session.get("image_order")
+        if order is None:
+            order = list(enumerate(session["images"], 1))
+            session["image_order"] = order
+        return order
+
+    def get_version(self, session_id: str) -> int:
+        """Get the session's change counter (0 for unknown sessions)"""
+        session = self.sessions.get(session_id)
+        if not session:
+            return 0
+        return session.get("version", 0)
+
+    def bump_version(self, session_id: str) -> int:
+        """Record a change to the session's images or annotations"""
+        with self._lock(session_id):
+            session = self.sessions.get(session_id)
+            if not session:
+                return 0
+            session["version"] = session.get("version", 0) + 1
+            return session["version"]
+
     def add_image(
         self,
         session_id: str,
@@ -53,10 +309,10 @@ class SessionStore:
         file_path: str,
         resolution: Optional[str] = None,
         source: Optional[str] = None,
+        sam_path: Optional[str] = None,
+        file_size: Optional[int] = None,
     ) -> SessionImage:
         """Add image to session and return the created image object"""
-        self.create_session(session_id)
-
         image_id = str(uuid.uuid4())
         image = SessionImage(
             image_id=image_id,
@@ -64,27 +320,47 @@ class SessionStore:
             file_path=file_path,
             resolution=resolution,
             source=source or "user_upload",
+            sam_path=sam_path,
+            file_size=file_size,
         )
 
-        self.sessions[session_id]["images"][image_id] = image
+        with self._lock(session_id):
+            self.create_session(session_id)
+            self.sessions[session_id]["images"][image_id] = image
+            order = self._image_order(session_id)
+            order.append((order[-1][0] + 1 if order else 1, image_id))
+            self.bump_version(session_id)
         return image
 
     def get_images(
         self, session_id: str, skip: int = 0, limit: int = 100
     ) -> List[SessionImage]:
         """Get all images in a session with pagination"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if not session:
             return []
 
-        images = list(self.sessions[session_id]["images"].values())
+        with self._lock(session_id):
+            images = list(session["images"].values())
         # Apply pagination
         return images[skip : skip + limit]
 
+    def get_images_page(
+        self, session_id: str, after: Optional[int] = None, limit: int = 100
+    ) -> Tuple[List[SessionImage], Optional[int]]:
+        """Get one page of images in upload order and the next position"""
+        if session_id not in self.sessions:
+            return [], None
+        with self._lock(session_id):
+            self._image_order(session_id)
+            return _page_images(self.sessions[session_id], after, limit)
+
     def get_image(self, session_id: str, image_id: str) -> Optional[SessionImage]:
         """Get specific image by ID"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if not session:
             return None
-        return self.sessions[session_id]["images"].get(image_id)
+        return session["images"].get(image_id)
 
     def add_annotation(
         self,
@@ -96,98 +372,197 @@ class SessionStore:
         annotation_id: Optional[str] = None,
     ) -> Optional[SessionAnnotation]:
         """Add annotation to session and return the created annotation object"""
-        if (
-            session_id not in self.sessions
-            or image_id not in self.sessions[session_id]["images"]
-        ):
-            return None
-
         # Use provided annotation_id or generate a new one
         if not annotation_id:
             annotation_id = str(uuid.uuid4())
 
-        annotation = SessionAnnotation(
-            annotation_id=annotation_id,
-            image_id=image_id,
-            file_path=file_path,
-            auto_generated=auto_generated,
-            model_id=model_id,
-        )
-
-        self.sessions[session_id]["annotations"][annotation_id] = annotation
+        with self._lock(session_id):
+            session = self.sessions.get(session_id)
+            image = session["images"].get(image_id) if session else None
+            if image is None:
+                return None
+
+            # Reuse the image's id string rather than keeping a copy per annotation
+            image_id = image.image_id
+            annotation = SessionAnnotation(
+                annotation_id=annotation_id,
+                image_id=image_id,
+                file_path=file_path,
+                auto_generated=auto_generated,
+                model_id=model_id,
+            )
+
+            annotations = session["annotations"]
+            index = self._annotation_index(session_id)
+            previous = annotations.get(annotation_id)
+            if previous is not None and previous.image_id != image_id:
+                index.get(previous.image_id, {}).pop(annotation_id, None)
+
+            annotations[annotation_id] = annotation
+            index.setdefault(image_id, {})[annotation_id] = None
+            self.bump_version(session_id)
         return annotation
 
     def get_annotations(
         self, session_id: str, image_id: Optional[str] = None
     ) -> List[SessionAnnotation]:
         """Get annotations, optionally filtered by image_id"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if not session:
             return []
 
-        annotations = list(self.sessions[session_id]["annotations"].values())
+        annotations = session["annotations"]
+        with self._lock(session_id):
+            if not image_id:
+                return list(annotations.values())
 
-        # Filter by image_id if provided
-        if image_id:
-            annotations = [a for a in annotations if a.image_id == image_id]
-
-        return annotations
+            # Only touch this image's annotations through the index
+            annotation_ids = self._annotation_index(session_id).get(image_id, {})
+            return [annotations[a] for a in annotation_ids if a in annotations]
 
     def get_annotation(
         self, session_id: str, annotation_id: str
     ) -> Optional[SessionAnnotation]:
         """Get specific annotation by ID"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if not session:
             return None
 
-        return self.sessions[session_id]["annotations"].get(annotation_id)
+        return session["annotations"].get(annotation_id)
 
-    def remove_annotation(self, session_id: str, annotation_id: str) -> bool:
-        """Remove annotation from session and return True if successful"""
+    def count_annotations(
+        self, session_id: str, image_ids: Iterable[str]
+    ) -> Dict[str, int]:
+        """Get the number of annotations of each of the given images"""
         if session_id not in self.sessions:
-            return False
+            return {image_id: 0 for image_id in image_ids}
+        with self._lock(session_id):
+            index = self._annotation_index(session_id)
+            return {image_id: len(index.get(image_id, ())) for image_id in image_ids}
 
-        if annotation_id in self.sessions[session_id]["annotations"]:
-            del self.sessions[session_id]["annotations"][annotation_id]
+    def remove_annotation(self, session_id: str, annotation_id: str) -> bool:
+        """Remove annotation from session and return True if successful"""
+        with self._lock(session_id):
+            session = self.sessions.get(session_id)
+            if not session:
+                return False
+
+            annotation = session["annotations"].pop(annotation_id, None)
+            if annotation is None:
+                return False
+            image_ids = self._annotation_index(session_id).get(annotation.image_id)
+            if image_ids is not None:
+                image_ids.pop(annotation_id, None)
+            self.bump_version(session_id)
             return True
-        return False
 
     def remove_image(self, session_id: str, image_id: str) -> bool:
         """Remove image from session and return True if successful"""
-        if session_id not in self.sessions:
-            return False
-
-        if image_id in self.sessions[session_id]["images"]:
-            # Remove the image
-            del self.sessions[session_id]["images"][image_id]
+        with self._lock(session_id):
+            session = self.sessions.get(session_id)
+            if not session or session["images"].pop(image_id, None) is None:
+                return False
 
             # Remove any annotations associated with this image
-            self.sessions[session_id]["annotations"] = {
-                k: v
-                for k, v in self.sessions[session_id]["annotations"].items()
-                if v.image_id != image_id
-            }
-
+            annotations = session["annotations"]
+            index = self._annotation_index(session_id)
+            for annotation_id in index.pop(image_id, {}):
+                annotations.pop(annotation_id, None)
+
+            # Removed images stay in the paging order until they are the
+            # majority; the last entry is kept so positions are never reused
+            order = self._image_order(session_id)
+            if len(order) > 2 * len(session["images"]) + 16:
+                images = session["images"]
+                order[:-1] = [e for e in order[:-1] if e[1] in images]
+
+            self.bump_version(session_id)
             return True
-        return False
 
     def delete_session(self, session_id: str) -> bool:
         """Delete a session and return True if successful"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            return True
-        return False
+        with self._lock(session_id):
+            return self.sessions.pop(session_id, None) is not None
+
+    def touch_session(self, session_id: str) -> None:
+        """Record that the session was just used"""
+        session = self.sessions.get(session_id)
+        if session:
+            session["last_access"] = datetime.now()
+
+    def get_idle_sessions(self, cutoff: datetime) -> List[str]:
+        """Get the ids of sessions not used since `cutoff`"""
+        return [
+            session_id
+            for session_id, session in list(self.sessions.items())
+            if (session.get("last_access") or session["created_at"]) < cutoff
+        ]
+
+    def get_session_usage(self, session_id: str) -> int:
+        """Get the bytes on disk used by the session's images"""
+        session = self.sessions.get(session_id)
+        if not session:
+            return 0
+        with self._lock(session_id):
+            images = list(session["images"].values())
+        return sum(image.file_size or 0 for image in images)
+
+    def iter_file_paths(self) -> Iterator[str]:
+        """Yield every file path referenced by any session"""
+        for session in list(self.sessions.values()):
+            for image in list(session["images"].values()):
+                yield image.file_path
+                if image.sam_path:
+                    yield image.sam_path
+            for annotation in list(session["annotations"].values()):
+                yield annotation.file_path
 
     def export_session(self, session_id: str) -> Optional[Dict]:
         """Export session data as a dictionary"""
-        return self.get_session(session_id)
+        with self._lock(session_id):
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            # A snapshot, so callers can iterate while the session changes
+            return dict(
+                session,
+                images=dict(session["images"]),
+                annotations=dict(session["annotations"]),
+                image_annotations=None,
+                image_order=None,
+            )
 
     def import_session(self, session_id: str, data: Dict) -> bool:
         """Import session data from a dictionary"""
         if "images" in data and "annotations" in data:
-            self.sessions[session_id] = data
+            with self._lock(session_id):
+                # Continue from the previous counter so cached ETags are invalidated
+                version = self.get_version(session_id)
+                self.sessions[session_id] = data
+                data["version"] = max(version, data.get("version", 0)) + 1
+                # Never trust an imported index, rebuild it from the annotations
+                data.pop("image_annotations", None)
+                data.pop("image_order", None)
+                self._annotation_index(session_id)
             return True
         return False
 
 
+def create_session_store(backend: Optional[str] = None) -> BaseSessionStore:
+    """Create the session store selected by SAT_ANNOTATOR_SESSION_BACKEND"""
+    backend = (backend or SESSION_BACKEND).lower()
+    if backend == "memory":
+        return SessionStore()
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteSessionStore
+
+        return SQLiteSessionStore()
+    if backend == "redis":
+        from .redis_store import RedisSessionStore
+
+        return RedisSessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
+
+
 # Global session store instance
-session_store = SessionStore()
+session_store = create_session_store()
@@ -0,0 +1,508 @@
+import os
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .session_store import BaseSessionStore, SessionImage, SessionAnnotation
+
+# Determine if we're running in Docker or locally
+in_docker = os.path.exists("/.dockerenv")
+base_path = (
+    Path("/app")
+    if in_docker
+    else Path(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+)
+
+# Database file, kept with the annotations so it shares their volume
+SQLITE_PATH = os.environ.get(
+    "SAT_ANNOTATOR_SQLITE_PATH", str(base_path / "annotations" / "sessions.db")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    last_access TEXT
+);
+CREATE TABLE IF NOT EXISTS images (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
+    image_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    resolution TEXT,
+    source TEXT,
+    sam_path TEXT,
+    file_size INTEGER,
+    capture_date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (session_id, image_id)
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
+    annotation_id TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    auto_generated INTEGER NOT NULL DEFAULT 0,
+    model_id TEXT,
+    UNIQUE (session_id, annotation_id)
+);
+CREATE INDEX IF NOT EXISTS annotations_by_image
+    ON annotations (session_id, image_id, seq);
+"""
+
+# Columns added after the first release of the schema, with their indexes
+MIGRATIONS = {
+    ("sessions", "last_access"): (
+        "ALTER TABLE sessions ADD COLUMN last_access TEXT",
+        "UPDATE sessions SET last_access = created_at WHERE last_access IS NULL",
+    ),
+    ("images", "file_size"): ("ALTER TABLE images ADD COLUMN file_size INTEGER",),
+}
+INDEXES = """
+CREATE INDEX IF NOT EXISTS sessions_by_access ON sessions (last_access);
+CREATE INDEX IF NOT EXISTS images_by_session ON images (session_id, seq);
+"""
+
+IMAGE_COLUMNS = (
+    "image_id, file_name, file_path, resolution, source, sam_path, "
+    "capture_date, created_at, file_size"
+)
+ANNOTATION_COLUMNS = (
+    "annotation_id, image_id, file_path, created_at, auto_generated, model_id"
+)
+
+# Statement text is constant so sqlite3's statement cache keeps them prepared
+SQL_INSERT_SESSION = (
+    "INSERT OR IGNORE INTO sessions (session_id, created_at, last_access) "
+    "VALUES (?1, ?2, ?2)"
+)
+SQL_TOUCH_SESSION = "UPDATE sessions SET last_access = ? WHERE session_id = ?"
+SQL_IDLE_SESSIONS = "SELECT session_id FROM sessions WHERE last_access < ?"
+SQL_SESSION_SUMMARY = (
+    "SELECT created_at, "
+    "(SELECT COUNT(*) FROM images WHERE session_id = ?), "
+    "(SELECT COUNT(*) FROM annotations WHERE session_id = ?) "
+    "FROM sessions WHERE session_id = ?"
+)
+SQL_GET_VERSION = "SELECT version FROM sessions WHERE session_id = ?"
+SQL_BUMP_VERSION = "UPDATE sessions SET version = version + 1 WHERE session_id = ?"
+SQL_INSERT_IMAGE = (
+    f"INSERT INTO images (session_id, {IMAGE_COLUMNS}) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_GET_IMAGES = (
+    f"SELECT {IMAGE_COLUMNS} FROM images WHERE session_id = ? "
+    "ORDER BY seq LIMIT ? OFFSET ?"
+)
+SQL_GET_IMAGES_AFTER = (
+    f"SELECT {IMAGE_COLUMNS}, seq FROM images WHERE session_id = ? AND seq > ? "
+    "ORDER BY seq LIMIT ?"
+)
+SQL_GET_IMAGE = (
+    f"SELECT {IMAGE_COLUMNS} FROM images WHERE session_id = ? AND image_id = ?"
+)
+SQL_IMAGE_EXISTS = "SELECT 1 FROM images WHERE session_id = ? AND image_id = ?"
+# Updated in place, so a re-added annotation keeps its seq and its place
+SQL_UPSERT_ANNOTATION = (
+    f"INSERT INTO annotations (session_id, {ANNOTATION_COLUMNS}) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (session_id, annotation_id) DO UPDATE SET "
+    "image_id = excluded.image_id, file_path = excluded.file_path, "
+    "created_at = excluded.created_at, "
+    "auto_generated = excluded.auto_generated, model_id = excluded.model_id"
+)
+SQL_GET_ANNOTATIONS = (
+    f"SELECT {ANNOTATION_COLUMNS} FROM annotations WHERE session_id = ? ORDER BY seq"
+)
+SQL_GET_IMAGE_ANNOTATIONS = (
+    f"SELECT {ANNOTATION_COLUMNS} FROM annotations "
+    "WHERE session_id = ? AND image_id = ? ORDER BY seq"
+)
+SQL_GET_ANNOTATION = (
+    f"SELECT {ANNOTATION_COLUMNS} FROM annotations "
+    "WHERE session_id = ? AND annotation_id = ?"
+)
+SQL_COUNT_ANNOTATIONS = (
+    "SELECT image_id, COUNT(*) FROM annotations "
+    "WHERE session_id = ? AND image_id IN ({}) GROUP BY image_id"
+)
+SQL_DELETE_ANNOTATION = (
+    "DELETE FROM annotations WHERE session_id = ? AND annotation_id = ?"
+)
+SQL_DELETE_IMAGE = "DELETE FROM images WHERE session_id = ? AND image_id = ?"
+SQL_DELETE_IMAGE_ANNOTATIONS = (
+    "DELETE FROM annotations WHERE session_id = ? AND image_id = ?"
+)
+SQL_DELETE_SESSION = "DELETE FROM sessions WHERE session_id = ?"
+SQL_SESSION_USAGE = (
+    "SELECT COALESCE(SUM(file_size), 0) FROM images WHERE session_id = ?"
+)
+SQL_FILE_PATHS = (
+    "SELECT file_path FROM images "
+    "UNION ALL SELECT sam_path FROM images WHERE sam_path IS NOT NULL "
+    "UNION ALL SELECT file_path FROM annotations"
+)
+
+
+def _image_from_row(row) -> SessionImage:
+    return SessionImage(
+        image_id=row[0],
+        file_name=row[1],
+        file_path=row[2],
+        resolution=row[3],
+        source=row[4],
+        sam_path=row[5],
+        capture_date=datetime.fromisoformat(row[6]),
+        created_at=datetime.fromisoformat(row[7]),
+        file_size=row[8],
+    )
+
+
+def _annotation_from_row(row) -> SessionAnnotation:
+    return SessionAnnotation(
+        annotation_id=row[0],
+        image_id=row[1],
+        file_path=row[2],
+        created_at=datetime.fromisoformat(row[3]),
+        auto_generated=bool(row[4]),
+        model_id=row[5],
+    )
+
+
+def _image_params(session_id: str, image: SessionImage) -> tuple:
+    return (
+        session_id,
+        image.image_id,
+        image.file_name,
+        image.file_path,
+        image.resolution,
+        image.source,
+        image.sam_path,
+        image.capture_date.isoformat(),
+        image.created_at.isoformat(),
+        image.file_size,
+    )
+
+
+def _annotation_params(session_id: str, annotation: SessionAnnotation) -> tuple:
+    return (
+        session_id,
+        annotation.annotation_id,
+        annotation.image_id,
+        annotation.file_path,
+        annotation.created_at.isoformat(),
+        int(annotation.auto_generated),
+        annotation.model_id,
+    )
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """
+    Persistent session storage in an SQLite database running in WAL mode.
+
+    Sessions survive restarts and every uvicorn worker sees the same data.
+    Each thread gets its own connection; WAL lets readers run alongside the
+    single writer. Writes commit immediately unless grouped with `batch()`.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or SQLITE_PATH
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # executescript manages its own transaction
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.executescript(INDEXES)
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Add columns missing from databases created by older versions"""
+        for (table, column), statements in MIGRATIONS.items():
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                with self._write():
+                    for statement in statements:
+                        conn.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=30.0,
+                isolation_level=None,  # Transactions are managed explicitly
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in a write transaction, joining an open batch"""
+        conn = self._connection()
+        if self._local.depth:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Commit every write made inside the block in one transaction"""
+        with self._write():
+            yield
+
+    def close(self) -> None:
+        """Close this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def create_session(self, session_id: str) -> None:
+        with self._write() as conn:
+            conn.execute(SQL_INSERT_SESSION, (session_id, datetime.now().isoformat()))
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        return self.export_session(session_id)
+
+    def get_session_summary(self, session_id: str) -> Optional[Dict]:
+        row = (
+            self._connection()
+            .execute(SQL_SESSION_SUMMARY, (session_id, session_id, session_id))
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return {
+            "created_at": datetime.fromisoformat(row[0]),
+            "images_count": row[1],
+            "annotations_count": row[2],
+        }
+
+    def get_version(self, session_id: str) -> int:
+        row = self._connection().execute(SQL_GET_VERSION, (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, session_id: str) -> int:
+        with self._write() as conn:
+            conn.execute(SQL_BUMP_VERSION, (session_id,))
+            row = conn.execute(SQL_GET_VERSION, (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def add_image(
+        self,
+        session_id: str,
+        file_name: str,
+        file_path: str,
+        resolution: Optional[str] = None,
+        source: Optional[str] = None,
+        sam_path: Optional[str] = None,
+        file_size: Optional[int] = None,
+    ) -> SessionImage:
+        image = SessionImage(
+            image_id=str(uuid.uuid4()),
+            file_name=file_name,
+            file_path=file_path,
+            resolution=resolution,
+            source=source or "user_upload",
+            sam_path=sam_path,
+            file_size=file_size,
+        )
+        with self._write() as conn:
+            conn.execute(SQL_INSERT_SESSION, (session_id, datetime.now().isoformat()))
+            conn.execute(SQL_INSERT_IMAGE, _image_params(session_id, image))
+            conn.execute(SQL_BUMP_VERSION, (session_id,))
+        return image
+
+    def get_images(
+        self, session_id: str, skip: int = 0, limit: int = 100
+    ) -> List[SessionImage]:
+        rows = self._connection().execute(SQL_GET_IMAGES, (session_id, limit, skip))
+        return [_image_from_row(row) for row in rows]
+
+    def get_images_page(
+        self, session_id: str, after: Optional[int] = None, limit: int = 100
+    ) -> Tuple[List[SessionImage], Optional[int]]:
+        # One extra row tells whether another page follows
+        rows = self._connection().execute(
+            SQL_GET_IMAGES_AFTER, (session_id, after or 0, limit + 1)
+        )
+        rows = rows.fetchall()
+        page = [_image_from_row(row) for row in rows[:limit]]
+        return page, rows[limit - 1][-1] if len(rows) > limit else None
+
+    def get_image(self, session_id: str, image_id: str) -> Optional[SessionImage]:
+        row = (
+            self._connection().execute(SQL_GET_IMAGE, (session_id, image_id)).fetchone()
+        )
+        return _image_from_row(row) if row else None
+
+    def add_annotation(
+        self,
+        session_id: str,
+        image_id: str,
+        file_path: str,
+        auto_generated: bool = False,
+        model_id: Optional[str] = None,
+        annotation_id: Optional[str] = None,
+    ) -> Optional[SessionAnnotation]:
+        annotation = SessionAnnotation(
+            annotation_id=annotation_id or str(uuid.uuid4()),
+            image_id=image_id,
+            file_path=file_path,
+            auto_generated=auto_generated,
+            model_id=model_id,
+        )
+        with self._write() as conn:
+            if not conn.execute(SQL_IMAGE_EXISTS, (session_id, image_id)).fetchone():
+                return None
+            conn.execute(
+                SQL_UPSERT_ANNOTATION, _annotation_params(session_id, annotation)
+            )
+            conn.execute(SQL_BUMP_VERSION, (session_id,))
+        return annotation
+
+    def get_annotations(
+        self, session_id: str, image_id: Optional[str] = None
+    ) -> List[SessionAnnotation]:
+        conn = self._connection()
+        if image_id:
+            rows = conn.execute(SQL_GET_IMAGE_ANNOTATIONS, (session_id, image_id))
+        else:
+            rows = conn.execute(SQL_GET_ANNOTATIONS, (session_id,))
+        return [_annotation_from_row(row) for row in rows]
+
+    def get_annotation(
+        self, session_id: str, annotation_id: str
+    ) -> Optional[SessionAnnotation]:
+        row = (
+            self._connection()
+            .execute(SQL_GET_ANNOTATION, (session_id, annotation_id))
+            .fetchone()
+        )
+        return _annotation_from_row(row) if row else None
+
+    def count_annotations(
+        self, session_id: str, image_ids: Iterable[str]
+    ) -> Dict[str, int]:
+        counts = dict.fromkeys(image_ids, 0)
+        if counts:
+            sql = SQL_COUNT_ANNOTATIONS.format(", ".join("?" * len(counts)))
+            rows = self._connection().execute(sql, (session_id, *counts))
+            counts.update(rows)
+        return counts
+
+    def remove_annotation(self, session_id: str, annotation_id: str) -> bool:
+        with self._write() as conn:
+            removed = conn.execute(
+                SQL_DELETE_ANNOTATION, (session_id, annotation_id)
+            ).rowcount
+            if removed:
+                conn.execute(SQL_BUMP_VERSION, (session_id,))
+        return removed > 0
+
+    def remove_image(self, session_id: str, image_id: str) -> bool:
+        with self._write() as conn:
+            removed = conn.execute(SQL_DELETE_IMAGE, (session_id, image_id)).rowcount
+            if removed:
+                conn.execute(SQL_DELETE_IMAGE_ANNOTATIONS, (session_id, image_id))
+                conn.execute(SQL_BUMP_VERSION, (session_id,))
+        return removed > 0
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._write() as conn:
+            removed = conn.execute(SQL_DELETE_SESSION, (session_id,)).rowcount
+        return removed > 0
+
+    def touch_session(self, session_id: str) -> None:
+        with self._write() as conn:
+            conn.execute(SQL_TOUCH_SESSION, (datetime.now().isoformat(), session_id))
+
+    def get_idle_sessions(self, cutoff: datetime) -> List[str]:
+        rows = self._connection().execute(SQL_IDLE_SESSIONS, (cutoff.isoformat(),))
+        return [row[0] for row in rows]
+
+    def get_session_usage(self, session_id: str) -> int:
+        return (
+            self._connection().execute(SQL_SESSION_USAGE, (session_id,)).fetchone()[0]
+        )
+
+    def iter_file_paths(self) -> Iterator[str]:
+        # A dedicated connection, the cursor streams rows as they are read
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            for (path,) in conn.execute(SQL_FILE_PATHS):
+                yield path
+        finally:
+            conn.close()
+
+    def export_session(self, session_id: str) -> Optional[Dict]:
+        summary = self.get_session_summary(session_id)
+        if summary is None:
+            return None
+        images = self.get_images(session_id, limit=-1)
+        annotations = self.get_annotations(session_id)
+        return {
+            "images": {image.image_id: image for image in images},
+            "annotations": {a.annotation_id: a for a in annotations},
+            "created_at": summary["created_at"],
+            "version": self.get_version(session_id),
+        }
+
+    def import_session(self, session_id: str, data: Dict) -> bool:
+        if "images" not in data or "annotations" not in data:
+            return False
+
+        version = self.get_version(session_id)
+        created_at = data.get("created_at") or datetime.now()
+        with self._write() as conn:
+            conn.execute(SQL_DELETE_SESSION, (session_id,))
+            conn.execute(
+                "INSERT INTO sessions (session_id, created_at, version, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    session_id,
+                    created_at.isoformat(),
+                    max(version, data.get("version", 0)) + 1,
+                    datetime.now().isoformat(),
+                ),
+            )
+            # One executemany per table instead of a statement per record
+            conn.executemany(
+                SQL_INSERT_IMAGE,
+                [_image_params(session_id, i) for i in data["images"].values()],
+            )
+            conn.executemany(
+                SQL_UPSERT_ANNOTATION,
+                [
+                    _annotation_params(session_id, a)
+                    for a in data["annotations"].values()
+                ],
+            )
+        return True
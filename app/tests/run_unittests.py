@@ -4,6 +4,7 @@
 """
 Run all unittest-based tests for the sat-annotator backend.
 """
+
 import sys
 import os
 import unittest
@@ -36,6 +37,23 @@ def main():
         "unittest_sam_segmenter.py",
         "unittest_session_images_api.py",
         "unittest_segmentation_api.py",
+        "unittest_chunked_upload.py",
+        "unittest_http_cache.py",
+        "unittest_sqlite_store.py",
+        "unittest_redis_store.py",
+        "unittest_session_sweeper.py",
+        "unittest_geometry_store.py",
+        "unittest_annotation_export.py",
+        "unittest_mask_cache.py",
+        "unittest_annotation_edits.py",
+        "unittest_spatial_index.py",
+        "unittest_geometry_lod.py",
+        "unittest_vector_tiles.py",
+        "unittest_geometry_codec.py",
+        "unittest_response_encoding.py",
+        "unittest_polygon_ops.py",
+        "unittest_annotation_journal.py",
+        "unittest_api_routes.py",
     ]
 
     # Import and run each unittest file separately
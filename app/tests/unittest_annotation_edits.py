@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator vertex-level annotation edits
+"""
+
+import unittest
+import sys
+import os
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils.annotation_edits import (
+    apply_vertex_ops,
+    edit_document,
+    get_revision,
+    outer_ring,
+)
+from storage.geometry_store import GeometryStore
+
+SQUARE = [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]]
+
+
+def manual(ring, hole=None):
+    """A document as saved by POST /api/annotations/"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "building"},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [ring] + ([hole] if hole else []),
+                },
+            },
+            {"type": "Feature", "properties": {}, "geometry": None},
+        ],
+    }
+
+
+class TestAnnotationEdits(unittest.TestCase):
+    """Tests for vertex operations and copy-on-write document edits"""
+
+    def test_vertex_ops(self):
+        """Test moving, inserting and deleting vertices in order"""
+        ring = apply_vertex_ops(
+            SQUARE,
+            [
+                {"op": "move", "index": 2, "point": [0.9, 0.8]},
+                {"op": "insert", "index": 4, "points": [[0.0, 0.5]]},
+                {"op": "insert", "index": 1, "points": [[0.3, 0.0], [0.6, 0.0]]},
+                {"op": "delete", "index": 0},
+                {"op": "delete", "index": 1, "end": 3},
+            ],
+        )
+        self.assertEqual(ring, [[0.3, 0.0], [0.9, 0.8], [0.0, 1.0], [0.0, 0.5]])
+        # The input is untouched
+        self.assertEqual(SQUARE[2], [1.0, 1.0])
+
+    def test_invalid_ops(self):
+        """Test that invalid operations are rejected"""
+        for ops in [
+            [{"op": "move", "index": 4, "point": [0, 0]}],
+            [{"op": "move", "index": 0, "point": [0, float("nan")]}],
+            [{"op": "move", "index": 0, "point": [0]}],
+            [{"op": "insert", "index": 5, "points": [[0, 0]]}],
+            [{"op": "delete", "index": 2, "end": 2}],
+            [{"op": "delete", "index": 0, "end": 2}],  # Leaves two vertices
+            [{"op": "rotate", "index": 0}],
+            [{"op": "move", "index": "0", "point": [0, 0]}],
+        ]:
+            with self.assertRaises(ValueError, msg=ops):
+                apply_vertex_ops(SQUARE, ops)
+
+    def test_edit_document(self):
+        """Test that edits copy only what they change and bump the revision"""
+        hole = [[0.4, 0.4], [0.6, 0.4], [0.5, 0.6]]
+        original = manual(SQUARE, hole)
+        self.assertEqual(get_revision(original), 0)
+
+        ring = apply_vertex_ops(
+            outer_ring(original), [{"op": "move", "index": 0, "point": [0.1, 0.1]}]
+        )
+        edited = edit_document(original, ring=ring, label="road")
+
+        self.assertEqual(get_revision(edited), 1)
+        feature = edited["features"][0]
+        self.assertEqual(feature["properties"]["label"], "road")
+        self.assertIn("modified", feature["properties"])
+        self.assertEqual(feature["geometry"]["coordinates"], [ring, hole])
+        # The original is unchanged and untouched parts are shared
+        self.assertEqual(outer_ring(original)[0], [0.0, 0.0])
+        self.assertEqual(original["features"][0]["properties"], {"label": "building"})
+        self.assertIs(edited["features"][1], original["features"][1])
+        self.assertIs(feature["geometry"]["coordinates"][1], hole)
+        self.assertIs(ring[1], SQUARE[1])
+
+        # Plain features (SAM results) are edited the same way
+        auto = original["features"][0]
+        self.assertEqual(get_revision(edit_document(edit_document(auto))), 2)
+
+    def test_store_update(self):
+        """Test atomic read-modify-write through the geometry store"""
+        store = GeometryStore(None)
+        store.put("s1", "a1", manual(SQUARE))
+        self.assertIsNone(store.update("s1", "missing", edit_document))
+
+        updated = store.update("s1", "a1", edit_document)
+        self.assertIs(store.get("s1", "a1"), updated)
+        self.assertEqual(get_revision(updated), 1)
+
+        def fail(document):
+            raise ValueError("rejected")
+
+        with self.assertRaises(ValueError):
+            store.update("s1", "a1", fail)
+        self.assertIs(store.get("s1", "a1"), updated)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator annotation export formats
+"""
+
+import unittest
+import sys
+import os
+import io
+import json
+import numpy as np
+import cv2
+from pathlib import Path
+from PIL import Image
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils.annotation_export import (
+    prepare_annotations,
+    label_classes,
+    rasterize,
+    mask_to_rle,
+    rle_to_string,
+    stream_coco,
+    stream_geojson,
+    stream_label_mask,
+)
+
+WIDTH, HEIGHT = 200, 120
+
+
+def manual(label, ring):
+    """A document as saved by POST /api/annotations/"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": label},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ],
+    }
+
+
+def auto(ring):
+    """A document as saved by POST /api/segment/"""
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+        "properties": {"cached": False},
+    }
+
+
+def box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def decode_rle(counts, width, height):
+    """Reference decoder: COCO counts to a (height, width) mask"""
+    flat = np.zeros(width * height, dtype=np.uint8)
+    position = 0
+    for i, count in enumerate(counts):
+        if i % 2:
+            flat[position : position + count] = 1
+        position += count
+    return flat.reshape(width, height).T
+
+
+def decode_rle_string(s):
+    """Reference port of pycocotools' rleFrString"""
+    counts, p = [], 0
+    while p < len(s):
+        x, k, more = 0, 0, True
+        while more:
+            c = ord(s[p]) - 48
+            x |= (c & 0x1F) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+class TestAnnotationExport(unittest.TestCase):
+    """Tests for the GeoJSON, COCO and label mask exports"""
+
+    def setUp(self):
+        """Build a few overlapping annotations in both stored shapes"""
+        self.documents = [
+            ("a1", manual("building", box(0.1, 0.1, 0.5, 0.5))),
+            ("a2", auto(box(0.3, 0.3, 0.9, 0.95))),
+            ("a3", manual("road", [[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]])),
+            ("a4", manual("road", [[0.5, 0.5], [0.6, 0.6]])),
+        ]
+        self.annotations = prepare_annotations(self.documents, WIDTH, HEIGHT)
+        self.image = {"file_name": "scene.png", "width": WIDTH, "height": HEIGHT}
+
+    def reference_mask(self):
+        """Label mask drawn on the full image, one polygon after another"""
+        classes = label_classes(self.annotations)
+        mask = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        for annotation in self.annotations:
+            cv2.fillPoly(mask, [annotation.ring], classes[annotation.label])
+        return mask
+
+    def test_prepare_annotations(self):
+        """Test that both document shapes are read and degenerate ones skipped"""
+        self.assertEqual(
+            [a.annotation_id for a in self.annotations], ["a1", "a2", "a3"]
+        )
+        self.assertEqual(
+            [a.label for a in self.annotations], ["building", "Unlabeled", "road"]
+        )
+        self.assertEqual(self.annotations[0].bbox, (20, 12, 101, 61))
+        self.assertEqual(self.annotations[2].bbox, (0, 0, WIDTH, HEIGHT))
+        self.assertEqual(
+            label_classes(self.annotations), {"Unlabeled": 1, "building": 2, "road": 3}
+        )
+
+    def test_rle(self):
+        """Test that RLE counts and strings round-trip to the rasterized masks"""
+        for annotation in self.annotations:
+            crop = rasterize(annotation)
+            counts = mask_to_rle(crop, annotation.bbox, WIDTH, HEIGHT)
+            self.assertEqual(sum(counts), WIDTH * HEIGHT)
+
+            expected = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+            cv2.fillPoly(expected, [annotation.ring], 1)
+            np.testing.assert_array_equal(decode_rle(counts, WIDTH, HEIGHT), expected)
+            self.assertEqual(decode_rle_string(rle_to_string(counts)), counts)
+
+        # Runs touching across columns (full-height box) are merged
+        full = np.ones((HEIGHT, 3), dtype=np.uint8)
+        self.assertEqual(
+            mask_to_rle(full, (5, 0, 8, HEIGHT), WIDTH, HEIGHT),
+            [5 * HEIGHT, 3 * HEIGHT, (WIDTH - 8) * HEIGHT],
+        )
+        # Masks starting at the first pixel begin with an empty background run
+        self.assertEqual(mask_to_rle(full[:2, :1], (0, 0, 1, 2), WIDTH, HEIGHT)[0], 0)
+
+    def test_coco(self):
+        """Test that the streamed COCO document is complete and valid"""
+        coco = json.loads(b"".join(stream_coco(self.image, self.annotations)))
+
+        self.assertEqual(coco["images"][0]["width"], WIDTH)
+        self.assertEqual(
+            [c["name"] for c in coco["categories"]], ["Unlabeled", "building", "road"]
+        )
+        self.assertEqual(len(coco["annotations"]), 3)
+        first = coco["annotations"][0]
+        self.assertEqual(first["category_id"], 2)
+        self.assertEqual(first["bbox"], [20, 12, 81, 49])
+        self.assertEqual(first["segmentation"]["size"], [HEIGHT, WIDTH])
+        counts = decode_rle_string(first["segmentation"]["counts"])
+        self.assertEqual(decode_rle(counts, WIDTH, HEIGHT).sum(), first["area"])
+
+    def test_geojson(self):
+        """Test that the streamed GeoJSON holds every feature with its ids"""
+        extra = {"a2": {"auto_generated": True}}
+        collection = json.loads(
+            b"".join(stream_geojson(self.image, self.documents, extra))
+        )
+
+        self.assertEqual(collection["type"], "FeatureCollection")
+        self.assertEqual(collection["image"]["height"], HEIGHT)
+        features = collection["features"]
+        self.assertEqual(
+            [f["properties"]["annotation_id"] for f in features],
+            ["a1", "a2", "a3", "a4"],
+        )
+        self.assertTrue(features[1]["properties"]["auto_generated"])
+        self.assertEqual(features[0]["properties"]["label"], "building")
+
+        empty = json.loads(b"".join(stream_geojson(self.image, [])))
+        self.assertEqual(empty["features"], [])
+
+    def test_label_mask(self):
+        """Test that the banded PNG matches a full-image rasterization"""
+        for band_rows in (7, 256):
+            png = b"".join(
+                stream_label_mask(self.annotations, WIDTH, HEIGHT, band_rows)
+            )
+            mask = np.array(Image.open(io.BytesIO(png)))
+            np.testing.assert_array_equal(mask, self.reference_mask())
+
+        # Past 255 classes the mask switches to 16-bit pixels
+        many = prepare_annotations(
+            [
+                (str(i), manual(f"class {i:03}", box(0.0, 0.0, 0.5, 0.5)))
+                for i in range(300)
+            ],
+            WIDTH,
+            HEIGHT,
+        )
+        png = b"".join(stream_label_mask(many, WIDTH, HEIGHT))
+        mask = np.array(Image.open(io.BytesIO(png)))
+        self.assertEqual(int(mask[0, 0]), 300)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
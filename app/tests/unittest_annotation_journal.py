@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator annotation journal (undo, redo and history)
+"""
+
+import unittest
+import sys
+import os
+import json
+import math
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from storage.annotation_journal import (
+    AnnotationJournal,
+    HistoryError,
+    HistoryExpiredError,
+    diff_documents,
+    patch_document,
+)
+from utils.annotation_edits import apply_vertex_ops, edit_document
+
+
+def document(ring, label="building"):
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": label},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ],
+    }
+
+
+def square(x, size=0.1):
+    """Ring of a square, in the precision the journal keeps"""
+    x1, y1 = round(x + size, 6), round(0.5 + size, 6)
+    return [[x, 0.5], [x1, 0.5], [x1, y1], [x, y1]]
+
+
+class TestAnnotationJournal(unittest.TestCase):
+    """Tests for AnnotationJournal functionality"""
+
+    def setUp(self):
+        """Create a journal of an in-memory session in a scratch directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.live = {}  # annotation_id -> document, the "stores"
+        self.journal = self.open()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def open(self, **options):
+        """Open a journal on the scratch directory, like a restart or a worker"""
+        journal = AnnotationJournal(self.temp_dir, **options)
+        journal.set_state_source(
+            lambda session_id: {
+                annotation_id: {
+                    "image_id": "img",
+                    "file_path": f"{annotation_id}.json",
+                    "auto_generated": False,
+                    "document": json_data,
+                }
+                for annotation_id, json_data in self.live.items()
+            }
+        )
+        return journal
+
+    # Like the router, change the session before journaling the change
+
+    def create(self, annotation_id, json_data):
+        self.live[annotation_id] = json_data
+        self.journal.record_create(
+            "s1",
+            SimpleNamespace(
+                annotation_id=annotation_id,
+                image_id="img",
+                file_path=f"{annotation_id}.json",
+                auto_generated=False,
+            ),
+            json_data,
+        )
+
+    def update(self, annotation_id, json_data):
+        previous, self.live[annotation_id] = self.live[annotation_id], json_data
+        self.journal.record_update("s1", annotation_id, previous, json_data)
+
+    def delete(self, annotation_id):
+        del self.live[annotation_id]
+        self.journal.record_delete("s1", annotation_id)
+
+    def restore(self, targets):
+        """What the router does on undo and redo, against the in-memory session"""
+        for annotation_id, target in targets.items():
+            if target is None:
+                self.delete(annotation_id)
+            elif annotation_id in self.live:
+                self.update(annotation_id, target["document"])
+            else:
+                self.create(annotation_id, target["document"])
+
+    def test_diff_documents(self):
+        """Test that diffs are small and turn each version into the next"""
+        old = document(
+            [
+                [
+                    round(0.5 + 0.1 * math.cos(i / 32), 6),
+                    round(0.5 + 0.1 * math.sin(i / 32), 6),
+                ]
+                for i in range(200)
+            ]
+        )
+        ring = apply_vertex_ops(
+            old["features"][0]["geometry"]["coordinates"][0],
+            [
+                {"op": "move", "index": 10, "point": [0.105, 0.6]},
+                {"op": "insert", "index": 20, "points": [[0.2, 0.7], [0.21, 0.7]]},
+            ],
+        )
+        new = edit_document(old, ring=ring, label="road")
+        copy = json.loads(json.dumps(old))
+        diff = diff_documents(old, new)
+        self.assertEqual(patch_document(old, diff), new)
+        self.assertEqual(old, copy)
+        self.assertLess(len(json.dumps(diff)), len(json.dumps(new)) / 10)
+        # Only the run of changed vertices is sent, as a compact ring
+        (splice,) = [
+            item[1]["k"]["geometry"]["k"]["coordinates"]["i"][0][1]["s"]
+            for item in diff["k"]["features"]["i"]
+        ]
+        self.assertEqual(splice[:2], [10, 10])
+        self.assertIsInstance(splice[2], str)
+
+        # Added holes, added and removed keys
+        with_hole = edit_document(new, holes=[square(0.3, 0.01)])
+        other = {**with_hole, "extra": 1}
+        del other["type"]
+        for a, b in ((new, with_hole), (with_hole, other), (other, new)):
+            self.assertEqual(patch_document(a, diff_documents(a, b)), b)
+        self.assertIsNone(diff_documents(old, copy))
+
+    def test_undo_and_redo(self):
+        """Test undoing and redoing creations, edits and deletions"""
+        with self.assertRaises(HistoryError):
+            self.journal.undo("s1", self.restore)
+
+        self.create("a1", document(square(0.1)))
+        with self.journal.group("s1"):  # One request, one undo step
+            self.update("a1", edit_document(self.live["a1"], ring=square(0.2)))
+            self.create("a2", document(square(0.4)))
+        after = dict(self.live)
+        self.delete("a1")
+
+        self.assertEqual(self.journal.undo("s1", self.restore)[1], ["a1"])
+        self.assertEqual(self.live, after)
+        self.assertEqual(self.journal.undo("s1", self.restore)[1], ["a1", "a2"])
+        self.assertEqual(list(self.live), ["a1"])
+        self.assertEqual(self.live["a1"], document(square(0.1)))
+        self.assertEqual(self.journal.history("s1")["redo"], 2)
+
+        self.journal.redo("s1", self.restore)
+        self.assertEqual(self.live, after)
+
+        # A new edit clears what can be redone
+        self.update("a2", edit_document(self.live["a2"], label="road"))
+        with self.assertRaises(HistoryError):
+            self.journal.redo("s1", self.restore)
+        self.assertEqual(self.journal.history("s1")["undo"], 3)
+
+        # Changes that cannot be undone take the annotations' history along
+        with self.journal.group("s1", undoable=False):
+            self.delete("a2")
+        self.assertEqual(self.journal.history("s1")["undo"], 1)
+
+        # Another worker (or a restart) rebuilds the stacks from the files
+        other = self.open()
+        self.assertEqual(other.history("s1"), self.journal.history("s1"))
+        other.undo("s1", self.restore)
+        self.assertNotIn("a1", self.live)
+        self.journal.redo("s1", self.restore)
+        self.assertIn("a1", self.live)
+
+    def test_group_locks(self):
+        """Test that groups only wait for their own session, and not on the loop"""
+        opened, release = threading.Event(), threading.Event()
+
+        def hold():
+            with self.journal.group("s1"):
+                opened.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        self.assertTrue(opened.wait(5))
+        started = time.monotonic()
+        with self.journal.group("s2"):
+            pass
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertFalse(self.journal._lock("s1").acquire(blocking=False))
+        release.set()
+        holder.join()
+
+        async def on_loop():
+            with self.journal.group("s1"):
+                pass
+
+        with self.assertRaises(AssertionError):
+            asyncio.run(on_loop())
+
+    def test_state_at(self):
+        """Test replaying a session's annotations as they were at a past time"""
+        self.create("a1", document(square(0.1)))
+        self.create("a2", document(square(0.3)))
+        time.sleep(0.01)
+        before = time.time()
+        time.sleep(0.01)
+        self.update("a1", edit_document(self.live["a1"], ring=square(0.2)))
+        self.delete("a2")
+
+        state = self.journal.state_at("s1", before)
+        self.assertEqual(sorted(state), ["a1", "a2"])
+        self.assertEqual(state["a1"]["document"], document(square(0.1)))
+        self.assertEqual(state["a2"]["image_id"], "img")
+        self.assertEqual(
+            self.journal.state_at("s1", time.time(), "img"),
+            {
+                "a1": {
+                    "image_id": "img",
+                    "file_path": "a1.json",
+                    "auto_generated": False,
+                    "document": self.live["a1"],
+                }
+            },
+        )
+        self.assertEqual(self.journal.state_at("s1", time.time(), "other"), {})
+        with self.assertRaises(HistoryExpiredError):
+            self.journal.state_at("s1", before - 60)
+        with self.assertRaises(HistoryExpiredError):
+            self.journal.state_at("unknown", before)
+
+    def test_snapshots_and_compaction(self):
+        """Test that snapshots bound replay and old history is deleted"""
+        self.journal = journal = self.open(snapshot_every=4, keep_snapshots=2)
+        self.create("a1", document(square(0.1)))
+        start = time.time()
+        for i in range(1, 21):
+            ring = square(0.1, 0.1 + i / 1000)
+            self.update("a1", edit_document(self.live["a1"], ring=ring))
+
+        session_dir = os.path.join(self.temp_dir, "s1")
+        names = sorted(name for name in os.listdir(session_dir) if name[0] != ".")
+        self.assertEqual(
+            names,
+            [
+                "journal-0000000017.log",
+                "snapshot-0000000016.json",
+                "snapshot-0000000020.json",
+            ],
+        )
+        self.assertEqual(journal.stats["compactions"], 4)
+        # Edits older than the oldest snapshot can no longer be undone
+        self.assertEqual(journal.history("s1")["undo"], 4)
+        with self.assertRaises(HistoryExpiredError):
+            journal.state_at("s1", start)
+
+        for _ in range(4):
+            journal.undo("s1", self.restore)
+        ring = self.live["a1"]["features"][0]["geometry"]["coordinates"][0]
+        self.assertEqual(ring, square(0.1, 0.116))
+        with self.assertRaises(HistoryError):
+            journal.undo("s1", self.restore)
+
+        # Undoing made another snapshot, so redo went with the edits
+        self.assertEqual(journal.history("s1")["redo"], 0)
+
+        # A line torn by a crash is skipped
+        with open(os.path.join(session_dir, "journal-0000000025.log"), "ab") as f:
+            f.write(b'{"n":99,"k":"ed')
+        self.update("a1", edit_document(self.live["a1"], label="road"))
+        self.assertEqual(journal.history("s1")["undo"], 1)
+        self.assertEqual(self.open().history("s1"), journal.history("s1"))
+        journal.undo("s1", self.restore)
+        self.assertEqual(
+            self.live["a1"]["features"][0]["properties"]["label"], "building"
+        )
+
+        journal.drop("s1")
+        self.assertEqual(journal.session_ids(), [])
+        self.assertEqual(journal.history("s1")["undo"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
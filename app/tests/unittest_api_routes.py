@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator API routes, run against the real routers
+"""
+
+import unittest
+import sys
+import os
+import io
+import time
+import uuid
+import shutil
+import zipfile
+import threading
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+# The routers import the application as the `app` package
+if str(app_path.parent) not in sys.path:
+    sys.path.insert(0, str(app_path.parent))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# The routers log to ./logs and keep geometry and journals under
+# annotations/: run them from a scratch directory holding all of it
+WORK_DIR = tempfile.mkdtemp()
+os.chdir(WORK_DIR)
+os.environ["SAT_ANNOTATOR_GEOMETRY_LOG"] = os.path.join(WORK_DIR, "geometry.log")
+os.environ["SAT_ANNOTATOR_JOURNAL_DIR"] = os.path.join(WORK_DIR, "journal")
+
+# Mock SAM's dependencies, but not PIL: uploads are really ingested
+from mocks import mock_segment_anything, mock_torch
+
+sys.modules["segment_anything"] = mock_segment_anything
+sys.modules["torch"] = mock_torch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image as PILImage
+
+# Import application code, without loading the SAM model
+with patch("app.utils.sam_model.SAMSegmenter"):
+    from app.routers import session_images, session_segmentation
+from app.storage.session_manager import SESSION_COOKIE_NAME
+from app.storage.session_store import SessionStore, session_store
+from app.storage.sqlite_store import SQLiteSessionStore
+from app.storage.redis_store import RedisSessionStore
+from app.storage.geometry_store import geometry_store
+from app.storage.annotation_journal import annotation_journal
+from app.utils.image_processing import UPLOAD_DIR
+from app.utils.chunked_upload import chunked_uploads
+from unittest_redis_store import StandInRedisServer
+import app.utils.image_processing as image_processing
+
+
+def png_bytes(size=(64, 48), mode="RGB"):
+    buffer = io.BytesIO()
+    PILImage.new(mode, size).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def tiff16_bytes():
+    """A 16-bit greyscale TIFF with values from 1000 to 3000, like a GeoTIFF band"""
+    img = PILImage.new("I;16", (40, 30))
+    for x in range(40):
+        for y in range(30):
+            img.putpixel((x, y), 1000 + 50 * x)
+    buffer = io.BytesIO()
+    img.save(buffer, "TIFF")
+    return buffer.getvalue()
+
+
+class TestUploadRoutes(unittest.TestCase):
+    """Tests for the image upload routes"""
+
+    def setUp(self):
+        """Mount the images router on a fresh app and session"""
+        app = FastAPI()
+        app.include_router(session_images.router, prefix="/api")
+        self.client = TestClient(app)
+        self.session_id = "test-session"
+        session_store.create_session(self.session_id)
+        self.client.cookies.set(SESSION_COOKIE_NAME, self.session_id)
+        self.uploads_before = set(os.listdir(UPLOAD_DIR))
+
+    def tearDown(self):
+        chunked_uploads.drop_session(self.session_id)
+        session_store.delete_session(self.session_id)
+        for name in set(os.listdir(UPLOAD_DIR)) - self.uploads_before:
+            os.remove(UPLOAD_DIR / name)
+
+    def new_uploads(self):
+        return set(os.listdir(UPLOAD_DIR)) - self.uploads_before
+
+    def test_bulk_upload_mixed_files(self):
+        """Test that bulk upload results follow upload order and failures leave no files"""
+        real_ingest = image_processing.ingest_image_file
+
+        def ingest(path, name, content_type=None):
+            if name == "broken.png":
+                raise OSError("disk full")
+            return real_ingest(path, name, content_type)
+
+        with patch.object(image_processing, "ingest_image_file", ingest):
+            response = self.client.post(
+                "/api/upload-images/",
+                files=[
+                    ("files", ("a.png", png_bytes(), "image/png")),
+                    ("files", ("notes.txt", b"not an image", "text/plain")),
+                    ("files", ("broken.png", png_bytes(), "image/png")),
+                    ("files", ("b.png", png_bytes((32, 32)), "image/png")),
+                ],
+            )
+
+        self.assertEqual(response.status_code, 200, response.text)
+        data = response.json()
+        self.assertEqual(
+            [(r["file_name"], r["success"]) for r in data["results"]],
+            [
+                ("a.png", True),
+                ("notes.txt", False),
+                ("broken.png", False),
+                ("b.png", True),
+            ],
+        )
+        self.assertEqual((data["uploaded"], data["failed"]), (2, 2))
+        self.assertEqual(data["results"][1]["error"], "File type not supported")
+        self.assertIn("disk full", data["results"][2]["error"])
+        self.assertEqual(data["results"][0]["image"]["resolution"], "64x48")
+
+        # Only the registered images are left in the upload directory
+        images = session_store.get_images(self.session_id)
+        self.assertEqual(
+            self.new_uploads(), {Path(image.file_path).name for image in images}
+        )
+
+    def test_bulk_upload_quota(self):
+        """Test that files past the quota are refused before they are staged"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+            for name in ("a.png", "b.png", "c.png"):
+                zf.writestr(name, png_bytes((256, 256), "RGBA"))
+        member_size = len(png_bytes((256, 256), "RGBA"))
+        staged = []
+        real_stage = image_processing._stage_stream
+
+        def stage(stream, name, max_size=None):
+            staged.append(name)
+            return real_stage(stream, name, max_size)
+
+        # Room for the first member only, by its declared size
+        with patch.object(
+            session_images, "SESSION_QUOTA_BYTES", 10 * member_size
+        ), patch.object(image_processing, "_stage_stream", stage):
+            session_store.add_image(
+                self.session_id, "old.png", "uploads/old.png", file_size=9 * member_size
+            )
+            response = self.client.post(
+                "/api/upload-images/",
+                files=[("files", ("tiles.zip", archive.getvalue(), "application/zip"))],
+            )
+
+        self.assertEqual(response.status_code, 200, response.text)
+        results = response.json()["results"]
+        self.assertEqual([r["success"] for r in results], [True, False, False])
+        self.assertIn("quota", results[1]["error"])
+        self.assertEqual(staged, ["a.png"])
+
+    def test_stage_stream_capped_at_declared_size(self):
+        """Test that a member longer than it claims is not kept"""
+        with self.assertRaises(ValueError):
+            image_processing._stage_stream(io.BytesIO(b"x" * 100), "a.png", max_size=10)
+        self.assertEqual(self.new_uploads(), set())
+
+    def test_upload_16bit_tiff(self):
+        """Test that SAM gets an 8-bit RGB image of a 16-bit TIFF with every derivative"""
+        for fmt in ("png", "jpeg"):
+            with self.subTest(fmt=fmt), patch.object(
+                image_processing, "DERIVATIVE_FORMAT", fmt
+            ):
+                response = self.client.post(
+                    "/api/upload-image/",
+                    files={"file": ("scene.tif", tiff16_bytes(), "image/tiff")},
+                )
+                self.assertEqual(response.status_code, 200, response.text)
+                image_id = response.json()["image"]["image_id"]
+                image = session_store.get_image(self.session_id, image_id)
+                self.assertEqual(image.resolution, "40x30")
+
+                # The lossless derivative is the SAM input, otherwise a PNG copy
+                sam_path = image.sam_path or image.file_path
+                self.assertTrue(sam_path.endswith(".png"))
+                with PILImage.open(UPLOAD_DIR / Path(sam_path).name) as sam_input:
+                    self.assertEqual(sam_input.mode, "RGB")
+                    # Stretched over the full 8-bit range, not clipped at 255
+                    self.assertEqual(sam_input.getpixel((0, 0)), (0, 0, 0))
+                    self.assertEqual(sam_input.getpixel((39, 0)), (255, 255, 255))
+                    self.assertEqual(sam_input.getpixel((20, 5))[0], 131)
+
+                # The TIFF itself is not kept
+                self.assertEqual(
+                    self.new_uploads(),
+                    {
+                        Path(path).name
+                        for image in session_store.get_images(self.session_id)
+                        for path in (image.file_path, image.sam_path)
+                        if path
+                    },
+                )
+
+    def test_chunked_upload_quota(self):
+        """Test that partial uploads count toward the quota and go with the session"""
+        with patch.object(session_images, "SESSION_QUOTA_BYTES", 1000):
+            ids = []
+            for name in ("a.png", "b.png"):
+                response = self.client.post(
+                    "/api/uploads/",
+                    json={
+                        "file_name": name,
+                        "total_size": 800,
+                        "content_type": "image/png",
+                    },
+                )
+                self.assertEqual(response.status_code, 200, response.text)
+                ids.append(response.json()["upload_id"])
+
+            response = self.client.put(
+                f"/api/uploads/{ids[0]}?offset=0", content=b"x" * 800
+            )
+            self.assertEqual(response.status_code, 200, response.text)
+            # The first upload's received bytes leave no room for the second
+            response = self.client.put(
+                f"/api/uploads/{ids[1]}?offset=0", content=b"x" * 300
+            )
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(chunked_uploads.session_usage(self.session_id), 800)
+
+        # Clearing the session deletes its unfinished uploads
+        upload = chunked_uploads.get(ids[0], self.session_id)
+        response = self.client.delete("/api/session/")
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertFalse(upload.part_path.exists())
+        self.assertFalse(upload.manifest_path.exists())
+        self.assertEqual(chunked_uploads.session_usage(self.session_id), 0)
+
+    def test_delete_image(self):
+        """Test that deleting an image removes its files and record"""
+        response = self.client.post(
+            "/api/upload-image/", files={"file": ("a.png", png_bytes(), "image/png")}
+        )
+        self.assertEqual(response.status_code, 200, response.text)
+        image_id = response.json()["image"]["image_id"]
+        self.assertTrue(self.new_uploads())
+
+        response = self.client.delete(f"/api/images/{image_id}")
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertIsNone(session_store.get_image(self.session_id, image_id))
+        self.assertEqual(self.new_uploads(), set())
+
+
+class TestBulkAnnotationRoutes(unittest.TestCase):
+    """Tests for the bulk annotation route on every session store backend"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInRedisServer()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def stores(self):
+        """A fresh store of each backend"""
+        yield "memory", SessionStore()
+        yield "sqlite", SQLiteSessionStore(os.path.join(WORK_DIR, f"{uuid.uuid4()}.db"))
+        url = "redis://127.0.0.1:%d/0" % self.server.server_address[1]
+        yield "redis", RedisSessionStore(url)
+
+    def test_create_then_delete_in_one_request(self):
+        """Test that an annotation created and deleted in one request is gone"""
+        app = FastAPI()
+        app.include_router(session_segmentation.router, prefix="/api")
+        client = TestClient(app)
+
+        for backend, store in self.stores():
+            with self.subTest(backend=backend), patch.object(
+                session_segmentation, "session_store", store
+            ):
+                session_id = str(uuid.uuid4())
+                client.cookies.set(SESSION_COOKIE_NAME, session_id)
+                image = store.add_image(session_id, "a.png", "uploads/a.png")
+                polygon = [[0.1, 0.1], [0.2, 0.1], [0.2, 0.2]]
+
+                response = client.post(
+                    "/api/annotations/bulk",
+                    json={
+                        "operations": [
+                            {
+                                "op": "create",
+                                "id": "b1",
+                                "image_id": image.image_id,
+                                "polygon": polygon,
+                                "label": "building",
+                            },
+                            {"op": "delete", "id": "b1"},
+                            {"op": "delete", "id": "b1"},
+                        ]
+                    },
+                )
+
+                self.assertEqual(response.status_code, 200, response.text)
+                self.assertEqual(
+                    [(r["op"], r["status"]) for r in response.json()["results"]],
+                    [("create", 200), ("delete", 200), ("delete", 404)],
+                )
+                self.assertIsNone(store.get_annotation(session_id, "b1"))
+                self.assertEqual(store.get_annotations(session_id), [])
+                self.assertIsNone(geometry_store.get(session_id, "b1"))
+                # The deletion was journaled too: history has no b1 at the end
+                self.assertEqual(annotation_journal.history(session_id)["undo"], 1)
+                self.assertEqual(
+                    annotation_journal.state_at(session_id, time.time()), {}
+                )
+
+                geometry_store.drop_session(session_id)
+                annotation_journal.drop(session_id)
+                store.delete_session(session_id)
+
+
+if __name__ == "__main__":
+    try:
+        unittest.main(argv=["first-arg", "-v"])
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for sat-annotator resumable chunked uploads
+"""
+
+import unittest
+import sys
+import os
+import uuid
+import time
+import hashlib
+import tempfile
+import shutil
+from pathlib import Path
+from unittest.mock import patch
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils import chunked_upload
+from utils.chunked_upload import (
+    ChunkedUploadManager,
+    ChunkedUploadError,
+    OffsetMismatchError,
+    QuotaExceededError,
+)
+
+
+class TestChunkedUpload(unittest.TestCase):
+    """Tests for the resumable upload registry"""
+
+    def setUp(self):
+        """Point the upload directories at a scratch location"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        (self.temp_dir / ".partial").mkdir()
+        self.patches = [
+            patch.object(chunked_upload, "UPLOAD_DIR", self.temp_dir),
+            patch.object(chunked_upload, "PARTIAL_DIR", self.temp_dir / ".partial"),
+        ]
+        for p in self.patches:
+            p.start()
+
+        self.manager = ChunkedUploadManager()
+        self.session_id = str(uuid.uuid4())
+        self.data = os.urandom(100_000)
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_chunks_append_in_order(self):
+        """Test writing chunks and finalizing with a checksum"""
+        upload = self.manager.create(
+            self.session_id,
+            "scene.tif",
+            len(self.data),
+            sha256=hashlib.sha256(self.data).hexdigest(),
+        )
+
+        offset = self.manager.write_chunk(upload, 0, self.data[:40_000])
+        self.assertEqual(offset, 40_000)
+
+        # A retried chunk at a stale offset is rejected with the real offset
+        with self.assertRaises(OffsetMismatchError) as ctx:
+            self.manager.write_chunk(upload, 0, self.data[:40_000])
+        self.assertEqual(ctx.exception.expected, 40_000)
+
+        # Finalizing early fails
+        with self.assertRaises(ChunkedUploadError):
+            self.manager.finalize(upload)
+
+        self.manager.write_chunk(upload, 40_000, self.data[40_000:])
+        final_path = self.manager.finalize(upload)
+
+        self.assertEqual(final_path.parent, self.temp_dir)
+        self.assertEqual(final_path.suffix, ".tif")
+        self.assertEqual(final_path.read_bytes(), self.data)
+        self.assertIsNone(self.manager.get(upload.upload_id, self.session_id))
+
+    def test_resume_after_restart(self):
+        """Test that an upload can be resumed by a fresh manager"""
+        upload = self.manager.create(
+            self.session_id,
+            "scene.png",
+            len(self.data),
+            sha256=hashlib.sha256(self.data).hexdigest(),
+        )
+        self.manager.write_chunk(upload, 0, self.data[:30_000])
+
+        restarted = ChunkedUploadManager()
+        resumed = restarted.get(upload.upload_id, self.session_id)
+        self.assertIsNotNone(resumed)
+        self.assertEqual(resumed.offset, 30_000)
+
+        # Other sessions cannot see the upload
+        self.assertIsNone(restarted.get(upload.upload_id, str(uuid.uuid4())))
+
+        restarted.write_chunk(resumed, 30_000, self.data[30_000:])
+        final_path = restarted.finalize(resumed)
+        self.assertEqual(final_path.read_bytes(), self.data)
+
+    def test_checksum_mismatch(self):
+        """Test that a corrupted upload is not finalized"""
+        upload = self.manager.create(
+            self.session_id, "scene.png", len(self.data), sha256="0" * 64
+        )
+        self.manager.write_chunk(upload, 0, self.data)
+        with self.assertRaises(ChunkedUploadError):
+            self.manager.finalize(upload)
+
+    def test_abort(self):
+        """Test aborting removes the partial data"""
+        upload = self.manager.create(self.session_id, "scene.png", len(self.data))
+        self.manager.write_chunk(upload, 0, self.data[:10])
+        self.manager.abort(upload)
+        self.assertFalse(upload.part_path.exists())
+        self.assertIsNone(self.manager.get(upload.upload_id, self.session_id))
+
+    def test_session_usage_and_drop(self):
+        """Test that received bytes are counted and dropped per session"""
+        upload = self.manager.create(self.session_id, "scene.png", len(self.data))
+        self.manager.write_chunk(upload, 0, self.data[:30_000])
+        other = self.manager.create(str(uuid.uuid4()), "other.png", len(self.data))
+        self.manager.write_chunk(other, 0, self.data[:10])
+
+        # Uploads another worker started are found through their manifests
+        restarted = ChunkedUploadManager()
+        self.assertEqual(restarted.session_usage(self.session_id), 30_000)
+
+        self.assertEqual(restarted.drop_session(self.session_id), 30_000)
+        self.assertFalse(upload.part_path.exists())
+        self.assertFalse(upload.manifest_path.exists())
+        self.assertEqual(restarted.session_usage(self.session_id), 0)
+        self.assertTrue(other.part_path.exists())
+
+    def test_reserve(self):
+        """Test that concurrent chunks of a session cannot share the same quota"""
+        free = lambda: 100
+        with self.manager.reserve(self.session_id, 60, free):
+            with self.assertRaises(QuotaExceededError):
+                with self.manager.reserve(self.session_id, 60, free):
+                    pass
+            # Other sessions are not affected
+            with self.manager.reserve(str(uuid.uuid4()), 60, free):
+                pass
+            with self.manager.reserve(self.session_id, 40, free):
+                pass
+
+        # Released when the write ends, even if it failed
+        with self.assertRaises(OSError):
+            with self.manager.reserve(self.session_id, 100, free):
+                raise OSError("disk full")
+        with self.manager.reserve(self.session_id, 100, free):
+            pass
+        self.assertEqual(self.manager._reserved, {})
+
+    def test_reap(self):
+        """Test that only stale partial uploads are deleted"""
+        stale = self.manager.create(self.session_id, "stale.png", len(self.data))
+        self.manager.write_chunk(stale, 0, self.data[:100])
+        fresh = self.manager.create(self.session_id, "fresh.png", len(self.data))
+        stray = chunked_upload.PARTIAL_DIR / f"{uuid.uuid4()}.part"
+        stray.write_bytes(b"x" * 50)
+
+        long_ago = time.time() - 7200
+        for path in (stale.part_path, stray):
+            os.utime(path, (long_ago, long_ago))
+
+        self.assertEqual(self.manager.reap(max_age=3600), (2, 150))
+        self.assertFalse(stale.part_path.exists())
+        self.assertFalse(stale.manifest_path.exists())
+        self.assertFalse(stray.exists())
+        self.assertTrue(fresh.part_path.exists())
+        self.assertIsNone(self.manager.get(stale.upload_id, self.session_id))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator compact geometry encoding
+"""
+
+import unittest
+import json
+import math
+import sys
+import os
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from storage.geometry_codec import (
+    decode_document,
+    decode_ring,
+    encode_document,
+    encode_ring,
+)
+
+
+def circle(cx, cy, radius, vertices):
+    return [
+        [
+            cx + radius * math.cos(2 * math.pi * i / vertices),
+            cy + radius * math.sin(2 * math.pi * i / vertices),
+        ]
+        for i in range(vertices)
+    ]
+
+
+class TestGeometryCodec(unittest.TestCase):
+    """Tests for compact rings and documents"""
+
+    def assertRingsClose(self, decoded, ring):
+        self.assertEqual(len(decoded), len(ring))
+        for a, b in zip(decoded, ring):
+            self.assertAlmostEqual(a[0], b[0], delta=5e-7)
+            self.assertAlmostEqual(a[1], b[1], delta=5e-7)
+
+    def test_ring_round_trip(self):
+        """Test that rings survive encoding to 6 decimals in the narrowest type"""
+        cases = {
+            "b": circle(0.5, 0.5, 0.00002, 64),
+            "h": circle(0.3, 0.7, 0.01, 64),
+            "i": circle(0.5, 0.5, 0.4, 8),
+        }
+        for code, ring in cases.items():
+            encoded = encode_ring(ring)
+            self.assertEqual(encoded[0], code)
+            self.assertRingsClose(decode_ring(encoded), ring)
+
+        # Exact on the fixed-point grid, including negative coordinates
+        ring = [[0.123456, -0.5], [1.0, 0.0], [0.0, 1.25], [0.123456, -0.5]]
+        self.assertEqual(decode_ring(encode_ring(ring)), ring)
+        self.assertEqual(decode_ring(encode_ring([[0.25, 0.75]])), [[0.25, 0.75]])
+
+        # Much smaller than the JSON of the floats
+        ring = circle(0.4, 0.6, 0.01, 500)
+        self.assertLess(len(json.dumps(encode_ring(ring))) * 6, len(json.dumps(ring)))
+
+    def test_unencodable_rings(self):
+        """Test that rings the encoding cannot hold are reported"""
+        for ring in ([], [[0.1, 0.2, 3.0]], [[0.1, math.nan]], [[5000.0, 0.0]]):
+            self.assertIsNone(encode_ring(ring))
+        with self.assertRaises(ValueError):
+            decode_ring("zAAAA")
+
+    def test_documents(self):
+        """Test encoding Polygons of FeatureCollections, Features and geometries"""
+        ring, hole = circle(0.5, 0.5, 0.1, 40), circle(0.5, 0.5, 0.01, 12)
+        collection = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"label": "field"},
+                    "geometry": {"type": "Polygon", "coordinates": [ring, hole]},
+                },
+                {
+                    "type": "Feature",
+                    "properties": {},
+                    "geometry": {"type": "Point", "coordinates": [0.5, 0.5]},
+                },
+            ],
+        }
+        encoded = encode_document(collection)
+        polygon, point = encoded["features"]
+        self.assertEqual(polygon["geometry"]["encoding"], "compact")
+        self.assertTrue(
+            all(isinstance(r, str) for r in polygon["geometry"]["coordinates"])
+        )
+        self.assertIs(polygon["properties"], collection["features"][0]["properties"])
+        self.assertIs(point, collection["features"][1])
+        self.assertIsInstance(
+            collection["features"][0]["geometry"]["coordinates"][0], list
+        )
+        # Encoding twice changes nothing
+        self.assertIs(encode_document(encoded)["features"][0], polygon)
+
+        decoded = decode_document(json.loads(json.dumps(encoded)))
+        geometry = decoded["features"][0]["geometry"]
+        self.assertNotIn("encoding", geometry)
+        self.assertRingsClose(geometry["coordinates"][0], ring)
+        self.assertRingsClose(geometry["coordinates"][1], hole)
+
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+        }
+        self.assertRingsClose(
+            decode_document(encode_document(feature))["geometry"]["coordinates"][0],
+            ring,
+        )
+        bare = {"type": "Polygon", "coordinates": [[[1, 0], [1, 1], [0, 1]]]}
+        self.assertEqual(decode_document(encode_document(bare)), bare)
+        # Plain documents are returned as they are
+        self.assertIs(decode_document(collection), collection)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator level-of-detail polygon simplification
+"""
+
+import unittest
+import math
+import sys
+import os
+import numpy as np
+import cv2
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils.geometry_lod import LODCache, lod_level, simplify_document
+
+WIDTH, HEIGHT = 4000, 3000
+
+
+def circle(cx, cy, radius, vertices=400):
+    return [
+        [
+            cx + radius * math.cos(2 * math.pi * i / vertices),
+            cy + radius * math.sin(2 * math.pi * i / vertices),
+        ]
+        for i in range(vertices)
+    ]
+
+
+def manual(*rings):
+    """A document as saved by POST /api/annotations/"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "field"},
+                "geometry": {"type": "Polygon", "coordinates": list(rings)},
+            }
+        ],
+    }
+
+
+def rings_of(document):
+    return document["features"][0]["geometry"]["coordinates"]
+
+
+class TestGeometryLOD(unittest.TestCase):
+    """Tests for tolerance levels, simplification and the LOD cache"""
+
+    def test_lod_level(self):
+        """Test that requests map to the coarsest level within half a screen pixel"""
+        self.assertIsNone(lod_level())
+        self.assertIsNone(lod_level(zoom=2))
+        self.assertEqual(lod_level(zoom=1), 0.5)
+        self.assertEqual(lod_level(zoom=0.1), 2.0)
+        self.assertEqual(lod_level(zoom=0.01), 32.0)
+        self.assertEqual(lod_level(tolerance=10), 8.0)
+        self.assertEqual(lod_level(zoom=0.01, tolerance=1), 0.5)
+
+    def test_simplify_within_tolerance(self):
+        """Test that simplified polygons stay within the tolerance in pixels"""
+        ring = circle(0.5, 0.5, 0.2)
+        document = manual(ring, circle(0.5, 0.5, 0.05), circle(0.6, 0.6, 0.0001))
+        pixels = np.asarray(ring) * (WIDTH, HEIGHT)
+        previous = len(ring)
+        for tolerance in (0.5, 2.0, 8.0, 32.0):
+            simplified = simplify_document(document, tolerance, WIDTH, HEIGHT)
+            outer = rings_of(simplified)[0]
+            self.assertLess(len(outer), previous)
+            previous = len(outer)
+            contour = (np.asarray(outer) * (WIDTH, HEIGHT)).astype(np.float32)
+            for x, y in pixels[::7]:
+                distance = cv2.pointPolygonTest(contour, (x, y), True)
+                self.assertLessEqual(abs(distance), tolerance + 0.1)
+            # The tiny hole is dropped, the other is kept
+            self.assertEqual(len(rings_of(simplified)), 2)
+
+        # Properties are shared and the original is untouched
+        self.assertIs(
+            simplified["features"][0]["properties"],
+            document["features"][0]["properties"],
+        )
+        self.assertEqual(len(rings_of(document)[0]), 400)
+
+    def test_tiny_polygon_becomes_box(self):
+        """Test that a polygon smaller than the tolerance keeps its bounding box"""
+        document = manual(circle(0.5, 0.5, 1 / WIDTH, vertices=12))
+        outer = rings_of(simplify_document(document, 32.0, WIDTH, HEIGHT))[0]
+        self.assertEqual(len(outer), 4)
+        xs, ys = zip(*outer)
+        self.assertAlmostEqual(min(xs), 0.5 - 1 / WIDTH, places=6)
+        self.assertAlmostEqual(max(ys), 0.5 + 1 / WIDTH, places=5)
+
+    def test_cache(self):
+        """Test that levels are cached per document and redone after edits"""
+        cache = LODCache(max_annotations=2)
+        document = manual(circle(0.5, 0.5, 0.2))
+        first = cache.get("s1", "a1", document, 8.0, WIDTH, HEIGHT)
+        self.assertIs(cache.get("s1", "a1", document, 8.0, WIDTH, HEIGHT), first)
+        cache.get("s1", "a1", document, 2.0, WIDTH, HEIGHT)
+        self.assertEqual(cache.stats, {"hits": 1, "misses": 2})
+
+        # An edit replaces the document, dropping its levels
+        edited = manual(circle(0.3, 0.3, 0.1))
+        second = cache.get("s1", "a1", edited, 8.0, WIDTH, HEIGHT)
+        self.assertNotEqual(second, first)
+        self.assertEqual(len(cache.entries[("s1", "a1")][1]), 1)
+
+        cache.get("s1", "a2", document, 8.0, WIDTH, HEIGHT)
+        cache.get("s2", "a3", document, 8.0, WIDTH, HEIGHT)
+        self.assertEqual(list(cache.entries), [("s1", "a2"), ("s2", "a3")])
+        cache.drop("s1")
+        self.assertEqual(list(cache.entries), [("s2", "a3")])
+        cache.drop("s2", "a3")
+        self.assertEqual(len(cache.entries), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator annotation geometry store
+"""
+
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+import storage.geometry_store as geometry_module
+from storage.geometry_store import GeometryStore
+
+
+def polygon(n):
+    return {"type": "Polygon", "coordinates": [[[n, 0], [n, 1], [0, 1], [n, 0]]]}
+
+
+class TestGeometryStore(unittest.TestCase):
+    """Tests for GeometryStore functionality"""
+
+    def setUp(self):
+        """Create a store writing to a scratch log"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, "geometry.log")
+        self.store = GeometryStore(self.log_path, flush_interval=0.01)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.temp_dir)
+
+    def reopen(self):
+        """Open another store on the same log, like a restart or a worker"""
+        other = GeometryStore(self.log_path, flush_interval=0.01)
+        self.addCleanup(other.close)
+        return other
+
+    def test_reads_and_writes(self):
+        """Test storing, reading and removing documents"""
+        self.store.put("s1", "a1", polygon(1))
+        self.store.put("s1", "a2", polygon(2))
+        self.store.put("s2", "a3", polygon(3))
+
+        self.assertEqual(sorted(self.store.session_ids()), ["s1", "s2"])
+        self.assertEqual(self.store.get("s1", "a1"), polygon(1))
+        self.assertEqual(
+            self.store.get_many("s1", ["a2", "missing", "a1"]),
+            {"a2": polygon(2), "a1": polygon(1)},
+        )
+
+        self.assertTrue(self.store.delete("s1", "a1"))
+        self.assertFalse(self.store.delete("s1", "a1"))
+        self.store.drop_session("s2")
+        self.assertIsNone(self.store.get("s2", "a3"))
+
+    def test_write_behind_and_replay(self):
+        """Test that changes reach the log in the background and are replayed"""
+        self.store.put("s1", "a1", polygon(1))
+        self.store.put("s1", "a2", polygon(2))
+        self.store.delete("s1", "a2")
+        self.store.put("s2", "a3", polygon(3))
+        self.store.drop_session("s2")
+
+        # The writer thread flushes without being asked
+        deadline = time.time() + 5
+        while os.path.getsize(self.log_path) == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.store.flush()
+
+        restarted = self.reopen()
+        self.assertIsNone(restarted.get("s1", "a2"))
+        self.assertEqual(restarted.documents, {"s1": {"a1": polygon(1)}})
+
+        # A line torn by a crash is ignored
+        with open(self.log_path, "ab") as f:
+            f.write(b'{"w":"x","s":"s1","a":"a9","d":{"type"')
+        restarted = self.reopen()
+        self.assertIsNone(restarted.get("s1", "a9"))
+        self.assertEqual(restarted.documents, {"s1": {"a1": polygon(1)}})
+
+    def test_group_commit(self):
+        """Test that a burst of edits is coalesced into one durable batch"""
+        store = GeometryStore(self.log_path, flush_interval=60)
+        self.addCleanup(store.close)
+        for i in range(200):
+            store.put("s1", "a1", polygon(i))
+        store.put("s1", "a2", polygon(1))
+        store.delete("s1", "a2")
+        store.put("s2", "a3", polygon(3))
+        store.drop_session("s2")
+        store.put("s2", "a4", polygon(4))
+        store.flush()
+
+        self.assertEqual(store.stats["changes"], 205)
+        self.assertEqual(store.stats["lines_written"], 4)
+        self.assertEqual(store.stats["batches"], 1)
+        self.assertEqual(store.stats["fsyncs"], 1)
+        restarted = self.reopen()
+        self.assertEqual(restarted.get("s1", "a1"), polygon(199))
+        self.assertIsNone(restarted.get("s1", "a2"))
+        self.assertEqual(restarted.documents["s2"], {"a4": polygon(4)})
+
+    def test_batch(self):
+        """Test that changes made in a batch are written together after it"""
+        store = GeometryStore(self.log_path, flush_interval=0)
+        self.addCleanup(store.close)
+        with store.batch():
+            for i in range(50):
+                store.put("s1", f"a{i}", polygon(i))
+                time.sleep(0.001)
+            self.assertEqual(store.stats["batches"], 0)
+            self.assertEqual(store.get("s1", "a49"), polygon(49))
+
+        deadline = time.time() + 5
+        while store.stats["batches"] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(store.stats["batches"], 1)
+        self.assertEqual(store.stats["lines_written"], 50)
+        restarted = self.reopen()
+        self.assertEqual(restarted.get("s1", "a0"), polygon(0))
+        self.assertEqual(len(restarted.documents["s1"]), 50)
+
+    def test_reads_during_flush(self):
+        """Test that reads and writes do not wait for a batch being synced"""
+        store = GeometryStore(self.log_path, flush_interval=60)
+        self.addCleanup(store.close)
+        store.put("s1", "a1", polygon(1))
+        syncing, release = threading.Event(), threading.Event()
+        real_fsync = os.fsync
+
+        def slow_fsync(fd):
+            syncing.set()
+            release.wait(5)
+            real_fsync(fd)
+
+        with patch.object(geometry_module.os, "fsync", slow_fsync):
+            flusher = threading.Thread(target=store.flush)
+            flusher.start()
+            self.assertTrue(syncing.wait(5))
+            started = time.monotonic()
+            self.assertEqual(store.get("s1", "a1"), polygon(1))
+            store.put("s1", "a2", polygon(2))
+            self.assertEqual(store.get_many("s1", ["a2"]), {"a2": polygon(2)})
+            # The fsync holds out for 5 s
+            self.assertLess(time.monotonic() - started, 2)
+            release.set()
+            flusher.join()
+
+        store.flush()
+        self.assertEqual(
+            self.reopen().get_many("s1", ["a1", "a2"]),
+            {"a1": polygon(1), "a2": polygon(2)},
+        )
+
+    def test_load_and_busy_reader(self):
+        """Test warming the store and serving reads while the log is being read"""
+        self.store.put("s1", "a1", polygon(1))
+        self.store.flush()
+
+        other = GeometryStore(self.log_path, flush_interval=0.01)
+        self.addCleanup(other.close)
+        other.load()
+        self.assertEqual(other.documents, {"s1": {"a1": polygon(1)}})
+
+        # While another thread holds the reader, a read does not wait for it
+        self.store.put("s1", "a2", polygon(2))
+        self.store.flush()
+        with other._read_lock:
+            self.assertIsNone(other.get("s1", "a2"))
+        self.assertEqual(other.get("s1", "a2"), polygon(2))
+
+    def test_torn_line_repaired(self):
+        """Test that appends after a crash do not run into the torn line"""
+        self.store.put("s1", "a1", polygon(1))
+        self.store.flush()
+        with open(self.log_path, "ab") as f:
+            f.write(b'{"w":"x","s":"s1","a":"a1","d":{"ty')
+
+        other = self.reopen()
+        other.put("s1", "a2", polygon(2))
+        other.flush()
+        restarted = self.reopen()
+        self.assertEqual(restarted.get("s1", "a1"), polygon(1))
+        self.assertEqual(restarted.get("s1", "a2"), polygon(2))
+
+    def test_shared_between_workers(self):
+        """Test that processes sharing a log see each other's changes"""
+        other = self.reopen()
+        self.store.put("s1", "a1", polygon(1))
+        self.store.flush()
+        self.assertEqual(other.get("s1", "a1"), polygon(1))
+
+        other.put("s1", "a1", polygon(5))
+        other.flush()
+        self.assertEqual(self.store.get("s1", "a1"), polygon(5))
+
+        # A change not written yet is not undone by an older one from the log
+        self.store.put("s1", "a1", polygon(6))
+        other.put("s1", "a2", polygon(7))
+        other.flush()
+        self.assertEqual(self.store.get("s1", "a1"), polygon(6))
+        self.assertEqual(self.store.get("s1", "a2"), polygon(7))
+
+    def test_compaction(self):
+        """Test that a log of mostly stale lines is rewritten"""
+        original = geometry_module.COMPACT_MIN_LINES
+        geometry_module.COMPACT_MIN_LINES = 50
+        self.addCleanup(setattr, geometry_module, "COMPACT_MIN_LINES", original)
+
+        other = self.reopen()
+        other.get("s1", "a1")
+        for i in range(60):
+            self.store.put("s1", "a1", polygon(i))
+            self.store.flush()
+
+        with open(self.log_path, "rb") as f:
+            self.assertLess(len(f.readlines()), 50)
+        self.assertEqual(self.reopen().get("s1", "a1"), polygon(59))
+        # Readers notice the log was replaced
+        self.assertEqual(other.get("s1", "a1"), polygon(59))
+
+    def test_compact_log(self):
+        """Test that polygons are logged compactly and replayed from either encoding"""
+        ring = [[0.1 + i / 7000, 0.2 + (i % 3) / 9000] for i in range(300)]
+        document = {
+            "type": "Feature",
+            "properties": {"label": "field"},
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+        }
+        plain_path = os.path.join(self.temp_dir, "plain.log")
+        plain = GeometryStore(plain_path, encoding="json")
+        self.addCleanup(plain.close)
+        for store in (self.store, plain):
+            store.put("s1", "a1", document)
+            store.flush()
+
+        self.assertLess(os.path.getsize(self.log_path) * 4, os.path.getsize(plain_path))
+        for path in (self.log_path, plain_path):
+            replayed = GeometryStore(path).get("s1", "a1")
+            self.assertEqual(replayed["properties"], {"label": "field"})
+            for a, b in zip(replayed["geometry"]["coordinates"][0], ring):
+                self.assertAlmostEqual(a[0], b[0], places=6)
+                self.assertAlmostEqual(a[1], b[1], places=6)
+        # The document in memory is not rounded
+        self.assertIs(self.store.get("s1", "a1"), document)
+
+    def test_memory_only(self):
+        """Test that a store without a log keeps everything in memory"""
+        store = GeometryStore(None)
+        store.put("s1", "a1", polygon(1))
+        store.flush()
+        self.assertEqual(store.get("s1", "a1"), polygon(1))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for sat-annotator HTTP caching helpers
+"""
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import FastAPI testing components
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+# Import application code
+from utils.http_cache import (
+    make_etag,
+    etag_matches,
+    if_match_passes,
+    not_modified,
+    set_cache_headers,
+    ImmutableStaticFiles,
+    IMMUTABLE_CACHE_CONTROL,
+)
+from storage.session_store import SessionStore
+
+
+class TestHTTPCache(unittest.TestCase):
+    """Tests for ETag handling and the immutable uploads mount"""
+
+    def setUp(self):
+        """Set up a small app using the helpers"""
+        self.upload_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.upload_dir, "scene.png"), "wb") as f:
+            f.write(bytes(range(256)) * 4)
+        os.mkdir(os.path.join(self.upload_dir, ".partial"))
+        with open(os.path.join(self.upload_dir, ".partial", "x.part"), "wb") as f:
+            f.write(b"partial")
+
+        self.store = SessionStore()
+        self.session_id = "test-session"
+        self.store.create_session(self.session_id)
+
+        self.app = FastAPI()
+
+        @self.app.get("/api/images/")
+        def get_images(request: Request, response: Response):
+            etag = make_etag(
+                "images", self.session_id, self.store.get_version(self.session_id)
+            )
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            set_cache_headers(response, etag)
+            return [img.file_name for img in self.store.get_images(self.session_id)]
+
+        self.app.mount(
+            "/uploads", ImmutableStaticFiles(directory=self.upload_dir), name="uploads"
+        )
+        self.client = TestClient(self.app)
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_dir)
+
+    def test_etag_revalidation(self):
+        """Test that unchanged sessions answer 304 and changes invalidate the ETag"""
+        response = self.client.get("/api/images/")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["etag"]
+        self.assertEqual(response.headers["cache-control"], "private, no-cache")
+
+        response = self.client.get("/api/images/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], etag)
+
+        self.store.add_image(self.session_id, "new.png", "uploads/new.png")
+        response = self.client.get("/api/images/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), ["new.png"])
+        self.assertNotEqual(response.headers["etag"], etag)
+
+    def test_etag_matching(self):
+        """Test If-None-Match parsing"""
+        etag = make_etag("a", 1)
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertNotEqual(etag, make_etag("a", 2))
+
+        def request_with(header):
+            return Request(
+                {"type": "http", "headers": [(b"if-none-match", header.encode())]}
+            )
+
+        self.assertTrue(etag_matches(request_with(etag), etag))
+        self.assertTrue(etag_matches(request_with(f'"x", {etag[2:]}'), etag))
+        self.assertTrue(etag_matches(request_with("*"), etag))
+        self.assertFalse(etag_matches(request_with('"other"'), etag))
+
+    def test_if_match(self):
+        """Test If-Match preconditions use strong comparison"""
+        etag = make_etag("a", 1, weak=False)
+        self.assertEqual(etag, make_etag("a", 1)[2:])
+
+        def request_with(header):
+            headers = [(b"if-match", header.encode())] if header is not None else []
+            return Request({"type": "http", "headers": headers})
+
+        self.assertTrue(if_match_passes(request_with(etag), etag))
+        self.assertTrue(if_match_passes(request_with(f'"x", {etag}'), etag))
+        self.assertTrue(if_match_passes(request_with("*"), etag))
+        self.assertTrue(if_match_passes(request_with(None), etag))
+        self.assertFalse(if_match_passes(request_with(f"W/{etag}"), etag))
+        self.assertFalse(if_match_passes(request_with('"other"'), etag))
+
+    def test_immutable_uploads(self):
+        """Test immutable caching and byte ranges on served uploads"""
+        response = self.client.get("/uploads/scene.png")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response.headers["accept-ranges"], "bytes")
+
+        response = self.client.get(
+            "/uploads/scene.png", headers={"Range": "bytes=16-31"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, bytes(range(16, 32)))
+
+        # In-progress chunked uploads are never served
+        response = self.client.get("/uploads/.partial/x.part")
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
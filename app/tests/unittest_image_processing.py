@@ -24,7 +24,12 @@ os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
 sys.modules["PIL"] = MagicMock()
 
 # Import application code
-from utils.image_processing import validate_image_file
+from utils.image_processing import (
+    validate_image_file,
+    is_archive_file,
+    iter_archive_images,
+    encode_derivative,
+)
 
 
 class MockUploadFile:
@@ -65,6 +70,74 @@ class TestImageProcessing(unittest.TestCase):
                 f"validate_image_file should return False for {content_type}",
             )
 
+    def test_is_archive_file(self):
+        """Test detecting archive uploads by name and content type"""
+        self.assertTrue(is_archive_file(MockUploadFile("tiles.zip", "")))
+        self.assertTrue(is_archive_file(MockUploadFile("tiles.tar.gz", "")))
+        self.assertTrue(is_archive_file(MockUploadFile("tiles", "application/x-tar")))
+        self.assertFalse(is_archive_file(MockUploadFile("tile.png", "image/png")))
+
+    def test_iter_archive_images(self):
+        """Test streaming image members out of zip and tar archives"""
+        import tarfile
+        import zipfile
+
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w") as archive:
+            archive.writestr("aoi/tile_1.png", b"png data")
+            archive.writestr("aoi/", b"")
+            archive.writestr("aoi/notes.txt", b"not an image")
+            archive.writestr("tile_2.TIF", b"tiff data")
+
+        members = [
+            (name, stream.read(), size)
+            for name, stream, size in iter_archive_images(zip_buffer, "tiles.zip")
+        ]
+        self.assertEqual(
+            members,
+            [("aoi/tile_1.png", b"png data", 8), ("tile_2.TIF", b"tiff data", 9)],
+        )
+
+        tar_buffer = io.BytesIO()
+        with tarfile.open(fileobj=tar_buffer, mode="w:gz") as archive:
+            for name, data in [("tile_3.jpg", b"jpeg data"), ("meta.xml", b"<x/>")]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+        members = [
+            (name, stream.read(), size)
+            for name, stream, size in iter_archive_images(tar_buffer, "tiles.tar.gz")
+        ]
+        self.assertEqual(members, [("tile_3.jpg", b"jpeg data", 9)])
+
+        with self.assertRaises(ValueError):
+            list(iter_archive_images(io.BytesIO(b"garbage"), "tiles.zip"))
+
+    def test_encode_derivative(self):
+        """Test the derivative format and options handed to PIL"""
+        img = MagicMock()
+        img.mode = "RGB"
+        img.size = (1024, 768)
+
+        path, lossy = encode_derivative(img, Path("/tmp"), "webp", quality=70)
+        self.assertTrue(lossy)
+        self.assertEqual(path.suffix, ".webp")
+        img.save.assert_called_with(path, "WEBP", quality=70, method=4)
+
+        path, lossy = encode_derivative(img, Path("/tmp"), "png", compress_level=1)
+        self.assertFalse(lossy)
+        img.save.assert_called_with(path, "PNG", compress_level=1)
+
+        # Scenes beyond WebP's size limit fall back to JPEG
+        img.size = (20000, 20000)
+        path, lossy = encode_derivative(img, Path("/tmp"), "webp")
+        self.assertTrue(lossy)
+        self.assertEqual(path.suffix, ".jpg")
+
+        with self.assertRaises(ValueError):
+            encode_derivative(img, Path("/tmp"), "bmp")
+
     @patch("builtins.open", MagicMock())
     @patch("os.path.getsize", MagicMock(return_value=1024))
     @patch("pathlib.Path.mkdir", MagicMock())
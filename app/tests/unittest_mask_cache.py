@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator mask and overlay cache
+"""
+
+import unittest
+import sys
+import os
+import numpy as np
+import cv2
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils.annotation_export import prepare_annotations, label_classes
+from utils.mask_cache import MaskCache
+
+WIDTH, HEIGHT = 160, 100
+
+
+def manual(label, x0, y0, x1, y1):
+    """A document as saved by POST /api/annotations/"""
+    ring = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": label},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ],
+    }
+
+
+def decode(png):
+    return cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+class TestMaskCache(unittest.TestCase):
+    """Tests for MaskCache functionality"""
+
+    def setUp(self):
+        """Create a cache and a few overlapping annotations"""
+        self.cache = MaskCache(max_images=2)
+        self.documents = {
+            "a1": manual("building", 0.1, 0.1, 0.5, 0.5),
+            "a2": manual("road", 0.3, 0.3, 0.9, 0.9),
+            "a3": manual("building", 0.6, 0.0, 0.7, 0.2),
+        }
+        self.base = np.full((HEIGHT, WIDTH, 3), 90, dtype=np.uint8)
+
+    def annotations(self):
+        return prepare_annotations(self.documents.items(), WIDTH, HEIGHT)
+
+    def render(self, mask_type="mask", image_id="img"):
+        png, classes = self.cache.render(
+            "s1",
+            image_id,
+            self.annotations(),
+            WIDTH,
+            HEIGHT,
+            mask_type,
+            load_image=lambda: self.base,
+        )
+        return decode(png), classes
+
+    def reference(self):
+        """Mask rendered from scratch, one polygon after another"""
+        annotations = self.annotations()
+        classes = label_classes(annotations)
+        mask = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        for annotation in annotations:
+            cv2.fillPoly(mask, [annotation.ring], classes[annotation.label])
+        return mask
+
+    def test_render_and_reuse(self):
+        """Test that masks are rendered once and reused while unchanged"""
+        mask, classes = self.render()
+        self.assertEqual(classes, {"building": 1, "road": 2})
+        np.testing.assert_array_equal(mask, self.reference())
+
+        self.render()
+        self.assertEqual(self.cache.stats["full_renders"], 1)
+        self.assertEqual(self.cache.stats["encodes"], 1)
+
+    def test_incremental_updates(self):
+        """Test that edits repaint only their regions and match a full render"""
+        self.render()
+
+        # Editing replaces the document, moving a polygon under another
+        self.documents["a1"] = manual("building", 0.2, 0.2, 0.6, 0.6)
+        mask, _ = self.render()
+        np.testing.assert_array_equal(mask, self.reference())
+
+        del self.documents["a2"]
+        self.documents["a4"] = manual("road", 0.0, 0.8, 0.2, 1.0)
+        mask, _ = self.render()
+        np.testing.assert_array_equal(mask, self.reference())
+
+        self.assertEqual(self.cache.stats["full_renders"], 1)
+        self.assertEqual(self.cache.stats["partial_renders"], 2)
+
+        # A new label renumbers the classes
+        self.documents["a5"] = manual("field", 0.0, 0.0, 0.05, 0.05)
+        mask, classes = self.render()
+        self.assertEqual(classes, {"building": 1, "field": 2, "road": 3})
+        np.testing.assert_array_equal(mask, self.reference())
+        self.assertEqual(self.cache.stats["full_renders"], 2)
+
+    def test_overlay(self):
+        """Test that overlays tint annotated pixels and follow edits"""
+        overlay, _ = self.render("overlay")
+        self.assertEqual(overlay.shape, (HEIGHT, WIDTH, 3))
+        self.assertTrue((overlay[0, 0] == 90).all())
+        self.assertFalse((overlay[HEIGHT // 4, WIDTH // 4] == 90).all())
+
+        del self.documents["a1"]
+        overlay, _ = self.render("overlay")
+        self.assertTrue((overlay[HEIGHT // 4, WIDTH // 4] == 90).all())
+        self.assertFalse((overlay[HEIGHT // 2, WIDTH // 2] == 90).all())
+
+    def test_eviction(self):
+        """Test that old images are evicted and sessions can be dropped"""
+        self.render(image_id="img1")
+        self.render(image_id="img2")
+        self.render(image_id="img3")
+        self.assertEqual(list(self.cache.entries), [("s1", "img2"), ("s1", "img3")])
+
+        self.cache.drop("s1", "img2")
+        self.assertEqual(list(self.cache.entries), [("s1", "img3")])
+        self.cache.drop("s1")
+        self.assertEqual(len(self.cache.entries), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
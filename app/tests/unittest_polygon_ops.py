@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator polygon merge, subtract, split and dissolve
+"""
+
+import unittest
+import sys
+import os
+from pathlib import Path
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils.polygon_ops import (
+    dissolve_groups,
+    document_rings,
+    merge_polygons,
+    polygon_parts,
+    split_polygon,
+    subtract_polygons,
+    to_polygons,
+    to_rings,
+)
+
+WIDTH, HEIGHT = 1000, 500
+
+
+def square(x, y, size):
+    """Normalized ring of a square on the test image"""
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size]]
+
+
+def polygons(*rings):
+    """Pixel polygons of single-ring annotations"""
+    return to_polygons([[ring] for ring in rings], WIDTH, HEIGHT)
+
+
+class TestPolygonOps(unittest.TestCase):
+    """Tests for the boolean operations on annotation polygons"""
+
+    def test_conversion(self):
+        """Test converting rings to pixel polygons and back"""
+        outer, hole = square(0.2, 0.2, 0.4), square(0.3, 0.3, 0.1)
+        bowtie = [[0.0, 0.0], [0.1, 0.1], [0.1, 0.0], [0.0, 0.1]]
+        converted = to_polygons(
+            [[outer, hole], [outer, [[0.5, 0.5]]], [bowtie]], 1000, 500
+        )
+        self.assertAlmostEqual(converted[0].area, 400 * 200 - 100 * 50)
+        self.assertEqual(
+            [sorted(ring) for ring in to_rings(converted[0], 1000, 500)],
+            [
+                [[0.2, 0.2], [0.2, 0.6], [0.6, 0.2], [0.6, 0.6]],
+                [[0.3, 0.3], [0.3, 0.4], [0.4, 0.3], [0.4, 0.4]],
+            ],
+        )
+        # Degenerate holes are dropped, self-intersections repaired
+        self.assertEqual(len(converted[1].interiors), 0)
+        self.assertTrue(converted[2].is_valid)
+        self.assertAlmostEqual(converted[2].area, 2 * 100 * 50 / 4)
+
+        for rings in ([[[0.1, 0.1], [0.2, 0.2]]], [[[0.1, 0.1], [0.2], [0.3, 0.1]]]):
+            with self.assertRaises(ValueError):
+                to_polygons([rings], WIDTH, HEIGHT)
+
+        document = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Polygon", "coordinates": [outer]},
+                }
+            ],
+        }
+        self.assertEqual(document_rings(document), [outer])
+        point = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [0, 0]},
+        }
+        self.assertIsNone(document_rings(point))
+
+    def test_merge(self):
+        """Test merging touching polygons and closing gaps"""
+        left, right, apart = polygons(
+            square(0.0, 0.0, 0.1), square(0.1, 0.0, 0.1), square(0.201, 0.0, 0.1)
+        )
+        merged = polygon_parts(merge_polygons([left, right]))
+        self.assertEqual(len(merged), 1)
+        # The vertices where the squares met are dropped
+        (ring,) = to_rings(merged[0], WIDTH, HEIGHT)
+        self.assertEqual(sorted(ring), [[0.0, 0.0], [0.0, 0.1], [0.2, 0.0], [0.2, 0.1]])
+
+        # A 1 pixel gap is kept without a tolerance and closed with one
+        self.assertEqual(len(polygon_parts(merge_polygons([right, apart]))), 2)
+        closed = polygon_parts(merge_polygons([right, apart], tolerance=2))
+        self.assertEqual(len(closed), 1)
+        self.assertAlmostEqual(closed[0].area, 201 * 50)
+
+    def test_subtract_and_split(self):
+        """Test cutting polygons out of one and splitting it along a line"""
+        field, road = polygons(
+            square(0.2, 0.2, 0.4), [[0.3, 0.0], [0.35, 0.0], [0.35, 1.0], [0.3, 1.0]]
+        )
+        pieces = polygon_parts(subtract_polygons(field, [road]))
+        self.assertEqual(len(pieces), 2)
+        self.assertAlmostEqual(pieces[0].area, 250 * 200)
+        self.assertAlmostEqual(pieces[1].area, 100 * 200)
+
+        # A hole where the cutter lies inside
+        courtyard = polygons(square(0.3, 0.3, 0.1))[0]
+        (piece,) = polygon_parts(subtract_polygons(field, [courtyard]))
+        self.assertEqual(len(piece.interiors), 1)
+
+        pieces = split_polygon(
+            field, [[0.1, 0.5], [0.5, 0.5], [0.5, 0.7]], WIDTH, HEIGHT
+        )
+        self.assertEqual(len(pieces), 2)
+        self.assertAlmostEqual(sum(piece.area for piece in pieces), field.area)
+        self.assertEqual(
+            len(split_polygon(field, [[0.0, 0.0], [0.1, 0.1]], WIDTH, HEIGHT)), 1
+        )
+        with self.assertRaises(ValueError):
+            split_polygon(field, [[0.5, 0.5]], WIDTH, HEIGHT)
+
+    def test_dissolve_groups(self):
+        """Test grouping chains of touching polygons"""
+        # One chain, whose shared edges only match up to float noise
+        rings = [square(0.01 * i, 0.0, 0.01) for i in range(50)]
+        rings += [square(0.8, 0.8, 0.05), square(0.851, 0.8, 0.05)]  # 1 px apart
+        rings += [square(0.5, 0.5, 0.01)]  # Alone
+        shapes = polygons(*rings)
+        self.assertEqual(dissolve_groups(shapes), [list(range(50))])
+        self.assertEqual(
+            dissolve_groups(shapes, tolerance=1.5), [list(range(50)), [50, 51]]
+        )
+        (merged,) = polygon_parts(merge_polygons(shapes[:50]))
+        self.assertAlmostEqual(merged.area, 500 * 5)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
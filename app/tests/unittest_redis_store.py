@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator Redis session store backend.
+
+The tests run against a small in-process server that speaks the Redis
+protocol for the commands the store uses, so no Redis install is needed.
+"""
+
+import unittest
+import sys
+import os
+import uuid
+import socket
+import threading
+import socketserver
+from pathlib import Path
+from datetime import datetime, timedelta
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from storage.session_store import SessionStore
+from storage.redis_store import RedisSessionStore, RedisError, _read_reply
+
+
+class StandInRedisHandler(socketserver.StreamRequestHandler):
+    """Serve one client connection of the stand-in server"""
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        queued = None
+        # Watched key -> its write count when it was watched
+        watched = {}
+        while True:
+            try:
+                command = _read_reply(self.rfile)
+            except ConnectionError:
+                return
+            name = command[0].decode().upper()
+            args = command[1:]
+            self.server.commands.append(name)
+
+            if name == "MULTI":
+                queued = []
+                self.write(b"+OK\r\n")
+            elif name == "WATCH":
+                with self.server.lock:
+                    watched.update((k, self.server.writes.get(k, 0)) for k in args)
+                self.write(b"+OK\r\n")
+            elif name == "UNWATCH":
+                watched.clear()
+                self.write(b"+OK\r\n")
+            elif name == "EXEC":
+                with self.server.lock:
+                    if any(
+                        self.server.writes.get(k, 0) != n for k, n in watched.items()
+                    ):
+                        replies = None
+                    else:
+                        replies = [self.server.execute(n, a) for n, a in queued]
+                queued = None
+                watched.clear()
+                if replies is None:
+                    self.write(b"*-1\r\n")
+                else:
+                    self.write(b"*%d\r\n" % len(replies) + b"".join(replies))
+            elif queued is not None:
+                queued.append((name, args))
+                self.write(b"+QUEUED\r\n")
+            else:
+                with self.server.lock:
+                    self.write(self.server.execute(name, args))
+
+    def write(self, data: bytes):
+        self.wfile.write(data)
+        self.wfile.flush()
+
+
+class StandInRedisServer(socketserver.ThreadingTCPServer):
+    """In-memory server for the hash and key commands used by the store"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInRedisHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+        self.commands = []
+        # Key -> number of commands that wrote to it, for WATCH
+        self.writes = {}
+
+    @staticmethod
+    def bulk(value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def execute(self, name, args):
+        data = self.data
+        if name in ("DEL", "HSET", "HSETNX", "HDEL", "HINCRBY", "ZADD", "ZREM"):
+            for key in args if name == "DEL" else args[:1]:
+                self.writes[key] = self.writes.get(key, 0) + 1
+        if name in ("PING", "SELECT", "AUTH"):
+            return b"+OK\r\n"
+        if name == "DEL":
+            return b":%d\r\n" % sum(data.pop(k, None) is not None for k in args)
+        if name == "EXISTS":
+            return b":%d\r\n" % sum(k in data for k in args)
+        if name == "HGET":
+            return self.bulk(data.get(args[0], {}).get(args[1]))
+        if name == "HEXISTS":
+            return b":%d\r\n" % (args[1] in data.get(args[0], {}))
+        if name == "HGETALL":
+            fields = data.get(args[0], {})
+            items = [x for kv in fields.items() for x in kv]
+            return b"*%d\r\n" % len(items) + b"".join(self.bulk(x) for x in items)
+        if name == "HSET":
+            fields = data.setdefault(args[0], {})
+            added = 0
+            for key, value in zip(args[1::2], args[2::2]):
+                added += key not in fields
+                fields[key] = value
+            return b":%d\r\n" % added
+        if name == "HSETNX":
+            fields = data.setdefault(args[0], {})
+            if args[1] in fields:
+                return b":0\r\n"
+            fields[args[1]] = args[2]
+            return b":1\r\n"
+        if name == "HDEL":
+            fields = data.get(args[0], {})
+            removed = sum(fields.pop(k, None) is not None for k in args[1:])
+            if not fields:
+                data.pop(args[0], None)
+            return b":%d\r\n" % removed
+        if name == "HINCRBY":
+            fields = data.setdefault(args[0], {})
+            value = int(fields.get(args[1], 0)) + int(args[2])
+            fields[args[1]] = str(value).encode()
+            return b":%d\r\n" % value
+        if name == "ZADD":
+            scores = data.setdefault(args[0], {})
+            flags = {a.upper() for a in args[1:] if a.upper() in (b"NX", b"XX")}
+            pairs = args[1 + len(flags) :]
+            added = 0
+            for score, member in zip(pairs[::2], pairs[1::2]):
+                if (b"NX" in flags and member in scores) or (
+                    b"XX" in flags and member not in scores
+                ):
+                    continue
+                added += member not in scores
+                scores[member] = float(score)
+            if not scores:
+                data.pop(args[0], None)
+            return b":%d\r\n" % added
+        if name == "HVALS":
+            values = list(data.get(args[0], {}).values())
+            return b"*%d\r\n" % len(values) + b"".join(self.bulk(v) for v in values)
+        if name == "ZRANGE":
+            members = [
+                m for _, m in sorted((s, m) for m, s in data.get(args[0], {}).items())
+            ]
+            start, stop = int(args[1]), int(args[2])
+            members = members[start : (stop + 1) or None]
+            return b"*%d\r\n" % len(members) + b"".join(self.bulk(m) for m in members)
+        if name == "ZREM":
+            scores = data.get(args[0], {})
+            return b":%d\r\n" % sum(scores.pop(m, None) is not None for m in args[1:])
+        if name == "ZRANGEBYSCORE":
+            low, high = (float(x) for x in args[1:3])
+            scores = data.get(args[0], {})
+            members = sorted((s, m) for m, s in scores.items() if low <= s <= high)
+            return b"*%d\r\n" % len(members) + b"".join(
+                self.bulk(m) for _, m in members
+            )
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+class TestRedisSessionStore(unittest.TestCase):
+    """Tests for RedisSessionStore functionality"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInRedisServer()
+        cls.url = "redis://127.0.0.1:%d/0" % cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Use a fresh store and session for each test"""
+        self.store = RedisSessionStore(self.url)
+        self.session_id = str(uuid.uuid4())
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_images_and_annotations(self):
+        """Test adding, reading and removing records"""
+        image = self.store.add_image(
+            self.session_id, "test.jpg", "uploads/test.jpg", "100x100", "test"
+        )
+        self.assertEqual(self.store.get_image(self.session_id, image.image_id), image)
+
+        annotation = self.store.add_annotation(
+            self.session_id, image.image_id, "annotations/test.json", True, "sam"
+        )
+        self.assertEqual(
+            self.store.get_annotation(self.session_id, annotation.annotation_id),
+            annotation,
+        )
+        self.assertIsNone(
+            self.store.add_annotation(self.session_id, "missing", "annotations/x")
+        )
+
+        summary = self.store.get_session_summary(self.session_id)
+        self.assertEqual(summary["images_count"], 1)
+        self.assertEqual(summary["annotations_count"], 1)
+
+        self.assertTrue(self.store.remove_image(self.session_id, image.image_id))
+        self.assertEqual(self.store.get_annotations(self.session_id), [])
+        self.assertTrue(self.store.delete_session(self.session_id))
+        self.assertFalse(self.store.session_exists(self.session_id))
+
+    def test_shared_between_workers(self):
+        """Test that a write by one worker invalidates another's cache"""
+        other = RedisSessionStore(self.url)
+        try:
+            image = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+            self.assertEqual(len(other.get_images(self.session_id)), 1)
+
+            self.store.add_annotation(self.session_id, image.image_id, "annotations/a")
+            self.assertEqual(
+                len(other.get_annotations(self.session_id, image.image_id)), 1
+            )
+
+            other.remove_image(self.session_id, image.image_id)
+            self.assertEqual(self.store.get_images(self.session_id), [])
+        finally:
+            other.close()
+
+    def test_cached_reads_are_one_command(self):
+        """Test that a warm read only asks the server for the version"""
+        image = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        ids = [
+            self.store.add_annotation(
+                self.session_id, image.image_id, f"annotations/{i}"
+            ).annotation_id
+            for i in range(5)
+        ]
+        self.store.get_images(self.session_id)
+
+        self.server.commands.clear()
+        listed = self.store.get_annotations(self.session_id, image.image_id)
+        self.assertEqual([a.annotation_id for a in listed], ids)
+        self.assertEqual(self.server.commands, ["HGET"])
+
+    def test_reload_keeps_order(self):
+        """Test that a cold cache rebuilds records in insertion order"""
+        names = [f"{i}.jpg" for i in range(10)]
+        for name in names:
+            self.store.add_image(self.session_id, name, f"uploads/{name}")
+
+        fresh = RedisSessionStore(self.url)
+        try:
+            images = fresh.get_images(self.session_id)
+            self.assertEqual([i.file_name for i in images], names)
+            self.assertEqual(images, self.store.get_images(self.session_id))
+        finally:
+            fresh.close()
+
+    def test_batch(self):
+        """Test that a batch is sent as one transaction and rolls back on error"""
+        with self.assertRaises(RuntimeError):
+            with self.store.batch():
+                self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+                raise RuntimeError("boom")
+        self.assertFalse(self.store.session_exists(self.session_id))
+
+        self.server.commands.clear()
+        with self.store.batch():
+            for i in range(3):
+                self.store.add_image(self.session_id, f"{i}.jpg", f"uploads/{i}.jpg")
+        self.assertEqual(self.server.commands.count("EXEC"), 1)
+        self.assertEqual(len(self.store.get_images(self.session_id)), 3)
+
+    def test_batch_reads_own_writes(self):
+        """Test that reads inside a batch see the writes made earlier in it"""
+        with self.store.batch():
+            image = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+            self.assertTrue(self.store.session_exists(self.session_id))
+            annotation = self.store.add_annotation(
+                self.session_id, image.image_id, "annotations/b1.json"
+            )
+            self.assertIsNotNone(annotation)
+            self.assertEqual(len(self.store.get_annotations(self.session_id)), 1)
+            self.assertTrue(
+                self.store.remove_annotation(self.session_id, annotation.annotation_id)
+            )
+            self.assertFalse(
+                self.store.remove_annotation(self.session_id, annotation.annotation_id)
+            )
+            # Nothing reaches the server before the block exits
+            other = RedisSessionStore(self.url)
+            self.assertFalse(other.session_exists(self.session_id))
+            other.close()
+
+        self.assertEqual(self.store.get_annotations(self.session_id), [])
+        self.assertEqual(
+            [i.image_id for i in self.store.get_images(self.session_id)],
+            [image.image_id],
+        )
+
+    def test_annotation_needs_image(self):
+        """Test that an annotation is not added to an image removed meanwhile"""
+        other = RedisSessionStore(self.url)
+        self.addCleanup(other.close)
+        image = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        spare = self.store.add_image(self.session_id, "b.jpg", "uploads/b.jpg")
+        watch = self.store.client.watch
+        writes = []
+
+        def watch_then_write(keys, commands):
+            replies = watch(keys, commands)
+            if writes:
+                # Another worker writes between the check and the EXEC
+                writes.pop(0)()
+            return replies
+
+        self.store.client.watch = watch_then_write
+        # An unrelated write aborts the transaction, which is retried
+        writes.append(lambda: other.add_image(self.session_id, "c.jpg", "uploads/c"))
+        self.assertIsNotNone(
+            self.store.add_annotation(self.session_id, image.image_id, "annotations/a")
+        )
+        writes.append(lambda: other.remove_image(self.session_id, spare.image_id))
+        self.assertIsNone(
+            self.store.add_annotation(self.session_id, spare.image_id, "annotations/b")
+        )
+        self.assertEqual(len(other.get_annotations(self.session_id)), 1)
+
+        # A batch whose image was removed is not sent
+        with self.assertRaises(RedisError):
+            with self.store.batch():
+                self.store.add_annotation(
+                    self.session_id, image.image_id, "annotations/c"
+                )
+                other.remove_image(self.session_id, image.image_id)
+        self.assertEqual(other.get_annotations(self.session_id), [])
+
+    def test_bump_version_in_batch(self):
+        """Test that a version bumped in a batch is the one it ends with"""
+        self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        with self.store.batch():
+            self.store.add_image(self.session_id, "b.jpg", "uploads/b.jpg")
+            version = self.store.bump_version(self.session_id)
+        self.assertEqual(version, self.store.get_version(self.session_id))
+        self.assertEqual(
+            self.store.bump_version(self.session_id),
+            self.store.get_version(self.session_id),
+        )
+
+    def test_images_page(self):
+        """Test keyset paging and per-image annotation counts"""
+        ids = [
+            self.store.add_image(
+                self.session_id, f"{i}.jpg", f"uploads/{i}.jpg"
+            ).image_id
+            for i in range(7)
+        ]
+        self.store.add_annotation(self.session_id, ids[1], "annotations/a")
+        self.store.add_annotation(self.session_id, ids[1], "annotations/b")
+
+        listed, cursor = [], None
+        while True:
+            page, cursor = self.store.get_images_page(self.session_id, cursor, limit=3)
+            listed.extend(image.image_id for image in page)
+            if cursor is None:
+                break
+            # Images listed on earlier pages may go away in between
+            self.store.remove_image(self.session_id, page[0].image_id)
+        self.assertEqual(listed, ids)
+        self.assertEqual(self.store.get_images_page("missing"), ([], None))
+
+        counts = self.store.count_annotations(self.session_id, [ids[1], ids[2]])
+        self.assertEqual(counts, {ids[1]: 2, ids[2]: 0})
+
+    def test_export_import(self):
+        """Test moving a session from the memory backend"""
+        memory = SessionStore()
+        image = memory.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        memory.add_annotation(self.session_id, image.image_id, "annotations/a")
+
+        self.assertTrue(
+            self.store.import_session(
+                self.session_id, memory.export_session(self.session_id)
+            )
+        )
+        exported = self.store.export_session(self.session_id)
+        self.assertEqual(exported["images"], memory.sessions[self.session_id]["images"])
+        self.assertEqual(
+            exported["annotations"], memory.sessions[self.session_id]["annotations"]
+        )
+
+    def test_idle_sessions(self):
+        """Test last-access tracking through the sessions sorted set"""
+        self.store.create_session(self.session_id)
+        later = datetime.now() + timedelta(seconds=1)
+        self.assertIn(self.session_id, self.store.get_idle_sessions(later))
+
+        earlier = datetime.now() - timedelta(days=1)
+        self.assertNotIn(self.session_id, self.store.get_idle_sessions(earlier))
+
+        self.store.delete_session(self.session_id)
+        self.assertNotIn(self.session_id, self.store.get_idle_sessions(later))
+        # Touching a deleted session does not bring it back
+        self.store.touch_session(self.session_id)
+        self.assertNotIn(self.session_id, self.store.get_idle_sessions(later))
+
+    def test_usage_and_file_paths(self):
+        """Test per-session disk usage and the referenced file listing"""
+        image = self.store.add_image(
+            self.session_id,
+            "a.jpg",
+            "uploads/a.jpg",
+            sam_path="uploads/a.tif",
+            file_size=300,
+        )
+        self.store.add_annotation(self.session_id, image.image_id, "annotations/a")
+        self.assertEqual(self.store.get_session_usage(self.session_id), 300)
+
+        paths = set(self.store.iter_file_paths())
+        self.assertTrue(
+            {"uploads/a.jpg", "uploads/a.tif", "annotations/a"}.issubset(paths)
+        )
+
+    def test_error_reply(self):
+        """Test that server errors are raised"""
+        with self.assertRaises(RedisError):
+            self.store.client.pipeline([("NOPE",)])
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
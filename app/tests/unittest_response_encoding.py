@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator JSON responses and response compression
+"""
+
+import unittest
+import gzip
+import json
+import sys
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from storage.session_store import SessionAnnotation
+from utils.compression import (
+    CompressionMiddleware,
+    SUPPORTED_ENCODINGS,
+    choose_encoding,
+    compress,
+)
+from utils.json_response import FastJSONResponse, dumps
+
+
+class Polygon(BaseModel):
+    label: str
+    points: list
+
+
+class TestJSONResponse(unittest.TestCase):
+    """Tests for dumps() and FastJSONResponse"""
+
+    def test_dumps(self):
+        """Test that bodies match what FastAPI's encoder would send"""
+        created = datetime(2025, 6, 1, 12, 30, 15, 250000)
+        annotation = SessionAnnotation(
+            annotation_id="a1", image_id="i1", file_path="", created_at=created
+        )
+        content = {
+            "annotation": annotation,
+            "created_at": created,
+            "polygon": [[0.25, 0.5], [0.125, 1e-07]],
+            "numpy": np.array([1.5, 2.5]),
+            "label": "café",
+        }
+        decoded = json.loads(dumps(content))
+        self.assertEqual(decoded["annotation"]["annotation_id"], "a1")
+        self.assertEqual(decoded["annotation"]["created_at"], created.isoformat())
+        self.assertEqual(decoded["created_at"], created.isoformat())
+        self.assertEqual(decoded["polygon"], content["polygon"])
+        self.assertEqual(decoded["numpy"], [1.5, 2.5])
+        self.assertEqual(decoded["label"], "café")
+
+        model = Polygon(label="field", points=[[0.1, 0.2]])
+        self.assertEqual(json.loads(dumps(model)), model.model_dump())
+        self.assertEqual(json.loads(dumps([model])), [model.model_dump()])
+        with self.assertRaises(TypeError):
+            dumps({"value": object()})
+
+    def test_response(self):
+        """Test that routes returning FastJSONResponse send its body"""
+        app = FastAPI()
+
+        @app.get("/polygon", response_model=Polygon)
+        def polygon():
+            return FastJSONResponse(Polygon(label="field", points=[[0.1, 0.2]]))
+
+        response = TestClient(app).get("/polygon")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(response.json(), {"label": "field", "points": [[0.1, 0.2]]})
+
+
+class TestCompression(unittest.TestCase):
+    """Tests for content coding negotiation and CompressionMiddleware"""
+
+    def test_choose_encoding(self):
+        """Test picking a coding from Accept-Encoding"""
+        preferred = SUPPORTED_ENCODINGS[0]
+        self.assertEqual(choose_encoding("gzip, deflate, br"), preferred)
+        self.assertEqual(choose_encoding("gzip"), "gzip")
+        self.assertEqual(choose_encoding("GZIP;q=0.5, identity"), "gzip")
+        self.assertEqual(choose_encoding("*"), preferred)
+        self.assertEqual(choose_encoding("br;q=0.2, gzip;q=0.8"), "gzip")
+        self.assertEqual(choose_encoding("br;q=0, *;q=0.5"), "gzip")
+        self.assertIsNone(choose_encoding(""))
+        self.assertIsNone(choose_encoding("identity, deflate"))
+        self.assertIsNone(choose_encoding("gzip;q=0"))
+        self.assertIsNone(choose_encoding("gzip;q=oops"))
+
+    def make_client(self):
+        app = FastAPI()
+        app.add_middleware(CompressionMiddleware, minimum_size=1000)
+        features = [{"label": "building", "polygon": [[0.1, 0.2]] * 10}] * 20
+
+        @app.get("/large")
+        def large():
+            return FastJSONResponse(features)
+
+        @app.get("/small")
+        def small():
+            return FastJSONResponse({"ok": True})
+
+        @app.get("/stream")
+        def stream():
+            chunks = (json.dumps(feature).encode() for feature in features)
+            return StreamingResponse(chunks, media_type="application/geo+json")
+
+        @app.get("/binary")
+        def binary():
+            return StreamingResponse(iter([b"\x89PNG" * 1000]), media_type="image/png")
+
+        return TestClient(app), features
+
+    def test_middleware(self):
+        """Test which responses are compressed, and that they decode"""
+        client, features = self.make_client()
+        plain = dumps(features)
+
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertLess(int(response.headers["content-length"]), len(plain) // 5)
+        self.assertEqual(response.json(), features)
+
+        response = client.get("/large", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(response.content, plain)
+
+        for path in ("/small", "/binary"):
+            response = client.get(path, headers={"Accept-Encoding": "gzip"})
+            self.assertNotIn("content-encoding", response.headers)
+
+        # Streamed bodies are compressed as they go, without a length
+        response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        expected = b"".join(json.dumps(feature).encode() for feature in features)
+        self.assertEqual(response.content, expected)
+
+    def test_brotli(self):
+        """Test brotli, when it is installed"""
+        if "br" not in SUPPORTED_ENCODINGS:
+            self.skipTest("brotli is not installed")
+        import brotli
+
+        client, features = self.make_client()
+        response = client.get("/large", headers={"Accept-Encoding": "br"})
+        self.assertEqual(response.headers["content-encoding"], "br")
+        self.assertEqual(response.json(), features)
+        self.assertEqual(brotli.decompress(compress(b"x" * 5000, "br")), b"x" * 5000)
+        self.assertEqual(gzip.decompress(compress(b"x" * 5000, "gzip")), b"x" * 5000)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -10,6 +10,7 @@ import sys
 import os
 from pathlib import Path
 import uuid
+import threading
 from datetime import datetime
 
 # Add app directory to path
@@ -83,6 +84,186 @@ class TestSessionStore(unittest.TestCase):
         self.assertEqual(len(annotations), 1)
         self.assertEqual(annotations[0].file_path, "annotations/test.json")
 
+    def test_record_timestamps(self):
+        """Test that every record gets its own creation time"""
+        image = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        first = self.store.add_annotation(self.session_id, image.image_id, "a.json")
+        later = datetime.now()
+        second = self.store.add_annotation(self.session_id, image.image_id, "b.json")
+
+        self.assertLessEqual(first.created_at, later)
+        self.assertGreaterEqual(second.created_at, later)
+        self.assertGreaterEqual(first.created_at, image.created_at)
+
+        # Records still serialize like the pydantic models they replaced
+        self.assertEqual(first.model_dump()["file_path"], "a.json")
+        self.assertEqual(image.dict()["image_id"], image.image_id)
+        self.assertFalse(hasattr(first, "__dict__"))
+
+    def test_version_counter(self):
+        """Test that every change bumps the session version"""
+        self.assertEqual(self.store.get_version(self.session_id), 0)
+        image = self.store.add_image(
+            session_id=self.session_id,
+            file_name="test.jpg",
+            file_path="uploads/test.jpg",
+        )
+        after_image = self.store.get_version(self.session_id)
+        self.assertGreater(after_image, 0)
+
+        annotation = self.store.add_annotation(
+            session_id=self.session_id,
+            image_id=image.image_id,
+            file_path="annotations/test.json",
+        )
+        after_annotation = self.store.get_version(self.session_id)
+        self.assertGreater(after_annotation, after_image)
+
+        self.store.remove_annotation(self.session_id, annotation.annotation_id)
+        self.assertGreater(self.store.get_version(self.session_id), after_annotation)
+
+    def test_annotation_index(self):
+        """Test the per-image annotation index stays consistent"""
+        first = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        second = self.store.add_image(self.session_id, "b.jpg", "uploads/b.jpg")
+
+        for i in range(3):
+            self.store.add_annotation(
+                self.session_id, first.image_id, f"a{i}.json", annotation_id=f"a{i}"
+            )
+        self.store.add_annotation(
+            self.session_id, second.image_id, "b0.json", annotation_id="b0"
+        )
+
+        ids = [
+            a.annotation_id
+            for a in self.store.get_annotations(self.session_id, first.image_id)
+        ]
+        self.assertEqual(ids, ["a0", "a1", "a2"])
+
+        self.store.remove_annotation(self.session_id, "a1")
+        ids = [
+            a.annotation_id
+            for a in self.store.get_annotations(self.session_id, first.image_id)
+        ]
+        self.assertEqual(ids, ["a0", "a2"])
+
+        # Removing an image drops exactly its annotations
+        self.store.remove_image(self.session_id, first.image_id)
+        self.assertEqual(
+            self.store.get_annotations(self.session_id, first.image_id), []
+        )
+        remaining = self.store.get_annotations(self.session_id)
+        self.assertEqual([a.annotation_id for a in remaining], ["b0"])
+
+        # Importing rebuilds the index from the annotations
+        data = self.store.export_session(self.session_id)
+        other = SessionStore()
+        other.import_session(self.session_id, dict(data, image_annotations={}))
+        ids = [
+            a.annotation_id
+            for a in other.get_annotations(self.session_id, second.image_id)
+        ]
+        self.assertEqual(ids, ["b0"])
+
+    def test_images_page(self):
+        """Test keyset paging stays stable while images are removed"""
+        ids = [
+            self.store.add_image(
+                self.session_id, f"{i}.png", f"uploads/{i}.png"
+            ).image_id
+            for i in range(50)
+        ]
+        page, cursor = self.store.get_images_page(self.session_id, limit=20)
+        self.assertEqual([i.image_id for i in page], ids[:20])
+
+        # Removing images already listed does not shift later pages
+        for image_id in ids[:45]:
+            self.store.remove_image(self.session_id, image_id)
+        page, cursor = self.store.get_images_page(self.session_id, cursor, limit=20)
+        self.assertEqual([i.image_id for i in page], ids[45:50])
+        self.assertIsNone(cursor)
+
+        # Removed images are compacted out of the order, positions are kept
+        order = self.store.sessions[self.session_id]["image_order"]
+        self.assertLess(len(order), 50)
+        new_id = self.store.add_image(
+            self.session_id, "n.png", "uploads/n.png"
+        ).image_id
+        page, cursor = self.store.get_images_page(self.session_id, 50, limit=20)
+        self.assertEqual([i.image_id for i in page], [new_id])
+
+        counts = self.store.count_annotations(self.session_id, [ids[45], "missing"])
+        self.assertEqual(counts, {ids[45]: 0, "missing": 0})
+        self.store.add_annotation(self.session_id, ids[45], "a.json")
+        counts = self.store.count_annotations(self.session_id, [ids[45]])
+        self.assertEqual(counts, {ids[45]: 1})
+
+    def test_concurrent_writers(self):
+        """Test that concurrent handlers lose no updates and leave no strays"""
+        writes = 2000
+        session_ids = [str(uuid.uuid4()) for _ in range(4)]
+        kept = {
+            session_id: self.store.add_image(session_id, "a.jpg", "uploads/a.jpg")
+            for session_id in session_ids
+        }
+        # Id of the image each session's churn thread is about to remove
+        doomed = dict.fromkeys(session_ids, "missing")
+        changes = {session_id: [] for session_id in session_ids}
+
+        def annotate(session_id):
+            done = 0
+            for i in range(writes):
+                self.store.add_annotation(
+                    session_id, kept[session_id].image_id, f"annotations/{i}"
+                )
+                done += 1
+                if self.store.add_annotation(
+                    session_id, doomed[session_id], f"annotations/d{i}"
+                ):
+                    done += 1
+            changes[session_id].append(done)
+
+        def churn(session_id):
+            done = 0
+            for i in range(writes):
+                image = self.store.add_image(session_id, "b.jpg", "uploads/b.jpg")
+                doomed[session_id] = image.image_id
+                done += self.store.remove_image(session_id, image.image_id) + 1
+            changes[session_id].append(done)
+
+        threads = [
+            threading.Thread(target=target, args=(session_id,))
+            for session_id in session_ids
+            for target in (annotate, annotate, annotate, churn)
+        ]
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        for session_id in session_ids:
+            image_id = kept[session_id].image_id
+            self.assertEqual(
+                len(self.store.get_annotations(session_id, image_id)), 3 * writes
+            )
+            # No annotation outlives its image
+            annotations = self.store.get_annotations(session_id)
+            self.assertEqual(len(annotations), 3 * writes)
+            self.assertEqual(
+                [image.image_id for image in self.store.get_images(session_id)],
+                [image_id],
+            )
+            # Every change bumped the version exactly once
+            self.assertEqual(
+                self.store.get_version(session_id), 1 + sum(changes[session_id])
+            )
+
 
 if __name__ == "__main__":
     print("Running tests...")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator idle session sweeper
+"""
+
+import unittest
+import sys
+import os
+import uuid
+import shutil
+import asyncio
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from storage.session_store import SessionStore
+from utils import session_sweeper
+from utils.session_sweeper import SessionSweeper
+
+
+class TestSessionSweeper(unittest.TestCase):
+    """Tests for SessionSweeper functionality"""
+
+    def setUp(self):
+        """Create a store with one idle and one active session"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.store = SessionStore()
+        self.evicted = []
+        self.sweeper = SessionSweeper(
+            self.store, timeout=timedelta(days=1), batch_size=2
+        )
+        self.sweeper.add_listener(
+            lambda session_id, images: self.evicted.extend(images)
+        )
+
+        self.idle_id = str(uuid.uuid4())
+        self.active_id = str(uuid.uuid4())
+        self.idle_files = self.add_session(self.idle_id)
+        self.active_files = self.add_session(self.active_id)
+        self.store.sessions[self.idle_id]["last_access"] = datetime.now() - timedelta(
+            days=2
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def add_session(self, session_id):
+        """Add an image with an annotation and create their files"""
+        image_path = self.temp_dir / f"{session_id}.png"
+        annotation_path = self.temp_dir / f"{session_id}.json"
+        image_path.write_bytes(b"x" * 1000)
+        annotation_path.write_bytes(b"{}")
+
+        image = self.store.add_image(session_id, "a.png", str(image_path))
+        self.store.add_annotation(session_id, image.image_id, str(annotation_path))
+        return [image_path, annotation_path]
+
+    def test_sweep_expires_idle_sessions(self):
+        """Test that idle sessions lose their metadata, files and cache entries"""
+        report = asyncio.run(self.sweeper.sweep())
+
+        self.assertEqual(report["sessions_expired"], 1)
+        self.assertEqual(report["files_deleted"], 2)
+        self.assertEqual(report["bytes_reclaimed"], 1002)
+        self.assertEqual(self.sweeper.stats["bytes_reclaimed"], 1002)
+
+        self.assertNotIn(self.idle_id, self.store.sessions)
+        self.assertFalse(any(path.exists() for path in self.idle_files))
+        self.assertEqual([image.file_name for image in self.evicted], ["a.png"])
+
+        # The active session is untouched
+        self.assertIn(self.active_id, self.store.sessions)
+        self.assertTrue(all(path.exists() for path in self.active_files))
+
+    def test_touch_keeps_session_alive(self):
+        """Test that recorded activity prevents expiry"""
+        self.sweeper.touch(self.idle_id)
+        report = asyncio.run(self.sweeper.sweep())
+        self.assertEqual(report["sessions_expired"], 0)
+
+        # Further touches within the interval are not written to the store
+        self.assertFalse(self.sweeper.needs_touch(self.idle_id))
+
+    def test_expire_session(self):
+        """Test clearing one session right away"""
+        reclaimed = self.sweeper.expire_session(self.active_id)
+        self.assertEqual(reclaimed, {"files_deleted": 2, "bytes_reclaimed": 1002})
+        self.assertNotIn(self.active_id, self.store.sessions)
+
+        # Unknown sessions have nothing to reclaim
+        reclaimed = self.sweeper.expire_session(str(uuid.uuid4()))
+        self.assertEqual(reclaimed["files_deleted"], 0)
+
+    def test_collect_orphans(self):
+        """Test that only old, unreferenced files in owned directories go"""
+        self.sweeper.orphan_dirs = {str(self.temp_dir): (".png", ".json")}
+        collected = []
+        self.sweeper.add_orphan_collector(lambda: collected.append(True))
+        orphan = self.temp_dir / "orphan.png"
+        orphan.write_bytes(b"x" * 500)
+        other_suffix = self.temp_dir / "sessions.db"
+        other_suffix.write_bytes(b"db")
+        hidden = self.temp_dir / ".upload.png.partial"
+        hidden.write_bytes(b"x")
+
+        # Fresh files may still be being ingested
+        report = self.sweeper.collect_orphans()
+        self.assertEqual(report["files_deleted"], 0)
+        self.assertTrue(orphan.exists())
+
+        report = self.sweeper.collect_orphans(min_age=0)
+        self.assertEqual(report["files_scanned"], 5)
+        self.assertEqual(report["files_deleted"], 1)
+        self.assertEqual(report["bytes_reclaimed"], 500)
+        self.assertFalse(orphan.exists())
+        self.assertTrue(other_suffix.exists() and hidden.exists())
+        self.assertTrue(all(path.exists() for path in self.idle_files))
+        self.assertEqual(len(collected), 2)
+
+    def test_orphan_gc_default(self):
+        """Test that orphans are only collected by default with a shared store"""
+        # Each worker of the in-memory store would take the others' files
+        self.assertFalse(self.sweeper.orphan_gc)
+
+        class SharedStore(SessionStore):
+            shared = True
+
+        sweeper = SessionSweeper(SharedStore(), timeout=timedelta(days=1))
+        self.assertTrue(sweeper.orphan_gc)
+
+        with patch.object(session_sweeper, "ORPHAN_GC", "1"):
+            sweeper = SessionSweeper(self.store, timeout=timedelta(days=1))
+            self.assertTrue(sweeper.orphan_gc)
+        with patch.object(session_sweeper, "ORPHAN_GC", "0"):
+            sweeper = SessionSweeper(SharedStore(), timeout=timedelta(days=1))
+            self.assertFalse(sweeper.orphan_gc)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
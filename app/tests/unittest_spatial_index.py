@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator spatial annotation index
+"""
+
+import unittest
+import random
+import sys
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils.spatial_index import RTree, SpatialIndexCache, document_box
+
+
+def manual(x0, y0, x1, y1, hole=None):
+    """A rectangle document as saved by POST /api/annotations/"""
+    rings = [[[x0, y0], [x1, y0], [x1, y1], [x0, y1]]]
+    if hole:
+        hx0, hy0, hx1, hy1 = hole
+        rings.append([[hx0, hy0], [hx1, hy0], [hx1, hy1], [hx0, hy1]])
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": "building"},
+                "geometry": {"type": "Polygon", "coordinates": rings},
+            }
+        ],
+    }
+
+
+def intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def random_box(rng, size=0.05):
+    x, y = rng.random(), rng.random()
+    return (x, y, x + rng.random() * size, y + rng.random() * size)
+
+
+class TestSpatialIndex(unittest.TestCase):
+    """Tests for the R-tree and the per-image annotation indexes"""
+
+    def test_rtree_matches_scan(self):
+        """Test that searches agree with a linear scan as boxes come and go"""
+        rng = random.Random(7)
+        tree = RTree(max_entries=6)
+        # Start from a packed tree
+        boxes = {key: random_box(rng) for key in range(400)}
+        tree.load(boxes.items())
+        for step in range(3000):
+            key = rng.randrange(800)
+            if key in boxes and rng.random() < 0.4:
+                self.assertTrue(tree.remove(key))
+                del boxes[key]
+            else:
+                boxes[key] = random_box(rng)
+                tree.insert(key, boxes[key])
+
+            if step % 100 == 0:
+                for _ in range(20):
+                    query = random_box(rng, 0.3)
+                    expected = {k for k, b in boxes.items() if intersects(b, query)}
+                    self.assertEqual(set(tree.search(query)), expected)
+        self.assertEqual(len(tree), len(boxes))
+        self.assertFalse(tree.remove("missing"))
+
+        for key in list(boxes):
+            tree.remove(key)
+        self.assertEqual(tree.search((0, 0, 2, 2)), [])
+        self.assertTrue(tree.root.leaf)
+
+    def test_query_and_hit(self):
+        """Test viewport queries in drawing order and exact point hit-tests"""
+        documents = {
+            "a1": manual(0.1, 0.1, 0.5, 0.5, hole=(0.2, 0.2, 0.3, 0.3)),
+            "a2": manual(0.4, 0.4, 0.9, 0.9),
+            "a3": manual(0.8, 0.0, 0.9, 0.1),
+            "a4": {"type": "Feature", "properties": {}, "geometry": None},
+        }
+        items = [(SimpleNamespace(annotation_id=a), d) for a, d in documents.items()]
+        cache = SpatialIndexCache()
+        index = cache.get("s1", "img", 1, lambda: items)
+
+        ids = lambda pairs: [annotation.annotation_id for annotation, _ in pairs]
+        self.assertEqual(ids(index.query((0.0, 0.0, 0.45, 0.45))), ["a1", "a2"])
+        self.assertEqual(ids(index.query((0.85, 0.05, 1.0, 0.2))), ["a3"])
+        self.assertEqual(ids(index.query((0.95, 0.95, 1.0, 1.0))), [])
+        self.assertIsNone(document_box(documents["a4"]))
+
+        # Topmost first; holes and bounding box corners are not hits
+        self.assertEqual(ids(index.hit(0.45, 0.45)), ["a2", "a1"])
+        self.assertEqual(ids(index.hit(0.25, 0.25)), [])
+        self.assertEqual(ids(index.hit(0.85, 0.15)), [])
+
+    def test_incremental_sync(self):
+        """Test that only changed annotations are re-indexed"""
+        annotations = {a: SimpleNamespace(annotation_id=a) for a in ("a1", "a2")}
+        documents = {"a1": manual(0.1, 0.1, 0.2, 0.2), "a2": manual(0.5, 0.5, 0.6, 0.6)}
+        load = lambda: [(annotations[a], d) for a, d in documents.items()]
+        cache = SpatialIndexCache()
+        index = cache.get("s1", "img", 1, load)
+        self.assertEqual(index.sync(load()), 0)
+
+        documents["a1"] = manual(0.7, 0.7, 0.8, 0.8)
+        del documents["a2"]
+        # Unchanged session version: the index is not synced
+        self.assertEqual(len(cache.get("s1", "img", 1, load).query((0, 0, 1, 1))), 2)
+        index = cache.get("s1", "img", 2, load)
+        self.assertEqual(len(index.query((0, 0, 1, 1))), 1)
+        self.assertEqual(index.query((0, 0, 0.3, 0.3)), [])
+        self.assertEqual(index.sync(load()), 0)
+
+        cache.drop("s1")
+        self.assertEqual(len(cache.indexes), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator SQLite session store backend
+"""
+
+import unittest
+import sys
+import os
+import uuid
+import shutil
+import tempfile
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from storage.session_store import SessionStore, create_session_store
+from storage.sqlite_store import SQLiteSessionStore
+
+
+class TestSQLiteSessionStore(unittest.TestCase):
+    """Tests for SQLiteSessionStore functionality"""
+
+    def setUp(self):
+        """Create a store backed by a scratch database"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "sessions.db")
+        self.store = SQLiteSessionStore(self.db_path)
+        self.session_id = str(uuid.uuid4())
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_images_and_annotations(self):
+        """Test adding, reading and removing records"""
+        image = self.store.add_image(
+            self.session_id, "test.jpg", "uploads/test.jpg", "100x100", "test"
+        )
+        self.assertEqual(self.store.get_image(self.session_id, image.image_id), image)
+
+        annotation = self.store.add_annotation(
+            self.session_id, image.image_id, "annotations/test.json", True, "sam"
+        )
+        self.assertTrue(annotation.auto_generated)
+        self.assertEqual(
+            self.store.get_annotation(self.session_id, annotation.annotation_id),
+            annotation,
+        )
+
+        # Annotations for unknown images are refused
+        self.assertIsNone(
+            self.store.add_annotation(self.session_id, "missing", "annotations/x")
+        )
+
+        summary = self.store.get_session_summary(self.session_id)
+        self.assertEqual(summary["images_count"], 1)
+        self.assertEqual(summary["annotations_count"], 1)
+
+        self.assertTrue(
+            self.store.remove_annotation(self.session_id, annotation.annotation_id)
+        )
+        self.assertFalse(
+            self.store.remove_annotation(self.session_id, annotation.annotation_id)
+        )
+        self.assertTrue(self.store.remove_image(self.session_id, image.image_id))
+        self.assertEqual(self.store.get_images(self.session_id), [])
+
+    def test_annotation_order_per_image(self):
+        """Test per-image annotation listing keeps insertion order"""
+        image_a = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        image_b = self.store.add_image(self.session_id, "b.jpg", "uploads/b.jpg")
+
+        ids_a = []
+        for i in range(5):
+            ids_a.append(
+                self.store.add_annotation(
+                    self.session_id, image_a.image_id, f"annotations/a{i}.json"
+                ).annotation_id
+            )
+            self.store.add_annotation(
+                self.session_id, image_b.image_id, f"annotations/b{i}.json"
+            )
+
+        listed = self.store.get_annotations(self.session_id, image_a.image_id)
+        self.assertEqual([a.annotation_id for a in listed], ids_a)
+
+        # Re-adding an annotation updates it in place
+        self.store.add_annotation(
+            self.session_id,
+            image_a.image_id,
+            "annotations/a0-edited.json",
+            annotation_id=ids_a[0],
+        )
+        listed = self.store.get_annotations(self.session_id, image_a.image_id)
+        self.assertEqual([a.annotation_id for a in listed], ids_a)
+        self.assertEqual(listed[0].file_path, "annotations/a0-edited.json")
+
+        # Removing an image drops its annotations only
+        self.store.remove_image(self.session_id, image_a.image_id)
+        self.assertEqual(len(self.store.get_annotations(self.session_id)), 5)
+
+    def test_version_counter(self):
+        """Test that every mutation bumps the session version"""
+        self.assertEqual(self.store.get_version(self.session_id), 0)
+        image = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        v1 = self.store.get_version(self.session_id)
+        self.store.add_annotation(self.session_id, image.image_id, "annotations/a")
+        self.assertGreater(self.store.get_version(self.session_id), v1)
+
+    def test_persistence(self):
+        """Test that a new store on the same file sees the data"""
+        image = self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        self.store.close()
+
+        reopened = SQLiteSessionStore(self.db_path)
+        try:
+            self.assertTrue(reopened.session_exists(self.session_id))
+            self.assertEqual(reopened.get_image(self.session_id, image.image_id), image)
+        finally:
+            reopened.close()
+
+    def test_batch_rollback(self):
+        """Test that a failed batch leaves no partial writes"""
+        with self.assertRaises(RuntimeError):
+            with self.store.batch():
+                self.store.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+                raise RuntimeError("boom")
+        self.assertFalse(self.store.session_exists(self.session_id))
+
+        with self.store.batch():
+            for i in range(3):
+                self.store.add_image(self.session_id, f"{i}.jpg", f"uploads/{i}.jpg")
+        self.assertEqual(len(self.store.get_images(self.session_id)), 3)
+
+    def test_images_page(self):
+        """Test keyset paging and per-image annotation counts"""
+        ids = [
+            self.store.add_image(
+                self.session_id, f"{i}.jpg", f"uploads/{i}.jpg"
+            ).image_id
+            for i in range(7)
+        ]
+        self.store.add_annotation(self.session_id, ids[1], "annotations/a")
+        self.store.add_annotation(self.session_id, ids[1], "annotations/b")
+
+        listed, cursor = [], None
+        while True:
+            page, cursor = self.store.get_images_page(self.session_id, cursor, limit=3)
+            listed.extend(image.image_id for image in page)
+            if cursor is None:
+                break
+            # Images listed on earlier pages may go away in between
+            self.store.remove_image(self.session_id, page[0].image_id)
+        self.assertEqual(listed, ids)
+        self.assertEqual(self.store.get_images_page("missing"), ([], None))
+
+        counts = self.store.count_annotations(self.session_id, [ids[1], ids[2]])
+        self.assertEqual(counts, {ids[1]: 2, ids[2]: 0})
+
+    def test_threads(self):
+        """Test concurrent writers each using their own connection"""
+
+        def worker():
+            for i in range(20):
+                self.store.add_image(self.session_id, f"{i}.jpg", f"uploads/{i}.jpg")
+            self.store.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(self.store.get_images(self.session_id, limit=-1)), 80)
+
+    def test_export_import(self):
+        """Test moving a session between the memory and SQLite backends"""
+        memory = SessionStore()
+        image = memory.add_image(self.session_id, "a.jpg", "uploads/a.jpg")
+        memory.add_annotation(self.session_id, image.image_id, "annotations/a")
+
+        self.assertTrue(
+            self.store.import_session(
+                self.session_id, memory.export_session(self.session_id)
+            )
+        )
+        exported = self.store.export_session(self.session_id)
+        self.assertEqual(exported["images"], memory.sessions[self.session_id]["images"])
+        self.assertEqual(
+            exported["annotations"], memory.sessions[self.session_id]["annotations"]
+        )
+
+        self.assertTrue(self.store.delete_session(self.session_id))
+        self.assertIsNone(self.store.export_session(self.session_id))
+
+    def test_usage_and_file_paths(self):
+        """Test per-session disk usage and the referenced file listing"""
+        image = self.store.add_image(
+            self.session_id,
+            "a.tif",
+            "uploads/a.png",
+            sam_path="uploads/a.tif",
+            file_size=300,
+        )
+        self.store.add_image(self.session_id, "b.jpg", "uploads/b.jpg", file_size=200)
+        self.store.add_image(self.session_id, "c.jpg", "uploads/c.jpg")
+        self.store.add_annotation(self.session_id, image.image_id, "annotations/a")
+
+        self.assertEqual(self.store.get_session_usage(self.session_id), 500)
+        self.assertEqual(self.store.get_session_usage("missing"), 0)
+        self.assertEqual(
+            sorted(self.store.iter_file_paths()),
+            [
+                "annotations/a",
+                "uploads/a.png",
+                "uploads/a.tif",
+                "uploads/b.jpg",
+                "uploads/c.jpg",
+            ],
+        )
+
+    def test_idle_sessions(self):
+        """Test last-access tracking and its migration for older databases"""
+        self.store.create_session(self.session_id)
+        self.assertEqual(
+            self.store.get_idle_sessions(datetime.now() + timedelta(seconds=1)),
+            [self.session_id],
+        )
+        self.assertEqual(
+            self.store.get_idle_sessions(datetime.now() - timedelta(days=1)), []
+        )
+        self.store.close()
+
+        # A database created before last_access existed gets the column
+        legacy_path = os.path.join(self.temp_dir, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute(
+            "CREATE TABLE sessions (session_id TEXT PRIMARY KEY, "
+            "created_at TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("INSERT INTO sessions VALUES ('old', '2020-01-01T00:00:00', 0)")
+        conn.commit()
+        conn.close()
+
+        legacy = SQLiteSessionStore(legacy_path)
+        try:
+            self.assertEqual(legacy.get_idle_sessions(datetime(2021, 1, 1)), ["old"])
+            legacy.touch_session("old")
+            self.assertEqual(legacy.get_idle_sessions(datetime(2021, 1, 1)), [])
+        finally:
+            legacy.close()
+
+    def test_backend_factory(self):
+        """Test selecting a backend by name"""
+        self.assertIsInstance(create_session_store("memory"), SessionStore)
+        with self.assertRaises(ValueError):
+            create_session_store("nope")
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
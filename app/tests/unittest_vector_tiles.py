@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the sat-annotator annotation vector tiles
+"""
+
+import unittest
+import struct
+import sys
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add app directory to path
+app_path = Path(__file__).parent.parent
+if str(app_path) not in sys.path:
+    sys.path.insert(0, str(app_path))
+
+# Set test mode environment variable
+os.environ["SAT_ANNOTATOR_TEST_MODE"] = "1"
+
+# Import application code
+from utils.vector_tiles import (
+    TILE_EXTENT,
+    TileCache,
+    clip_ring,
+    encode_tile,
+    max_zoom,
+    tile_bounds,
+    tile_level,
+)
+
+WIDTH, HEIGHT = 2048, 1024
+
+
+def read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def read_fields(data):
+    """(field number, value) of a protobuf message; length-delimited values are bytes"""
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        wire = key & 7
+        if wire == 0:
+            value, position = read_varint(data, position)
+        elif wire == 1:
+            value = struct.unpack("<d", data[position : position + 8])[0]
+            position += 8
+        else:
+            length, position = read_varint(data, position)
+            value = data[position : position + length]
+            position += length
+        yield key >> 3, value
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_tile(data):
+    """{layer name: (extent, [(properties, rings)])} of an encoded tile"""
+    layers = {}
+    for _, layer in read_fields(data):
+        fields = list(read_fields(layer))
+        keys = [v.decode() for n, v in fields if n == 3]
+        values = []
+        for n, v in fields:
+            if n == 4:
+                number, value = next(read_fields(v))
+                if number == 1:
+                    value = value.decode()
+                elif number == 6:
+                    value = unzigzag(value)
+                elif number == 7:
+                    value = bool(value)
+                values.append(value)
+        features = []
+        for n, feature in fields:
+            if n != 2:
+                continue
+            properties, rings = {}, []
+            for number, value in read_fields(feature):
+                if number == 2:
+                    tags = packed(value)
+                    for k, v in zip(tags[::2], tags[1::2]):
+                        properties[keys[k]] = values[v]
+                elif number == 3:
+                    assert value == 3
+                elif number == 4:
+                    rings = decode_geometry(packed(value))
+            features.append((properties, rings))
+        name = next(v.decode() for n, v in fields if n == 1)
+        extent = next(v for n, v in fields if n == 5)
+        layers[name] = (extent, features)
+    return layers
+
+
+def packed(data):
+    values, position = [], 0
+    while position < len(data):
+        value, position = read_varint(data, position)
+        values.append(value)
+    return values
+
+
+def decode_geometry(commands):
+    rings, x, y, position = [], 0, 0, 0
+    while position < len(commands):
+        command, count = commands[position] & 7, commands[position] >> 3
+        position += 1
+        if command == 7:
+            continue
+        if command == 1:
+            rings.append([])
+        for _ in range(count):
+            x += unzigzag(commands[position])
+            y += unzigzag(commands[position + 1])
+            position += 2
+            rings[-1].append((x, y))
+    return rings
+
+
+def signed_area(ring):
+    return sum(
+        x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])
+    )
+
+
+def manual(*rings, label="building"):
+    """A document as saved by POST /api/annotations/"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"label": label, "confidence": 0.5},
+                "geometry": {"type": "Polygon", "coordinates": list(rings)},
+            }
+        ],
+    }
+
+
+def rectangle(x0, y0, x1, y1):
+    """A counter-clockwise (on screen) rectangle in normalized coordinates"""
+    return [[x0, y0], [x0, y1], [x1, y1], [x1, y0], [x0, y0]]
+
+
+class TestVectorTiles(unittest.TestCase):
+    """Tests for the tile pyramid, MVT encoding and the tile cache"""
+
+    def test_pyramid(self):
+        """Test tile bounds and simplification per zoom level"""
+        self.assertEqual(max_zoom(WIDTH, HEIGHT), 3)
+        self.assertEqual(tile_bounds(0, 0, 0, WIDTH, HEIGHT), (0, 0, 2048, 2048))
+        self.assertEqual(tile_bounds(3, 7, 3, WIDTH, HEIGHT), (1792, 768, 2048, 1024))
+        self.assertEqual(tile_bounds(4, 0, 0, WIDTH, HEIGHT), (0, 0, 128, 128))
+        for z, x, y in ((3, 8, 0), (3, 0, 4), (1, 0, 1), (-1, 0, 0), (7, 0, 0)):
+            with self.assertRaises(ValueError):
+                tile_bounds(z, x, y, WIDTH, HEIGHT)
+
+        self.assertEqual(tile_level(0, WIDTH, HEIGHT), 2.0)
+        self.assertEqual(tile_level(3, WIDTH, HEIGHT), 0.5)
+        self.assertIsNone(tile_level(4, WIDTH, HEIGHT))
+
+    def test_clip_ring(self):
+        """Test that rings are clipped to the square"""
+        ring = [(-10, -10), (10, -10), (10, 30), (-10, 30)]
+        clipped = clip_ring(ring, 0, 20)
+        self.assertEqual(sorted(set(clipped)), [(0, 0), (0, 20), (10, 0), (10, 20)])
+        self.assertEqual(clip_ring([(30, 30), (40, 30), (40, 40)], 0, 20), [])
+
+    def test_encode_tile(self):
+        """Test that polygons are encoded in tile coordinates, clipped and wound"""
+        documents = [
+            (
+                {"annotation_id": "a1", "auto_generated": False},
+                manual(
+                    rectangle(0.0, 0.0, 0.25, 0.5),
+                    rectangle(0.05, 0.05, 0.1, 0.1),
+                ),
+            ),
+            # Crosses the right edge of tile 1/0/0
+            (
+                {"annotation_id": "a2", "auto_generated": True},
+                manual(rectangle(0.4, 0.0, 0.6, 0.25), label="road"),
+            ),
+            # Outside tile 1/0/0
+            (
+                {"annotation_id": "a3", "auto_generated": False},
+                manual(rectangle(0.8, 0.8, 0.9, 0.9)),
+            ),
+        ]
+        bounds = tile_bounds(1, 0, 0, WIDTH, HEIGHT)
+        layers = decode_tile(encode_tile(documents, bounds, WIDTH, HEIGHT))
+        extent, features = layers["annotations"]
+        self.assertEqual(extent, TILE_EXTENT)
+        self.assertEqual(len(features), 2)
+
+        properties, rings = features[0]
+        self.assertEqual(
+            properties,
+            {
+                "annotation_id": "a1",
+                "auto_generated": False,
+                "label": "building",
+                "confidence": 0.5,
+            },
+        )
+        self.assertEqual(sorted(rings[0]), [(0, 0), (0, 2048), (2048, 0), (2048, 2048)])
+        self.assertGreater(signed_area(rings[0]), 0)
+        self.assertLess(signed_area(rings[1]), 0)
+
+        properties, rings = features[1]
+        self.assertEqual(properties["label"], "road")
+        self.assertIs(properties["auto_generated"], True)
+        self.assertEqual(len(rings), 1)
+        self.assertEqual(max(x for x, _ in rings[0]), TILE_EXTENT + 64)
+
+        empty = tile_bounds(3, 0, 3, WIDTH, HEIGHT)
+        self.assertEqual(encode_tile(documents[2:], empty, WIDTH, HEIGHT), b"")
+
+    def test_cache(self):
+        """Test that tiles are encoded again only when their annotations change"""
+        cache = TileCache(max_tiles=2)
+        annotation = SimpleNamespace(annotation_id="a1")
+        pairs = [(annotation, manual(rectangle(0.1, 0.1, 0.2, 0.2)))]
+        encoded = []
+
+        def encode(items):
+            encoded.append(items)
+            return b"tile%d" % len(encoded)
+
+        get = lambda version, tile=(0, 0, 0): cache.get(
+            "s1", "img", tile, version, lambda: list(pairs), encode
+        )
+        self.assertEqual(get(1), b"tile1")
+        self.assertEqual(get(1), b"tile1")
+        # Another annotation changed: the tile's documents are the same
+        self.assertEqual(get(2), b"tile1")
+        pairs[0] = (annotation, manual(rectangle(0.1, 0.1, 0.3, 0.3)))
+        self.assertEqual(get(3), b"tile2")
+        self.assertEqual(cache.stats, {"hits": 1, "revalidated": 1, "encodes": 2})
+
+        get(3, (1, 0, 0))
+        get(3, (1, 1, 0))
+        self.assertEqual(len(cache.entries), 2)
+        cache.drop("s1", "other")
+        self.assertEqual(len(cache.entries), 2)
+        cache.drop("s1")
+        self.assertEqual(len(cache.entries), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=["first-arg", "-v"])
@@ -0,0 +1,149 @@
+import math
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+# Fewest vertices a polygon may be left with
+MIN_VERTICES = 3
+
+
+def first_feature(document: dict) -> Optional[dict]:
+    """The feature an annotation's edits apply to (Feature or FeatureCollection)"""
+    if document.get("type") == "FeatureCollection":
+        features = document.get("features") or []
+        return features[0] if features else None
+    if document.get("type") == "Feature":
+        return document
+    return None
+
+
+def get_revision(document: dict) -> int:
+    """Edit counter of an annotation, 0 until it is first edited"""
+    feature = first_feature(document) or {}
+    return int((feature.get("properties") or {}).get("revision", 0))
+
+
+def _point(value, name: str) -> List[float]:
+    if (
+        not isinstance(value, (list, tuple))
+        or len(value) != 2
+        or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)
+            for v in value
+        )
+    ):
+        raise ValueError(f"{name} must be an [x, y] pair of numbers")
+    return [float(value[0]), float(value[1])]
+
+
+def apply_vertex_ops(ring: list, ops: Iterable[dict]) -> list:
+    """
+    Apply vertex operations to a polygon ring and return the new ring.
+
+    Operations run in order, each on the result of the previous one:
+
+    - `{"op": "move", "index": i, "point": [x, y]}` moves vertex i
+    - `{"op": "insert", "index": i, "points": [[x, y], ...]}` inserts
+      vertices before vertex i (i may equal the vertex count to append)
+    - `{"op": "delete", "index": i, "end": j}` deletes vertices i to j
+      (exclusive, defaults to i + 1)
+
+    The input ring is not modified; untouched vertices are shared with it.
+    Raises ValueError on an invalid operation or when fewer than
+    MIN_VERTICES vertices would remain.
+    """
+    ring = list(ring)
+    for number, op in enumerate(ops):
+        kind = op.get("op")
+        index = op.get("index")
+        if not isinstance(index, int) or isinstance(index, bool):
+            raise ValueError(f"Operation {number}: index must be an integer")
+        if kind == "move":
+            if not 0 <= index < len(ring):
+                raise ValueError(f"Operation {number}: no vertex {index}")
+            ring[index] = _point(op.get("point"), f"Operation {number}: point")
+        elif kind == "insert":
+            if not 0 <= index <= len(ring):
+                raise ValueError(f"Operation {number}: cannot insert at {index}")
+            points = op.get("points") or []
+            ring[index:index] = [
+                _point(p, f"Operation {number}: points[{i}]")
+                for i, p in enumerate(points)
+            ]
+        elif kind == "delete":
+            end = op.get("end")
+            end = index + 1 if end is None else end
+            if not 0 <= index < end <= len(ring):
+                raise ValueError(f"Operation {number}: no vertices {index} to {end}")
+            del ring[index:end]
+        else:
+            raise ValueError(f"Operation {number}: unknown op {kind!r}")
+    if len(ring) < MIN_VERTICES:
+        raise ValueError(f"A polygon needs at least {MIN_VERTICES} vertices")
+    return ring
+
+
+def edit_document(
+    document: dict,
+    ring: Optional[list] = None,
+    label: Optional[str] = None,
+    holes: Optional[list] = None,
+) -> dict:
+    """
+    Return a copy of an annotation's document with a new outer ring (and
+    holes, if given) and/or label, its `modified` time set and its revision
+    bumped.
+
+    Only the containers on the path to the edited values are copied; the
+    rest (other features, holes, unchanged vertices) is shared with the
+    original, which stays valid for readers holding it.
+    """
+    feature = first_feature(document)
+    if feature is None:
+        raise ValueError("Annotation has no feature to edit")
+
+    properties = dict(feature.get("properties") or {})
+    if label:
+        properties["label"] = label
+    properties["modified"] = datetime.now().isoformat()
+    properties["revision"] = get_revision(document) + 1
+    feature = {**feature, "properties": properties}
+
+    if ring is not None:
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") != "Polygon":
+            raise ValueError("Only polygon annotations can be edited")
+        if holes is None:
+            holes = (geometry.get("coordinates") or [])[1:]
+        feature["geometry"] = {**geometry, "coordinates": [ring, *holes]}
+
+    if document.get("type") == "FeatureCollection":
+        return {**document, "features": [feature, *document["features"][1:]]}
+    return feature
+
+
+def outer_ring(document: dict) -> list:
+    """The outer ring of an annotation's polygon"""
+    feature = first_feature(document) or {}
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") != "Polygon" or not geometry.get("coordinates"):
+        raise ValueError("Only polygon annotations can be edited")
+    return geometry["coordinates"][0]
+
+
+def restore_document(document: dict, revision: int) -> dict:
+    """
+    Return a copy of an earlier version of an annotation's document to store
+    as its next revision (after `revision`, the current one), so an ETag is
+    never reused for different content, with its `modified` time set
+    """
+    feature = first_feature(document)
+    if feature is None:
+        return document
+    properties = dict(feature.get("properties") or {})
+    properties["revision"] = max(revision, get_revision(document))
+    feature = {**feature, "properties": properties}
+    if document.get("type") == "FeatureCollection":
+        document = {**document, "features": [feature, *document["features"][1:]]}
+    else:
+        document = feature
+    return edit_document(document)
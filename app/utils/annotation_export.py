@@ -0,0 +1,295 @@
+import json
+import zlib
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Label of annotations saved without one (SAM results)
+DEFAULT_LABEL = "Unlabeled"
+# Mask rows rasterized and compressed at a time while streaming a PNG
+MASK_BAND_ROWS = 256
+# Bytes of compressed PNG data per IDAT chunk
+PNG_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class ExportAnnotation:
+    """One polygon to export, with its outer ring in pixels"""
+
+    annotation_id: str
+    label: str
+    feature: dict
+    ring: np.ndarray  # int32, shape (n, 2), x then y
+    bbox: Tuple[int, int, int, int]  # x0, y0, x1, y1, exclusive
+
+
+def iter_features(document: dict) -> Iterator[dict]:
+    """Yield the features of a stored annotation (a Feature or FeatureCollection)"""
+    if document.get("type") == "FeatureCollection":
+        yield from document.get("features") or []
+    elif document.get("type") == "Feature":
+        yield document
+
+
+def feature_label(feature: dict) -> str:
+    properties = feature.get("properties") or {}
+    return properties.get("label") or properties.get("class_name") or DEFAULT_LABEL
+
+
+def to_pixels(ring, width: int, height: int) -> np.ndarray:
+    """Scale a ring of normalized (0-1) coordinates to pixel vertices"""
+    points = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+    points = np.rint(points * (width, height))
+    return points.astype(np.int32)
+
+
+def prepare_annotations(
+    documents: Iterable[Tuple[str, dict]], width: int, height: int
+) -> List[ExportAnnotation]:
+    """
+    Turn (annotation_id, document) pairs into polygons in pixels, in order.
+
+    Only the outer ring of each polygon is used; features without at least
+    three vertices are skipped.
+    """
+    result = []
+    for annotation_id, document in documents:
+        for feature in iter_features(document):
+            geometry = feature.get("geometry") or {}
+            rings = geometry.get("coordinates") or []
+            if geometry.get("type") != "Polygon" or not rings or len(rings[0]) < 3:
+                continue
+            ring = to_pixels(rings[0], width, height)
+            x0, y0 = ring.min(axis=0)
+            x1, y1 = ring.max(axis=0) + 1
+            bbox = (
+                max(int(x0), 0),
+                max(int(y0), 0),
+                min(int(x1), width),
+                min(int(y1), height),
+            )
+            result.append(
+                ExportAnnotation(
+                    annotation_id, feature_label(feature), feature, ring, bbox
+                )
+            )
+    return result
+
+
+def label_classes(annotations: List[ExportAnnotation]) -> Dict[str, int]:
+    """Map each label to a class id from 1, in sorted order (0 is background)"""
+    return {
+        label: i
+        for i, label in enumerate(sorted({a.label for a in annotations}), start=1)
+    }
+
+
+def rasterize(annotation: ExportAnnotation) -> np.ndarray:
+    """Rasterize one polygon into a uint8 mask of its bounding box"""
+    x0, y0, x1, y1 = annotation.bbox
+    crop = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), dtype=np.uint8)
+    if crop.size:
+        cv2.fillPoly(crop, [annotation.ring], 1, offset=(-x0, -y0))
+    return crop
+
+
+# COCO
+
+
+def mask_to_rle(
+    crop: np.ndarray, bbox: Tuple[int, int, int, int], width: int, height: int
+) -> List[int]:
+    """
+    Run-length encode a bounding-box mask as a full-image COCO RLE.
+
+    COCO counts alternate background and foreground runs over the image in
+    column-major order. The runs are found on the crop alone (a zero row is
+    appended so runs never cross columns) and shifted to image offsets, so
+    the cost does not depend on the image size.
+    """
+    x0, y0 = bbox[0], bbox[1]
+    rows = crop.shape[0]
+    # Column-major: one row per crop column
+    padded = np.zeros((crop.shape[1], rows + 2), dtype=np.int8)
+    padded[:, 1:-1] = crop.T != 0
+    edges = np.diff(padded.ravel())
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    def to_image(index):
+        column, row = np.divmod(index, rows + 2)
+        return (x0 + column) * height + y0 + row
+
+    starts, ends = to_image(starts), to_image(ends)
+    # Merge runs that touch across a column boundary of the image
+    keep = starts[1:] != ends[:-1]
+    starts = starts[np.concatenate(([True], keep))]
+    ends = ends[np.concatenate((keep, [True]))]
+
+    boundaries = np.empty(2 * len(starts) + 2, dtype=np.int64)
+    boundaries[0] = 0
+    boundaries[1:-1:2] = starts
+    boundaries[2:-1:2] = ends
+    boundaries[-1] = width * height
+    counts = np.diff(boundaries)
+    if len(counts) > 1 and counts[-1] == 0:
+        counts = counts[:-1]
+    return counts.tolist()
+
+
+def rle_to_string(counts: List[int]) -> str:
+    """Compress RLE counts to the string form used by pycocotools"""
+    out = []
+    for i, count in enumerate(counts):
+        value = count - counts[i - 2] if i > 2 else count
+        more = True
+        while more:
+            c = value & 0x1F
+            value >>= 5
+            more = value != -1 if c & 0x10 else value != 0
+            if more:
+                c |= 0x20
+            out.append(chr(c + 48))
+    return "".join(out)
+
+
+def stream_coco(image: dict, annotations: List[ExportAnnotation]) -> Iterator[bytes]:
+    """
+    Stream a COCO instances document for one image.
+
+    Segmentations are compressed RLE. Each annotation is rasterized only
+    when its turn comes, so memory stays bounded by the largest polygon.
+    """
+    classes = label_classes(annotations)
+    width, height = image["width"], image["height"]
+    header = {
+        "info": {"description": "SAT Annotator export"},
+        "images": [{"id": 1, **image}],
+        "categories": [{"id": i, "name": label} for label, i in classes.items()],
+    }
+    yield json.dumps(header)[:-1].encode() + b', "annotations": ['
+    for number, annotation in enumerate(annotations, start=1):
+        crop = rasterize(annotation)
+        x0, y0, x1, y1 = annotation.bbox
+        record = {
+            "id": number,
+            "image_id": 1,
+            "category_id": classes[annotation.label],
+            "segmentation": {
+                "size": [height, width],
+                "counts": rle_to_string(
+                    mask_to_rle(crop, annotation.bbox, width, height)
+                ),
+            },
+            "area": int(np.count_nonzero(crop)),
+            "bbox": [x0, y0, max(x1 - x0, 0), max(y1 - y0, 0)],
+            "iscrowd": 0,
+            "attributes": {"annotation_id": annotation.annotation_id},
+        }
+        yield (b"" if number == 1 else b", ") + json.dumps(record).encode()
+    yield b"]}"
+
+
+# GeoJSON
+
+
+def stream_geojson(
+    image: dict, documents: Iterable[Tuple[str, dict]], extra: Optional[dict] = None
+) -> Iterator[bytes]:
+    """
+    Stream a GeoJSON FeatureCollection of the given annotations, one feature
+    at a time. Coordinates stay normalized to the image (0-1); the image's
+    size is given in the top-level `image` member.
+    """
+    yield b'{"type": "FeatureCollection", "image": ' + json.dumps(image).encode()
+    yield b', "features": ['
+    first = True
+    for annotation_id, document in documents:
+        for feature in iter_features(document):
+            properties = {
+                **(feature.get("properties") or {}),
+                "annotation_id": annotation_id,
+                **((extra or {}).get(annotation_id) or {}),
+            }
+            record = {
+                "type": "Feature",
+                "geometry": feature.get("geometry"),
+                "properties": properties,
+            }
+            yield (b"" if first else b", ") + json.dumps(record, default=str).encode()
+            first = False
+    yield b"]}"
+
+
+# Label mask
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data))
+    )
+
+
+def stream_label_mask(
+    annotations: List[ExportAnnotation],
+    width: int,
+    height: int,
+    band_rows: int = MASK_BAND_ROWS,
+) -> Iterator[bytes]:
+    """
+    Stream a grayscale PNG whose pixels are the class ids of label_classes().
+
+    The image is built in bands of rows: each polygon is rasterized once
+    into its bounding box, pasted into the bands it crosses (later
+    annotations over earlier ones) and dropped after its last band; each
+    band is compressed and sent. The full mask is never held in memory.
+    Pixels are 8-bit, or 16-bit past 255 classes.
+    """
+    classes = label_classes(annotations)
+    wide = len(classes) > 255
+    dtype = np.dtype(">u2" if wide else "u1")
+
+    yield b"\x89PNG\r\n\x1a\n"
+    yield _png_chunk(
+        b"IHDR", struct.pack(">IIBBBBB", width, height, 16 if wide else 8, 0, 0, 0, 0)
+    )
+
+    tops = np.array([a.bbox[1] for a in annotations], dtype=np.int64)
+    bottoms = np.array([a.bbox[3] for a in annotations], dtype=np.int64)
+    values = [classes[a.label] for a in annotations]
+    # Rasterized polygons still crossing bands to come
+    active: Dict[int, np.ndarray] = {}
+    compressor = zlib.compressobj(6)
+    buffered = b""
+    for top in range(0, height, band_rows):
+        rows = min(band_rows, height - top)
+        band = np.zeros((rows, width), dtype=np.uint16 if wide else np.uint8)
+        for i in np.flatnonzero((tops < top + rows) & (bottoms > top)):
+            crop = active.get(i)
+            if crop is None:
+                crop = active[i] = rasterize(annotations[i]).astype(bool)
+            x0, y0, x1, y1 = annotations[i].bbox
+            start, stop = max(top, y0), min(top + rows, y1)
+            np.copyto(
+                band[start - top : stop - top, x0:x1],
+                values[i],
+                where=crop[start - y0 : stop - y0],
+            )
+            if y1 <= top + rows:
+                del active[i]
+        # Each row starts with filter type 0 (none)
+        raw = np.zeros((rows, 1 + width * dtype.itemsize), dtype=np.uint8)
+        raw[:, 1:] = band.astype(dtype).view(np.uint8).reshape(rows, -1)
+        buffered += compressor.compress(raw.tobytes())
+        if len(buffered) >= PNG_CHUNK_SIZE:
+            yield _png_chunk(b"IDAT", buffered)
+            buffered = b""
+    buffered += compressor.flush()
+    yield _png_chunk(b"IDAT", buffered)
+    yield _png_chunk(b"IEND", b"")
@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from .image_processing import UPLOAD_DIR
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Partial uploads live next to the finished ones so finalizing is a rename
+PARTIAL_DIR = UPLOAD_DIR / ".partial"
+PARTIAL_DIR.mkdir(exist_ok=True)
+
+# Suggested chunk size returned to clients (8 MiB)
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# Partial uploads that received no chunk for this long are deleted (seconds)
+PARTIAL_MAX_AGE = float(os.environ.get("SAT_ANNOTATOR_PARTIAL_MAX_AGE", "86400"))
+
+
+class ChunkedUploadError(Exception):
+    """Raised when a chunk or finalize request does not fit the upload state"""
+
+
+class OffsetMismatchError(ChunkedUploadError):
+    """Raised when a chunk does not start at the current end of the upload"""
+
+    def __init__(self, expected: int):
+        super().__init__(f"Chunk must start at offset {expected}")
+        self.expected = expected
+
+
+class QuotaExceededError(ChunkedUploadError):
+    """Raised when a chunk does not fit in the session's disk quota"""
+
+
+class ChunkedUpload:
+    """State of one resumable upload, backed by a partial file and a manifest"""
+
+    def __init__(
+        self,
+        upload_id: str,
+        session_id: str,
+        file_name: str,
+        total_size: int,
+        content_type: Optional[str] = None,
+        sha256: Optional[str] = None,
+    ):
+        self.upload_id = upload_id
+        self.session_id = session_id
+        self.file_name = file_name
+        self.total_size = total_size
+        self.content_type = content_type
+        self.sha256 = sha256.lower() if sha256 else None
+        self.lock = threading.Lock()
+        self._hasher = None
+
+    @property
+    def part_path(self) -> Path:
+        return PARTIAL_DIR / f"{self.upload_id}.part"
+
+    @property
+    def manifest_path(self) -> Path:
+        return PARTIAL_DIR / f"{self.upload_id}.json"
+
+    @property
+    def offset(self) -> int:
+        """Number of bytes durably received so far"""
+        try:
+            return self.part_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "session_id": self.session_id,
+            "file_name": self.file_name,
+            "total_size": self.total_size,
+            "content_type": self.content_type,
+            "sha256": self.sha256,
+        }
+
+    def hasher(self):
+        """
+        Incremental SHA-256 of the bytes received so far.
+
+        After a server restart the running hash is gone, so it is rebuilt once
+        from the partial file and then kept up to date chunk by chunk.
+        """
+        if self._hasher is None:
+            self._hasher = hashlib.sha256()
+            if self.part_path.exists():
+                with open(self.part_path, "rb") as f:
+                    for block in iter(lambda: f.read(DEFAULT_CHUNK_SIZE), b""):
+                        self._hasher.update(block)
+        return self._hasher
+
+
+class ChunkedUploadManager:
+    """
+    Registry of resumable uploads.
+
+    Chunks are appended straight to a partial file in the upload directory and
+    hashed as they arrive. A small JSON manifest next to each partial file lets
+    uploads survive a server restart.
+    """
+
+    def __init__(self):
+        self.uploads: Dict[str, ChunkedUpload] = {}
+        self._lock = threading.Lock()
+        # session_id -> bytes reserved by chunks being written
+        self._reserved: Dict[str, int] = {}
+        self._session_locks = weakref.WeakValueDictionary()
+
+    def create(
+        self,
+        session_id: str,
+        file_name: str,
+        total_size: int,
+        content_type: Optional[str] = None,
+        sha256: Optional[str] = None,
+    ) -> ChunkedUpload:
+        """Register a new upload and create its empty partial file"""
+        if total_size <= 0:
+            raise ChunkedUploadError("total_size must be positive")
+
+        upload = ChunkedUpload(
+            upload_id=str(uuid.uuid4()),
+            session_id=session_id,
+            file_name=file_name,
+            total_size=total_size,
+            content_type=content_type,
+            sha256=sha256,
+        )
+        upload.part_path.touch()
+        with open(upload.manifest_path, "w") as f:
+            json.dump(upload.to_dict(), f)
+
+        with self._lock:
+            self.uploads[upload.upload_id] = upload
+        return upload
+
+    def get(self, upload_id: str, session_id: str) -> Optional[ChunkedUpload]:
+        """Look up an upload owned by the session, reloading it from disk if needed"""
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                upload = self._load(upload_id)
+                if upload is not None:
+                    self.uploads[upload_id] = upload
+
+        if upload is None or upload.session_id != session_id:
+            return None
+        return upload
+
+    def _load(self, upload_id: str) -> Optional[ChunkedUpload]:
+        # Only accept ids we could have generated, they end up in file paths
+        try:
+            upload_id = str(uuid.UUID(upload_id))
+        except ValueError:
+            return None
+
+        manifest_path = PARTIAL_DIR / f"{upload_id}.json"
+        if not manifest_path.exists():
+            return None
+        try:
+            with open(manifest_path, "r") as f:
+                return ChunkedUpload(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Unreadable upload manifest {manifest_path}: {e}")
+            return None
+
+    def _uploads(self) -> Iterator[ChunkedUpload]:
+        """Every upload with a manifest on disk, including other workers' ones"""
+        try:
+            entries = os.scandir(PARTIAL_DIR)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                upload_id = entry.name[: -len(".json")]
+                with self._lock:
+                    upload = self.uploads.get(upload_id)
+                if upload is None:
+                    upload = self._load(upload_id)
+                if upload is not None:
+                    yield upload
+
+    def session_usage(self, session_id: str) -> int:
+        """Bytes received so far by the session's unfinished uploads"""
+        return sum(
+            upload.offset
+            for upload in self._uploads()
+            if upload.session_id == session_id
+        )
+
+    def drop_session(self, session_id: str) -> int:
+        """Abort every unfinished upload of a session, return the bytes freed"""
+        freed = 0
+        for upload in self._uploads():
+            if upload.session_id == session_id:
+                freed += upload.offset
+                self.abort(upload)
+        return freed
+
+    def reap(self, max_age: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Abort uploads that received nothing for `max_age` seconds.
+
+        Also removes partial files whose manifest is gone. Returns
+        (uploads removed, bytes freed).
+        """
+        cutoff = time.time() - (PARTIAL_MAX_AGE if max_age is None else max_age)
+        removed = freed = 0
+        for upload in self._uploads():
+            try:
+                # The partial file is touched by every chunk, the manifest never
+                path = upload.part_path if upload.part_path.exists() else None
+                last_write = os.stat(path or upload.manifest_path).st_mtime
+            except FileNotFoundError:
+                continue
+            if last_write <= cutoff:
+                freed += upload.offset
+                self.abort(upload)
+                removed += 1
+
+        try:
+            entries = os.scandir(PARTIAL_DIR)
+        except FileNotFoundError:
+            entries = None
+        if entries is not None:
+            with entries:
+                for entry in entries:
+                    if not entry.name.endswith(".part"):
+                        continue
+                    manifest = PARTIAL_DIR / (entry.name[: -len(".part")] + ".json")
+                    try:
+                        stat = entry.stat()
+                        if manifest.exists() or stat.st_mtime > cutoff:
+                            continue
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    removed += 1
+                    freed += stat.st_size
+
+        if removed:
+            logger.info(
+                f"Deleted {removed} abandoned partial uploads, "
+                f"reclaimed {freed / 1024**2:.1f} MiB"
+            )
+        return removed, freed
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def reserve(
+        self, session_id: str, size: int, available: Callable[[], float]
+    ) -> Iterator[None]:
+        """
+        Hold `size` bytes of the session's quota while a chunk is written.
+
+        `available()` is the session's free quota without the reservations,
+        so concurrent chunks of the session cannot both take the same bytes.
+        Raises QuotaExceededError if the chunk does not fit. The reservation
+        is released when the block exits, when a written chunk is counted on
+        disk instead.
+        """
+        lock = self._session_lock(session_id)
+        with lock:
+            if size > available() - self._reserved.get(session_id, 0):
+                raise QuotaExceededError("Chunk exceeds the session's disk quota")
+            self._reserved[session_id] = self._reserved.get(session_id, 0) + size
+        try:
+            yield
+        finally:
+            with lock:
+                left = self._reserved[session_id] - size
+                if left:
+                    self._reserved[session_id] = left
+                else:
+                    del self._reserved[session_id]
+
+    def write_chunk(self, upload: ChunkedUpload, offset: int, data: bytes) -> int:
+        """
+        Append a chunk at `offset` and return the new offset.
+
+        The offset must equal the bytes already received, so a client that
+        lost a response can ask for the progress and resume from there.
+        """
+        with upload.lock:
+            current = upload.offset
+            if offset != current:
+                raise OffsetMismatchError(current)
+            if current + len(data) > upload.total_size:
+                raise ChunkedUploadError("Chunk exceeds the declared total_size")
+
+            hasher = upload.hasher()
+            try:
+                with open(upload.part_path, "ab") as f:
+                    f.write(data)
+            except OSError:
+                # Part of the chunk may be on disk, rebuild the hash from it later
+                upload._hasher = None
+                raise
+            hasher.update(data)
+            return current + len(data)
+
+    def finalize(self, upload: ChunkedUpload) -> Path:
+        """
+        Check size and checksum, then move the file into the upload directory.
+
+        Returns the path of the completed file, ready for normal ingestion.
+        """
+        with upload.lock:
+            received = upload.offset
+            if received != upload.total_size:
+                raise ChunkedUploadError(
+                    f"Upload incomplete: {received} of {upload.total_size} bytes"
+                )
+            if upload.sha256 and upload.hasher().hexdigest() != upload.sha256:
+                raise ChunkedUploadError("SHA-256 checksum mismatch")
+
+            file_extension = os.path.splitext(upload.file_name)[1].lower()
+            final_path = UPLOAD_DIR / f"{uuid.uuid4()}{file_extension}"
+            os.replace(upload.part_path, final_path)
+            self._forget(upload)
+            return final_path
+
+    def abort(self, upload: ChunkedUpload) -> None:
+        """Drop an upload and its partial data"""
+        with upload.lock:
+            if upload.part_path.exists():
+                os.remove(upload.part_path)
+            self._forget(upload)
+
+    def _forget(self, upload: ChunkedUpload) -> None:
+        if upload.manifest_path.exists():
+            os.remove(upload.manifest_path)
+        with self._lock:
+            self.uploads.pop(upload.upload_id, None)
+
+
+# Global chunked upload registry
+chunked_uploads = ChunkedUploadManager()
@@ -0,0 +1,187 @@
+import os
+import zlib
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Smallest body worth compressing; smaller ones are sent as they are
+COMPRESS_MIN_SIZE = int(os.environ.get("SAT_ANNOTATOR_COMPRESS_MIN_SIZE", "1024"))
+# Fastest levels: coordinate digits barely compress better at higher ones,
+# and annotation JSON is compressed on every uncached request
+GZIP_LEVEL = 1
+BROTLI_QUALITY = 1
+# Bodies larger than this are compressed in a worker thread
+THREADPOOL_MIN_SIZE = 256 * 1024
+# Content types worth compressing (images are compressed already)
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/geo+json",
+    "application/javascript",
+    "application/vnd.mapbox-vector-tile",
+    "image/svg+xml",
+    "text/",
+)
+# Content codings we can produce, most preferred first
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the content coding for an Accept-Encoding header: the supported
+    one with the highest q-value, brotli on ties. None means identity.
+    """
+    weights = {}
+    for entry in accept_encoding.split(","):
+        token, _, params = entry.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[token] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class _Compressor:
+    """Incremental gzip or brotli compressor"""
+
+    def __init__(self, encoding: str):
+        self.brotli = encoding == "br"
+        if self.brotli:
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.brotli:
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        if self.brotli:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a whole body with the given content coding"""
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def is_compressible(content_type: str) -> bool:
+    """Check whether responses of a content type are worth compressing"""
+    content_type = content_type.lower()
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the coding negotiated from Accept-Encoding.
+
+    Only textual (and vector tile) bodies of at least `minimum_size` bytes
+    are compressed; streamed bodies are always compressed as they are sent.
+    Responses that are already encoded, partial (206) or empty keep their
+    body, and compressible ones get `Vary: Accept-Encoding` either way.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows what to do
+                start = message
+                return
+            if compressor is not None:
+                if message["type"] != "http.response.body":
+                    await send(message)
+                    return
+                body = compressor.compress(message.get("body", b""))
+                if message.get("more_body", False):
+                    if body:
+                        await send(
+                            {
+                                "type": "http.response.body",
+                                "body": body,
+                                "more_body": True,
+                            }
+                        )
+                    return
+                body += compressor.finish()
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            compressible = (
+                message["type"] == "http.response.body"
+                and start["status"] not in (204, 206, 304)
+                and "content-encoding" not in headers
+                and is_compressible(headers.get("content-type", ""))
+            )
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if (
+                not compressible
+                or encoding is None
+                or (not more_body and len(body) < self.minimum_size)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            headers["Content-Encoding"] = encoding
+            if more_body:
+                # Streamed: the length is unknown until the end
+                del headers["Content-Length"]
+                compressor = _Compressor(encoding)
+                await send(start)
+                await send_compressed(message)
+                return
+
+            if len(body) >= THREADPOOL_MIN_SIZE:
+                body = await run_in_threadpool(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers["Content-Length"] = str(len(body))
+            passthrough = True
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
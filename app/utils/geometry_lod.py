@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Simplification tolerances served, in image pixels
+LOD_TOLERANCES = (0.5, 2.0, 8.0, 32.0)
+# Annotations whose simplified geometry is kept in memory
+LOD_CACHE_SIZE = int(os.environ.get("SAT_ANNOTATOR_LOD_CACHE_SIZE", "100000"))
+# Decimals kept in simplified normalized coordinates (~0.02 px at 20000 px)
+LOD_DECIMALS = 6
+
+
+def lod_level(
+    zoom: Optional[float] = None, tolerance: Optional[float] = None
+) -> Optional[float]:
+    """
+    The coarsest tolerance level within `tolerance` image pixels, or
+    within half a screen pixel at `zoom` (screen pixels per image pixel).
+    None means the full geometry.
+    """
+    if tolerance is None:
+        if not zoom or zoom <= 0:
+            return None
+        tolerance = 0.5 / zoom
+    levels = [level for level in LOD_TOLERANCES if level <= tolerance]
+    return levels[-1] if levels else None
+
+
+def simplify_ring(
+    ring, tolerance: float, width: int, height: int, outer: bool = True
+) -> Optional[list]:
+    """
+    Douglas-Peucker simplification of a normalized ring at a tolerance in
+    pixels. An outer ring too small to keep three vertices becomes its
+    bounding box; a hole that small is dropped (None).
+    """
+    scale = np.array([width, height], dtype=np.float64)
+    points = np.asarray(ring, dtype=np.float64).reshape(-1, 2) * scale
+    approx = cv2.approxPolyDP(
+        points.astype(np.float32).reshape(-1, 1, 2), tolerance, True
+    ).reshape(-1, 2)
+    if len(approx) < 3:
+        if not outer:
+            return None
+        (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        approx = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    return np.round(approx / scale, LOD_DECIMALS).tolist()
+
+
+def simplify_document(
+    document: dict, tolerance: float, width: int, height: int
+) -> dict:
+    """
+    Copy of an annotation's document with every polygon simplified;
+    properties and non-polygon features are shared with the original
+    """
+
+    def simplify(feature):
+        geometry = feature.get("geometry") or {}
+        rings = geometry.get("coordinates") or []
+        if geometry.get("type") != "Polygon" or not rings or len(rings[0]) < 3:
+            return feature
+        simplified = [simplify_ring(rings[0], tolerance, width, height)]
+        for hole in rings[1:]:
+            hole = simplify_ring(hole, tolerance, width, height, outer=False)
+            if hole is not None:
+                simplified.append(hole)
+        return {**feature, "geometry": {**geometry, "coordinates": simplified}}
+
+    if document.get("type") == "FeatureCollection":
+        features = document.get("features") or []
+        return {**document, "features": [simplify(f) for f in features]}
+    if document.get("type") == "Feature":
+        return simplify(document)
+    return document
+
+
+class LODCache:
+    """
+    Simplified geometry of annotations, per tolerance level.
+
+    Levels are computed on first request and kept with the document they
+    were made from; an edit replaces the document, so its levels are made
+    again on the next request. The least recently used annotations are
+    evicted past `max_annotations`.
+    """
+
+    def __init__(self, max_annotations: Optional[int] = None):
+        self.max_annotations = max_annotations or LOD_CACHE_SIZE
+        # (session_id, annotation_id) -> (document, {(level, w, h): simplified})
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[dict, Dict]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        session_id: str,
+        annotation_id: str,
+        document: dict,
+        level: float,
+        width: int,
+        height: int,
+    ) -> dict:
+        """The document simplified at `level` pixels for a width x height image"""
+        key = (session_id, annotation_id)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is document:
+                simplified = entry[1].get((level, width, height))
+                if simplified is not None:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return simplified
+            self.stats["misses"] += 1
+
+        simplified = simplify_document(document, level, width, height)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] is not document:
+                entry = self.entries[key] = (document, {})
+            entry[1][(level, width, height)] = simplified
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_annotations:
+                self.entries.popitem(last=False)
+        return simplified
+
+    def drop(self, session_id: str, annotation_id: Optional[str] = None) -> None:
+        """Forget the levels of one annotation, or of every annotation of a session"""
+        with self._lock:
+            if annotation_id is not None:
+                self.entries.pop((session_id, annotation_id), None)
+                return
+            for key in [key for key in self.entries if key[0] == session_id]:
+                del self.entries[key]
+
+
+# Global simplified geometry cache instance
+lod_cache = LODCache()
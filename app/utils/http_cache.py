@@ -0,0 +1,98 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException
+
+# Upload names are random UUIDs and never reused, so browsers may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# JSON reads may be cached but must be revalidated with the ETag every time
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts, weak: bool = True) -> str:
+    """
+    Build an ETag from the values that determine a response.
+
+    Tags are weak by default because the same JSON may be sent with
+    different content encodings. Tags used as If-Match preconditions must
+    be strong.
+    """
+    digest = hashlib.blake2b(
+        "|".join(str(part) for part in parts).encode(), digest_size=12
+    ).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag (weak comparison)"""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def if_match_passes(request: Request, etag: str) -> bool:
+    """
+    Check the request's If-Match header against a strong ETag.
+
+    Weak tags never match (strong comparison). Requests without the header
+    pass; callers that require a precondition check for it first.
+    """
+    return if_match_header_passes(request.headers.get("if-match"), etag)
+
+
+def if_match_header_passes(header: Optional[str], etag: str) -> bool:
+    """if_match_passes() for an If-Match value taken from elsewhere"""
+    if header is None or header.strip() == "*":
+        return True
+    return any(candidate.strip() == etag for candidate in header.split(","))
+
+
+def not_modified(etag: str, cache_control: str = REVALIDATE_CACHE_CONTROL) -> Response:
+    """Empty 304 response carrying the validator headers"""
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": cache_control}
+    )
+
+
+def set_cache_headers(
+    response: Response, etag: str, cache_control: str = REVALIDATE_CACHE_CONTROL
+) -> None:
+    """Attach the ETag and Cache-Control headers to a response"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles for the uploads directory.
+
+    Adds a long-lived immutable Cache-Control header and refuses to serve
+    hidden entries such as in-progress chunked uploads. Range requests,
+    ETag and Last-Modified handling come from Starlette's FileResponse.
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        if any(part.startswith(".") for part in path.replace("\\", "/").split("/")):
+            # Never expose hidden files, e.g. uploads/.partial
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        response.headers.setdefault("Accept-Ranges", "bytes")
+        return response
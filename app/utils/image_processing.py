@@ -1,7 +1,14 @@
 import os
 import uuid
+import asyncio
 import logging
+import mimetypes
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+import numpy as np
 from fastapi import UploadFile
 from PIL import Image
 
@@ -24,6 +31,57 @@ else:
 
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Image extensions accepted inside bulk uploads and archives
+SUPPORTED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Worker pool for the blocking part of ingestion (TIFF conversion, header reads)
+INGEST_WORKERS = int(
+    os.environ.get("SAT_ANNOTATOR_INGEST_WORKERS", min(8, (os.cpu_count() or 1) + 2))
+)
+# Upper bound on images accepted by a single bulk request (archives included)
+MAX_BULK_FILES = int(os.environ.get("SAT_ANNOTATOR_MAX_BULK_FILES", 1000))
+# Disk space each session may use for its images in MiB (0 disables the quota)
+SESSION_QUOTA_BYTES = int(
+    float(os.environ.get("SAT_ANNOTATOR_SESSION_QUOTA_MB", 10240)) * 1024 * 1024
+)
+
+# Browser derivative for TIFF uploads: "png", "webp" or "jpeg"
+DERIVATIVE_FORMAT = os.environ.get("SAT_ANNOTATOR_DERIVATIVE_FORMAT", "png").lower()
+# Quality for lossy derivatives (1-100) and zlib level for PNG (0-9)
+DERIVATIVE_QUALITY = int(os.environ.get("SAT_ANNOTATOR_DERIVATIVE_QUALITY", 85))
+PNG_COMPRESS_LEVEL = int(os.environ.get("SAT_ANNOTATOR_PNG_COMPRESS_LEVEL", 6))
+
+# WebP cannot hold images larger than this on either side
+WEBP_MAX_DIMENSION = 16383
+# PIL modes with more than 8 bits per sample (16-bit, 32-bit and float TIFFs)
+HIGH_BIT_DEPTH_MODES = {"I;16", "I;16L", "I;16B", "I;16N", "I", "F"}
+
+
+def _png_options(quality: int, compress_level: int) -> dict:
+    return {"compress_level": compress_level}
+
+
+def _webp_options(quality: int, compress_level: int) -> dict:
+    # method 4 is libwebp's default speed/size trade-off
+    return {"quality": quality, "method": 4}
+
+
+def _jpeg_options(quality: int, compress_level: int) -> dict:
+    return {"quality": quality, "optimize": False, "subsampling": "4:2:0"}
+
+
+# name -> (file extension, PIL format, lossy, save options builder)
+DERIVATIVE_ENCODERS = {
+    "png": (".png", "PNG", False, _png_options),
+    "webp": (".webp", "WEBP", True, _webp_options),
+    "jpeg": (".jpg", "JPEG", True, _jpeg_options),
+}
+
+_ingest_executor = ThreadPoolExecutor(
+    max_workers=INGEST_WORKERS, thread_name_prefix="image-ingest"
+)
+
 
 async def save_upload_file(file: UploadFile) -> dict:
     """Save an uploaded file to the upload directory and convert TIFF to PNG if needed."""
@@ -39,31 +97,67 @@ async def save_upload_file(file: UploadFile) -> dict:
     with open(temp_file_path, "wb") as f:
         f.write(contents)
 
-    # Check if we need to convert TIFF to PNG for browser compatibility
+    return await ingest_saved_file(temp_file_path, file.filename, file.content_type)
+
+
+async def ingest_saved_file(
+    file_path: Path, original_filename: str, content_type: Optional[str] = None
+) -> dict:
+    """Run `ingest_image_file` on the ingest worker pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _ingest_executor, ingest_image_file, file_path, original_filename, content_type
+    )
+
+
+def ingest_image_file(
+    temp_file_path: Path, original_filename: str, content_type: Optional[str] = None
+) -> dict:
+    """
+    Turn a file already written to the upload directory into a servable image.
+
+    TIFFs are re-encoded into a browser derivative (see `encode_derivative`).
+    SAM reads the derivative when it is lossless; with a lossy one it reads
+    the original TIFF if that is 8-bit RGB, and otherwise an 8-bit RGB PNG
+    written next to it, which replaces the TIFF. Returns the same file info
+    dictionary as `save_upload_file`.
+    """
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    temp_filename = temp_file_path.name
+
+    # The served file, replaced by a derivative for TIFFs
     final_file_path = temp_file_path
     final_filename = temp_filename
 
-    if file_extension in [".tif", ".tiff"]:
-        # Convert TIFF to PNG for browser compatibility
-        png_filename = f"{uuid.uuid4()}.png"
-        png_file_path = UPLOAD_DIR / png_filename
+    sam_file = None  # SAM input, when it is not the served file
 
+    if file_extension in [".tif", ".tiff"]:
+        # Re-encode TIFF into a browser friendly derivative
         try:
             with Image.open(temp_file_path) as img:
-                # Convert to RGB if necessary (some TIFFs might be in different color modes)
-                if img.mode not in ("RGB", "RGBA"):
-                    img = img.convert("RGB")
-                # Save as PNG
-                img.save(png_file_path, "PNG")
+                sam_ready = img.mode == "RGB"
+                img = to_8bit(img)
+                derivative_path, lossy = encode_derivative(img, UPLOAD_DIR)
+                if lossy and not sam_ready:
+                    # cv2 cannot read high bit depth or non-RGB TIFFs as SAM needs
+                    sam_copy = UPLOAD_DIR / f"{uuid.uuid4()}.png"
+                    img.convert("RGB").save(
+                        sam_copy, "PNG", compress_level=PNG_COMPRESS_LEVEL
+                    )
 
+            if lossy and sam_ready:
+                # Keep the untouched upload as the SAM input
+                sam_file = temp_file_path
+            else:
                 # Remove the temporary TIFF file
                 os.remove(temp_file_path)
-                # Use the PNG file as the final file
-                final_file_path = png_file_path
-                final_filename = png_filename
+                if lossy:
+                    sam_file = sam_copy
+            final_file_path = derivative_path
+            final_filename = derivative_path.name
         except Exception as e:
             # If conversion fails, keep the original TIFF file
-            logger.warning(f"Failed to convert TIFF to PNG: {e}")
+            logger.warning(f"Failed to convert TIFF to {DERIVATIVE_FORMAT}: {e}")
 
     # Get image dimensions and resolution
     resolution = None
@@ -75,21 +169,275 @@ async def save_upload_file(file: UploadFile) -> dict:
         pass
     # Get file size
     file_size = os.path.getsize(final_file_path)
+    stored_size = file_size
+    sam_path = None
+    if sam_file is not None:
+        sam_path = f"uploads/{sam_file.name}"
+        stored_size += os.path.getsize(sam_file)
 
     # Store only the filename for the path to make it work in both Docker and local environments
     # This will be served from the /uploads/ route
     return {
         "filename": final_filename,
-        "original_filename": file.filename,
+        "original_filename": original_filename,
         "size": file_size,
-        "content_type": file.content_type,
+        "content_type": content_type,
         "path": f"uploads/{final_filename}",  # Use relative path for consistent access
         "resolution": resolution,
+        "sam_path": sam_path,  # 8-bit RGB SAM input when the derivative is lossy
+        "stored_size": stored_size,  # Bytes on disk, counted against the quota
     }
 
 
+def to_8bit(img: Image.Image) -> Image.Image:
+    """
+    An image with 8 bits per sample: high bit depth images (see
+    `HIGH_BIT_DEPTH_MODES`) are stretched linearly from their darkest to
+    their brightest value onto grey levels 0-255, others are returned as is.
+    """
+    if img.mode not in HIGH_BIT_DEPTH_MODES:
+        return img
+    values = np.nan_to_num(np.asarray(img, dtype=np.float64))
+    low, high = values.min(), values.max()
+    scale = 255.0 / (high - low) if high > low else 0.0
+    return Image.fromarray(np.round((values - low) * scale).astype(np.uint8), "L")
+
+
+def encode_derivative(
+    img: Image.Image,
+    dest_dir: Path,
+    fmt: Optional[str] = None,
+    quality: Optional[int] = None,
+    compress_level: Optional[int] = None,
+) -> Tuple[Path, bool]:
+    """
+    Encode the display derivative of an image that browsers cannot show.
+
+    The format defaults to `DERIVATIVE_FORMAT` (see `DERIVATIVE_ENCODERS`).
+    Returns the written path and whether the encoding is lossy.
+    """
+    fmt = (fmt or DERIVATIVE_FORMAT).lower()
+    if fmt not in DERIVATIVE_ENCODERS:
+        raise ValueError(f"Unknown derivative format: {fmt}")
+    if fmt == "webp" and max(img.size) > WEBP_MAX_DIMENSION:
+        logger.info(f"{img.size} is too large for WebP, using JPEG instead")
+        fmt = "jpeg"
+
+    extension, pil_format, lossy, build_options = DERIVATIVE_ENCODERS[fmt]
+    options = build_options(
+        DERIVATIVE_QUALITY if quality is None else quality,
+        PNG_COMPRESS_LEVEL if compress_level is None else compress_level,
+    )
+
+    # Convert to RGB if necessary (some TIFFs might be in different color modes)
+    if img.mode not in ("RGB", "RGBA") or (pil_format == "JPEG" and img.mode != "RGB"):
+        img = img.convert("RGB")
+
+    derivative_path = dest_dir / f"{uuid.uuid4()}{extension}"
+    img.save(derivative_path, pil_format, **options)
+    return derivative_path, lossy
+
+
 def validate_image_file(file: UploadFile) -> bool:
     """Validate if the file is a supported image format."""
     content_type = file.content_type
     valid_types = ["image/jpeg", "image/png", "image/tiff", "image/geotiff"]
     return content_type in valid_types
+
+
+def is_supported_image_name(filename: Optional[str]) -> bool:
+    """Check if a file name has one of the supported image extensions."""
+    if not filename:
+        return False
+    return os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def is_archive_file(file: UploadFile) -> bool:
+    """Check if an uploaded file is a zip or tar archive of images."""
+    filename = (file.filename or "").lower()
+    if filename.endswith(ARCHIVE_EXTENSIONS):
+        return True
+    return file.content_type in (
+        "application/zip",
+        "application/x-zip-compressed",
+        "application/x-tar",
+        "application/gzip",
+        "application/x-gzip",
+    )
+
+
+def iter_archive_images(
+    fileobj: BinaryIO, filename: str
+) -> Iterator[Tuple[str, BinaryIO, int]]:
+    """
+    Stream the image members of a zip or tar archive.
+
+    Yields (member name, readable stream, declared size) one at a time, so
+    members are never extracted all at once. Each stream is only valid until
+    the next member is requested. Non-image members and directories are
+    skipped.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_supported_image_name(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member, info.file_size
+        return
+
+    fileobj.seek(0)
+    try:
+        # "r|*" reads the tar as a forward-only stream (any compression)
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as e:
+        raise ValueError(f"{filename} is not a valid zip or tar archive") from e
+
+    with archive:
+        for member in archive:
+            if not member.isfile() or not is_supported_image_name(member.name):
+                continue
+            stream = archive.extractfile(member)
+            if stream is not None:
+                yield member.name, stream, member.size
+
+
+def _stage_stream(
+    stream: BinaryIO, original_filename: str, max_size: Optional[int] = None
+) -> Tuple[Path, int]:
+    """
+    Copy a readable stream into the upload directory under a unique name.
+
+    Returns the staged path and its size. Streams longer than `max_size`
+    bytes are refused with ValueError and nothing is kept.
+    """
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    staged_path = UPLOAD_DIR / f"{uuid.uuid4()}{file_extension}"
+    size = 0
+    try:
+        with open(staged_path, "wb") as f:
+            while True:
+                block = stream.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+                if max_size is not None and size > max_size:
+                    raise ValueError("File is larger than its declared size")
+                f.write(block)
+    except Exception:
+        staged_path.unlink(missing_ok=True)
+        raise
+    return staged_path, size
+
+
+def _stream_size(stream: BinaryIO) -> int:
+    """Size of a seekable stream, which is left at its start"""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def _ingest_batch(
+    uploads: List[Tuple[str, Optional[str], Optional[BinaryIO], bool]],
+    quota: float = float("inf"),
+) -> List[dict]:
+    """
+    Stage every file (and every image inside archives) to disk and ingest them
+    concurrently on the ingest worker pool.
+
+    Staging is sequential because archives can only be read as a stream, the
+    conversion work is what runs in parallel. Uploads without a stream were
+    rejected as unsupported. Each file's declared size (archive members) or
+    actual size (plain files) is counted against `quota` bytes before it is
+    staged, and nothing more is staged once the quota is used up. Returns
+    one result per image with either `file_info` or `error` set, in upload
+    order. Files whose ingestion failed are deleted.
+    """
+    pending = []
+    remaining = quota
+    quota_error = f"Session disk quota of {SESSION_QUOTA_BYTES // 1024**2} MiB exceeded"
+
+    def submit(
+        name: str, content_type: Optional[str], stream: BinaryIO, size: int
+    ) -> None:
+        nonlocal remaining
+        if len(pending) >= MAX_BULK_FILES:
+            pending.append(
+                (
+                    name,
+                    None,
+                    f"Too many files, at most {MAX_BULK_FILES} per request",
+                    None,
+                )
+            )
+            return
+        if size > remaining:
+            remaining = 0
+            pending.append((name, None, quota_error, None))
+            return
+        remaining -= size
+        try:
+            staged_path, staged_size = _stage_stream(stream, name, max_size=size)
+        except Exception as e:
+            pending.append((name, None, f"Could not store file: {e}", None))
+            return
+        remaining += size - staged_size
+        future = _ingest_executor.submit(
+            ingest_image_file, staged_path, name, content_type
+        )
+        pending.append((name, future, None, staged_path))
+
+    for filename, content_type, fileobj, is_archive in uploads:
+        if fileobj is None:
+            pending.append((filename, None, "File type not supported", None))
+            continue
+        if not is_archive:
+            submit(filename, content_type, fileobj, _stream_size(fileobj))
+            continue
+        # Stream the archive's image members straight into the pool
+        try:
+            for member_name, stream, size in iter_archive_images(fileobj, filename):
+                base_name = os.path.basename(member_name)
+                submit(base_name, mimetypes.guess_type(base_name)[0], stream, size)
+        except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+            pending.append((filename, None, f"Error reading archive: {e}", None))
+
+    results = []
+    for name, future, error, staged_path in pending:
+        if future is not None:
+            try:
+                results.append(
+                    {"original_filename": name, "file_info": future.result()}
+                )
+                continue
+            except Exception as e:
+                error = f"Error processing file: {e}"
+                staged_path.unlink(missing_ok=True)
+        results.append({"original_filename": name, "file_info": None, "error": error})
+    return results
+
+
+async def save_upload_files(
+    files: List[UploadFile], quota: float = float("inf")
+) -> List[dict]:
+    """
+    Save many uploaded images and/or zip/tar archives of images.
+
+    Archives are stream-extracted and every image is ingested through the
+    shared worker pool. Unsupported plain files, and files past the `quota`
+    bytes the session may still store, are reported, not raised. Results
+    are in upload order, archives expanded in place.
+    """
+    uploads = []
+    for file in files:
+        if is_archive_file(file):
+            uploads.append((file.filename, file.content_type, file.file, True))
+        elif validate_image_file(file) or is_supported_image_name(file.filename):
+            uploads.append((file.filename, file.content_type, file.file, False))
+        else:
+            uploads.append((file.filename, file.content_type, None, False))
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _ingest_batch, uploads, quota)
@@ -0,0 +1,64 @@
+import dataclasses
+import json
+from datetime import date, datetime, time
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Slower stdlib fallback with the same output
+    orjson = None
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """Convert what the JSON encoder cannot serialize by itself"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if hasattr(value, "model_dump"):
+        # Session records: slotted dataclasses with the pydantic method
+        return value.model_dump()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if hasattr(value, "tolist"):
+        # numpy arrays and scalars
+        return value.tolist()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize a response body to compact UTF-8 JSON.
+
+    Pydantic models are serialized by pydantic-core directly; everything
+    else goes through orjson, which handles datetimes, dataclasses and numpy
+    values natively, or the stdlib encoder when orjson is not installed.
+    """
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with dumps().
+
+    Routes return it directly so FastAPI skips response_model validation
+    and the jsonable_encoder walk over every coordinate; the body is built
+    once, when the response is created.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
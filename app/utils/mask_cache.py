@@ -0,0 +1,198 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .annotation_export import ExportAnnotation, label_classes, rasterize
+
+# Images whose rendered mask (and overlay) are kept in memory
+MASK_CACHE_IMAGES = int(os.environ.get("SAT_ANNOTATOR_MASK_CACHE_IMAGES", "16"))
+# Past this many changed regions the whole mask is rendered again
+MAX_DIRTY_REGIONS = 64
+# Opacity of the class colours drawn over the image in overlays
+OVERLAY_ALPHA = 0.5
+
+MASK_TYPES = ("mask", "overlay")
+
+Region = Tuple[int, int, int, int]  # x0, y0, x1, y1, exclusive
+
+
+def class_palette(count: int) -> np.ndarray:
+    """BGR colours for class ids 0..count, spread around the hue circle"""
+    hues = (np.arange(count + 1) * 0.618033988749895 % 1.0 * 180).astype(np.uint8)
+    hsv = np.stack(
+        [hues, np.full_like(hues, 200), np.full_like(hues, 255)], axis=-1
+    ).reshape(1, -1, 3)
+    palette = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR).reshape(-1, 3)
+    palette[0] = 0
+    return palette
+
+
+def _intersects(a: Region, b: Region) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+@dataclass
+class MaskEntry:
+    """Rendered rasters of one image"""
+
+    width: int
+    height: int
+    classes: Dict[str, int]
+    mask: np.ndarray
+    # id(feature) -> (feature, bbox) of the polygons drawn in the mask; the
+    # features are kept so their ids stay unique
+    sources: Dict[int, Tuple[dict, Region]] = field(default_factory=dict)
+    base: Optional[np.ndarray] = None  # Image the overlay is drawn on
+    overlay: Optional[np.ndarray] = None
+    # Bumped whenever pixels change, so encoded PNGs can be reused
+    generation: int = 0
+    png: Dict[str, Tuple[int, bytes]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class MaskCache:
+    """
+    Label masks and overlays of annotated images, rendered on demand.
+
+    A mask's pixels are the class ids of label_classes(). When annotations
+    change, only the regions covered by added, edited or removed polygons
+    are cleared and repainted (with every polygon crossing them, in order),
+    and the overlay is re-blended in the same regions. A change in the set
+    of labels renumbers the classes and renders everything again. Encoded
+    PNGs are kept until the pixels change. The least recently used images
+    are evicted past `max_images`.
+    """
+
+    def __init__(self, max_images: Optional[int] = None):
+        self.max_images = max_images or MASK_CACHE_IMAGES
+        self.entries: "OrderedDict[Tuple[str, str], MaskEntry]" = OrderedDict()
+        self.stats = {"full_renders": 0, "partial_renders": 0, "encodes": 0}
+        self._lock = threading.Lock()
+
+    def render(
+        self,
+        session_id: str,
+        image_id: str,
+        annotations: List[ExportAnnotation],
+        width: int,
+        height: int,
+        mask_type: str = "mask",
+        load_image: Optional[Callable[[], np.ndarray]] = None,
+    ) -> Tuple[bytes, Dict[str, int]]:
+        """
+        Get a PNG of the image's mask or overlay and the label -> class map.
+
+        `annotations` are the image's polygons in drawing order, and
+        `load_image` returns the BGR image overlays are drawn on. Blocks on
+        rasterizing and encoding, so call it from a worker thread.
+        """
+        if mask_type not in MASK_TYPES:
+            raise ValueError(f"Unknown mask type: {mask_type}")
+        entry = self._entry(session_id, image_id, annotations, width, height)
+        with entry.lock:
+            self._update(entry, annotations)
+            if mask_type == "overlay" and entry.overlay is None:
+                entry.base = load_image()
+                entry.overlay = entry.base.copy()
+                self._blend(entry, (0, 0, width, height))
+            cached = entry.png.get(mask_type)
+            if cached is None or cached[0] != entry.generation:
+                pixels = entry.mask if mask_type == "mask" else entry.overlay
+                ok, encoded = cv2.imencode(".png", pixels)
+                if not ok:
+                    raise ValueError("Could not encode PNG")
+                cached = entry.png[mask_type] = (entry.generation, encoded.tobytes())
+                with self._lock:
+                    self.stats["encodes"] += 1
+            return cached[1], dict(entry.classes)
+
+    def drop(self, session_id: str, image_id: Optional[str] = None) -> None:
+        """Forget the rasters of one image, or of every image of a session"""
+        with self._lock:
+            for key in list(self.entries):
+                if key[0] == session_id and image_id in (None, key[1]):
+                    del self.entries[key]
+
+    def _entry(self, session_id, image_id, annotations, width, height) -> MaskEntry:
+        classes = label_classes(annotations)
+        key = (session_id, image_id)
+        with self._lock:
+            entry = self.entries.get(key)
+            if (
+                entry is None
+                or entry.classes != classes
+                or (entry.width, entry.height) != (width, height)
+            ):
+                dtype = np.uint16 if len(classes) > 255 else np.uint8
+                entry = MaskEntry(
+                    width, height, classes, np.zeros((height, width), dtype=dtype)
+                )
+                self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_images:
+                self.entries.popitem(last=False)
+            return entry
+
+    def _update(self, entry: MaskEntry, annotations: List[ExportAnnotation]) -> None:
+        """Repaint the regions whose polygons changed since the last render"""
+        current = {id(a.feature): a for a in annotations}
+        regions = [
+            bbox for key, (_, bbox) in entry.sources.items() if key not in current
+        ]
+        regions += [a.bbox for key, a in current.items() if key not in entry.sources]
+        if not regions:
+            return
+
+        if not entry.sources or len(regions) > MAX_DIRTY_REGIONS:
+            regions = [(0, 0, entry.width, entry.height)]
+            full = True
+        else:
+            full = False
+        for region in regions:
+            self._paint(entry, annotations, region)
+            if entry.overlay is not None:
+                self._blend(entry, region)
+
+        entry.sources = {key: (a.feature, a.bbox) for key, a in current.items()}
+        entry.generation += 1
+        with self._lock:
+            self.stats["full_renders" if full else "partial_renders"] += 1
+
+    def _paint(self, entry: MaskEntry, annotations, region: Region) -> None:
+        """Clear a region of the mask and draw the polygons crossing it"""
+        x0, y0, x1, y1 = region
+        if x0 >= x1 or y0 >= y1:
+            return
+        entry.mask[y0:y1, x0:x1] = 0
+        for annotation in annotations:
+            if not _intersects(annotation.bbox, region):
+                continue
+            crop = rasterize(annotation)
+            ax0, ay0, ax1, ay1 = annotation.bbox
+            cx0, cy0 = max(x0, ax0), max(y0, ay0)
+            cx1, cy1 = min(x1, ax1), min(y1, ay1)
+            np.copyto(
+                entry.mask[cy0:cy1, cx0:cx1],
+                entry.classes[annotation.label],
+                where=crop[cy0 - ay0 : cy1 - ay0, cx0 - ax0 : cx1 - ax0].astype(bool),
+            )
+
+    def _blend(self, entry: MaskEntry, region: Region) -> None:
+        """Draw the class colours of a mask region over the image"""
+        x0, y0, x1, y1 = region
+        mask = entry.mask[y0:y1, x0:x1]
+        base = entry.base[y0:y1, x0:x1]
+        palette = class_palette(len(entry.classes)).astype(np.float32)
+        blended = base * (1 - OVERLAY_ALPHA) + palette[mask] * OVERLAY_ALPHA
+        entry.overlay[y0:y1, x0:x1] = np.where(
+            mask[..., None] > 0, blended.astype(np.uint8), base
+        )
+
+
+# Global mask cache instance
+mask_cache = MaskCache()
@@ -0,0 +1,173 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import LineString
+from shapely.ops import split as split_geometry
+
+from .annotation_edits import first_feature
+
+# Decimals kept in normalized result coordinates (~0.02 px at 20000 px)
+RESULT_DECIMALS = 6
+# Pixel grid vertices are snapped to, so that polygons sharing an edge up
+# to float noise touch
+GRID_SIZE = 0.001
+# Parts of a result smaller than this (square image pixels) are dropped
+MIN_PART_AREA = 0.5
+# Result vertices within this distance (pixels) of a straight line are
+# dropped, e.g. where the edges of merged polygons met
+STRAIGHTEN_TOLERANCE = 0.01
+
+
+def document_rings(document: dict) -> Optional[list]:
+    """
+    The rings ([outer, *holes], normalized) of an annotation's polygon, or
+    None if it has no polygon with at least three outer vertices
+    """
+    feature = first_feature(document) or {}
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") != "Polygon":
+        return None
+    rings = geometry.get("coordinates") or []
+    if not rings or len(rings[0]) < 3:
+        return None
+    return rings
+
+
+def to_polygons(polygons: Sequence[list], width: int, height: int) -> np.ndarray:
+    """
+    Shapely polygons in image pixels of polygons given as normalized rings
+    ([outer, *holes] each), built with one vectorized call.
+
+    Vertices are snapped to GRID_SIZE. Invalid (e.g. self-intersecting)
+    polygons are repaired, which may turn them into MultiPolygons. Raises
+    ValueError for malformed coordinates.
+    """
+    coordinates = []
+    ring_polygons = []
+    ring_indices = []
+    for number, rings in enumerate(polygons):
+        for index, ring in enumerate(rings):
+            if len(ring) < 3:
+                if not index:
+                    raise ValueError("A polygon needs at least 3 vertices")
+                continue  # Degenerate hole
+            coordinates.extend(ring)
+            ring_indices.extend([len(ring_polygons)] * len(ring))
+            ring_polygons.append(number)
+    if not ring_polygons:
+        return np.empty(0, dtype=object)
+    try:
+        points = np.asarray(coordinates, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Vertices must be [x, y] pairs of numbers")
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError("Vertices must be [x, y] pairs of numbers")
+    if not np.all(np.isfinite(points)):
+        raise ValueError("Coordinates must be finite")
+    points *= (width, height)
+
+    rings = shapely.linearrings(points, indices=ring_indices)
+    result = shapely.polygons(rings, indices=ring_polygons)
+    result = shapely.set_precision(result, GRID_SIZE, mode="pointwise")
+    invalid = ~shapely.is_valid(result)
+    if invalid.any():
+        result[invalid] = [
+            _polygonal(shapely.make_valid(polygon)) for polygon in result[invalid]
+        ]
+    return result
+
+
+def _polygonal(geometry):
+    """The polygons of a geometry, dropping lines and points"""
+    return shapely.union_all(polygon_parts(geometry, 0.0))
+
+
+def polygon_parts(geometry, min_area: float = MIN_PART_AREA) -> list:
+    """The Polygons of a (multi)polygon or collection, largest first"""
+    parts = []
+    for part in shapely.get_parts(geometry):
+        if isinstance(part, shapely.Polygon):
+            if part.area > min_area:
+                parts.append(part)
+        elif isinstance(part, (shapely.MultiPolygon, shapely.GeometryCollection)):
+            parts.extend(polygon_parts(part, min_area))
+    return sorted(parts, key=lambda part: part.area, reverse=True)
+
+
+def to_rings(polygon, width: int, height: int) -> List[list]:
+    """Normalized rings ([outer, *holes], not closed) of a pixel polygon"""
+    polygon = shapely.simplify(polygon, STRAIGHTEN_TOLERANCE)
+    rings = [polygon.exterior, *polygon.interiors]
+    return [
+        np.round(
+            np.asarray(ring.coords)[:-1] / (width, height), RESULT_DECIMALS
+        ).tolist()
+        for ring in rings
+    ]
+
+
+def merge_polygons(polygons: Sequence, tolerance: float = 0.0):
+    """
+    Union of polygons. With a tolerance (pixels), gaps up to that wide
+    between them are closed as well (a morphological closing).
+    """
+    if tolerance > 0:
+        grown = shapely.buffer(polygons, tolerance / 2, join_style="mitre")
+        return shapely.buffer(
+            shapely.union_all(grown), -tolerance / 2, join_style="mitre"
+        )
+    return shapely.union_all(polygons)
+
+
+def subtract_polygons(polygon, cutters: Sequence):
+    """What is left of a polygon once the cutters are taken out of it"""
+    return shapely.difference(polygon, shapely.union_all(cutters))
+
+
+def split_polygon(polygon, line: list, width: int, height: int) -> list:
+    """
+    Pieces of a polygon cut along a polyline (normalized [x, y] vertices),
+    largest first. The line must cross the polygon's outline; a polygon it
+    does not cut comes back as the only piece.
+    """
+    points = np.asarray(line, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) < 2:
+        raise ValueError("The line needs at least two [x, y] vertices")
+    if not np.all(np.isfinite(points)):
+        raise ValueError("Coordinates must be finite")
+    return polygon_parts(split_geometry(polygon, LineString(points * (width, height))))
+
+
+def dissolve_groups(polygons: Sequence, tolerance: float = 0.0) -> List[list]:
+    """
+    Indices of the polygons that touch (or come within `tolerance` pixels
+    of) each other, in groups of two or more connected polygons.
+
+    Candidate pairs come from one bulk STRtree query; groups are the
+    connected components of the pairs, each in input order.
+    """
+    tree = STRtree(polygons)
+    if tolerance > 0:
+        left, right = tree.query(polygons, predicate="dwithin", distance=tolerance)
+    else:
+        left, right = tree.query(polygons, predicate="intersects")
+
+    parent = list(range(len(polygons)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        a, b = root(a), root(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for i in range(len(polygons)):
+        groups.setdefault(root(i), []).append(i)
+    return [group for group in groups.values() if len(group) > 1]
@@ -271,11 +271,13 @@ class SAMSegmenter:
 
     def clear_cache(self, image_path=None):
         """Clear the cache for a specific image or all images"""
-        if image_path:
-            if image_path in self.cache:
-                del self.cache[image_path]
-                if self.current_image_path == image_path:
-                    self.current_image_path = None
-        else:
-            self.cache = {}
-            self.current_image_path = None
+        # Take the lock so an eviction never races a running prediction
+        with self._lock:
+            if image_path:
+                if image_path in self.cache:
+                    del self.cache[image_path]
+                    if self.current_image_path == image_path:
+                        self.current_image_path = None
+            else:
+                self.cache = {}
+                self.current_image_path = None
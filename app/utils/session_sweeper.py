@@ -0,0 +1,333 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds between two sweeps for idle sessions
+SWEEP_INTERVAL = float(os.environ.get("SAT_ANNOTATOR_SWEEP_INTERVAL", "3600"))
+# Files deleted per worker-thread hop while sweeping
+SWEEP_BATCH_SIZE = int(os.environ.get("SAT_ANNOTATOR_SWEEP_BATCH_SIZE", "256"))
+# Last access is written to the store at most this often per session (seconds)
+TOUCH_INTERVAL = 60.0
+# Delete files no session references after each sweep ("1" or "0"). Only safe
+# when every process sees every session, so unless set it is on with a shared
+# session store (sqlite or redis) and off with the in-memory one
+ORPHAN_GC = os.environ.get("SAT_ANNOTATOR_ORPHAN_GC")
+# Unreferenced files younger than this (seconds) may still be being ingested
+ORPHAN_MIN_AGE = float(os.environ.get("SAT_ANNOTATOR_ORPHAN_MIN_AGE", "3600"))
+
+
+def delete_files(paths: List[str]) -> Tuple[int, int]:
+    """Delete files that exist and return (files deleted, bytes reclaimed)"""
+    deleted = reclaimed = 0
+    for path in paths:
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning(f"Could not delete {path}: {e}")
+            continue
+        deleted += 1
+        reclaimed += size
+    return deleted, reclaimed
+
+
+def _normalize(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+class SessionSweeper:
+    """
+    Expires sessions that have been idle for longer than the timeout.
+
+    Expiring a session removes it from the store, deletes its uploads and
+    annotation files, and calls the registered listeners with its images so
+    in-process caches (e.g. SAM embeddings) can drop them too. After each
+    sweep, files in `orphan_dirs` that no session references are removed and
+    the registered orphan collectors run, if `orphan_gc` is on (by default
+    when SAT_ANNOTATOR_ORPHAN_GC says so or the store is shared). Registered
+    reapers run after every sweep either way.
+    """
+
+    def __init__(
+        self,
+        store,
+        timeout: timedelta,
+        resolve_path: Optional[Callable[[str], str]] = None,
+        interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        orphan_dirs: Optional[Dict[str, Optional[Tuple[str, ...]]]] = None,
+        orphan_gc: Optional[bool] = None,
+    ):
+        self.store = store
+        self.timeout = timeout
+        self.resolve_path = resolve_path or (lambda path: path)
+        self.interval = interval if interval is not None else SWEEP_INTERVAL
+        self.batch_size = batch_size or SWEEP_BATCH_SIZE
+        # Directory -> file suffixes it owns (None for every file)
+        self.orphan_dirs = orphan_dirs or {}
+        if orphan_gc is None:
+            orphan_gc = (
+                ORPHAN_GC != "0"
+                if ORPHAN_GC is not None
+                else getattr(store, "shared", False)
+            )
+        self.orphan_gc = orphan_gc
+        self.listeners: List[Callable[[str, list], None]] = []
+        self.orphan_collectors: List[Callable[[], None]] = []
+        self.reapers: List[Callable[[], None]] = []
+        self.stats = {
+            "sweeps": 0,
+            "sessions_expired": 0,
+            "files_deleted": 0,
+            "bytes_reclaimed": 0,
+            "orphans_deleted": 0,
+            "orphan_bytes_reclaimed": 0,
+            "last_sweep": None,
+        }
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback: Callable[[str, list], None]) -> None:
+        """Call `callback(session_id, images)` for every expired session"""
+        self.listeners.append(callback)
+
+    def add_orphan_collector(self, callback: Callable[[], None]) -> None:
+        """Call `callback()` whenever orphaned files are collected"""
+        self.orphan_collectors.append(callback)
+
+    def add_reaper(self, callback: Callable[[], None]) -> None:
+        """Call `callback()` after every sweep, e.g. to drop stale temporary files"""
+        self.reapers.append(callback)
+
+    def needs_touch(self, session_id: str) -> bool:
+        """Check whether the session's last access should be written again"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._touched.get(session_id)
+            if last is not None and now - last < TOUCH_INTERVAL:
+                return False
+            self._touched[session_id] = now
+            return True
+
+    def touch(self, session_id: str) -> None:
+        """Record activity for a session, throttled to TOUCH_INTERVAL"""
+        if self.needs_touch(session_id):
+            self.store.touch_session(session_id)
+
+    def _release(self, session_id: str) -> List[str]:
+        """Drop a session from the store and listeners, return its files"""
+        data = self.store.export_session(session_id)
+        if data is None:
+            return []
+        images = list(data["images"].values())
+        annotations = list(data["annotations"].values())
+        self.store.delete_session(session_id)
+        with self._lock:
+            self._touched.pop(session_id, None)
+
+        for listener in self.listeners:
+            try:
+                listener(session_id, images)
+            except Exception as e:
+                logger.warning(f"Session expiry listener failed: {e}")
+
+        paths = []
+        for image in images:
+            paths.append(self.resolve_path(image.file_path))
+            if image.sam_path:
+                paths.append(self.resolve_path(image.sam_path))
+        paths.extend(self.resolve_path(a.file_path) for a in annotations)
+        return paths
+
+    def _record(self, sessions: int, deleted: int, reclaimed: int) -> None:
+        with self._lock:
+            self.stats["sessions_expired"] += sessions
+            self.stats["files_deleted"] += deleted
+            self.stats["bytes_reclaimed"] += reclaimed
+
+    def expire_session(self, session_id: str) -> Dict:
+        """
+        Expire one session right away and return what was reclaimed.
+
+        Blocks on file I/O, so call it from a worker thread (sync routes).
+        """
+        paths = self._release(session_id)
+        deleted = reclaimed = 0
+        for start in range(0, len(paths), self.batch_size):
+            d, r = delete_files(paths[start : start + self.batch_size])
+            deleted += d
+            reclaimed += r
+        self._record(1 if paths else 0, deleted, reclaimed)
+        return {"files_deleted": deleted, "bytes_reclaimed": reclaimed}
+
+    async def sweep(self) -> Dict:
+        """
+        Expire every idle session and return what was reclaimed.
+
+        Store access and file deletion run in worker threads, one batch of
+        files at a time, so the event loop keeps serving requests.
+        """
+        cutoff = datetime.now() - self.timeout
+        session_ids = await run_in_threadpool(self.store.get_idle_sessions, cutoff)
+
+        paths: List[str] = []
+        for session_id in session_ids:
+            paths.extend(await run_in_threadpool(self._release, session_id))
+
+        deleted = reclaimed = 0
+        for start in range(0, len(paths), self.batch_size):
+            d, r = await run_in_threadpool(
+                delete_files, paths[start : start + self.batch_size]
+            )
+            deleted += d
+            reclaimed += r
+
+        # Forget throttling entries old enough to be written again anyway
+        horizon = time.monotonic() - TOUCH_INTERVAL
+        with self._lock:
+            self._touched = {s: t for s, t in self._touched.items() if t > horizon}
+            self.stats["sweeps"] += 1
+            self.stats["last_sweep"] = datetime.now()
+        self._record(len(session_ids), deleted, reclaimed)
+
+        if session_ids:
+            logger.info(
+                f"Expired {len(session_ids)} idle sessions: deleted {deleted} files, "
+                f"reclaimed {reclaimed / 1024**2:.1f} MiB"
+            )
+        return {
+            "sessions_expired": len(session_ids),
+            "files_deleted": deleted,
+            "bytes_reclaimed": reclaimed,
+        }
+
+    def collect_orphans(self, min_age: Optional[float] = None) -> Dict:
+        """
+        Delete files in the orphan directories that no session references.
+
+        Both the store's paths and the directory listings are streamed
+        (os.scandir), so only the set of referenced paths is held in memory.
+        Hidden entries and files newer than `min_age` seconds are skipped.
+        Blocks on I/O, so run it in a worker thread.
+        """
+        referenced = {
+            _normalize(self.resolve_path(path)) for path in self.store.iter_file_paths()
+        }
+        cutoff = time.time() - (ORPHAN_MIN_AGE if min_age is None else min_age)
+
+        scanned = deleted = reclaimed = 0
+        for directory, suffixes in self.orphan_dirs.items():
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_file(
+                        follow_symlinks=False
+                    ):
+                        continue
+                    if suffixes and not entry.name.lower().endswith(suffixes):
+                        continue
+                    scanned += 1
+                    if _normalize(entry.path) in referenced:
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_mtime > cutoff:
+                            continue
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        logger.warning(f"Could not delete orphan {entry.path}: {e}")
+                        continue
+                    deleted += 1
+                    reclaimed += stat.st_size
+
+        for collector in self.orphan_collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Orphan collector failed: {e}")
+
+        with self._lock:
+            self.stats["orphans_deleted"] += deleted
+            self.stats["orphan_bytes_reclaimed"] += reclaimed
+        if deleted:
+            logger.info(
+                f"Deleted {deleted} orphaned files of {scanned} scanned, "
+                f"reclaimed {reclaimed / 1024**2:.1f} MiB"
+            )
+        return {
+            "files_scanned": scanned,
+            "files_deleted": deleted,
+            "bytes_reclaimed": reclaimed,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+                if self.orphan_gc and self.orphan_dirs:
+                    await run_in_threadpool(self.collect_orphans)
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+            for reaper in self.reapers:
+                try:
+                    await run_in_threadpool(reaper)
+                except Exception as e:
+                    logger.warning(f"Reaper failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start sweeping in the background on the running event loop"""
+        if self._task is None:
+            if self.orphan_dirs and not self.orphan_gc:
+                reason = (
+                    "SAT_ANNOTATOR_ORPHAN_GC=0"
+                    if ORPHAN_GC is not None
+                    else "the session store is not shared by workers; set "
+                    "SAT_ANNOTATOR_ORPHAN_GC=1 to turn it on with a single worker"
+                )
+                logger.info(f"Orphaned file collection is off ({reason})")
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background sweep"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class SessionActivityMiddleware:
+    """ASGI middleware recording session activity from the session cookie"""
+
+    def __init__(self, app, sweeper: SessionSweeper, cookie_name: str):
+        self.app = app
+        self.sweeper = sweeper
+        self.cookie_name = cookie_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            session_id = HTTPConnection(scope).cookies.get(self.cookie_name)
+            if session_id and self.sweeper.needs_touch(session_id):
+                await run_in_threadpool(self.sweeper.store.touch_session, session_id)
+        await self.app(scope, receive, send)
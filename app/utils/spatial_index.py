@@ -0,0 +1,408 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .annotation_export import iter_features
+
+# Images whose annotation index is kept in memory
+INDEX_CACHE_IMAGES = int(os.environ.get("SAT_ANNOTATOR_INDEX_CACHE_IMAGES", "64"))
+# Entries per R-tree node before it is split
+RTREE_MAX_ENTRIES = 16
+
+Box = Tuple[float, float, float, float]  # x0, y0, x1, y1, inclusive
+
+
+def _union(a: Box, b: Box) -> Box:
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _area(box: Box) -> float:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def _intersects(a: Box, b: Box) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class _Node:
+    """R-tree node; leaf entries are (box, key), others are child nodes"""
+
+    __slots__ = ("leaf", "entries", "box", "parent")
+
+    def __init__(self, leaf: bool, entries: Optional[list] = None):
+        self.leaf = leaf
+        self.entries = entries or []
+        self.box: Optional[Box] = None
+        self.parent: Optional["_Node"] = None
+
+    def entry_box(self, entry) -> Box:
+        return entry[0] if self.leaf else entry.box
+
+    def refresh(self) -> None:
+        """Recompute the box covering the node's entries"""
+        box = None
+        for entry in self.entries:
+            entry_box = self.entry_box(entry)
+            box = entry_box if box is None else _union(box, entry_box)
+        self.box = box
+
+
+class RTree:
+    """
+    R-tree of keyed boxes (Guttman's, with linear splits).
+
+    Keys can be inserted, moved and removed one at a time; a leaf lookup
+    table makes removal independent of the tree's size. Nodes left
+    underfull by a removal are dissolved and their keys inserted again.
+    An empty tree can instead be packed with many keys at once (load()).
+    """
+
+    def __init__(self, max_entries: int = RTREE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.min_entries = max(2, max_entries * 2 // 5)
+        self.root = _Node(leaf=True)
+        self.boxes: Dict[Hashable, Box] = {}
+        self._leaves: Dict[Hashable, _Node] = {}
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def insert(self, key: Hashable, box: Box) -> None:
+        """Add a key, replacing its previous box if it has one"""
+        if key in self.boxes:
+            self.remove(key)
+        self.boxes[key] = box
+        self._insert(box, key)
+
+    def load(self, items: Iterable[Tuple[Hashable, Box]]) -> None:
+        """
+        Add (key, box) pairs. An empty tree is packed by sort-tile-recursive
+        order into full nodes of neighbouring boxes, which is much faster
+        than inserting them one by one.
+        """
+        if self.boxes:
+            for key, box in items:
+                self.insert(key, box)
+            return
+        self.boxes = dict(items)
+        if not self.boxes:
+            return
+        nodes = self._pack([(box, key) for key, box in self.boxes.items()], True)
+        while len(nodes) > 1:
+            nodes = self._pack(nodes, False)
+        self.root = nodes[0]
+        self.root.parent = None
+
+    def _pack(self, entries: list, leaf: bool) -> List[_Node]:
+        """Group the entries of one level into nodes"""
+        size = self.max_entries
+        box_of = (lambda entry: entry[0]) if leaf else (lambda entry: entry.box)
+        count = -(-len(entries) // size)  # Nodes needed
+        per_slice = size * math.ceil(math.sqrt(count))
+        entries.sort(key=lambda entry: box_of(entry)[0] + box_of(entry)[2])
+        nodes = []
+        for start in range(0, len(entries), per_slice):
+            column = sorted(
+                entries[start : start + per_slice],
+                key=lambda entry: box_of(entry)[1] + box_of(entry)[3],
+            )
+            for i in range(0, len(column), size):
+                node = _Node(leaf, column[i : i + size])
+                for entry in node.entries:
+                    if leaf:
+                        self._leaves[entry[1]] = node
+                    else:
+                        entry.parent = node
+                node.refresh()
+                nodes.append(node)
+        return nodes
+
+    def remove(self, key: Hashable) -> bool:
+        """Remove a key; returns False if it is not in the tree"""
+        if self.boxes.pop(key, None) is None:
+            return False
+        leaf = self._leaves.pop(key)
+        leaf.entries = [entry for entry in leaf.entries if entry[1] != key]
+        self._condense(leaf)
+        return True
+
+    def search(self, box: Box) -> List[Hashable]:
+        """Keys whose boxes intersect `box`, in no particular order"""
+        if self.root.box is None:
+            return []
+        result = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                result.extend(
+                    key
+                    for entry_box, key in node.entries
+                    if _intersects(entry_box, box)
+                )
+            else:
+                stack.extend(
+                    child for child in node.entries if _intersects(child.box, box)
+                )
+        return result
+
+    def _insert(self, box: Box, key: Hashable) -> None:
+        node = self.root
+        # Boxes on the way down grow to cover the new one
+        node.box = box if node.box is None else _union(node.box, box)
+        while not node.leaf:
+            # Child needing the least enlargement, then the smallest
+            best = None
+            for child in node.entries:
+                area = _area(child.box)
+                grown = _union(child.box, box)
+                rank = (_area(grown) - area, area)
+                if best is None or rank < best[0]:
+                    best = (rank, child, grown)
+            node = best[1]
+            node.box = best[2]
+        node.entries.append((box, key))
+        self._leaves[key] = node
+        self._split_up(node)
+
+    def _split_up(self, node: _Node) -> None:
+        """Split overfull nodes from `node` up to the root"""
+        while node is not None and len(node.entries) > self.max_entries:
+            sibling = self._split(node)
+            if node.parent is None:
+                self.root = _Node(leaf=False, entries=[node, sibling])
+                node.parent = sibling.parent = self.root
+                self.root.refresh()
+            else:
+                sibling.parent = node.parent
+                node.parent.entries.append(sibling)
+            node = node.parent
+
+    def _split(self, node: _Node) -> _Node:
+        """Move about half of an overfull node's entries to a new sibling"""
+        entries = node.entries
+        boxes = [node.entry_box(entry) for entry in entries]
+
+        # Seeds: the pair lying furthest apart along either axis, relative
+        # to the spread of all the boxes on it
+        first, second, separation = 0, 1, -1.0
+        for axis in (0, 1):
+            low = max(range(len(boxes)), key=lambda i: boxes[i][axis])
+            high = min(range(len(boxes)), key=lambda i: boxes[i][axis + 2])
+            spread = max(b[axis + 2] for b in boxes) - min(b[axis] for b in boxes)
+            gap = (boxes[low][axis] - boxes[high][axis + 2]) / (spread or 1.0)
+            if low != high and gap > separation:
+                first, second, separation = high, low, gap
+        groups = [[first], [second]]
+        covers = [boxes[first], boxes[second]]
+
+        # The rest join the group they enlarge least, keeping both
+        # groups at least min_entries long
+        rest = [i for i in range(len(entries)) if i not in (first, second)]
+        for position, i in enumerate(rest):
+            left = len(rest) - position
+            short = [g for g in (0, 1) if len(groups[g]) + left <= self.min_entries]
+            if short:
+                g = short[0]
+            else:
+                areas = [_area(covers[0]), _area(covers[1])]
+                grow = [_area(_union(covers[g], boxes[i])) - areas[g] for g in (0, 1)]
+                g = min((0, 1), key=lambda g: (grow[g], areas[g], len(groups[g])))
+            groups[g].append(i)
+            covers[g] = _union(covers[g], boxes[i])
+
+        node.entries = [entries[i] for i in groups[0]]
+        sibling = _Node(node.leaf, [entries[i] for i in groups[1]])
+        for entry in sibling.entries:
+            if sibling.leaf:
+                self._leaves[entry[1]] = sibling
+            else:
+                entry.parent = sibling
+        node.refresh()
+        sibling.refresh()
+        return sibling
+
+    def _condense(self, node: _Node) -> None:
+        """Dissolve underfull nodes above a removal and reinsert their keys"""
+        orphans = []
+        while node.parent is not None:
+            parent = node.parent
+            if len(node.entries) < self.min_entries:
+                parent.entries.remove(node)
+                self._collect(node, orphans)
+            else:
+                node.refresh()
+            node = parent
+        node.refresh()
+
+        while not self.root.leaf and len(self.root.entries) == 1:
+            self.root = self.root.entries[0]
+            self.root.parent = None
+        if not self.root.leaf and not self.root.entries:
+            self.root = _Node(leaf=True)
+
+        for box, key in orphans:
+            self._insert(box, key)
+
+    def _collect(self, node: _Node, out: list) -> None:
+        if node.leaf:
+            out.extend(node.entries)
+        else:
+            for child in node.entries:
+                self._collect(child, out)
+
+
+def document_box(document: dict) -> Optional[Box]:
+    """Normalized bounding box of an annotation's polygons, or None"""
+    box = None
+    for feature in iter_features(document):
+        geometry = feature.get("geometry") or {}
+        rings = geometry.get("coordinates") or []
+        if geometry.get("type") != "Polygon" or not rings or not rings[0]:
+            continue
+        xs = [point[0] for point in rings[0]]
+        ys = [point[1] for point in rings[0]]
+        feature_box = (min(xs), min(ys), max(xs), max(ys))
+        box = feature_box if box is None else _union(box, feature_box)
+    return box
+
+
+def contains_point(document: dict, x: float, y: float) -> bool:
+    """Check whether a point lies in one of an annotation's polygons (not in a hole)"""
+    for feature in iter_features(document):
+        geometry = feature.get("geometry") or {}
+        rings = geometry.get("coordinates") or []
+        if geometry.get("type") != "Polygon" or not rings or len(rings[0]) < 3:
+            continue
+        inside = [
+            cv2.pointPolygonTest(
+                np.asarray(ring, dtype=np.float32).reshape(-1, 1, 2), (x, y), False
+            )
+            >= 0
+            for ring in rings
+            if len(ring) >= 3
+        ]
+        if inside[0] and not any(inside[1:]):
+            return True
+    return False
+
+
+class AnnotationIndex:
+    """
+    Spatial index of one image's annotations.
+
+    `entries` maps annotation ids to (annotation, document), and `order`
+    gives their position in the image's annotation list so results come
+    back in drawing order.
+    """
+
+    def __init__(self):
+        self.tree = RTree()
+        self.entries: Dict[str, Tuple[object, dict]] = {}
+        self.order: Dict[str, int] = {}
+        self.version: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def sync(self, items: Iterable[Tuple[object, dict]]) -> int:
+        """
+        Bring the index in line with the image's (annotation, document)
+        pairs, re-indexing only documents that were added, replaced or
+        removed. Returns the number of annotations re-indexed.
+        """
+        changed = 0
+        seen = {}
+        added = []
+        for position, (annotation, document) in enumerate(items):
+            annotation_id = annotation.annotation_id
+            seen[annotation_id] = position
+            previous = self.entries.get(annotation_id)
+            if previous is None or previous[1] is not document:
+                box = document_box(document)
+                if previous is None:
+                    if box is not None:
+                        added.append((annotation_id, box))
+                elif box is None:
+                    self.tree.remove(annotation_id)
+                else:
+                    self.tree.insert(annotation_id, box)
+                changed += 1
+            self.entries[annotation_id] = (annotation, document)
+        for annotation_id in [a for a in self.entries if a not in seen]:
+            del self.entries[annotation_id]
+            self.tree.remove(annotation_id)
+            changed += 1
+        # New annotations go in together, packed when the index is empty
+        self.tree.load(added)
+        self.order = seen
+        return changed
+
+    def query(self, box: Box) -> List[Tuple[object, dict]]:
+        """Annotations whose bounding boxes intersect `box`, in drawing order"""
+        with self.lock:
+            keys = sorted(self.tree.search(box), key=self.order.__getitem__)
+            return [self.entries[key] for key in keys]
+
+    def hit(self, x: float, y: float) -> List[Tuple[object, dict]]:
+        """Annotations whose polygons contain the point, topmost first"""
+        candidates = self.query((x, y, x, y))
+        return [
+            (annotation, document)
+            for annotation, document in reversed(candidates)
+            if contains_point(document, x, y)
+        ]
+
+
+class SpatialIndexCache:
+    """
+    Annotation indexes of recently queried images.
+
+    An index is synced with the image's annotations when the session
+    version it was built at is out of date; the least recently used
+    indexes are evicted past `max_images`.
+    """
+
+    def __init__(self, max_images: Optional[int] = None):
+        self.max_images = max_images or INDEX_CACHE_IMAGES
+        self.indexes: "OrderedDict[Tuple[str, str], AnnotationIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        session_id: str,
+        image_id: str,
+        version: int,
+        load: Callable[[], Iterable[Tuple[object, dict]]],
+    ) -> AnnotationIndex:
+        """
+        Get an image's index, synced with `load()` (the image's
+        (annotation, document) pairs in order) unless it is at `version`.
+        """
+        key = (session_id, image_id)
+        with self._lock:
+            index = self.indexes.get(key)
+            if index is None:
+                index = self.indexes[key] = AnnotationIndex()
+            self.indexes.move_to_end(key)
+            while len(self.indexes) > self.max_images:
+                self.indexes.popitem(last=False)
+        with index.lock:
+            if index.version != version:
+                index.sync(load())
+                index.version = version
+        return index
+
+    def drop(self, session_id: str, image_id: Optional[str] = None) -> None:
+        """Forget the index of one image, or of every image of a session"""
+        with self._lock:
+            for key in list(self.indexes):
+                if key[0] == session_id and image_id in (None, key[1]):
+                    del self.indexes[key]
+
+
+# Global spatial index cache instance
+spatial_index = SpatialIndexCache()
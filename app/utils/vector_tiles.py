@@ -0,0 +1,314 @@
+import math
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .annotation_export import iter_features
+from .geometry_lod import lod_level
+
+# Screen pixels per tile side; at the deepest native zoom one image pixel
+# is one screen pixel
+TILE_SIZE = 256
+# Vector tile coordinates per tile side
+TILE_EXTENT = 4096
+# Tile coordinates kept around each tile so clipped edges stay hidden
+TILE_BUFFER = 64
+# Zoom levels served past one screen pixel per image pixel (full geometry)
+MAX_OVERZOOM = 3
+# Name of the layer annotations are encoded in
+TILE_LAYER = "annotations"
+# Encoded tiles kept in memory
+TILE_CACHE_SIZE = int(os.environ.get("SAT_ANNOTATOR_TILE_CACHE_SIZE", "4096"))
+
+# Geometry commands (MVT 2.1, section 4.3)
+_MOVE_TO = 1
+_LINE_TO = 2
+_CLOSE_PATH = 7
+_POLYGON = 3
+
+Bounds = Tuple[float, float, float, float]  # x0, y0, x1, y1 in image pixels
+
+
+def max_zoom(width: int, height: int) -> int:
+    """The zoom level at which one image pixel is one screen pixel"""
+    return max(0, math.ceil(math.log2(max(width, height, 1) / TILE_SIZE)))
+
+
+def tile_span(z: int, width: int, height: int) -> float:
+    """Image pixels covered by a tile side at zoom `z`"""
+    return TILE_SIZE * 2.0 ** (max_zoom(width, height) - z)
+
+
+def tile_bounds(z: int, x: int, y: int, width: int, height: int) -> Bounds:
+    """
+    Image pixel bounds of tile z/x/y. Zoom 0 is one tile over the whole
+    image; each level halves the tiles' span. Raises ValueError for tiles
+    outside the image or the served zoom levels.
+    """
+    if not 0 <= z <= max_zoom(width, height) + MAX_OVERZOOM:
+        raise ValueError(
+            f"Zoom must be between 0 and {max_zoom(width, height) + MAX_OVERZOOM}"
+        )
+    span = tile_span(z, width, height)
+    if not (0 <= x < math.ceil(width / span) and 0 <= y < math.ceil(height / span)):
+        raise ValueError(f"Tile {z}/{x}/{y} is outside the image")
+    return (x * span, y * span, (x + 1) * span, (y + 1) * span)
+
+
+def tile_level(z: int, width: int, height: int) -> Optional[float]:
+    """Simplification level (geometry_lod) for tiles at zoom `z`, half a screen pixel"""
+    return lod_level(tolerance=0.5 * tile_span(z, width, height) / TILE_SIZE)
+
+
+def clip_ring(ring: List[Tuple[float, float]], lo: float, hi: float) -> list:
+    """Clip a ring to the square [lo, hi] on both axes (Sutherland-Hodgman)"""
+    for axis, limit, keep in ((0, lo, 1), (0, hi, -1), (1, lo, 1), (1, hi, -1)):
+        if not ring:
+            break
+        clipped = []
+        previous = ring[-1]
+        previous_in = (previous[axis] - limit) * keep >= 0
+        for point in ring:
+            point_in = (point[axis] - limit) * keep >= 0
+            if point_in != previous_in:
+                t = (limit - previous[axis]) / (point[axis] - previous[axis])
+                crossing = [
+                    previous[0] + t * (point[0] - previous[0]),
+                    previous[1] + t * (point[1] - previous[1]),
+                ]
+                crossing[axis] = limit
+                clipped.append(tuple(crossing))
+            if point_in:
+                clipped.append(point)
+            previous, previous_in = point, point_in
+        ring = clipped
+    return ring
+
+
+def _tile_ring(ring, bounds: Bounds, width: int, height: int, exterior: bool):
+    """
+    A normalized ring in integer tile coordinates, clipped to the buffered
+    tile and wound as MVT requires, or None if nothing of it is left
+    """
+    if len(ring) < 3:
+        return None
+    # Rings are short once simplified, so plain Python beats numpy here
+    scale = TILE_EXTENT / (bounds[2] - bounds[0])
+    sx, sy = width * scale, height * scale
+    ox, oy = bounds[0] * scale, bounds[1] * scale
+    points = [(point[0] * sx - ox, point[1] * sy - oy) for point in ring]
+    lo, hi = -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    x0, y0, x1, y1 = min(xs), min(ys), max(xs), max(ys)
+    if x1 < lo or y1 < lo or x0 > hi or y0 > hi:
+        return None
+    if x0 < lo or y0 < lo or x1 > hi or y1 > hi:
+        points = clip_ring(points, lo, hi)
+
+    # Drop repeated vertices (including a closing one) left by rounding
+    quantized = []
+    for x, y in points:
+        point = (round(x), round(y))
+        if not quantized or point != quantized[-1]:
+            quantized.append(point)
+    while len(quantized) > 1 and quantized[0] == quantized[-1]:
+        quantized.pop()
+    if len(quantized) < 3:
+        return None
+    area = 0
+    px, py = quantized[-1]
+    for x, y in quantized:
+        area += px * y - x * py
+        px, py = x, y
+    if area == 0:
+        return None
+    # Exterior rings have a positive area in tile coordinates (y down)
+    if (area > 0) != exterior:
+        quantized.reverse()
+    return quantized
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """A length-delimited protobuf field"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(number: int, values: Iterable[int]) -> bytes:
+    return _field(number, b"".join(_varint(value) for value in values))
+
+
+def _value(value) -> bytes:
+    """An MVT Value message"""
+    if isinstance(value, bool):
+        return _varint(7 << 3) + _varint(int(value))
+    if isinstance(value, int):
+        return _varint(6 << 3) + _varint(_zigzag(value) & 0xFFFFFFFFFFFFFFFF)
+    if isinstance(value, float):
+        return _varint(3 << 3 | 1) + struct.pack("<d", value)
+    return _field(1, str(value).encode())
+
+
+def _geometry(rings: List[list]) -> List[int]:
+    """Command integers drawing polygon rings from a cursor at the origin"""
+    commands = []
+    cx = cy = 0
+    for ring in rings:
+        for index, (x, y) in enumerate(ring):
+            if index == 0:
+                commands.append(_MOVE_TO | 1 << 3)
+            elif index == 1:
+                commands.append(_LINE_TO | (len(ring) - 1) << 3)
+            commands.append(_zigzag(x - cx))
+            commands.append(_zigzag(y - cy))
+            cx, cy = x, y
+        commands.append(_CLOSE_PATH | 1 << 3)
+    return commands
+
+
+def encode_tile(
+    items: Iterable[Tuple[dict, dict]],
+    bounds: Bounds,
+    width: int,
+    height: int,
+    layer: str = TILE_LAYER,
+) -> bytes:
+    """
+    Encode a Mapbox Vector Tile (2.1) of annotations.
+
+    `items` are (properties, document) pairs in drawing order, with
+    normalized coordinates; every polygon becomes a feature with the
+    annotation's properties and its own scalar properties, clipped to the
+    tile. Tiles with no polygons are empty (no layer).
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[str, object], int] = {}
+    features = []
+    for properties, document in items:
+        for feature in iter_features(document):
+            geometry = feature.get("geometry") or {}
+            coordinates = geometry.get("coordinates") or []
+            if geometry.get("type") != "Polygon" or not coordinates:
+                continue
+            exterior = _tile_ring(coordinates[0], bounds, width, height, True)
+            if exterior is None:
+                continue
+            rings = [exterior]
+            for hole in coordinates[1:]:
+                hole = _tile_ring(hole, bounds, width, height, False)
+                if hole is not None:
+                    rings.append(hole)
+
+            tags = []
+            merged = {**(feature.get("properties") or {}), **properties}
+            for key, value in merged.items():
+                if not isinstance(value, (str, int, float)):
+                    continue
+                tags.append(keys.setdefault(key, len(keys)))
+                tags.append(
+                    values.setdefault((type(value).__name__, value), len(values))
+                )
+            features.append(
+                _packed(2, tags)
+                + _varint(3 << 3)
+                + _varint(_POLYGON)
+                + _packed(4, _geometry(rings))
+            )
+
+    if not features:
+        return b""
+    body = [_varint(15 << 3) + _varint(2), _field(1, layer.encode())]
+    body += [_field(2, feature) for feature in features]
+    body += [_field(3, key.encode()) for key in keys]
+    body += [_field(4, _value(value)) for _, value in values]
+    body.append(_varint(5 << 3) + _varint(TILE_EXTENT))
+    return _field(3, b"".join(body))
+
+
+class TileCache:
+    """
+    Encoded annotation tiles.
+
+    A tile is kept with the session version and the documents it was made
+    from. While the version is unchanged it is served as is; after a
+    change, the tile's annotations are looked up again and it is encoded
+    again only if one of them was added, edited or removed. The least
+    recently used tiles are evicted past `max_tiles`.
+    """
+
+    def __init__(self, max_tiles: Optional[int] = None):
+        self.max_tiles = max_tiles or TILE_CACHE_SIZE
+        # (session_id, image_id, z, x, y) -> (version, documents, tile)
+        self.entries: "OrderedDict[tuple, Tuple[int, tuple, bytes]]" = OrderedDict()
+        self.stats = {"hits": 0, "revalidated": 0, "encodes": 0}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        session_id: str,
+        image_id: str,
+        tile: Tuple[int, int, int],
+        version: int,
+        query: Callable[[], List[Tuple[object, dict]]],
+        encode: Callable[[List[Tuple[object, dict]]], bytes],
+    ) -> bytes:
+        """
+        Get tile (z, x, y) of an image at session `version`. `query()`
+        returns the (annotation, document) pairs the tile shows, and
+        `encode(pairs)` encodes them; both block, so call this from a worker
+        thread.
+        """
+        key = (session_id, image_id, *tile)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[2]
+
+        pairs = query()
+        documents = tuple(document for _, document in pairs)
+        if (
+            entry is not None
+            and len(entry[1]) == len(documents)
+            and all(a is b for a, b in zip(entry[1], documents))
+        ):
+            encoded = entry[2]
+            stat = "revalidated"
+        else:
+            encoded = encode(pairs)
+            stat = "encodes"
+
+        with self._lock:
+            self.stats[stat] += 1
+            self.entries[key] = (version, documents, encoded)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_tiles:
+                self.entries.popitem(last=False)
+        return encoded
+
+    def drop(self, session_id: str, image_id: Optional[str] = None) -> None:
+        """Forget the tiles of one image, or of every image of a session"""
+        with self._lock:
+            for key in list(self.entries):
+                if key[0] == session_id and image_id in (None, key[1]):
+                    del self.entries[key]
+
+
+# Global vector tile cache instance
+tile_cache = TileCache()
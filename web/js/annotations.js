@@ -129,9 +129,7 @@ class AnnotationManager {
     // Save any existing annotations for the current image before switching
     if (this.currentImageId && this.annotations.length > 0) {
       try {
-        await Promise.all(
-          this.annotations.map(ann => this.saveAnnotation(ann.id))
-        );
+        await this.saveAllAnnotations();
       } catch (error) {
         console.error(
           'Failed to save some annotations before switching images:',
@@ -290,6 +288,7 @@ class AnnotationManager {
           label: label,
           created: ann.created_at || new Date().toISOString(),
           source: ann.auto_generated ? 'ai' : 'manual',
+          etag: ann.etag || null, // Version that vertex edits apply to
           canvasPolygon: [], // Will be calculated when drawing
         };
 
@@ -731,17 +730,83 @@ class AnnotationManager {
     if (!annotation || !this.currentImageId) return;
 
     try {
-      await api.saveAnnotation(this.currentImageId, {
+      const response = await api.saveAnnotation(this.currentImageId, {
         id: annotation.id,
         type: annotation.type,
         polygon: annotation.polygon,
         label: annotation.label,
         source: annotation.source,
       });
+      annotation.etag = response.etag || null;
     } catch (error) {
       console.error('Failed to save annotation:', error);
     }
   }
+
+  // Save every annotation of the current image in one bulk request
+  async saveAllAnnotations() {
+    const response = await api.bulkAnnotations(
+      this.annotations.map(annotation => ({
+        op: 'create',
+        id: annotation.id,
+        image_id: this.currentImageId,
+        type: annotation.type,
+        polygon: annotation.polygon,
+        label: annotation.label,
+        source: annotation.source,
+      }))
+    );
+    response.results.forEach(result => {
+      const annotation = this.annotations.find(ann => ann.id === result.id);
+      if (annotation && result.success) annotation.etag = result.etag;
+    });
+    if (response.failed > 0) {
+      console.error('Some annotations were not saved:', response.results);
+    }
+    return response;
+  }
+
+  // Send vertex operations instead of the whole polygon. Edits to one
+  // annotation are sent one after another so each carries the ETag
+  // returned by the previous one.
+  patchAnnotation(annotationId, ops) {
+    const annotation = this.annotations.find(ann => ann.id === annotationId);
+    if (!annotation || !this.currentImageId) return Promise.resolve();
+
+    const previous = annotation.pendingSave || Promise.resolve();
+    const save = previous.then(async () => {
+      if (!annotation.etag) {
+        return this.saveAnnotation(annotationId);
+      }
+      try {
+        const response = await api.patchAnnotation(
+          annotationId,
+          { ops },
+          annotation.etag
+        );
+        annotation.etag = response.etag;
+      } catch (error) {
+        if (error.status === 404) {
+          // Not saved yet: create it with the full polygon
+          await this.saveAnnotation(annotationId);
+        } else if (error.status === 412) {
+          Utils.showToast(
+            'Annotation was changed elsewhere, reloading it',
+            'warning'
+          );
+          await this.loadAnnotations(this.currentImageId);
+        } else {
+          console.error('Failed to update annotation:', error);
+          Utils.showToast(
+            `Failed to update annotation: ${error.message}`,
+            'error'
+          );
+        }
+      }
+    });
+    annotation.pendingSave = save;
+    return save;
+  }
   async deleteAnnotation(id) {
     console.log('Attempting to delete annotation with ID:', id);
     if (confirm('Are you sure you want to delete this annotation?')) {
@@ -1046,9 +1111,7 @@ class AnnotationManager {
     try {
       // Save current image's annotations first
       if (this.currentImageId && this.annotations.length > 0) {
-        await Promise.all(
-          this.annotations.map(ann => this.saveAnnotation(ann.id))
-        );
+        await this.saveAllAnnotations();
       }
 
       const allAnnotations = [];
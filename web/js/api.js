@@ -41,9 +41,15 @@ class API {
 
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({}));
-        throw new Error(
+        const error = new Error(
           errorData.detail || `HTTP error! status: ${response.status}`
         );
+        error.status = response.status;
+        throw error;
+      }
+
+      if (options.rawResponse) {
+        return response;
       }
 
       const contentType = response.headers.get('content-type');
@@ -236,13 +242,26 @@ class API {
     }
   }
 
-  // Get all images
+  // Get all images, following the X-Next-Cursor header page by page
   async getImages() {
     try {
       console.log('API: Starting getImages call...');
-      const images = await this.get('/api/images/');
+      const images = [];
+      let cursor = null;
+      do {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response = await this.request(`/api/images/${query}`, {
+          method: 'GET',
+          rawResponse: true,
+        });
+        const page = await response.json();
+        if (Array.isArray(page)) {
+          images.push(...page);
+        }
+        cursor = response.headers.get('X-Next-Cursor');
+      } while (cursor);
       console.log('API: getImages response:', images);
-      return Array.isArray(images) ? images : [];
+      return images;
     } catch (error) {
       console.error('API: Failed to fetch images:', error);
       Utils.showToast(`Failed to load images: ${error.message}`, 'error');
@@ -350,13 +369,14 @@ class API {
     return `${this.baseURL}/${imagePath}`;
   }
 
-  // Download annotations
-  async downloadAnnotations(imageId, format = 'json') {
+  // Download annotations as a Blob (format: geojson, coco or mask)
+  async downloadAnnotations(imageId, format = 'geojson') {
     try {
-      const response = await this.get(
-        `/api/annotations/${imageId}/export?format=${format}`
+      const response = await this.request(
+        `/api/annotations/${imageId}/export?format=${encodeURIComponent(format)}`,
+        { method: 'GET', rawResponse: true }
       );
-      return response;
+      return await response.blob();
     } catch (error) {
       console.error('Failed to download annotations:', error);
       throw error;
@@ -414,17 +434,154 @@ class API {
     }
   }
 
-  // Get annotations for image
-  async getAnnotations(imageId) {
+  // Apply vertex operations to an annotation; etag is the version they were made on
+  async patchAnnotation(annotationId, changes, etag) {
+    const response = await this.request(`/api/annotations/${annotationId}`, {
+      method: 'PATCH',
+      headers: { 'If-Match': etag },
+      body: JSON.stringify(changes),
+    });
+    return response;
+  }
+
+  // Create, update and delete many annotations in one request
+  async bulkAnnotations(operations) {
+    return this.post('/api/annotations/bulk', { operations });
+  }
+
+  // Merge annotations into the first; tolerance (pixels) closes gaps between them
+  async mergeAnnotations(annotationIds, tolerance = 0, label = null) {
+    return this.post('/api/annotations/merge', {
+      annotation_ids: annotationIds,
+      tolerance,
+      label,
+    });
+  }
+
+  // Cut other annotations out of an annotation
+  async subtractAnnotations(annotationId, annotationIds) {
+    return this.post(`/api/annotations/${annotationId}/subtract`, {
+      annotation_ids: annotationIds,
+    });
+  }
+
+  // Cut an annotation along a normalized polyline
+  async splitAnnotation(annotationId, line) {
+    return this.post(`/api/annotations/${annotationId}/split`, { line });
+  }
+
+  // Merge every group of touching polygons with a label on an image
+  async dissolveAnnotations(imageId, label, tolerance = 0) {
+    return this.post('/api/annotations/dissolve', {
+      image_id: imageId,
+      label,
+      tolerance,
+    });
+  }
+
+  // Undo the session's last annotation change
+  async undoAnnotationChange() {
+    return this.post('/api/annotations/undo');
+  }
+
+  // Redo the last undone annotation change
+  async redoAnnotationChange() {
+    return this.post('/api/annotations/redo');
+  }
+
+  // How many changes can be undone and redone, and since when
+  async getHistory() {
+    return this.get('/api/history/');
+  }
+
+  // Annotations (optionally one image's) as they were at a Date
+  async getHistoryState(at, imageId = null) {
+    const query = imageId ? `&image_id=${encodeURIComponent(imageId)}` : '';
+    const state = await this.get(
+      `/api/history/state?at=${encodeURIComponent(at.toISOString())}` +
+        `&encoding=compact${query}`
+    );
+    state.annotations.forEach((annotation) => {
+      annotation.data = this.decodeGeometry(annotation.data);
+    });
+    return state;
+  }
+
+  // Get annotations for image, optionally only those overlapping a
+  // normalized [x0, y0, x1, y1] viewport. Geometry is fetched in the
+  // compact encoding and decoded here.
+  async getAnnotations(imageId, bbox = null) {
     try {
-      const annotations = await this.get(`/api/annotations/${imageId}`);
-      return Array.isArray(annotations) ? annotations : [];
+      const query = bbox ? `&bbox=${bbox.join(',')}` : '';
+      const annotations = await this.get(
+        `/api/annotations/${imageId}?encoding=compact${query}`
+      );
+      if (!Array.isArray(annotations)) {
+        return [];
+      }
+      annotations.forEach((annotation) => {
+        annotation.data = this.decodeGeometry(annotation.data);
+      });
+      return annotations;
     } catch (error) {
       console.error('Failed to fetch annotations:', error);
       return [];
     }
   }
 
+  // Decode a compact ring: a struct code for the delta type (b, h or i)
+  // and the base64 of the first vertex as two int32 followed by the x
+  // then y deltas, all little-endian fixed-point with 6 decimals
+  decodeCompactRing(encoded) {
+    const bytes = Uint8Array.from(atob(encoded.slice(1)), (c) =>
+      c.charCodeAt(0)
+    );
+    const view = new DataView(bytes.buffer);
+    const size = { b: 1, h: 2, i: 4 }[encoded[0]];
+    if (!size) {
+      throw new Error(`Unknown compact ring type: ${encoded[0]}`);
+    }
+    const read = {
+      b: (offset) => view.getInt8(offset),
+      h: (offset) => view.getInt16(offset, true),
+      i: (offset) => view.getInt32(offset, true),
+    }[encoded[0]];
+    const count = (bytes.length - 8) / size / 2;
+    let x = view.getInt32(0, true);
+    let y = view.getInt32(4, true);
+    const ring = [[x / 1e6, y / 1e6]];
+    for (let i = 0; i < count; i++) {
+      x += read(8 + i * size);
+      y += read(8 + (count + i) * size);
+      ring.push([x / 1e6, y / 1e6]);
+    }
+    return ring;
+  }
+
+  // Turn the compact Polygons of an annotation's GeoJSON back into plain ones
+  decodeGeometry(data) {
+    const decode = (geometry) => {
+      if (!geometry || geometry.encoding !== 'compact') {
+        return;
+      }
+      geometry.coordinates = geometry.coordinates.map((ring) =>
+        typeof ring === 'string' ? this.decodeCompactRing(ring) : ring
+      );
+      delete geometry.encoding;
+    };
+    if (data && data.type === 'FeatureCollection') {
+      (data.features || []).forEach((feature) => decode(feature.geometry));
+    } else if (data && data.type === 'Feature') {
+      decode(data.geometry);
+    }
+    return data;
+  }
+
+  // Get the annotations containing a normalized point, topmost first
+  async hitTestAnnotations(imageId, x, y) {
+    return this.get(`/api/annotations/${imageId}/hit?x=${x}&y=${y}`);
+  }
+
   // Check server status
   async checkStatus() {
     try {
@@ -250,10 +250,15 @@ class CanvasManager {
         // Keep the canvas polygon coordinates we've been dragging
         // Don't clear isDragging yet to prevent recalculation
 
-        // Save the annotation with updated coordinates
-        window.annotationManager.saveAnnotation(
-          this.draggingVertex.annotationId
-        );
+        // Send the moved vertex to the backend
+        const vertexIndex = this.draggingVertex.vertexIndex;
+        window.annotationManager.patchAnnotation(annotation.id, [
+          {
+            op: 'move',
+            index: vertexIndex,
+            point: annotation.polygon[vertexIndex],
+          },
+        ]);
         // Small delay before allowing recalculation to ensure smooth transition
         setTimeout(() => {
           if (annotation) {
@@ -303,7 +308,13 @@ class CanvasManager {
     annotation.canvasPolygon.splice(insertIndex, 0, { x: pos.x, y: pos.y });
 
     // Save changes
-    window.annotationManager.saveAnnotation(annotation.id);
+    window.annotationManager.patchAnnotation(annotation.id, [
+      {
+        op: 'insert',
+        index: insertIndex,
+        points: [[imageCoords.x, imageCoords.y]],
+      },
+    ]);
     window.annotationManager.updateUI();
     this.redraw();
   }
@@ -318,7 +329,9 @@ class CanvasManager {
     annotation.canvasPolygon.splice(vertexInfo.vertexIndex, 1);
 
     // Save changes
-    window.annotationManager.saveAnnotation(annotation.id);
+    window.annotationManager.patchAnnotation(annotation.id, [
+      { op: 'delete', index: vertexInfo.vertexIndex },
+    ]);
     window.annotationManager.updateUI();
     this.redraw();
   }